@@ -0,0 +1,15 @@
+"""Shared bootstrap for the benchmark scripts: puts src/ on the path and configures Django."""
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def setup():
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
+    os.environ.setdefault('MAX_EMAILS', '5')
+
+    import django
+    django.setup()
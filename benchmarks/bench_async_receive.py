@@ -0,0 +1,73 @@
+"""
+Many concurrent receives against a slow server: blocking engine on a few threads vs the asyncio engine.
+
+The threads stand in for sync workers (each gunicorn sync worker handles one
+request at a time). The asyncio engine runs every receive on one event loop
+in one thread.
+
+    python benchmarks/bench_async_receive.py [--mailboxes 200] [--rtt 0.05] [--threads 4]
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mailboxes', type=int, default=200, help="concurrent receive requests, one mailbox each")
+    parser.add_argument('--rtt', type=float, default=0.05, help="seconds added to every server answer")
+    parser.add_argument('--threads', type=int, default=4, help="threads for the blocking engine")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.cache import message_cache
+    from email_app.pool import imap_pool
+    from email_app.service import EmailReceiver
+
+    server = FakeIMAPServer(Mailbox(make_message(i) for i in range(10)), rtt=args.rtt).start()
+    configs = [
+        {
+            'host': '127.0.0.1',
+            'port': server.port,
+            'username': f'bench{index}@example.com',
+            'password': 'secret',
+            'use_ssl': False,
+            'use_tls': False,
+            'protocol': 'IMAP',
+            'folder': 'INBOX',
+            'max_emails': 5,
+            'mode': 'headers'
+        }
+        for index in range(args.mailboxes)
+    ]
+
+    print(f"{args.mailboxes} receives (mode=headers, 5 messages), {args.rtt * 1000:.0f}ms RTT")
+
+    message_cache.clear()
+    imap_pool.close_all()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        results = list(executor.map(EmailReceiver.receive_emails, configs))
+    elapsed = time.perf_counter() - start
+    assert all(result['success'] for result in results), results[0]
+    print(f"blocking, {args.threads} threads   {elapsed:7.3f}s  {args.mailboxes / elapsed:7.1f} receives/s")
+    imap_pool.close_all()
+
+    async def receive_all():
+        return await asyncio.gather(*(EmailReceiver.receive_emails_async(config) for config in configs))
+
+    message_cache.clear()
+    start = time.perf_counter()
+    results = asyncio.run(receive_all())
+    elapsed = time.perf_counter() - start
+    assert all(result['success'] for result in results), results[0]
+    print(f"asyncio, 1 thread      {elapsed:7.3f}s  {args.mailboxes / elapsed:7.1f} receives/s")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
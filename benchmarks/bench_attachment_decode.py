@@ -0,0 +1,101 @@
+"""
+Peak RSS and CPU time of the send path for a 100MB total attachment payload.
+
+"before" replays the old behaviour (base64 decoded and thrown away by
+EmailSerializer, again by EmailService.validate_attachment and a third time
+before attach), "after" is the current single decode. Each mode runs in its own process so peak RSS
+is measured independently.
+
+    python benchmarks/bench_attachment_decode.py
+"""
+import base64
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ATTACHMENTS = 4
+ATTACHMENT_SIZE = 25 * 1024 * 1024 - 3072  # just under the 25MB per-file limit
+CHUNK = 3072  # multiple of 3, so repeated base64 chunks stay valid without padding
+
+
+def make_content():
+    """Base64 payload built without a raw-bytes temporary, so it doesn't inflate the peak"""
+    return base64.b64encode(os.urandom(CHUNK)).decode('ascii') * (ATTACHMENT_SIZE // CHUNK)
+
+
+def run(mode):
+    from _django import setup
+    setup()
+
+    from rest_framework import serializers
+    from email_app.serializers import EmailSerializer
+    from email_app.service import EmailService
+
+    class LegacyEmailSerializer(EmailSerializer):
+        """validate_attachments as it was: decode to measure, then drop the bytes"""
+
+        def validate_attachments(self, value):
+            for i, attachment in enumerate(value):
+                content = base64.b64decode(attachment['content'], validate=True)
+                if len(content) > 25 * 1024 * 1024:
+                    raise serializers.ValidationError(f"Attachment {i+1} exceeds maximum size of 25MB")
+            return value
+
+    payload = {
+        'use_default_settings': True,
+        'sender': 'sender@example.com',
+        'recipients': ['recipient@example.com'],
+        'subject': 'Attachment benchmark',
+        'body': 'See attached',
+        'attachments': [
+            {
+                'filename': f'file{i}.bin',
+                'content': make_content(),
+                'content_type': 'application/octet-stream'
+            }
+            for i in range(ATTACHMENTS)
+        ]
+    }
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start_cpu = time.process_time()
+    serializer_class = LegacyEmailSerializer if mode == 'before' else EmailSerializer
+    serializer = serializer_class(data=payload)
+    assert serializer.is_valid(), serializer.errors
+    attachments = serializer.validated_data['attachments']
+
+    if mode == 'before':
+        for attachment in attachments:
+            # The decode the old EmailService.validate_attachment did
+            base64.b64decode(attachment['content'], validate=True)
+
+    prepared = EmailService.prepare_email(
+        sender=payload['sender'],
+        recipients=payload['recipients'],
+        subject=payload['subject'],
+        body=payload['body'],
+        attachments=attachments,
+        use_default_settings=True
+    )
+    assert prepared['success'] and prepared['result']['attachments_processed'] == ATTACHMENTS
+    cpu = time.process_time() - start_cpu
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f"{mode:>6}: cpu {cpu:6.3f}s  peak RSS {peak_rss / 1024:7.1f}MB  "
+          f"(+{(peak_rss - baseline_rss) / 1024:6.1f}MB over the request payload)")
+
+
+def main():
+    total_mb = ATTACHMENTS * ATTACHMENT_SIZE / (1024 * 1024)
+    print(f"{ATTACHMENTS} attachments, {total_mb:.0f}MB decoded in total")
+    for mode in ('before', 'after'):
+        subprocess.run([sys.executable, __file__, mode], check=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        main()
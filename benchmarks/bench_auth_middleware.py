@@ -0,0 +1,162 @@
+"""
+Per-request latency of the full middleware stack, and of the token check alone.
+
+"before" is the previous setup: the token check last in MIDDLEWARE behind
+sessions, CSRF, auth and messages, reading request.headers. "after" is the
+current settings.MIDDLEWARE with the JWT verifier. Requests go through
+Django's WSGI handler to GET /api/send/ (a small JSON answer), so the
+numbers include routing, DRF and rendering; rejected requests show the cost
+of the stack in front of the token check.
+
+    python benchmarks/bench_auth_middleware.py [--requests 2000] [--rounds 5]
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import io
+import json
+import time
+
+from _django import setup
+
+SECRET = 'benchmark-secret'
+STATIC_TOKEN = 'benchmark-static-token'
+
+
+class LegacyJWTMiddleware:
+    """The token check as it was: one static token compared with !="""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from django.http import JsonResponse
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return JsonResponse({"success": False, "message": "Authorization header missing or invalid"}, status=401)
+        if auth_header.split(" ")[1] != STATIC_TOKEN:
+            return JsonResponse({"success": False, "message": "Invalid or unauthorized token"}, status=403)
+        return self.get_response(request)
+
+
+LEGACY_MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    '__main__.LegacyJWTMiddleware',
+]
+
+
+def make_jwt(claims, key=SECRET):
+    def encode(data):
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+    signing_input = encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode()) + '.' + encode(json.dumps(claims).encode())
+    signature = hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return signing_input + '.' + encode(signature)
+
+
+def environ(token):
+    env = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': '/api/send/',
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_ACCEPT': 'application/json',
+        'HTTP_USER_AGENT': 'bench/1.0',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': io.StringIO(),
+    }
+    if token is not None:
+        env['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return env
+
+
+def time_requests(handler, token, count, rounds):
+    """Best of rounds, in microseconds per request, and the statuses seen"""
+    def start_response(status, headers):
+        pass
+
+    statuses = set()
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(count):
+            response = handler(environ(token), start_response)
+            statuses.add(response.status_code)
+            response.close()
+        elapsed = (time.perf_counter() - start) / count * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    import logging
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import override_settings
+    import email_app.middleware
+    from email_app.tokens import TokenVerifier, VerifiedTokenCache
+
+    # 401/403 responses are logged as warnings by django.request
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    expires = time.time() + 3600
+    hs256_token = make_jwt({'sub': 'bench', 'exp': expires})
+    verifier = TokenVerifier(static_tokens=[STATIC_TOKEN], hs256_keys=[('old', 'retired-secret'), ('current', SECRET)])
+    uncached = TokenVerifier(static_tokens=[STATIC_TOKEN], hs256_keys=[('old', 'retired-secret'), ('current', SECRET)],
+                             cache=VerifiedTokenCache(max_size=0))
+
+    print(f"{args.requests} requests per row, best of {args.rounds} rounds, microseconds per request")
+    print("token check alone:")
+    for label, check, token in (('static token', verifier, STATIC_TOKEN),
+                                ('HS256, cached', verifier, hs256_token),
+                                ('HS256, uncached (2 keys)', uncached, hs256_token)):
+        best = None
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                check.verify(token)
+            elapsed = (time.perf_counter() - start) / args.requests * 1e6
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"  {label:26} {best:8.2f}us")
+
+    with override_settings(MIDDLEWARE=LEGACY_MIDDLEWARE):
+        legacy = WSGIHandler()
+    email_app.middleware.token_verifier = verifier
+    current = WSGIHandler()
+    email_app.middleware.token_verifier = uncached
+    current_uncached = WSGIHandler()
+
+    print("full stack, GET /api/send/:")
+    rows = (
+        ('before, static token', legacy, STATIC_TOKEN),
+        ('after, static token', current, STATIC_TOKEN),
+        ('after, HS256 cached', current, hs256_token),
+        ('after, HS256 uncached', current_uncached, hs256_token),
+        ('before, no token (401)', legacy, None),
+        ('after, no token (401)', current, None),
+        ('before, bad token (403)', legacy, 'wrong'),
+        ('after, bad token (403)', current, 'wrong'),
+    )
+    for label, handler, token in rows:
+        elapsed, statuses = time_requests(handler, token, args.requests, args.rounds)
+        print(f"  {label:26} {elapsed:8.1f}us  {sorted(statuses)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+One message to recipients at several domains: one envelope for everyone
+(delivery 'single') vs one envelope per domain in parallel ('per_domain'),
+with one slow domain and one domain whose recipients are refused.
+
+Reported per mode: wall time of send_email, when the recipients at the
+fast domains were accepted by the server, and what the result says about
+the refused recipients.
+
+    python benchmarks/bench_domain_delivery.py [--domains 8] [--per-domain 5] [--rtt 0.01] [--slow 0.2]
+"""
+import argparse
+import statistics
+import time
+
+from _django import setup
+from fake_smtp import FakeSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--domains', type=int, default=8, help="fast destination domains")
+    parser.add_argument('--per-domain', type=int, default=5, help="recipients per domain")
+    parser.add_argument('--rtt', type=float, default=0.01, help="seconds added to every server reply")
+    parser.add_argument('--slow', type=float, default=0.2, help="extra reply delay of the slow domain")
+    parser.add_argument('--per-message', type=int, default=4, help="envelopes of the message sent at once")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.delivery import domain_delivery
+    from email_app.pool import smtp_pool
+    from email_app.service import EmailService
+
+    domain_delivery.per_message = args.per_message
+    server = FakeSMTPServer(rtt=args.rtt, slow={'slow.example': args.slow}, refuse=['gone.example']).start()
+    domains = [f'd{index}.example' for index in range(args.domains)] + ['slow.example', 'gone.example']
+    fast_domains = set(domains[:args.domains])
+    recipients = [f'user{number}@{domain}' for number in range(args.per_domain) for domain in domains]
+    send_kwargs = {
+        'email_settings': {'host': '127.0.0.1', 'port': str(server.port), 'username': 'bench', 'password': 'secret',
+                           'use_tls': 'False', 'use_ssl': 'False'},
+        'sender': 'sender@example.com',
+        'recipients': recipients,
+        'subject': 'Newsletter',
+        'body': 'Hello ' * 2000
+    }
+
+    print(f"{len(recipients)} recipients: {args.domains} domains at {args.rtt * 1000:.0f}ms per reply, "
+          f"1 at +{args.slow * 1000:.0f}ms, 1 refused; {args.per_message} envelopes at once")
+    for delivery in ('single', 'per_domain'):
+        smtp_pool.close_all()
+        del server.deliveries[:]
+        start = time.monotonic()
+        result = EmailService.send_email(**send_kwargs, delivery=delivery)
+        elapsed = time.monotonic() - start
+        fast = [accepted - start for accepted, _, envelope, _ in server.deliveries
+                if any(address.rpartition('@')[2] in fast_domains for address in envelope)]
+        accepted = sum(len(envelope) for _, _, envelope, _ in server.deliveries)
+        print(f"{delivery:10} {elapsed:6.3f}s  fast domains accepted after {statistics.median(fast):6.3f}s (median)  "
+              f"{accepted} accepted by the server, {len(server.deliveries)} envelopes")
+        print(f"{'':10} result: success={result['success']} error={result.get('error')} "
+              f"failed_recipients={len(result.get('failed_recipients', []))} "
+              f"recipient_status={'yes' if 'recipient_status' in result else 'no'}")
+
+    domain_delivery.shutdown()
+    smtp_pool.close_all()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
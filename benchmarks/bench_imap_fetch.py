@@ -0,0 +1,51 @@
+"""
+Receive latency for 100 messages against a local IMAP server with artificial RTT.
+
+fetch_chunk_size=1 is the old one-FETCH-per-message behaviour.
+
+    python benchmarks/bench_imap_fetch.py [--rtt 0.02] [--messages 100]
+"""
+import argparse
+import time
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rtt', type=float, default=0.02, help="seconds added to every server answer")
+    parser.add_argument('--messages', type=int, default=100)
+    args = parser.parse_args()
+
+    setup()
+    from email_app.service import EmailReceiver
+
+    mailbox = Mailbox(make_message(i) for i in range(args.messages))
+    server = FakeIMAPServer(mailbox, rtt=args.rtt).start()
+    config = {
+        'host': '127.0.0.1',
+        'port': server.port,
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'protocol': 'IMAP',
+        'folder': 'INBOX',
+        'max_emails': args.messages
+    }
+
+    print(f"{args.messages} messages, {args.rtt * 1000:.0f}ms RTT")
+    for chunk_size in (1, 10, 50, 100):
+        mailbox.commands.clear()
+        start = time.perf_counter()
+        result = EmailReceiver.receive_emails({**config, 'fetch_chunk_size': chunk_size})
+        elapsed = time.perf_counter() - start
+        assert result['success'] and len(result['emails']) == args.messages, result
+        fetches = sum(1 for command in mailbox.commands if command.upper().startswith(('FETCH', 'UID FETCH')))
+        print(f"fetch_chunk_size={chunk_size:<4} {elapsed:7.3f}s  {fetches:4d} FETCH commands")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
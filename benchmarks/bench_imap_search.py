@@ -0,0 +1,94 @@
+"""
+"Unread from the boss since last week" in a large mailbox: filtering on the client vs IMAP SEARCH.
+
+"client" is what callers had to do before filters existed: list every
+message with mode=headers and filter the records themselves (and they could
+not even see the \\Seen flag). "server" passes the filters, so the server does
+the matching and only the matching messages are fetched. The last two lines
+compare the size of a plain SEARCH answer with an ESEARCH one for the same
+mailbox.
+
+    python benchmarks/bench_imap_search.py [--messages 2000] [--rtt 0.02]
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--rtt', type=float, default=0.02, help="seconds added to every server answer")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.pool import imap_pool
+    from email_app.service import EmailReceiver
+
+    start_day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = [
+        make_message(
+            index,
+            sender='boss@example.com' if index % 50 == 0 else None,
+            day=start_day + timedelta(hours=index * 4)
+        )
+        for index in range(args.messages)
+    ]
+    mailbox = Mailbox(messages)
+    # Everything is read except every other message from the boss
+    for index, uid in enumerate(mailbox.uids):
+        if index % 100 != 50:
+            mailbox.set_flags(uid, ['\\Seen'])
+    since = (start_day + timedelta(hours=(args.messages - 200) * 4)).date()
+    filters = {'from': 'boss@example.com', 'unseen': True, 'since': since}
+
+    server = FakeIMAPServer(mailbox, rtt=args.rtt, capabilities=('IMAP4rev1', 'ESEARCH')).start()
+    config = {
+        'host': '127.0.0.1',
+        'port': server.port,
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'protocol': 'IMAP',
+        'folder': 'INBOX',
+        'mode': 'headers'
+    }
+    print(f"{args.messages} messages, {args.rtt * 1000:.0f}ms RTT, filters {filters}")
+
+    def run(label, receive_config, pick=None):
+        imap_pool.close_all()
+        server.bytes_sent = 0
+        begin = time.perf_counter()
+        result = EmailReceiver.receive_emails(receive_config)
+        emails = pick(result['emails']) if pick else result['emails']
+        elapsed = time.perf_counter() - begin
+        print(f"{label:8} {elapsed:7.3f}s  {server.bytes_sent / 1024:9.1f}KB from server  {len(emails)} matches")
+
+    def client_side(emails):
+        # The headers listing carries no flags, so "unread" cannot be checked here at all
+        return [
+            email for email in emails
+            if 'boss@example.com' in email['from'] and
+            datetime.strptime(email['date'][5:16], '%d %b %Y').date() >= since
+        ]
+
+    run('client', {**config, 'max_emails': args.messages}, pick=client_side)
+    run('server', {**config, 'max_emails': 100, 'filters': filters})
+
+    for capabilities in (('IMAP4rev1',), ('IMAP4rev1', 'ESEARCH')):
+        server.capabilities = list(capabilities)
+        imap_pool.close_all()
+        EmailReceiver.receive_emails({**config, 'max_emails': 1})
+        server.bytes_sent = 0
+        EmailReceiver.receive_emails({**config, 'max_emails': 1})
+        label = 'ESEARCH' if 'ESEARCH' in capabilities else 'SEARCH'
+        print(f"{label:8} newest message of {args.messages}: {server.bytes_sent / 1024:7.1f}KB from server")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Encode/decode throughput of the API's JSON bodies: DRF's stdlib-json
+JSONRenderer/JSONParser vs FastJSONRenderer/FastJSONParser.
+
+The receive response holds 50 messages of the mixed corpus from
+bench_parse_corpus.py, parsed in full mode, so attachments are inlined as
+base64 the way POST /api/receive/ returns them. The send request is one
+email with base64 attachments, as POST /api/send/ receives it.
+
+    python benchmarks/bench_json_codec.py [--messages 50] [--rounds 5]
+"""
+import argparse
+import base64
+import io
+import os
+import time
+
+from _django import setup
+from bench_parse_corpus import make_corpus
+
+
+def best_time(function, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from email_app import fastjson
+    from email_app.parsers import FastJSONParser
+    from email_app.renderers import FastJSONRenderer
+    from email_app.service import EmailReceiver
+
+    emails = []
+    for uid, raw in enumerate(make_corpus(args.messages), 1):
+        emails.append({'uid': uid, 'size': len(raw), **EmailReceiver._message_record(raw, False)})
+    receive_response = {'success': True, 'emails': emails}
+    send_request = {
+        'sender': 'sender@example.com',
+        'recipients': [f'user{index}@example.com' for index in range(20)],
+        'subject': 'Quarterly report',
+        'body': 'Please find the reports attached.',
+        'attachments': [
+            {'filename': f'report-{index}.pdf', 'content_type': 'application/pdf',
+             'content': base64.b64encode(os.urandom(2 * 1024 * 1024)).decode('ascii')}
+            for index in range(4)
+        ]
+    }
+
+    print(f"orjson {'installed' if fastjson.orjson else 'not installed: both rows use stdlib json'}, "
+          f"best of {args.rounds} rounds")
+    for label, data in ((f'receive response, {len(emails)} messages', receive_response),
+                        ('send request, 4 x 2MB attachments', send_request)):
+        body = JSONRenderer().render(data)
+        assert FastJSONRenderer().render(data) == body
+        megabytes = len(body) / 1024 / 1024
+        print(f"{label} ({megabytes:.1f}MB):")
+        for name, renderer in (('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())):
+            elapsed = best_time(lambda: renderer.render(data), args.rounds)
+            print(f"  encode {name:18} {elapsed * 1000:8.1f}ms  {megabytes / elapsed:8.1f}MB/s")
+        for name, json_parser in (('JSONParser', JSONParser()), ('FastJSONParser', FastJSONParser())):
+            elapsed = best_time(lambda: json_parser.parse(io.BytesIO(body), 'application/json', {}), args.rounds)
+            print(f"  decode {name:18} {elapsed * 1000:8.1f}ms  {megabytes / elapsed:8.1f}MB/s")
+
+
+if __name__ == '__main__':
+    main()
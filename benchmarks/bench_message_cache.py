@@ -0,0 +1,57 @@
+"""
+Cold vs repeated receive of the same messages with the parsed-message cache.
+
+    python benchmarks/bench_message_cache.py [--messages 50] [--rtt 0.02] [--backend local|django]
+"""
+import argparse
+import time
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--attachment-size', type=int, default=100000)
+    parser.add_argument('--rtt', type=float, default=0.02, help="seconds added to every server answer")
+    parser.add_argument('--backend', choices=['local', 'django'], default='local')
+    args = parser.parse_args()
+
+    setup()
+    from email_app import cache
+    from email_app.service import EmailReceiver
+
+    if args.backend == 'django':
+        cache.message_cache.backend = cache.DjangoCacheBackend()
+    mailbox = Mailbox(make_message(i, attachment_size=args.attachment_size) for i in range(args.messages))
+    server = FakeIMAPServer(mailbox, rtt=args.rtt).start()
+    config = {
+        'host': '127.0.0.1',
+        'port': server.port,
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'protocol': 'IMAP',
+        'folder': 'INBOX',
+        'max_emails': args.messages
+    }
+
+    print(f"{args.messages} messages with a {args.attachment_size // 1000}KB attachment, "
+          f"{args.rtt * 1000:.0f}ms RTT, {args.backend} backend")
+    cache.message_cache.clear()
+    for label in ('cold', 'repeat'):
+        mailbox.commands.clear()
+        start = time.perf_counter()
+        result = EmailReceiver.receive_emails(config)
+        elapsed = time.perf_counter() - start
+        assert result['success'] and len(result['emails']) == args.messages, result
+        fetches = sum(1 for command in mailbox.commands if command.upper().startswith('UID FETCH'))
+        print(f"{label:<7} {elapsed:7.3f}s  {fetches} FETCH commands")
+    print(cache.message_cache.stats())
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
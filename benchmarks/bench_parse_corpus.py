@@ -0,0 +1,174 @@
+"""
+Parse cost of full downloads (POP, and IMAP in full/metadata mode) on a corpus of multipart messages.
+
+"before" replays the old parse loop: the whole message fed line by line
+through email.message_from_bytes, walk() plus a separate numbering pass, and
+every text part decoded as UTF-8 a second time after get_payload(decode=True).
+"after" is the current EmailReceiver._message_record. The default corpus is generated and mixes the
+shapes real mailboxes are full of: quoted-printable alternatives in Latin-1
+and Windows-1252, newsletters with inline images, base64 PDF attachments,
+forwarded messages and RFC 2231 filenames. Point --mbox or --maildir at a real
+mailbox to use that instead.
+
+    python benchmarks/bench_parse_corpus.py [--messages 500] [--rounds 3] [--mbox PATH | --maildir PATH]
+"""
+import argparse
+import base64
+import email
+import mailbox
+import os
+import quopri
+import random
+import time
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from datetime import datetime, timezone
+
+from _django import setup
+
+WORDS = "the quick brown fox jumps over lazy dog café naïve façade crème brûlée über straße".split()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _base(rng, index):
+    message = EmailMessage()
+    message['Message-ID'] = make_msgid(domain='example.com')
+    message['Subject'] = f"Corpus message {index} – {_text(rng, 4)}"
+    message['From'] = f'Sender {index} <sender{index}@example.com>'
+    message['To'] = 'recipient@example.com'
+    message['Date'] = format_datetime(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    return message
+
+
+def make_corpus(count, seed=1):
+    """Deterministic list of raw messages in a realistic mix of MIME shapes"""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        message = _base(rng, index)
+        kind = index % 6
+        if kind == 0:
+            # plain text in an 8-bit legacy charset
+            message.set_content(_text(rng, 400), charset='iso-8859-1', cte='8bit')
+        elif kind == 1:
+            # newsletter: quoted-printable alternative in windows-1252
+            message.set_content(_text(rng, 300), charset='windows-1252', cte='quoted-printable')
+            message.add_alternative(f"<html><body><p>{_text(rng, 600)}</p></body></html>",
+                                    subtype='html', charset='windows-1252', cte='quoted-printable')
+        elif kind == 2:
+            # html with inline images
+            message.set_content(_text(rng, 200))
+            message.add_alternative(f'<html><body><img src="cid:logo"><p>{_text(rng, 400)}</p></body></html>', subtype='html')
+            html = message.get_payload()[1]
+            html.add_related(os.urandom(rng.randint(5_000, 30_000)), 'image', 'png', cid='<logo>')
+        elif kind == 3:
+            # office mail with a PDF or two
+            message.set_content(_text(rng, 150))
+            message.add_alternative(f"<p>{_text(rng, 150)}</p>", subtype='html')
+            for number in range(rng.randint(1, 2)):
+                message.add_attachment(os.urandom(rng.randint(50_000, 400_000)), 'application', 'pdf',
+                                       filename=f'report-{index}-{number}.pdf')
+        elif kind == 4:
+            # forwarded message with its own attachment
+            inner = _base(rng, index + count)
+            inner.set_content(_text(rng, 200))
+            inner.add_attachment(os.urandom(20_000), 'image', 'jpeg', filename='photo.jpg')
+            message.set_content("Forwarding this:\n\n" + _text(rng, 50))
+            message.add_attachment(inner)
+        else:
+            # non-ASCII attachment name (RFC 2231) and a text/plain attachment
+            message.set_content(_text(rng, 250), charset='utf-8')
+            message.add_attachment(_text(rng, 2000).encode('utf-8'), 'text', 'plain', filename='notes.txt')
+            message.add_attachment(os.urandom(rng.randint(10_000, 80_000)), 'application', 'octet-stream',
+                                   filename=f'données-été-{index}.bin')
+        corpus.append(message.as_bytes())
+    return corpus
+
+
+def load_corpus(args):
+    if args.mbox:
+        return [message.as_bytes() for message in mailbox.mbox(args.mbox)][:args.messages]
+    if args.maildir:
+        return [message.as_bytes() for message in mailbox.Maildir(args.maildir, create=False)][:args.messages]
+    return make_corpus(args.messages)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--mbox', help="parse the messages of this mbox file instead of the generated corpus")
+    parser.add_argument('--maildir', help="parse the messages of this Maildir instead of the generated corpus")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.service import EmailReceiver
+
+    def message_parts(message, prefix=''):
+        if message.get_content_maintype() == 'multipart' and isinstance(message.get_payload(), list):
+            for number, child in enumerate(message.get_payload(), 1):
+                yield from message_parts(child, f'{prefix}.{number}' if prefix else str(number))
+        else:
+            yield prefix or '1', message
+
+    def decode_body(payload, content_type):
+        try:
+            if content_type == 'base64':
+                return base64.b64decode(payload).decode('utf-8', errors='ignore')
+            elif content_type == 'quoted-printable':
+                return quopri.decodestring(payload).decode('utf-8', errors='ignore')
+            return payload.decode('utf-8', errors='ignore')
+        except Exception:
+            return payload
+
+    def legacy_record(raw_email, attachment_metadata):
+        email_message = email.message_from_bytes(raw_email)
+        part_numbers = {id(part): number for number, part in message_parts(email_message)}
+        record = {'subject': EmailReceiver._decode_subject(email_message.get('Subject', '')),
+                  'body': '', 'html_body': '', 'attachments': []}
+        for part in email_message.walk():
+            content_type = part.get_content_type()
+            if content_type == 'text/plain':
+                record['body'] = decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
+            elif content_type == 'text/html':
+                record['html_body'] = decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
+            elif part.get_filename():
+                attachment = {'part': part_numbers.get(id(part)),
+                              'filename': EmailReceiver._decode_subject(part.get_filename()),
+                              'mimetype': content_type}
+                if attachment_metadata:
+                    attachment['size'] = len(part.get_payload().encode('utf-8', errors='ignore'))
+                else:
+                    attachment['content'] = base64.b64encode(part.get_payload(decode=True)).decode('utf-8')
+                record['attachments'].append(attachment)
+        return record
+
+    corpus = load_corpus(args)
+    total = sum(len(raw) for raw in corpus)
+    print(f"{len(corpus)} messages, {total / 1024 / 1024:.1f}MB, best of {args.rounds} rounds")
+
+    for attachment_metadata in (False, True):
+        mode = 'metadata' if attachment_metadata else 'full'
+        for label, parse in (('before', legacy_record), ('after', EmailReceiver._message_record)):
+            best = None
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                for raw in corpus:
+                    parse(raw, attachment_metadata)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{mode:8} {label:6} {best:7.3f}s  {len(corpus) / best:8.1f} msg/s  {total / best / 1024 / 1024:6.1f}MB/s")
+
+    # What the two versions make of the same text: mojibake vs the declared charset
+    sample = corpus[0]
+    before = legacy_record(sample, True)['body'][:60]
+    after = EmailReceiver._message_record(sample, True)['body'][:60]
+    print(f"iso-8859-1 body before: {before!r}")
+    print(f"iso-8859-1 body after:  {after!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Wall time of receiving several mailboxes one after another vs through the fan-out pool,
+with one server that answers too slowly and runs into the per-mailbox timeout.
+
+All fake servers listen on 127.0.0.1, so they share one per-host limit
+(--per-host) here; real mailboxes on different servers do not.
+
+    python benchmarks/bench_receive_multi.py [--mailboxes 8] [--rtt 0.02] [--slow-rtt 3] [--timeout 2]
+"""
+import argparse
+import time
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mailboxes', type=int, default=8, help="mailboxes on responsive servers")
+    parser.add_argument('--rtt', type=float, default=0.02, help="seconds added to every server answer")
+    parser.add_argument('--slow-rtt', type=float, default=3.0, help="answer delay of the slow server")
+    parser.add_argument('--timeout', type=float, default=2.0, help="seconds allowed per mailbox")
+    parser.add_argument('--per-host', type=int, default=16)
+    args = parser.parse_args()
+
+    setup()
+    from email_app.fanout import mailbox_fanout
+    from email_app.pool import imap_pool
+    from email_app.service import EmailReceiver
+
+    mailbox_fanout.per_host = args.per_host
+    messages = [make_message(i) for i in range(10)]
+    servers = [FakeIMAPServer(Mailbox(messages), rtt=args.rtt).start() for _ in range(args.mailboxes)]
+    slow = FakeIMAPServer(Mailbox(messages), rtt=args.slow_rtt).start()
+    configs = [
+        {
+            'host': '127.0.0.1',
+            'port': server.port,
+            'username': f'bench{index}@example.com',
+            'password': 'secret',
+            'use_ssl': False,
+            'use_tls': False,
+            'protocol': 'IMAP',
+            'folder': 'INBOX',
+            'max_emails': 10,
+            'mode': 'headers'
+        }
+        for index, server in enumerate(servers + [slow])
+    ]
+
+    print(f"{args.mailboxes} mailboxes at {args.rtt * 1000:.0f}ms RTT + 1 at {args.slow_rtt:.1f}s, "
+          f"timeout {args.timeout:.1f}s")
+
+    imap_pool.close_all()
+    start = time.perf_counter()
+    results = [EmailReceiver.receive_emails({**config, 'timeout': args.timeout}) for config in configs]
+    elapsed = time.perf_counter() - start
+    print(f"sequential {elapsed:7.3f}s  {sum(result['success'] for result in results)} of {len(configs)} succeeded")
+
+    imap_pool.close_all()
+    start = time.perf_counter()
+    results = mailbox_fanout.receive_many(configs, timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+    errors = sorted({result.get('error', 'RECEIVE_ERROR') for result in results if not result['success']})
+    print(f"fan-out    {elapsed:7.3f}s  {sum(result['success'] for result in results)} of {len(configs)} succeeded "
+          f"{errors}")
+
+    mailbox_fanout.shutdown()
+    for server in servers + [slow]:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Walking a large folder with cursor pagination, and what a page costs as the folder grows.
+
+The first part drains an archive over IMAP (with ESEARCH) page by page,
+following next_cursor, and reports the traced peak memory of each page
+request: it stays flat from the first page to the last. The fake server runs
+in the same process, so its allocations are included.
+
+The second part times the UID selection alone for folders of growing size:
+"before" replays the old approach (every UID of the SEARCH answer split out,
+sorted and sliced), "after" is EmailReceiver._imap_select on the ESEARCH
+answer, which stays a handful of ranges however many messages match.
+
+    python benchmarks/bench_receive_pages.py [--messages 3000] [--page 100]
+"""
+import argparse
+import time
+import tracemalloc
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--page', type=int, default=100, help="max_emails per page")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.pool import imap_pool
+    from email_app.service import EmailReceiver
+
+    server = FakeIMAPServer(
+        Mailbox(make_message(index, body_size=256) for index in range(args.messages)),
+        capabilities=('IMAP4rev1', 'ESEARCH')
+    ).start()
+    config = {
+        'host': '127.0.0.1',
+        'port': server.port,
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'protocol': 'IMAP',
+        'folder': 'INBOX',
+        'max_emails': args.page,
+        'mode': 'headers'
+    }
+
+    imap_pool.close_all()
+    EmailReceiver.receive_emails({**config, 'max_emails': 1})  # log in and warm the server's header cache
+    cursor, received, peaks = None, 0, []
+    start = time.perf_counter()
+    while True:
+        tracemalloc.start()
+        result = EmailReceiver.receive_emails({**config, 'cursor': cursor})
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        received += len(result['emails'])
+        cursor = result['next_cursor']
+        if cursor is None:
+            break
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    print(f"drained {received} of {args.messages} messages in {len(peaks)} pages of {args.page}, {elapsed:.2f}s")
+    print(f"peak per page: first {peaks[0] / 1024:.0f}KB, middle {peaks[len(peaks) // 2] / 1024:.0f}KB, "
+          f"last {peaks[-1] / 1024:.0f}KB, max {max(peaks) / 1024:.0f}KB")
+
+    cursor = {'since_uid': None, 'since_modseq': None, 'uidvalidity_changed': False}
+    print("\nUID selection for one page of the newest messages")
+    for size in (10_000, 100_000, 1_000_000):
+        search = [b' '.join(str(uid).encode() for uid in range(1, size + 1))]
+        esearch = [f'(TAG "A0001") UID ALL 1:{size}'.encode()]
+        for label, select in (
+            ('before', lambda: sorted(search[0].split(), key=int)[::-1][:args.page]),
+            ('after', lambda: EmailReceiver._imap_select(config, 'SEARCH', [None], esearch, cursor, 1, None)[0]),
+        ):
+            tracemalloc.start()
+            start = time.perf_counter()
+            select()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{size:>9} messages {label:6} {elapsed * 1000:9.2f}ms  peak {peak / 1024:9.1f}KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Latency of repeated receive calls on one mailbox, with and without the IMAP/POP session pools.
+
+The fake servers do not speak TLS, so the saving shown is the login round
+trips only; over IMAPS/POP3S the pool also skips the TLS handshake.
+
+    python benchmarks/bench_receive_sessions.py [--rtt 0.02] [--calls 20]
+"""
+import argparse
+import time
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+from fake_pop import FakePOPServer, Maildrop
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rtt', type=float, default=0.02, help="seconds added to every server answer")
+    parser.add_argument('--calls', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from email_app.pool import imap_pool, pop_pool
+    from email_app.service import EmailReceiver
+
+    messages = [make_message(i) for i in range(20)]
+    imap_server = FakeIMAPServer(Mailbox(messages), rtt=args.rtt, capabilities=('IMAP4rev1', 'ENABLE', 'CONDSTORE')).start()
+    pop_server = FakePOPServer(Maildrop(messages), rtt=args.rtt).start()
+    config = {
+        'host': '127.0.0.1',
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'folder': 'INBOX',
+        'max_emails': 5,
+        'mode': 'headers'
+    }
+
+    print(f"{args.calls} receive calls (mode=headers, 5 messages), {args.rtt * 1000:.0f}ms RTT")
+    for protocol, server, pool in (('IMAP', imap_server, imap_pool), ('POP', pop_server, pop_pool)):
+        for pooled in (False, True):
+            pool.close_all()
+            max_size = pool.max_size
+            if not pooled:
+                pool.max_size = 0
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                result = EmailReceiver.receive_emails({**config, 'protocol': protocol, 'port': server.port})
+                assert result['success'], result
+            elapsed = time.perf_counter() - start
+            pool.max_size = max_size
+            label = 'pooled' if pooled else 'new session per call'
+            print(f"{protocol:<4} {label:<21} {elapsed / args.calls * 1000:7.1f}ms per call")
+        pool.close_all()
+
+
+if __name__ == '__main__':
+    main()
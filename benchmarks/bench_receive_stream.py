@@ -0,0 +1,74 @@
+"""
+Time to first byte and peak Python memory of a receive, buffered JSON vs NDJSON streaming.
+
+Messages carry a base64 attachment so each parsed record is large.
+
+    python benchmarks/bench_receive_stream.py [--attachment-size 200000] [--chunk-size 10]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from _django import setup
+from fake_imap import FakeIMAPServer, Mailbox, make_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--attachment-size', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=10)
+    parser.add_argument('--rtt', type=float, default=0.005, help="seconds added to every server answer")
+    args = parser.parse_args()
+
+    setup()
+    from email_app.service import EmailReceiver
+    from email_app.views import ReceiveEmailView
+
+    counts = (20, 100, 200)
+    mailbox = Mailbox(make_message(i, attachment_size=args.attachment_size) for i in range(max(counts)))
+    server = FakeIMAPServer(mailbox, rtt=args.rtt).start()
+    config = {
+        'host': '127.0.0.1',
+        'port': server.port,
+        'username': 'bench@example.com',
+        'password': 'secret',
+        'use_ssl': False,
+        'use_tls': False,
+        'protocol': 'IMAP',
+        'folder': 'INBOX',
+        'fetch_chunk_size': args.chunk_size
+    }
+
+    print(f"{args.attachment_size // 1000}KB attachment per message, fetch_chunk_size={args.chunk_size}")
+    for count in counts:
+        tracemalloc.start()
+        start = time.perf_counter()
+        body = json.dumps(EmailReceiver.receive_emails({**config, 'max_emails': count})).encode()
+        first_byte = time.perf_counter() - start
+        _, buffered_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del body
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = ReceiveEmailView.stream({**config, 'max_emails': count})
+        stream_first_byte = None
+        lines = 0
+        for line in response.streaming_content:
+            if stream_first_byte is None:
+                stream_first_byte = time.perf_counter() - start
+            lines += 1
+        _, stream_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert lines == count + 1, lines
+
+        print(
+            f"max_emails={count:<4} json: first byte {first_byte:6.3f}s peak {buffered_peak / 2**20:6.1f}MB   "
+            f"ndjson: first byte {stream_first_byte:6.3f}s peak {stream_peak / 2**20:6.1f}MB"
+        )
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
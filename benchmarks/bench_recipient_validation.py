@@ -0,0 +1,79 @@
+"""
+Recipient validation cost on the send path, over 10k addresses sent as
+100-recipient messages.
+
+"before" is what a send did per message: ListField(child=EmailField()) in
+the serializer, then Django's validate_email again on every address in
+EmailService. "after" is EmailAddressListField plus
+EmailService.validate_email_addresses, both going through the cached
+address_validator: "cold" with an empty cache, "warm" when the same
+distribution lists are sent to again.
+
+    python benchmarks/bench_recipient_validation.py [--addresses 10000] [--per-message 100] [--rounds 5]
+"""
+import argparse
+import time
+
+from _django import setup
+
+
+def best_time(function, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--addresses', type=int, default=10000)
+    parser.add_argument('--per-message', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    from django.core.exceptions import ValidationError
+    from django.core.validators import validate_email
+    from rest_framework import serializers
+    from email_app.addresses import address_validator
+    from email_app.serializers import EmailAddressListField
+    from email_app.service import EmailService
+
+    domains = ['example.com', 'mail.example.org', 'corp.example.net', 'subsidiary.example.co.uk', 'gmail.com']
+    addresses = [f'first.last+{index}@{domains[index % len(domains)]}' for index in range(args.addresses)]
+    messages = [addresses[start:start + args.per_message] for start in range(0, len(addresses), args.per_message)]
+
+    legacy_field = serializers.ListField(child=serializers.EmailField(), min_length=1)
+    field = EmailAddressListField(min_length=1)
+
+    def before():
+        for recipients in messages:
+            legacy_field.run_validation(recipients)
+            for address in recipients:
+                try:
+                    validate_email(address)
+                except ValidationError:
+                    pass
+
+    def after():
+        for recipients in messages:
+            EmailService.validate_email_addresses(field.run_validation(recipients))
+
+    def after_cold():
+        address_validator.clear()
+        after()
+
+    print(f"{len(addresses)} addresses in {len(messages)} messages of {args.per_message}, best of {args.rounds} rounds")
+    for label, run in (('before (EmailField + validate_email)', before),
+                       ('after, cold cache', after_cold),
+                       ('after, warm cache', after)):
+        elapsed = best_time(run, args.rounds)
+        print(f"  {label:38} {elapsed * 1000:8.1f}ms  {elapsed / len(addresses) * 1e6:6.2f}us/address")
+    print(f"  cache {address_validator.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Queued sends during a relay outage: the retry engine brings every message
+through without a caller-side retry loop.
+
+The relay answers every recipient with 451 (try again later) for the first
+--outage seconds. All jobs are queued at once and fail together. Reported:
+how long after the relay is back the queue is drained, the attempts it took,
+and the retry delays drawn by the jittered backoff.
+
+Runs on a throwaway SQLite database file, like the one the queue uses
+(an in-memory database locks whole tables between threads).
+
+    python benchmarks/bench_send_retry.py [--jobs 200] [--workers 16] [--outage 1.0] [--base-delay 0.2]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from _django import setup
+from fake_smtp import FakeSMTPServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=16, help="queue worker threads")
+    parser.add_argument('--outage', type=float, default=1.0, help="seconds the relay answers 451")
+    parser.add_argument('--base-delay', type=float, default=0.2, help="backoff after the first failure")
+    args = parser.parse_args()
+
+    setup()
+    from django.db import connection
+    from django.test.utils import setup_databases, teardown_databases
+    from email_app.jobs import EmailQueue
+    from email_app.models import EmailJob
+    from email_app.pool import smtp_pool
+
+    database_dir = tempfile.mkdtemp()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(database_dir, 'bench.sqlite3')
+    databases = setup_databases(verbosity=0, interactive=False)
+    server = FakeSMTPServer().start()
+    send_kwargs = {
+        'email_settings': {'host': '127.0.0.1', 'port': str(server.port), 'username': 'bench', 'password': 'secret'},
+        'sender': 'sender@example.com',
+        'subject': 'Receipt',
+        'body': 'Thank you for your order.'
+    }
+
+    queue = EmailQueue(workers=0, poll_interval=0.01, max_attempts=20,
+                       retry_base_delay=args.base_delay, retry_max_delay=60)
+    delays = []
+    retry_delay = queue.retry_delay
+
+    def recorded_retry_delay(failures):
+        delays.append((failures, retry_delay(failures)))
+        return delays[-1][1]
+
+    queue.retry_delay = recorded_retry_delay
+    for index in range(args.jobs):
+        queue.enqueue({**send_kwargs, 'recipients': [f'customer{index}@example.com']})
+
+    print(f"{args.jobs} jobs, {args.workers} workers, relay answers 451 for {args.outage:.1f}s, "
+          f"backoff from {args.base_delay * 1000:.0f}ms")
+    server.defer.add('example.com')
+    stop = threading.Event()
+    threads = [threading.Thread(target=queue.run_forever, args=(stop,), daemon=True) for _ in range(args.workers)]
+    start = time.monotonic()
+    threading.Timer(args.outage, server.defer.clear).start()
+    for thread in threads:
+        thread.start()
+    while EmailJob.objects.exclude(status__in=[EmailJob.STATUS_SENT, EmailJob.STATUS_FAILED]).exists():
+        time.sleep(0.05)
+    drained = time.monotonic() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    sent = EmailJob.objects.filter(status=EmailJob.STATUS_SENT).count()
+    per_job = Counter(EmailJob.objects.values_list('attempts', flat=True))
+    print(f"{sent} of {args.jobs} sent, drained {drained - args.outage:.2f}s after the relay was back")
+    print(f"{sum(count * jobs for count, jobs in per_job.items())} attempts: " + ', '.join(f"{jobs} jobs x {count}" for count, jobs in sorted(per_job.items())))
+    for failures in sorted({failures for failures, _ in delays}):
+        drawn = [delay for number, delay in delays if number == failures]
+        print(f"  retry delay after {failures} failure(s): {min(drawn) * 1000:6.0f}-{max(drawn) * 1000:6.0f}ms "
+              f"({len(drawn)} jobs)")
+
+    smtp_pool.close_all()
+    server.shutdown()
+    teardown_databases(databases, verbosity=0)
+    os.rmdir(database_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Worker boot time and per-request latency of the full settings (src.settings)
+vs the API-only profile (src.settings_api).
+
+Every run is a fresh interpreter, like a gunicorn worker without --preload:
+"boot" is importing src.wsgi (django.setup(), app registry, middleware
+chain), "first request" adds the URL conf and view imports, and the request
+rows are the steady state through the WSGI handler.
+
+    python benchmarks/bench_settings_profiles.py [--runs 10] [--requests 2000]
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from _django import SRC_DIR
+
+PROFILES = ('src.settings', 'src.settings_api')
+TOKEN = 'benchmark-static-token'
+
+
+def environ(method, path, token, body=b'', content_type=''):
+    env = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_ACCEPT': 'application/json',
+        'HTTP_USER_AGENT': 'bench/1.0',
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+    }
+    if token is not None:
+        env['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return env
+
+
+def child(requests):
+    """Runs inside the measured interpreter; prints one JSON line"""
+    start = time.perf_counter()
+    from src.wsgi import application
+    boot = time.perf_counter() - start
+
+    import logging
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    def start_response(status, headers):
+        pass
+
+    def call(*args, **kwargs):
+        response = application(environ(*args, **kwargs), start_response)
+        response.close()
+        return response.status_code
+
+    start = time.perf_counter()
+    call('GET', '/api/send/', TOKEN)
+    first = time.perf_counter() - start
+    modules = len(sys.modules)
+
+    # An invalid receive payload: parsed and validated, no server contacted
+    invalid = json.dumps({'host': 'imap.example.com', 'port': 'x', 'username': 'u', 'password': 'p'}).encode()
+    rows = {}
+    for label, args in (('GET /api/send/', ('GET', '/api/send/', TOKEN)),
+                        ('POST /api/receive/ (400)', ('POST', '/api/receive/', TOKEN, invalid, 'application/json')),
+                        ('no token (401)', ('GET', '/api/send/', None))):
+        status = call(*args)
+        start = time.perf_counter()
+        for _ in range(requests):
+            call(*args)
+        rows[label] = ((time.perf_counter() - start) / requests * 1e6, status)
+
+    print(json.dumps({'boot': boot, 'first': first, 'modules': modules, 'rows': rows}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10, help="fresh interpreters per profile")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, SRC_DIR)
+        child(args.requests)
+        return
+
+    print(f"{args.runs} fresh interpreters per profile, {args.requests} requests per row")
+    for profile in PROFILES:
+        # No queue workers: they would poll the database during the measurements
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': profile, 'JWT_ACCESS_TOKEN': TOKEN, 'EMAIL_QUEUE_WORKERS': '0'}
+        results = []
+        walls = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', '--requests', str(args.requests)],
+                                    env=env, cwd=SRC_DIR, capture_output=True, text=True, check=True).stdout
+            walls.append(time.perf_counter() - start)
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        def spread(values, scale, unit):
+            values = [value * scale for value in values]
+            return f"{min(values):8.1f}{unit} min {statistics.median(values):8.1f}{unit} median"
+
+        print(f"{profile}: {results[0]['modules']} modules loaded after the first request")
+        print(f"  boot (import src.wsgi)     {spread([r['boot'] for r in results], 1000, 'ms')}")
+        print(f"  boot + first request       {spread([r['boot'] + r['first'] for r in results], 1000, 'ms')}")
+        print(f"  process wall time          {spread(walls, 1, 's ')}")
+        for label in results[0]['rows']:
+            print(f"  {label:26} {spread([r['rows'][label][0] for r in results], 1, 'us')}  "
+                  f"[{results[0]['rows'][label][1]}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Several worker processes sending through one SMTP account whose provider
+allows only --max-sessions connections at once: without a limit vs with
+SMTP_MAX_CONNECTIONS_PER_ACCOUNT set to the provider's cap (and, with
+--per-minute, a message rate as well).
+
+Every worker is a separate interpreter with its own threads, like gunicorn
+workers with --threads; only the lock files in a shared SMTP_RATE_LIMIT_DIR
+tie them together. Reported per mode: connections opened and those the
+provider turned away with 421, how the sends ended, and the wall time.
+
+    python benchmarks/bench_smtp_rate_limit.py [--processes 4] [--threads 4] [--messages 10] [--max-sessions 2]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from _django import SRC_DIR, setup
+from fake_smtp import FakeSMTPServer
+
+
+def child(port, threads, messages):
+    """Runs inside one worker process; prints one JSON line of result codes"""
+    setup()
+    from email_app.pool import smtp_pool
+    from email_app.service import EmailService
+
+    send_kwargs = {
+        'email_settings': {'host': '127.0.0.1', 'port': str(port), 'username': 'bench', 'password': 'secret'},
+        'sender': 'sender@example.com',
+        'subject': 'Receipt',
+        'body': 'Thank you for your order.'
+    }
+
+    def send(index):
+        result = EmailService.send_email(**send_kwargs, recipients=[f'customer{index}@example.com'])
+        return 'SENT' if result['success'] else result['error']
+
+    with ThreadPoolExecutor(threads) as executor:
+        outcomes = Counter(executor.map(send, range(messages)))
+    # Log out like a worker shutting down, so the provider sees the sessions end
+    smtp_pool.close_all()
+    print(json.dumps(outcomes))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4, help="worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="threads per worker")
+    parser.add_argument('--messages', type=int, default=10, help="messages per worker")
+    parser.add_argument('--max-sessions', type=int, default=2, help="connections the provider allows at once")
+    parser.add_argument('--per-minute', type=float, default=0, help="SMTP_RATE_LIMIT_PER_MINUTE when limited")
+    parser.add_argument('--rtt', type=float, default=0.01, help="seconds added to every server reply")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.threads, args.messages)
+        return
+
+    server = FakeSMTPServer(rtt=args.rtt, max_sessions=args.max_sessions).start()
+    total = args.processes * args.messages
+    print(f"{args.processes} processes x {args.threads} threads, {total} messages, "
+          f"provider allows {args.max_sessions} connections, {args.rtt * 1000:.0f}ms per reply")
+    modes = (
+        ('no limit', {}),
+        ('limited', {'SMTP_MAX_CONNECTIONS_PER_ACCOUNT': str(args.max_sessions),
+                     'SMTP_RATE_LIMIT_PER_MINUTE': str(args.per_minute),
+                     'SMTP_RATE_LIMIT_MAX_WAIT': '30'})
+    )
+    for label, limits in modes:
+        limit_dir = tempfile.mkdtemp()
+        env = {**os.environ, 'SMTP_RATE_LIMIT_DIR': limit_dir, **limits}
+        server.throttled = server.connections = 0
+        del server.deliveries[:]
+        command = [sys.executable, os.path.abspath(__file__), '--child', str(server.port),
+                   '--threads', str(args.threads), '--messages', str(args.messages)]
+        start = time.monotonic()
+        workers = [subprocess.Popen(command, env=env, cwd=SRC_DIR, stdout=subprocess.PIPE, text=True)
+                   for _ in range(args.processes)]
+        outcomes = Counter()
+        for worker in workers:
+            output, _ = worker.communicate()
+            outcomes.update(json.loads(output.strip().splitlines()[-1]))
+        elapsed = time.monotonic() - start
+        shutil.rmtree(limit_dir)
+
+        print(f"{label:9} {elapsed:6.2f}s  {server.connections:3} connections opened, "
+              f"{server.throttled} turned away with 421  {len(server.deliveries)} of {total} delivered")
+        print(f"{'':9} results: " + ', '.join(f"{code} {count}" for code, count in outcomes.most_common()))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+Minimal in-process IMAP4rev1 server for the receive benchmarks.
+
+It understands just enough of the protocol for imaplib and EmailReceiver:
+LOGIN, ENABLE, SELECT/EXAMINE, SEARCH (the keys EmailReceiver sends, with
+ESEARCH's RETURN and a CHARSET literal), SORT, FETCH (with CONDSTORE's CHANGEDSINCE,
+BODYSTRUCTURE and BODY[<section>]), STORE and their UID forms, NOOP, CLOSE and LOGOUT. Every command answer is delayed
+by ``rtt`` seconds to model a remote server. Dates are taken from the Date
+header, which stands in for the internal date.
+"""
+import email
+import re
+import socketserver
+import threading
+import time
+from email.header import decode_header, make_header
+from email.utils import format_datetime, make_msgid, parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+def make_message(index, body_size=2048, attachment_size=0, sender=None, day=None):
+    """A simple RFC 5322 message; multipart with a base64 attachment when attachment_size > 0"""
+    date = format_datetime(day or datetime(2024, 1, 1, tzinfo=timezone.utc))
+    headers = (
+        f"Message-ID: {make_msgid(domain='example.com')}\r\n"
+        f"Subject: Benchmark message {index}\r\n"
+        f"From: {sender or f'sender{index}@example.com'}\r\n"
+        f"To: recipient@example.com\r\n"
+        f"Date: {date}\r\n"
+        f"MIME-Version: 1.0\r\n"
+    )
+    text = ("Lorem ipsum dolor sit amet. " * (body_size // 28 + 1))[:body_size]
+    body = "\r\n".join(text[i:i + 76] for i in range(0, len(text), 76))
+    if not attachment_size:
+        return (headers + "Content-Type: text/plain; charset=utf-8\r\n\r\n" + body + "\r\n").encode()
+
+    import base64
+    attachment = base64.encodebytes((bytes(range(256)) * (attachment_size // 256 + 1))[:attachment_size])
+    return (
+        headers
+        + 'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+        + "--b1\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n" + body + "\r\n"
+        + '--b1\r\nContent-Type: application/octet-stream\r\n'
+        + 'Content-Disposition: attachment; filename="data.bin"\r\n'
+        + "Content-Transfer-Encoding: base64\r\n\r\n"
+        + attachment.decode().replace("\n", "\r\n")
+        + "\r\n--b1--\r\n"
+    ).encode()
+
+
+def _quote(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' if value is not None else 'NIL'
+
+
+_SEARCH_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|(\([^)]*\))|(\S+)')
+
+
+def _search_tokens(args):
+    """Split SEARCH/SORT arguments into strings, parenthesised lists and atoms"""
+    return [
+        re.sub(r'\\(.)', r'\1', match.group(1)) if match.group(1) is not None else match.group(2) or match.group(3)
+        for match in _SEARCH_TOKEN_RE.finditer(args)
+    ]
+
+
+def _param_list(pairs):
+    return '(' + ' '.join(f'{_quote(k.upper())} {_quote(v)}' for k, v in pairs) + ')' if pairs else 'NIL'
+
+
+def _leaves(message, prefix=''):
+    """(section, part) pairs numbered the IMAP way"""
+    if message.is_multipart():
+        for number, child in enumerate(message.get_payload(), 1):
+            yield from _leaves(child, f'{prefix}.{number}' if prefix else str(number))
+    else:
+        yield prefix or '1', message
+
+
+def bodystructure(message):
+    """BODYSTRUCTURE of an email.message.Message"""
+    if message.is_multipart():
+        children = ''.join(bodystructure(child) for child in message.get_payload())
+        params = [(k, v) for k, v in message.get_params()[1:]]
+        return f'({children} {_quote(message.get_content_subtype().upper())} {_param_list(params)} NIL NIL NIL)'
+    body = message.get_payload().encode()
+    params = [(k, v) for k, v in message.get_params()[1:]] if message.get_params() else []
+    fields = [
+        _quote(message.get_content_maintype().upper()),
+        _quote(message.get_content_subtype().upper()),
+        _param_list(params),
+        'NIL', 'NIL',
+        _quote((message.get('Content-Transfer-Encoding') or '7BIT').upper()),
+        str(len(body)),
+    ]
+    if message.get_content_maintype() == 'text':
+        fields.append(str(body.count(b'\n') + 1))
+    disposition = message.get_content_disposition()
+    if disposition:
+        filename = message.get_param('filename', header='content-disposition')
+        fields += ['NIL', f'({_quote(disposition.upper())} {_param_list([("filename", filename)] if filename else [])})']
+    return '(' + ' '.join(fields) + ')'
+
+
+class Mailbox:
+    def __init__(self, messages, uidvalidity=1):
+        self.messages = list(messages)
+        self.uids = list(range(1, len(self.messages) + 1))
+        self.flags = [[] for _ in self.messages]
+        self.modseqs = [1 for _ in self.messages]
+        self.highest_modseq = 1
+        self.uidvalidity = uidvalidity
+        self.commands = []
+        self._headers = {}
+
+    def headers(self, number):
+        """Parsed headers of message number, cached"""
+        if number not in self._headers:
+            self._headers[number] = email.message_from_bytes(self.messages[number - 1].split(b'\r\n\r\n', 1)[0])
+        return self._headers[number]
+
+    def append(self, raw):
+        self.messages.append(raw)
+        self.uids.append((self.uids[-1] if self.uids else 0) + 1)
+        self.flags.append([])
+        self.highest_modseq += 1
+        self.modseqs.append(self.highest_modseq)
+
+    def set_flags(self, uid, flags):
+        index = self.uids.index(uid)
+        self.flags[index] = list(flags)
+        self.highest_modseq += 1
+        self.modseqs[index] = self.highest_modseq
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        self.server.bytes_sent += len(data)
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def respond(self, tag, text):
+        time.sleep(self.server.rtt)
+        self.send(f"{tag} {text}\r\n".encode())
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.send(b"* OK fake IMAP4rev1 ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            # A literal ends the line with {size}; splice it back in as a quoted string
+            while re.search(rb'\{(\d+)\}\r\n$', line):
+                size = int(re.search(rb'\{(\d+)\}\r\n$', line).group(1))
+                self.send(b"+ Ready for literal\r\n")
+                literal = self.rfile.read(size).decode('utf-8')
+                quoted = '"' + literal.replace('\\', '\\\\').replace('"', '\\"') + '"'
+                line = re.sub(rb'\{\d+\}\r\n$', lambda _: quoted.encode(), line) + self.rfile.readline()
+            tag, _, rest = line.decode().strip().partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            mailbox.commands.append(rest)
+
+            if command == 'UID':
+                sub, _, args = args.partition(' ')
+                command = sub.upper()
+                uid_mode = True
+            else:
+                uid_mode = False
+
+            if command == 'CAPABILITY':
+                self.send(f"* CAPABILITY {' '.join(self.server.capabilities)}\r\n".encode())
+                self.respond(tag, "OK CAPABILITY completed")
+            elif command == 'LOGIN':
+                self.respond(tag, "OK LOGIN completed")
+            elif command == 'ENABLE':
+                self.send(f"* ENABLED {args}\r\n".encode())
+                self.respond(tag, "OK ENABLE completed")
+            elif command in ('SELECT', 'EXAMINE'):
+                self.send(
+                    f"* {len(mailbox.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                    f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n"
+                    f"* OK [UIDNEXT {(mailbox.uids[-1] if mailbox.uids else 0) + 1}] Predicted next UID\r\n".encode()
+                )
+                if 'CONDSTORE' in self.server.capabilities:
+                    self.send(f"* OK [HIGHESTMODSEQ {mailbox.highest_modseq}] Highest\r\n".encode())
+                self.respond(tag, f"OK [READ-WRITE] {command} completed")
+            elif command in ('SEARCH', 'SORT'):
+                self.search(tag, args, uid_mode, sort=command == 'SORT')
+            elif command == 'FETCH':
+                self.fetch(tag, args, uid_mode)
+            elif command == 'STORE':
+                self.store(tag, args, uid_mode)
+            elif command in ('NOOP', 'CLOSE', 'CHECK'):
+                self.respond(tag, f"OK {command} completed")
+            elif command == 'LOGOUT':
+                self.send(b"* BYE logging out\r\n")
+                self.respond(tag, "OK LOGOUT completed")
+                return
+            else:
+                self.respond(tag, f"BAD unknown command {command}")
+
+    def _numbers(self, sequence_set, uid_mode):
+        """Resolve a sequence set to 1-based message numbers"""
+        mailbox = self.server.mailbox
+        total = len(mailbox.messages)
+        keys = mailbox.uids if uid_mode else list(range(1, total + 1))
+        highest = keys[-1] if keys else 0
+        wanted = set()
+        for part in sequence_set.split(','):
+            if ':' in part:
+                a, b = part.split(':')
+                a = highest if a == '*' else int(a)
+                b = highest if b == '*' else int(b)
+                wanted.update(range(min(a, b), max(a, b) + 1))
+            else:
+                wanted.add(highest if part == '*' else int(part))
+        return [index + 1 for index, key in enumerate(keys) if key in wanted]
+
+    def _matches(self, number, keys, uid_numbers):
+        """Whether message number matches the SEARCH keys (all of them)"""
+        mailbox = self.server.mailbox
+        headers = mailbox.headers(number)
+        day = parsedate_to_datetime(headers['Date']).date()
+        flags = mailbox.flags[number - 1]
+        keys = list(keys)
+        while keys:
+            key = keys.pop(0).upper()
+            if key == 'ALL':
+                continue
+            if key == 'UID':
+                keys.pop(0)
+                if number not in uid_numbers:
+                    return False
+            elif key in ('SINCE', 'BEFORE'):
+                limit = datetime.strptime(keys.pop(0), '%d-%b-%Y').date()
+                if (day < limit) if key == 'SINCE' else (day >= limit):
+                    return False
+            elif key in ('SEEN', 'UNSEEN', 'FLAGGED', 'UNFLAGGED'):
+                flag = '\\Seen' if key.endswith('SEEN') else '\\Flagged'
+                if (flag in flags) == key.startswith('UN'):
+                    return False
+            elif key == 'LARGER':
+                if len(mailbox.messages[number - 1]) <= int(keys.pop(0)):
+                    return False
+            elif key in ('FROM', 'TO', 'SUBJECT'):
+                value = str(make_header(decode_header(headers.get(key, ''))))
+                if keys.pop(0).lower() not in value.lower():
+                    return False
+            else:
+                raise ValueError(f'unsupported search key {key}')
+        return True
+
+    def search(self, tag, args, uid_mode, sort=False):
+        mailbox = self.server.mailbox
+        keys = _search_tokens(args)
+        esearch = False
+        if sort:
+            criteria, _charset, *keys = keys
+        if keys and keys[0].upper() == 'RETURN':
+            esearch = True
+            keys = keys[2:]
+        if keys and keys[0].upper() == 'CHARSET':
+            keys = keys[2:]
+        uid_numbers = set()
+        for key, value in zip(keys, keys[1:]):
+            if key.upper() == 'UID':
+                uid_numbers = set(self._numbers(value, True))
+        numbers = [n for n in range(1, len(mailbox.messages) + 1) if self._matches(n, keys, uid_numbers)]
+        if sort:
+            def date_of(n):
+                return parsedate_to_datetime(mailbox.headers(n)['Date'])
+            numbers.sort(key=lambda n: (date_of(n), n), reverse='REVERSE' in criteria.upper())
+        values = [mailbox.uids[n - 1] if uid_mode else n for n in numbers]
+        if esearch:
+            ranges = []
+            for value in sorted(values):
+                if ranges and ranges[-1][1] == value - 1:
+                    ranges[-1][1] = value
+                else:
+                    ranges.append([value, value])
+            found = ' ALL ' + ','.join(f'{a}:{b}' if a != b else str(a) for a, b in ranges) if ranges else ''
+            self.send(f'* ESEARCH (TAG "{tag}"){" UID" if uid_mode else ""}{found}\r\n'.encode())
+        else:
+            name = 'SORT' if sort else 'SEARCH'
+            self.send((f"* {name}" + "".join(f" {v}" for v in values) + "\r\n").encode())
+        self.respond(tag, f"OK {'SORT' if sort else 'SEARCH'} completed")
+
+    def store(self, tag, args, uid_mode):
+        mailbox = self.server.mailbox
+        sequence_set, _, rest = args.partition(' ')
+        action, _, flag_list = rest.partition(' ')
+        action = action.upper()
+        changes = flag_list.strip('()').split()
+        for number in self._numbers(sequence_set, uid_mode):
+            uid = mailbox.uids[number - 1]
+            flags = mailbox.flags[number - 1]
+            if action.startswith('+'):
+                flags = flags + [flag for flag in changes if flag not in flags]
+            elif action.startswith('-'):
+                flags = [flag for flag in flags if flag not in changes]
+            else:
+                flags = changes
+            mailbox.set_flags(uid, flags)
+            if not action.endswith('.SILENT'):
+                self.send(f"* {number} FETCH (UID {uid} FLAGS ({' '.join(flags)}))\r\n".encode())
+        self.respond(tag, "OK STORE completed")
+
+    def fetch(self, tag, args, uid_mode):
+        mailbox = self.server.mailbox
+        sequence_set, _, items = args.partition(' ')
+        items = items.upper()
+        changed_since = re.search(r'CHANGEDSINCE (\d+)', items)
+        for number in self._numbers(sequence_set, uid_mode):
+            raw = mailbox.messages[number - 1]
+            uid = mailbox.uids[number - 1]
+            if changed_since and mailbox.modseqs[number - 1] <= int(changed_since.group(1)):
+                continue
+            parts = []
+            if uid_mode or 'UID' in items:
+                parts.append(f"UID {uid}".encode())
+            if 'FLAGS' in items:
+                parts.append(f"FLAGS ({' '.join(mailbox.flags[number - 1])})".encode())
+            if changed_since:
+                parts.append(f"MODSEQ ({mailbox.modseqs[number - 1]})".encode())
+            if 'RFC822.SIZE' in items:
+                parts.append(f"RFC822.SIZE {len(raw)}".encode())
+            header_fields = re.search(r'BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]', items)
+            if header_fields:
+                wanted = set(header_fields.group(1).split())
+                head = raw.split(b'\r\n\r\n', 1)[0].split(b'\r\n')
+                selected = b''.join(
+                    line + b'\r\n' for line in head
+                    if line.split(b':', 1)[0].decode().upper() in wanted
+                ) + b'\r\n'
+                parts.append(
+                    f"BODY[HEADER.FIELDS ({header_fields.group(1)})] {{{len(selected)}}}\r\n".encode() + selected
+                )
+            if 'BODYSTRUCTURE' in items:
+                parts.append(f"BODYSTRUCTURE {bodystructure(email.message_from_bytes(raw))}".encode())
+            if re.search(r'BODY(?:\.PEEK)?\[HEADER\]', items):
+                head = raw.split(b'\r\n\r\n', 1)[0] + b'\r\n\r\n'
+                parts.append(f"BODY[HEADER] {{{len(head)}}}\r\n".encode() + head)
+            sections = re.findall(r'BODY(?:\.PEEK)?\[(\d+(?:\.\d+)*)\]', items)
+            if sections:
+                leaves = dict(_leaves(email.message_from_bytes(raw)))
+                for section in sections:
+                    content = leaves[section].get_payload().encode() if section in leaves else b''
+                    parts.append(f"BODY[{section}] {{{len(content)}}}\r\n".encode() + content)
+            if 'RFC822' in items.replace('RFC822.SIZE', '') or 'BODY[]' in items or 'BODY.PEEK[]' in items:
+                name = b"RFC822" if 'RFC822' in items.replace('RFC822.SIZE', '') else b"BODY[]"
+                parts.append(name + f" {{{len(raw)}}}\r\n".encode() + raw)
+            self.send(f"* {number} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+        self.respond(tag, "OK FETCH completed")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    # Room for many clients connecting at once (the asyncio benchmark)
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def __init__(self, mailbox, rtt=0.0, capabilities=('IMAP4rev1', 'AUTH=PLAIN')):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.mailbox = mailbox
+        self.rtt = rtt
+        self.capabilities = list(capabilities)
+        self.bytes_sent = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,97 @@
+"""
+Minimal in-process POP3 server for the receive benchmarks.
+
+Supports USER/PASS, STAT, LIST, UIDL, TOP, RETR, NOOP and QUIT. Every
+answer is delayed by ``rtt`` seconds to model a remote server.
+"""
+import socketserver
+import threading
+import time
+
+
+class Maildrop:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.uids = [f"uid-{i + 1}" for i in range(len(self.messages))]
+        self.commands = []
+
+    def append(self, raw):
+        self.messages.append(raw)
+        self.uids.append(f"uid-{len(self.messages)}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, text):
+        time.sleep(self.server.rtt)
+        self.wfile.write(text if isinstance(text, bytes) else text.encode())
+        self.wfile.flush()
+
+    def multiline(self, first, lines):
+        body = b''.join(
+            (b'.' + line if line.startswith(b'.') else line) + b'\r\n' for line in lines
+        )
+        self.send(f"+OK {first}\r\n".encode() + body + b".\r\n")
+
+    def handle(self):
+        maildrop = self.server.maildrop
+        self.send("+OK fake POP3 ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, _, args = line.decode().strip().partition(' ')
+            command = command.upper()
+            maildrop.commands.append(line.decode().strip())
+
+            if command in ('USER', 'PASS', 'NOOP'):
+                self.send("+OK\r\n")
+            elif command == 'STAT':
+                total = sum(len(m) for m in maildrop.messages)
+                self.send(f"+OK {len(maildrop.messages)} {total}\r\n")
+            elif command == 'LIST':
+                self.multiline(
+                    f"{len(maildrop.messages)} messages",
+                    [f"{i + 1} {len(m)}".encode() for i, m in enumerate(maildrop.messages)]
+                )
+            elif command == 'UIDL':
+                if args:
+                    self.send(f"+OK {args} {maildrop.uids[int(args) - 1]}\r\n")
+                else:
+                    self.multiline("", [f"{i + 1} {uid}".encode() for i, uid in enumerate(maildrop.uids)])
+            elif command in ('RETR', 'TOP'):
+                number, _, lines = args.partition(' ')
+                raw = maildrop.messages[int(number) - 1]
+                if command == 'TOP':
+                    head, _, body = raw.partition(b'\r\n\r\n')
+                    body_lines = body.split(b'\r\n')[:int(lines or 0)]
+                    content = head.split(b'\r\n') + [b''] + body_lines
+                else:
+                    content = raw.split(b'\r\n')
+                    if content and content[-1] == b'':
+                        content.pop()
+                self.multiline(f"{len(raw)} octets", content)
+            elif command == 'QUIT':
+                self.send("+OK bye\r\n")
+                return
+            else:
+                self.send("-ERR unknown command\r\n")
+
+
+class FakePOPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    # Room for many clients connecting at once (the asyncio benchmark)
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def __init__(self, maildrop, rtt=0.0):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.maildrop = maildrop
+        self.rtt = rtt
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
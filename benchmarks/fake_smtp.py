@@ -0,0 +1,119 @@
+"""
+Minimal in-process SMTP server for the send benchmarks.
+
+Supports EHLO/HELO, AUTH, MAIL, RCPT, DATA, RSET, NOOP and QUIT. Every
+reply is delayed by ``rtt`` seconds to model a remote server. Domains in
+``slow`` model a slow destination: the reply to RCPT TO for one of their
+addresses, and the reply to the end of DATA of an envelope holding one, is
+delayed by the given number of seconds. RCPT TO for a domain in ``refuse``
+is answered with 550, and for one in ``defer`` with 451 (try again later).
+With ``max_sessions`` set, a connection beyond that many open at once is
+greeted with 421 and closed, like a provider throttling an account.
+``deliveries`` records (monotonic time of the
+final reply, sender, recipients, size) for every accepted message.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, text, delay=0.0):
+        time.sleep(self.server.rtt + delay)
+        self.wfile.write(f"{text}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.sessions += 1
+            throttled = server.max_sessions is not None and server.sessions > server.max_sessions
+            server.throttled += throttled
+        try:
+            if throttled:
+                self.send("421 4.7.0 Too many concurrent SMTP connections, try again later")
+            else:
+                self.session()
+        finally:
+            with server.lock:
+                server.sessions -= 1
+
+    def session(self):
+        server = self.server
+        self.send("220 fake SMTP ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self.wfile.write(b"250-fake\r\n250-AUTH PLAIN LOGIN\r\n")
+                self.send("250 SIZE 104857600")
+            elif verb in ('HELO', 'NOOP'):
+                self.send("250 OK")
+            elif verb == 'AUTH':
+                self.send("235 Authentication successful")
+            elif verb == 'MAIL':
+                sender, recipients = command.partition(':')[2].strip(), []
+                self.send("250 OK")
+            elif verb == 'RCPT':
+                address = command.partition(':')[2].strip().strip('<>')
+                domain = address.rpartition('@')[2].lower()
+                if domain in server.refuse:
+                    self.send(f"550 5.1.1 <{address}>: Recipient address rejected", server.slow.get(domain, 0))
+                elif domain in server.defer:
+                    self.send(f"451 4.7.1 <{address}>: Try again later", server.slow.get(domain, 0))
+                else:
+                    recipients.append(address)
+                    self.send("250 OK", server.slow.get(domain, 0))
+            elif verb == 'DATA':
+                self.send("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b'.\r\n', b''):
+                        break
+                    size += len(data)
+                delay = max((server.slow.get(r.rpartition('@')[2].lower(), 0) for r in recipients), default=0)
+                with server.lock:
+                    server.deliveries.append((time.monotonic() + server.rtt + delay, sender, list(recipients), size))
+                self.send("250 OK queued", delay)
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.send("250 OK")
+            elif verb == 'QUIT':
+                self.send("221 Bye")
+                return
+            else:
+                self.send("500 Command not recognized")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def __init__(self, rtt=0.0, slow=None, refuse=(), defer=(), max_sessions=None):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.rtt = rtt
+        self.slow = {domain.lower(): delay for domain, delay in (slow or {}).items()}
+        self.refuse = {domain.lower() for domain in refuse}
+        self.defer = {domain.lower() for domain in defer}
+        self.deliveries = []
+        self.max_sessions = max_sessions
+        self.connections = 0
+        self.sessions = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
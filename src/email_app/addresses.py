@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.validators import validate_email
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+INVALID_ADDRESS = "Enter a valid email address."
+
+# policy(address, domain) -> None to accept, or the reason the address is refused
+DomainPolicy = Callable[[str, str], Optional[str]]
+
+
+class AddressValidator:
+    """
+    Validates email addresses once and remembers the verdict.
+
+    Syntax is checked with Django's validate_email (the check behind
+    serializers.EmailField), then by the policy hook of the address's
+    domain, or the '*' hook, if one is configured. Verdicts are kept per
+    normalised address (domain lower-cased) in an LRU with a TTL, so a
+    distribution list sent to again costs one lookup per address.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, DomainPolicy]] = None, max_size: int = 10000, ttl: float = 3600):
+        self.policies = {domain.lower(): policy for domain, policy in (policies or {}).items()}
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[str]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        local, separator, domain = address.rpartition('@')
+        return f'{local}@{domain.lower()}' if separator else domain
+
+    def _verdict(self, address: str) -> Optional[str]:
+        try:
+            validate_email(address)
+        except ValidationError:
+            return INVALID_ADDRESS
+        domain = address.rpartition('@')[2]
+        policy = self.policies.get(domain) or self.policies.get('*')
+        return policy(address, domain) if policy else None
+
+    def check_many(self, addresses: Sequence[str]) -> List[Optional[str]]:
+        """Per address, None if it is valid or the reason it is not"""
+        keys = [self.normalize(address) for address in addresses]
+        verdicts: List[Optional[str]] = [None] * len(keys)
+        missing: Dict[str, List[int]] = {}
+        now = time.monotonic()
+        with self._lock:
+            for index, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    verdicts[index] = entry[1]
+                else:
+                    missing.setdefault(key, []).append(index)
+            # An address repeated in the list is looked up once; the repeats count as hits
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        if not missing:
+            return verdicts
+
+        # Policy hooks may query DNS: run them outside the lock
+        found = {key: self._verdict(key) for key in missing}
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, verdict in found.items():
+                for index in missing[key]:
+                    verdicts[index] = verdict
+                if self.max_size > 0:
+                    self._entries[key] = (expires_at, verdict)
+                    self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return verdicts
+
+    def check(self, address: str) -> Optional[str]:
+        return self.check_many([address])[0]
+
+    def invalid_addresses(self, addresses: Sequence[str]) -> List[str]:
+        return [address for address, verdict in zip(addresses, self.check_many(addresses)) if verdict]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class MXPolicy:
+    """
+    Domain policy hook refusing domains that cannot receive mail: no such
+    domain, a null MX (RFC 7505), or neither MX nor address records.
+    Needs the 'dnspython' package. Answers are kept per domain for ``ttl``
+    seconds, for at most ``max_size`` domains (least recently used first
+    out); when a lookup fails (e.g. times out) the address is accepted.
+    """
+
+    def __init__(self, ttl: float = 3600, timeout: float = 3.0, max_size: int = 10000):
+        try:
+            import dns.resolver
+        except ImportError:
+            raise ImproperlyConfigured("email_app.addresses.MXPolicy requires the 'dnspython' package")
+        self.resolver = dns.resolver
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_size = max_size
+        self._domains: 'OrderedDict[str, Tuple[float, Optional[str]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, domain: str) -> Optional[str]:
+        resolver = self.resolver
+        try:
+            answer = resolver.resolve(domain, 'MX', lifetime=self.timeout)
+        except resolver.NXDOMAIN:
+            return f"Domain {domain} does not exist"
+        except resolver.NoAnswer:
+            # No MX: mail goes to the domain's own address records (RFC 5321 section 5.1)
+            for record_type in ('A', 'AAAA'):
+                try:
+                    resolver.resolve(domain, record_type, lifetime=self.timeout)
+                    return None
+                except resolver.NoAnswer:
+                    continue
+            return f"Domain {domain} does not accept email"
+        if all(record.exchange.to_text() == '.' for record in answer):
+            return f"Domain {domain} does not accept email"
+        return None
+
+    def __call__(self, address: str, domain: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._domains.get(domain)
+            if entry is not None and entry[0] > now:
+                self._domains.move_to_end(domain)
+                return entry[1]
+        try:
+            verdict = self._lookup(domain)
+        except Exception as e:
+            logger.warning(f"MX lookup for {domain} failed, accepting: {str(e)}")
+            return None
+        if self.max_size > 0:
+            with self._lock:
+                self._domains[domain] = (now + self.ttl, verdict)
+                self._domains.move_to_end(domain)
+                while len(self._domains) > self.max_size:
+                    self._domains.popitem(last=False)
+        return verdict
+
+
+def _load_policies(value: str) -> Dict[str, DomainPolicy]:
+    """'example.com=pkg.module.hook,*=...' into {domain: hook}; classes are instantiated"""
+    policies = {}
+    for entry in value.split(','):
+        domain, separator, path = entry.strip().partition('=')
+        if not separator:
+            continue
+        policy = import_string(path.strip())
+        policies[domain.strip()] = policy() if isinstance(policy, type) else policy
+    return policies
+
+
+address_validator = AddressValidator(
+    policies=_load_policies(getattr(settings, 'RECIPIENT_DOMAIN_POLICIES', '')),
+    max_size=getattr(settings, 'RECIPIENT_VALIDATION_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'RECIPIENT_VALIDATION_CACHE_TTL', 3600)
+)
@@ -0,0 +1,509 @@
+"""
+Minimal asyncio SMTP, IMAP4 and POP3 clients for the async send and receive engines.
+
+Only the commands EmailService and EmailReceiver use are implemented. Return
+values and exceptions mirror smtplib, imaplib and poplib, so the response
+parsing helpers are shared with the blocking code paths and errors map to
+the same result codes.
+"""
+import asyncio
+import base64
+import imaplib
+import logging
+import poplib
+import re
+import smtplib
+import ssl
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+
+logger = logging.getLogger(__name__)
+
+CRLF = b'\r\n'
+# IMAP SEARCH responses for large mailboxes arrive as one long line
+STREAM_LIMIT = 16 * 1024 * 1024
+_PERIOD_RE = re.compile(rb'(?m)^\.')
+
+_local_hostname: Optional[str] = None
+
+
+class POP3Disconnected(ConnectionError):
+    """
+    The POP3 server closed the connection in the middle of a command
+
+    poplib raises error_proto for this too, which callers cannot tell from
+    a -ERR reply such as a server without UIDL.
+    """
+
+
+class _AsyncConnection:
+    """Line-oriented stream connection; every read and write is bounded by timeout"""
+
+    # Raised when the server closes the connection, as the blocking library would
+    disconnected: type = ConnectionError
+
+    def __init__(self, host: str, port: int, use_ssl: bool = False, timeout: Optional[float] = None):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def _wait(self, awaitable):
+        if self.timeout:
+            return await asyncio.wait_for(awaitable, self.timeout)
+        return await awaitable
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await self._wait(asyncio.open_connection(
+            self.host,
+            self.port,
+            ssl=ssl.create_default_context() if self.use_ssl else None,
+            limit=STREAM_LIMIT
+        ))
+
+    async def start_tls(self) -> None:
+        await self._wait(self.writer.start_tls(ssl.create_default_context(), server_hostname=self.host))
+
+    async def _readline(self) -> bytes:
+        line = await self._wait(self.reader.readline())
+        if not line:
+            raise self.disconnected('Connection unexpectedly closed')
+        return line
+
+    async def _readexactly(self, size: int) -> bytes:
+        try:
+            return await self._wait(self.reader.readexactly(size))
+        except asyncio.IncompleteReadError:
+            raise self.disconnected('Connection unexpectedly closed')
+
+    async def _write(self, data: bytes) -> None:
+        self.writer.write(data)
+        await self._wait(self.writer.drain())
+
+    def close(self) -> None:
+        """Drop the connection without a goodbye, e.g. after an error"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class AsyncSMTP(_AsyncConnection):
+    """SMTP client with STARTTLS and AUTH PLAIN/LOGIN"""
+
+    disconnected = smtplib.SMTPServerDisconnected
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.features: Dict[str, str] = {}
+
+    async def reply(self) -> Tuple[int, bytes]:
+        """Read a possibly multi-line reply: (code, text)"""
+        lines = []
+        while True:
+            line = (await self._readline()).rstrip(CRLF)
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            code = -1
+        return code, b'\n'.join(lines)
+
+    async def command(self, line: str) -> Tuple[int, bytes]:
+        await self._write(line.encode('utf-8') + CRLF)
+        return await self.reply()
+
+    async def ehlo(self, name: str) -> None:
+        code, text = await self.command(f'EHLO {name}')
+        if code != 250:
+            code, text = await self.command(f'HELO {name}')
+            if code != 250:
+                raise smtplib.SMTPHeloError(code, text)
+        self.features = {}
+        for line in text.decode('latin-1').split('\n')[1:]:
+            feature, _, params = line.partition(' ')
+            self.features[feature.lower()] = params
+
+    async def login(self, username: str, password: str) -> None:
+        if 'auth' not in self.features:
+            raise smtplib.SMTPNotSupportedError('SMTP AUTH extension not supported by server.')
+        methods = self.features['auth'].upper().split()
+        if 'PLAIN' in methods or 'LOGIN' not in methods:
+            token = base64.b64encode(f'\0{username}\0{password}'.encode('utf-8')).decode('ascii')
+            code, text = await self.command(f'AUTH PLAIN {token}')
+        else:
+            code, text = await self.command('AUTH LOGIN')
+            for value in (username, password):
+                if code != 334:
+                    break
+                code, text = await self.command(base64.b64encode(value.encode('utf-8')).decode('ascii'))
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, text)
+
+    async def open(self, username: str = '', password: str = '', use_tls: bool = False) -> None:
+        """Connect, greet, upgrade to TLS if asked and log in"""
+        global _local_hostname
+        if _local_hostname is None:
+            # The first lookup may hit DNS, so it runs in a thread; the result is cached
+            _local_hostname = await asyncio.to_thread(DNS_NAME.get_fqdn)
+        await self.connect()
+        code, text = await self.reply()
+        if code != 220:
+            self.close()
+            raise smtplib.SMTPConnectError(code, text)
+        await self.ehlo(_local_hostname)
+        if use_tls:
+            code, text = await self.command('STARTTLS')
+            if code != 220:
+                raise smtplib.SMTPResponseException(code, text)
+            await self.start_tls()
+            await self.ehlo(_local_hostname)
+        if username and password:
+            await self.login(username, password)
+
+    async def sendmail(self, from_addr: str, to_addrs: List[str], message: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send one message; returns the refused recipients like smtplib.SMTP.sendmail
+
+        Raises SMTPRecipientsRefused only when every recipient was refused.
+        """
+        code, text = await self.command(f'MAIL FROM:<{from_addr}>')
+        if code != 250:
+            await self.command('RSET')
+            raise smtplib.SMTPSenderRefused(code, text, from_addr)
+        refused = {}
+        for recipient in to_addrs:
+            code, text = await self.command(f'RCPT TO:<{recipient}>')
+            if code not in (250, 251):
+                refused[recipient] = (code, text)
+        if len(refused) == len(to_addrs):
+            await self.command('RSET')
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, text = await self.command('DATA')
+        if code != 354:
+            await self.command('RSET')
+            raise smtplib.SMTPDataError(code, text)
+        data = _PERIOD_RE.sub(b'..', message)
+        if not data.endswith(CRLF):
+            data += CRLF
+        await self._write(data + b'.' + CRLF)
+        code, text = await self.reply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, text)
+        return refused
+
+    async def quit(self) -> None:
+        try:
+            await self.command('QUIT')
+        except (OSError, asyncio.TimeoutError, smtplib.SMTPException):
+            pass
+        finally:
+            self.close()
+
+    @classmethod
+    async def connect_with(cls, backend_kwargs: Dict[str, Any]) -> 'AsyncSMTP':
+        """Open a logged-in connection from EmailBackend arguments"""
+        client = cls(
+            backend_kwargs['host'],
+            int(backend_kwargs['port']),
+            use_ssl=bool(backend_kwargs.get('use_ssl')),
+            timeout=backend_kwargs.get('timeout')
+        )
+        await client.open(
+            backend_kwargs.get('username') or '',
+            backend_kwargs.get('password') or '',
+            use_tls=bool(backend_kwargs.get('use_tls'))
+        )
+        return client
+
+    @classmethod
+    async def send_envelope(cls, backend_kwargs: Dict[str, Any], from_addr: str, recipients: List[str],
+                            message: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """Deliver one envelope over its own connection; returns the refused recipients like sendmail"""
+        client = await cls.connect_with(backend_kwargs)
+        try:
+            refused = await client.sendmail(from_addr, recipients, message)
+        except BaseException:
+            client.close()
+            raise
+        await client.quit()
+        return refused
+
+    @classmethod
+    async def send_messages(cls, backend_kwargs: Dict[str, Any], email_messages: List[Any]) -> int:
+        """
+        Deliver Django EmailMessage objects over one connection, like EmailBackend.send_messages
+
+        backend_kwargs holds the EmailBackend arguments (host, port,
+        username, password, use_tls, use_ssl, timeout). Returns the number
+        of messages sent.
+        """
+        client = await cls.connect_with(backend_kwargs)
+        sent = 0
+        try:
+            for email_message in email_messages:
+                recipients = email_message.recipients()
+                if not recipients:
+                    continue
+                encoding = email_message.encoding or settings.DEFAULT_CHARSET
+                await client.sendmail(
+                    sanitize_address(email_message.from_email, encoding),
+                    [sanitize_address(address, encoding) for address in recipients],
+                    email_message.message().as_bytes(linesep='\r\n')
+                )
+                sent += 1
+        except BaseException:
+            client.close()
+            raise
+        await client.quit()
+        return sent
+
+
+class AsyncIMAP4(_AsyncConnection):
+    """
+    IMAP4rev1 client returning imaplib-shaped (type, data) results
+
+    FETCH data is a list of (text, literal) tuples and byte strings exactly
+    as imaplib builds it, so parse_fetch_response and the UID helpers work
+    on it unchanged. Untagged responses and response codes are collected
+    in untagged_responses, which response() reads like imaplib's.
+    """
+
+    disconnected = imaplib.IMAP4.abort
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.capabilities: Tuple[str, ...] = ()
+        self.untagged_responses: Dict[str, List[Any]] = {}
+        self._tag = 0
+        self._command_name = ''
+        # Like imaplib: sent as a literal after the next command's arguments, then cleared
+        self.literal: Optional[bytes] = None
+
+    def _append_untagged(self, typ: str, data: Any) -> None:
+        self.untagged_responses.setdefault(typ, []).append(data)
+
+    async def _untagged(self, line: bytes) -> None:
+        """Store one untagged ('* ...') response, reading any literals it announces"""
+        match = imaplib.Untagged_response.match(line)
+        extra = None
+        if match is None:
+            match = imaplib.Untagged_status.match(line)
+            if match is None:
+                raise imaplib.IMAP4.abort(f'unexpected response: {line!r}')
+            extra = match.group('data2')
+        typ = match.group('type').decode('ascii')
+        data = match.group('data') or b''
+        if extra:
+            data = data + b' ' + extra
+        while True:
+            literal = imaplib.Literal.match(data)
+            if literal is None:
+                break
+            content = await self._readexactly(int(literal.group('size')))
+            self._append_untagged(typ, (data, content))
+            data = (await self._readline()).rstrip(CRLF)
+        self._append_untagged(typ, data)
+        if typ == 'BYE' and self._command_name != 'LOGOUT':
+            raise imaplib.IMAP4.abort(data.decode('utf-8', errors='replace'))
+        if typ in ('OK', 'NO', 'BAD'):
+            code = imaplib.Response_code.match(data)
+            if code:
+                self._append_untagged(code.group('type').decode('ascii'), code.group('data'))
+
+    async def _command(self, name: str, *args: Union[str, bytes, None]) -> Tuple[str, List[bytes]]:
+        for typ in ('OK', 'NO', 'BAD'):
+            self.untagged_responses.pop(typ, None)
+        self._tag += 1
+        tag = f'A{self._tag:04d}'.encode('ascii')
+        line = tag + b' ' + name.encode('ascii')
+        for arg in args:
+            if arg is None:
+                continue
+            line += b' ' + (arg if isinstance(arg, bytes) else arg.encode('utf-8'))
+        literal, self.literal = self.literal, None
+        if literal is not None:
+            line += b' {%d}' % len(literal)
+        self._command_name = name
+        await self._write(line + CRLF)
+        while literal is not None:
+            response = (await self._readline()).rstrip(CRLF)
+            if response.startswith(b'+'):
+                await self._write(literal + CRLF)
+                literal = None
+            elif response.startswith(b'* '):
+                await self._untagged(response)
+            else:
+                # Tagged NO/BAD: the server refused the command before the literal
+                status, _, text = response[len(tag) + 1:].partition(b' ')
+                if status.upper() == b'BAD':
+                    raise imaplib.IMAP4.error(f'{name} command error: BAD [{text.decode("utf-8", errors="replace")}]')
+                return status.decode('ascii').upper(), [text]
+        while True:
+            response = (await self._readline()).rstrip(CRLF)
+            if response.startswith(tag + b' '):
+                status, _, text = response[len(tag) + 1:].partition(b' ')
+                status = status.decode('ascii').upper()
+                if status == 'BAD':
+                    raise imaplib.IMAP4.error(f'{name} command error: BAD [{text.decode("utf-8", errors="replace")}]')
+                return status, [text]
+            if response.startswith(b'* '):
+                await self._untagged(response)
+            else:
+                raise imaplib.IMAP4.abort(f'unexpected response: {response!r}')
+
+    def _untagged_response(self, typ: str, data: List[bytes], name: str) -> Tuple[str, List[Any]]:
+        if typ == 'NO':
+            return typ, data
+        if name not in self.untagged_responses:
+            return typ, [None]
+        return typ, self.untagged_responses.pop(name)
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    async def connect(self) -> None:
+        await super().connect()
+        greeting = (await self._readline()).rstrip(CRLF)
+        if not greeting.startswith((b'* OK', b'* PREAUTH')):
+            self.close()
+            raise imaplib.IMAP4.error(greeting.decode('utf-8', errors='replace'))
+        await self._untagged(greeting)
+        if 'CAPABILITY' not in self.untagged_responses:
+            await self._command('CAPABILITY')
+        data = self.untagged_responses.pop('CAPABILITY')[-1]
+        self.capabilities = tuple(data.decode('ascii', errors='ignore').upper().split())
+
+    async def login(self, username: str, password: str) -> Tuple[str, List[bytes]]:
+        typ, data = await self._command('LOGIN', username, self._quote(password))
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(data[-1])
+        return typ, data
+
+    async def enable(self, capability: str) -> Tuple[str, List[Any]]:
+        typ, data = await self._command('ENABLE', capability)
+        return self._untagged_response(typ, data, 'ENABLED')
+
+    async def select(self, mailbox: str = 'INBOX', readonly: bool = False) -> Tuple[str, List[Any]]:
+        self.untagged_responses = {}
+        typ, data = await self._command('EXAMINE' if readonly else 'SELECT', mailbox)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f'SELECT {mailbox} failed: {data[-1].decode("utf-8", errors="replace")}')
+        return typ, self.untagged_responses.get('EXISTS', [None])
+
+    async def uid(self, command: str, *args: Union[str, bytes, None]) -> Tuple[str, List[Any]]:
+        command = command.upper()
+        name = command if command in ('SEARCH', 'SORT', 'THREAD') else 'FETCH'
+        typ, data = await self._command('UID', command, *args)
+        return self._untagged_response(typ, data, name)
+
+    def response(self, code: str) -> Tuple[str, List[Any]]:
+        return self._untagged_response(code, [None], code.upper())
+
+    async def logout(self) -> None:
+        try:
+            await self._command('LOGOUT')
+        except (OSError, asyncio.TimeoutError, imaplib.IMAP4.error):
+            pass
+        finally:
+            self.close()
+
+    @classmethod
+    async def open(cls, config: Dict[str, Any]) -> 'AsyncIMAP4':
+        """Connect and log in, turning CONDSTORE on like MailSessionPool.open"""
+        mail = cls(config['host'], int(config['port']), use_ssl=bool(config.get('use_ssl')), timeout=config.get('timeout'))
+        await mail.connect()
+        try:
+            await mail.login(config['username'], config['password'])
+            if 'CONDSTORE' in mail.capabilities and 'ENABLE' in mail.capabilities:
+                await mail.enable('CONDSTORE')
+        except BaseException:
+            mail.close()
+            raise
+        return mail
+
+
+class AsyncPOP3(_AsyncConnection):
+    """
+    POP3 client returning poplib-shaped (response, lines, octets) results
+
+    A -ERR reply raises poplib.error_proto; a dropped connection raises
+    POP3Disconnected.
+    """
+
+    disconnected = POP3Disconnected
+
+    async def _response(self) -> bytes:
+        line = (await self._readline()).rstrip(CRLF)
+        if not line.startswith(b'+'):
+            raise poplib.error_proto(line)
+        return line
+
+    async def _command(self, line: str) -> bytes:
+        await self._write(line.encode('utf-8') + CRLF)
+        return await self._response()
+
+    async def _long_command(self, line: str) -> Tuple[bytes, List[bytes], int]:
+        response = await self._command(line)
+        lines = []
+        octets = 0
+        while True:
+            raw = await self._readline()
+            size = len(raw)
+            raw = raw.rstrip(CRLF)
+            if raw == b'.':
+                return response, lines, octets
+            octets += size
+            if raw.startswith(b'..'):
+                octets -= 1
+                raw = raw[1:]
+            lines.append(raw)
+
+    async def connect(self) -> None:
+        await super().connect()
+        self.welcome = await self._response()
+
+    async def user(self, username: str) -> bytes:
+        return await self._command(f'USER {username}')
+
+    async def pass_(self, password: str) -> bytes:
+        return await self._command(f'PASS {password}')
+
+    async def list(self) -> Tuple[bytes, List[bytes], int]:
+        return await self._long_command('LIST')
+
+    async def uidl(self) -> Tuple[bytes, List[bytes], int]:
+        return await self._long_command('UIDL')
+
+    async def retr(self, number: int) -> Tuple[bytes, List[bytes], int]:
+        return await self._long_command(f'RETR {number}')
+
+    async def top(self, number: int, lines: int) -> Tuple[bytes, List[bytes], int]:
+        return await self._long_command(f'TOP {number} {lines}')
+
+    async def quit(self) -> None:
+        try:
+            await self._command('QUIT')
+        except (OSError, asyncio.TimeoutError, poplib.error_proto):
+            pass
+        finally:
+            self.close()
+
+    @classmethod
+    async def open(cls, config: Dict[str, Any]) -> 'AsyncPOP3':
+        mail = cls(config['host'], int(config['port']), use_ssl=bool(config.get('use_ssl')), timeout=config.get('timeout'))
+        await mail.connect()
+        try:
+            await mail.user(config['username'])
+            await mail.pass_(config['password'])
+        except BaseException:
+            mail.close()
+            raise
+        return mail
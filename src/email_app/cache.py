@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def record_size(value: Any) -> int:
+    """Rough size in bytes of a parsed message record, dominated by its strings"""
+    if isinstance(value, (str, bytes)):
+        return len(value) + 50
+    if isinstance(value, dict):
+        return 100 + sum(len(key) + record_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 60 + sum(record_size(item) for item in value)
+    return 30
+
+
+class LocalMemoryBackend:
+    """
+    In-process LRU store bounded by total record size, with a TTL.
+
+    The least recently used records are dropped once the estimated size of
+    everything stored goes over ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, int, Dict[str, Any]]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, size, record = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    self._size -= size
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = record
+        return found
+
+    def set(self, key: Hashable, record: Dict[str, Any]) -> None:
+        size = record_size(record)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, record)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes}
+
+
+class DjangoCacheBackend:
+    """Store records in one of Django's configured caches (shared between processes if the cache is)"""
+
+    def __init__(self, alias: str = 'default', ttl: float = 3600):
+        self.alias = alias
+        self.ttl = ttl
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(key: Hashable) -> str:
+        # Cache keys must be short and free of spaces for memcached
+        return 'email_app:message:' + hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        cache_keys = {self._cache_key(key): key for key in keys}
+        found = self.cache.get_many(list(cache_keys))
+        return {cache_keys[cache_key]: record for cache_key, record in found.items()}
+
+    def set(self, key: Hashable, record: Dict[str, Any]) -> None:
+        self.cache.set(self._cache_key(key), record, self.ttl)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'alias': self.alias}
+
+
+class ParsedMessageCache:
+    """
+    Cache of parsed receive records, keyed by mailbox and message.
+
+    Keys are (host, username, folder, UIDVALIDITY, UID) plus the kind of
+    record (full, headers, ...). IMAP guarantees that a UID names the same
+    immutable message for as long as UIDVALIDITY is unchanged, so cached
+    records never need invalidating; POP messages are keyed by their UIDL
+    id. Records are only looked up after the server accepted the login.
+    """
+
+    def __init__(self, backend: Optional[Any]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def make_key(email_config: Dict[str, Any], uidvalidity: Any, uid: Any, kind: str) -> Tuple:
+        return (
+            email_config['host'],
+            email_config['username'],
+            email_config.get('folder') or '',
+            uidvalidity,
+            str(uid),
+            kind
+        )
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Dict[str, Any]]:
+        """Return the cached records among keys, counting hits and misses"""
+        keys = list(keys)
+        if not self.enabled or not keys:
+            return {}
+        try:
+            found = self.backend.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Message cache lookup failed: {str(e)}")
+            found = {}
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key: Hashable, record: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, record)
+        except Exception as e:
+            logger.warning(f"Message cache store failed: {str(e)}")
+
+    def clear(self) -> None:
+        if self.enabled:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {'enabled': self.enabled, 'hits': self.hits, 'misses': self.misses}
+        if self.enabled:
+            counters.update(self.backend.stats())
+        return counters
+
+
+def _build_backend() -> Optional[Any]:
+    backend = getattr(settings, 'MESSAGE_CACHE_BACKEND', 'local')
+    ttl = getattr(settings, 'MESSAGE_CACHE_TTL', 3600)
+    if backend == 'local':
+        return LocalMemoryBackend(max_bytes=getattr(settings, 'MESSAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024), ttl=ttl)
+    if backend == 'django':
+        return DjangoCacheBackend(alias=getattr(settings, 'MESSAGE_CACHE_ALIAS', 'default'), ttl=ttl)
+    return None
+
+
+message_cache = ParsedMessageCache(_build_backend())
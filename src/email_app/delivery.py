@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+
+from .aio import AsyncSMTP
+from .pool import smtp_pool
+from .ratelimit import smtp_limiter
+
+logger = logging.getLogger(__name__)
+
+# What an envelope ended with: the recipients the server refused (empty when
+# all were accepted), or the exception that failed the whole envelope
+EnvelopeOutcome = Union[Dict[str, Tuple[int, bytes]], Exception]
+
+
+def group_by_domain(addresses: Sequence[str]) -> 'OrderedDict[str, List[str]]':
+    """
+    Group addresses by lower-cased domain, in first-seen order
+
+    An address listed twice (in any case, e.g. in both to and bcc) is
+    delivered once.
+    """
+    groups: 'OrderedDict[str, List[str]]' = OrderedDict()
+    seen = set()
+    for address in addresses:
+        local, _, domain = address.rpartition('@')
+        domain = domain.lower()
+        key = f'{local}@{domain}'
+        if key in seen:
+            continue
+        seen.add(key)
+        groups.setdefault(domain, []).append(address)
+    return groups
+
+
+class DomainDelivery:
+    """
+    Deliver one message as one SMTP envelope per recipient domain, in parallel.
+
+    Envelopes run on a thread pool shared by all requests, each over its own
+    pooled connection, so a slow or refusing domain only holds up and fails
+    its own recipients. At most ``per_message`` envelopes of one message are
+    in flight at once; the rest wait for a free slot without holding a
+    worker thread.
+    """
+
+    def __init__(self, workers: int = 16, per_message: int = 4):
+        self.workers = workers
+        self.per_message = per_message
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='domain-delivery')
+            return self._executor
+
+    @staticmethod
+    def _send(backend_kwargs: Dict[str, Any], from_addr: str, recipients: List[str], message: bytes) -> EnvelopeOutcome:
+        try:
+            return smtp_pool.sendmail(backend_kwargs, from_addr, recipients, message)
+        except Exception as e:
+            return e
+
+    def deliver(self, backend_kwargs: Dict[str, Any], from_addr: str, envelopes: List[List[str]],
+                message: bytes) -> List[EnvelopeOutcome]:
+        """Send ``message`` to each recipient list and return the outcomes in the same order"""
+        if len(envelopes) == 1:
+            return [self._send(backend_kwargs, from_addr, envelopes[0], message)]
+
+        outcomes: List[Optional[EnvelopeOutcome]] = [None] * len(envelopes)
+        pending = deque(range(len(envelopes)))
+        running: Dict[Future, int] = {}
+        while pending or running:
+            while pending and len(running) < self.per_message:
+                index = pending.popleft()
+                future = self.executor.submit(self._send, backend_kwargs, from_addr, envelopes[index], message)
+                running[future] = index
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                outcomes[running.pop(future)] = future.result()
+        return outcomes
+
+    async def deliver_async(self, backend_kwargs: Dict[str, Any], from_addr: str, envelopes: List[List[str]],
+                            message: bytes) -> List[EnvelopeOutcome]:
+        """deliver() over AsyncSMTP connections instead of the thread pool"""
+        slots = asyncio.Semaphore(self.per_message)
+
+        async def send(recipients: List[str]) -> EnvelopeOutcome:
+            async with slots:
+                try:
+                    async with smtp_limiter.slot_async(backend_kwargs):
+                        return await AsyncSMTP.send_envelope(backend_kwargs, from_addr, recipients, message)
+                except Exception as e:
+                    return e
+
+        return list(await asyncio.gather(*(send(recipients) for recipients in envelopes)))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+domain_delivery = DomainDelivery(
+    workers=getattr(settings, 'SMTP_DELIVERY_WORKERS', 16),
+    per_message=getattr(settings, 'SMTP_DELIVERY_PER_MESSAGE', 4)
+)
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .service import EmailReceiver
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxFanout:
+    """
+    Receive from many mailboxes at once over a bounded thread pool.
+
+    At most ``per_host`` mailboxes of the same server are fetched at the same
+    time; the others wait in a per-host queue without holding a worker
+    thread, so a busy server does not starve the rest. Each mailbox gets
+    ``timeout`` seconds from the moment it is handed to the thread pool and
+    one still running then is reported as TIMEOUT without waiting for it.
+
+    The timeout only bounds each socket operation of the receive itself, so
+    a timed-out receive can keep its thread for a while longer. Its host
+    slot stays taken until the thread is done; mailboxes queued behind a
+    server whose slots are all held by timed-out receives are reported as
+    TIMEOUT once they have waited another ``timeout`` seconds.
+    """
+
+    def __init__(self, workers: int = 16, per_host: int = 4, timeout: float = 30):
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='receive-fanout')
+            return self._executor
+
+    @staticmethod
+    def _receive(email_config: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return EmailReceiver.receive_emails(email_config)
+        finally:
+            # Worker threads outlive the request, so they must not keep a stale connection
+            close_old_connections()
+
+    def receive_many(self, configs: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Run receive_emails for each configuration and return the results in the same order
+        """
+        timeout = timeout or self.timeout
+        results: List[Optional[Dict[str, Any]]] = [None] * len(configs)
+        queues: 'OrderedDict[str, deque]' = OrderedDict()
+        for index, email_config in enumerate(configs):
+            queues.setdefault(email_config['host'].lower(), deque()).append(index)
+        active: Counter = Counter()
+        running: Dict[Future, Tuple[int, str, float]] = {}
+        # Timed-out receives whose threads still run, and so still hold their host slot
+        abandoned: Dict[Future, str] = {}
+        # Host to when all its slots came to be held by timed-out receives
+        stalled: Dict[str, float] = {}
+
+        def timed_out() -> Dict[str, Any]:
+            return {
+                'success': False,
+                'error': 'TIMEOUT',
+                'message': f"Mailbox did not answer within {timeout} seconds"
+            }
+
+        def start_ready():
+            for host, queue in queues.items():
+                while queue and active[host] < self.per_host:
+                    index = queue.popleft()
+                    email_config = {**configs[index], 'timeout': timeout}
+                    future = self.executor.submit(self._receive, email_config)
+                    running[future] = (index, host, time.monotonic())
+                    active[host] += 1
+
+        start_ready()
+        while running or any(queues.values()):
+            deadlines = [started + timeout for _, _, started in running.values()]
+            deadlines += [since + timeout for since in stalled.values()]
+            wait_for = max(0, min(deadlines, default=0) - time.monotonic())
+            done, _ = wait(list(running) + list(abandoned), timeout=wait_for, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in done & abandoned.keys():
+                active[abandoned.pop(future)] -= 1
+            for future, (index, host, started) in list(running.items()):
+                if future in done:
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        results[index] = {'success': False, 'message': str(e)}
+                    active[host] -= 1
+                elif now - started >= timeout:
+                    logger.warning(f"Receive from {configs[index]['host']} timed out after {timeout}s")
+                    results[index] = timed_out()
+                    if future.cancel():
+                        active[host] -= 1
+                    else:
+                        abandoned[future] = host
+                else:
+                    continue
+                del running[future]
+
+            live_hosts = {host for _, host, _ in running.values()}
+            for host, queue in queues.items():
+                if not queue or active[host] < self.per_host or host in live_hosts:
+                    stalled.pop(host, None)
+                    continue
+                since = stalled.setdefault(host, now)
+                if now - since >= timeout:
+                    logger.warning(f"Receives from {host} still running after timing out, "
+                                   f"giving up on {len(queue)} queued mailboxes")
+                    while queue:
+                        index = queue.popleft()
+                        results[index] = timed_out()
+                    del stalled[host]
+            start_ready()
+
+        return results
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+mailbox_fanout = MailboxFanout(
+    workers=getattr(settings, 'RECEIVE_MULTI_WORKERS', 16),
+    per_host=getattr(settings, 'RECEIVE_MULTI_PER_HOST', 4),
+    timeout=getattr(settings, 'RECEIVE_MULTI_TIMEOUT', 30)
+)
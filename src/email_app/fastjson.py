@@ -0,0 +1,45 @@
+import json
+from typing import Any
+
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency: stdlib json is used instead
+    orjson = None
+
+# DRF's encoder for what orjson leaves to ``default``: lazy strings,
+# Decimal, and datetimes, which DRF formats differently from orjson
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+_ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def dumps(data: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_encoder.default, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers over 64 bits; stdlib json handles those
+            pass
+    return _encoder.encode(data).encode('utf-8')
+
+
+def loads(data: bytes) -> Any:
+    """Parse JSON, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Re-parse so edge cases and error messages stay those of stdlib json
+            pass
+    return json.loads(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse encoded with dumps()"""
+
+    def __init__(self, data: Any, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
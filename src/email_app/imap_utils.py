@@ -0,0 +1,297 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from email.message import Message
+from email.parser import BytesHeaderParser
+from urllib.parse import unquote
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}\r\n')
+_ATOM_END = b' ()"\r\n'
+_BLANK_LINE_RE = re.compile(rb'\r?\n\r?\n')
+_HEADER_PARSER = BytesHeaderParser()
+
+
+class Atom(str):
+    """An unquoted IMAP atom, as opposed to a (bytes) string"""
+
+
+def _tokens(data: bytes):
+    """Tokenize an IMAP response: '(' / ')', Atom, bytes for strings and literals, None for NIL"""
+    pos = 0
+    length = len(data)
+    while pos < length:
+        char = data[pos:pos + 1]
+        if char in b' \r\n':
+            pos += 1
+        elif char in b'()':
+            yield char.decode()
+            pos += 1
+        elif char == b'"':
+            pos += 1
+            value = bytearray()
+            while pos < length and data[pos:pos + 1] != b'"':
+                if data[pos:pos + 1] == b'\\':
+                    pos += 1
+                value += data[pos:pos + 1]
+                pos += 1
+            pos += 1
+            yield bytes(value)
+        elif char == b'{' or data[pos:pos + 2] == b'~{':
+            # ~{n} is a binary literal (RFC 3516)
+            match = _LITERAL_RE.match(data, pos + 1 if char == b'~' else pos)
+            if not match:
+                raise ValueError("Malformed literal in IMAP response")
+            start = match.end()
+            end = start + int(match.group(1))
+            yield data[start:end]
+            pos = end
+        else:
+            start = pos
+            depth = 0
+            # Section specs such as BODY[HEADER.FIELDS (FROM TO)] contain spaces and parentheses
+            while pos < length:
+                char = data[pos:pos + 1]
+                if char == b'[':
+                    depth += 1
+                elif char == b']':
+                    depth -= 1
+                elif depth == 0 and char in _ATOM_END:
+                    break
+                pos += 1
+            atom = data[start:pos].decode('ascii', errors='replace')
+            yield None if atom.upper() == 'NIL' else Atom(atom)
+
+
+def _parse(tokens) -> List[Any]:
+    """Build nested lists from a token stream"""
+    stack: List[List[Any]] = [[]]
+    for token in tokens:
+        if token == '(' and not isinstance(token, Atom):
+            stack.append([])
+        elif token == ')' and not isinstance(token, Atom):
+            finished = stack.pop()
+            stack[-1].append(finished)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+def _wire_bytes(data: List[Any]) -> bytes:
+    """
+    Rebuild the raw response from imaplib's fetch data
+
+    imaplib splits each literal into a (text ending in {n}, literal) tuple
+    and returns the rest of that line as the next bytes item.
+    """
+    chunks = []
+    after_literal = False
+    for item in data:
+        if isinstance(item, tuple):
+            chunks.append(item[0] + b'\r\n' + item[1])
+            after_literal = True
+        elif item is not None:
+            if not after_literal and chunks:
+                chunks.append(b'\r\n')
+            chunks.append(item)
+            after_literal = False
+    return b''.join(chunks)
+
+
+def parse_fetch_response(data: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Parse imaplib FETCH data into one dict per message
+
+    Keys are the upper-cased item names as sent by the server (UID,
+    BODYSTRUCTURE, BODY[HEADER], BODY[1.2] ...).
+    """
+    parsed = _parse(_tokens(_wire_bytes(data)))
+    messages = []
+    for index in range(0, len(parsed) - 1):
+        items = parsed[index + 1]
+        if isinstance(parsed[index], Atom) and parsed[index].isdigit() and isinstance(items, list):
+            message = {}
+            for position in range(0, len(items) - 1, 2):
+                key = items[position]
+                if isinstance(key, Atom):
+                    message[key.upper()] = items[position + 1]
+            messages.append(message)
+    return messages
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def _params(value: Any) -> Dict[str, str]:
+    """("NAME" "value" ...) parameter list to a dict with lower-cased names"""
+    if not isinstance(value, list):
+        return {}
+    return {
+        _text(value[i]).lower(): _text(value[i + 1])
+        for i in range(0, len(value) - 1, 2)
+    }
+
+
+def _param_filename(params: Dict[str, str], name: str) -> Optional[str]:
+    """Parameter value, honouring RFC 2231 encoded (name*) and continued (name*0*) variants"""
+    if name in params:
+        return params[name]
+    keys = [f'{name}*'] if f'{name}*' in params else sorted(
+        (key for key in params if re.fullmatch(rf'{re.escape(name)}\*\d+\*?', key)),
+        key=lambda key: int(key[len(name) + 1:].rstrip('*'))
+    )
+    if not keys:
+        return None
+    encoded = keys[0].endswith('*')
+    value = ''.join(params[key] for key in keys)
+    if not encoded:
+        return value
+    charset, _, rest = value.partition("'")
+    _, _, text = rest.partition("'")
+    try:
+        return unquote(text, encoding=charset or 'utf-8', errors='replace')
+    except LookupError:
+        return unquote(text, errors='replace')
+
+
+def body_parts(structure: List[Any], prefix: str = '') -> List[Dict[str, Any]]:
+    """
+    Flatten a BODYSTRUCTURE into its leaf parts
+
+    Every part is described by its IMAP section number ('1', '2.1' ...),
+    MIME type, parameters, transfer encoding, size in octets, disposition
+    and filename. Attached messages (message/rfc822) are kept as a single
+    leaf.
+    """
+    if structure and isinstance(structure[0], list):
+        # multipart: child parts followed by the subtype and extension data
+        parts = []
+        number = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            number += 1
+            parts.extend(body_parts(child, f'{prefix}.{number}' if prefix else str(number)))
+        return parts
+
+    maintype = _text(structure[0]).lower()
+    subtype = _text(structure[1]).lower()
+    params = _params(structure[2])
+    size = structure[6] if len(structure) > 6 else None
+
+    # Extension data starts after the type specific fields
+    if maintype == 'text':
+        extension_start = 8
+    elif maintype == 'message' and subtype == 'rfc822':
+        extension_start = 10
+    else:
+        extension_start = 7
+    disposition_field = structure[extension_start + 1] if len(structure) > extension_start + 1 else None
+
+    disposition = ''
+    disposition_params: Dict[str, str] = {}
+    if isinstance(disposition_field, list) and disposition_field:
+        disposition = _text(disposition_field[0]).lower()
+        disposition_params = _params(disposition_field[1] if len(disposition_field) > 1 else None)
+
+    filename = _param_filename(disposition_params, 'filename') or _param_filename(params, 'name')
+
+    return [{
+        'part': prefix or '1',
+        'mimetype': f'{maintype}/{subtype}',
+        'params': params,
+        'encoding': _text(structure[5]).lower(),
+        'size': int(size) if isinstance(size, str) and size.isdigit() else None,
+        'disposition': disposition,
+        'filename': filename
+    }]
+
+
+def split_parts(parts: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Separate inline text/plain and text/html bodies from attachments"""
+    texts = []
+    attachments = []
+    for part in parts:
+        if part['mimetype'] in ('text/plain', 'text/html') and part['disposition'] != 'attachment':
+            texts.append(part)
+        elif part['filename'] or part['disposition'] == 'attachment':
+            attachments.append(part)
+    return texts, attachments
+
+
+def _split_headers(raw: bytes) -> Tuple[Message, bytes]:
+    """Parse the header block of an entity and return it with the body bytes"""
+    if raw.startswith((b'\r\n', b'\n')):
+        return Message(), raw[2 if raw.startswith(b'\r\n') else 1:]
+    blank = _BLANK_LINE_RE.search(raw)
+    if blank is None:
+        return _HEADER_PARSER.parsebytes(raw), b''
+    return _HEADER_PARSER.parsebytes(raw[:blank.start()]), raw[blank.end():]
+
+
+def _split_multipart(body: bytes, boundary: bytes) -> Optional[List[bytes]]:
+    """Bodies between the delimiter lines of a multipart body, or None without any delimiter"""
+    delimiter = b'--' + boundary
+    parts = []
+    start = None
+    pos = 0
+    while True:
+        index = body.find(delimiter, pos)
+        if index < 0:
+            break
+        after = index + len(delimiter)
+        close = body.startswith(b'--', after)
+        line_end = body.find(b'\n', after)
+        if line_end < 0:
+            line_end = len(body)
+        # A delimiter starts a line and has nothing but whitespace after it
+        if (index and body[index - 1] != 0x0a) or body[after + 2 * close:line_end].strip():
+            pos = after
+            continue
+        if start is not None:
+            # The line break before the delimiter belongs to the delimiter
+            end = index - 1
+            if end > start and body[end - 1] == 0x0d:
+                end -= 1
+            parts.append(body[start:max(end, start)])
+        if close:
+            return parts
+        start = pos = line_end + 1
+    if start is None:
+        return None
+    # Unterminated: the last part runs to the end less its final line break,
+    # like the email package reads it (an empty part after a trailing delimiter)
+    end = len(body)
+    if body.endswith(b'\n'):
+        end -= 2 if body.endswith(b'\r\n') else 1
+    parts.append(body[start:max(end, start)])
+    return parts
+
+
+def _leaf_parts(headers: Message, body: bytes, prefix: str):
+    boundary = headers.get_param('boundary') if headers.get_content_maintype() == 'multipart' else None
+    children = _split_multipart(body, str(boundary).encode('utf-8', 'surrogateescape')) if boundary else None
+    if children is None:
+        yield prefix or '1', headers, body
+        return
+    child_type = 'message/rfc822' if headers.get_content_subtype() == 'digest' else 'text/plain'
+    for number, child in enumerate(children, 1):
+        child_headers, child_body = _split_headers(child)
+        child_headers.set_default_type(child_type)
+        yield from _leaf_parts(child_headers, child_body, f'{prefix}.{number}' if prefix else str(number))
+
+
+def mime_parts(raw: bytes) -> Tuple[Message, List[Tuple[str, Message, bytes]]]:
+    """
+    Split a raw message into its headers and (section number, headers, encoded body) per leaf part
+
+    Numbering follows IMAP BODYSTRUCTURE, so a number found in a downloaded
+    message addresses the same part on the server; message/rfc822 parts are
+    leaves. Only header blocks go through the email package, bodies are
+    sliced out at their boundaries instead of being fed through it line by line.
+    """
+    headers, body = _split_headers(raw)
+    return headers, list(_leaf_parts(headers, body, ''))
@@ -0,0 +1,375 @@
+import base64
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.core.files import File
+from django.db import OperationalError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailJob
+from .service import ATTACHMENT_READ_CHUNK_SIZE, EmailService
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# A write that finds the table locked is tried this many times in all
+_LOCK_ATTEMPTS = 5
+_LOCK_RETRY_DELAY = 0.05
+
+
+def _is_locked(error: Exception) -> bool:
+    """SQLite 'database is locked' or 'database table is locked'"""
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def _fernet(secret: str) -> Fernet:
+    """Fernet key for sealing credentials, derived from a SECRET_KEY"""
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+               info=b'email_app.jobs.credentials').derive(secret.encode('utf-8'))
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def seal(value: str) -> str:
+    """Encrypt a credential for storage in a job row, with Fernet under a key derived from SECRET_KEY"""
+    return _fernet(settings.SECRET_KEY).encrypt(value.encode('utf-8')).decode('ascii')
+
+
+def unseal(token: str) -> str:
+    """Decrypt a sealed credential; ValueError if no current or fallback SECRET_KEY sealed it"""
+    keys = [settings.SECRET_KEY, *getattr(settings, 'SECRET_KEY_FALLBACKS', [])]
+    try:
+        return MultiFernet([_fernet(secret) for secret in keys]).decrypt(token.encode('ascii')).decode('utf-8')
+    except (InvalidToken, UnicodeError):
+        raise ValueError("Sealed credential does not match SECRET_KEY")
+
+
+class EmailQueue:
+    """
+    Durable send queue backed by the EmailJob table.
+
+    Jobs are claimed with a conditional UPDATE so any number of in-process
+    worker threads and ``process_email_queue`` processes can drain the same
+    database without sending a message twice. A job left in ``sending`` by a
+    worker that died is handed out again after ``stale_after`` seconds.
+
+    A send that fails with a transient error (see EmailService.is_transient)
+    waits in ``retrying`` and is tried again after an exponential backoff
+    with jitter, up to ``max_attempts`` attempts in all. The schedule is
+    kept in the table, so it survives worker restarts.
+
+    The SMTP password is stored sealed (see seal). Uploaded attachments are
+    copied as they are into files under ``attachment_dir``, which the row
+    names. The payload and those files are removed once the job is sent or
+    has failed for good.
+    """
+
+    def __init__(self, workers: int = 2, poll_interval: float = 1.0, stale_after: float = 900,
+                 max_attempts: int = 5, retry_base_delay: float = 30, retry_max_delay: float = 3600,
+                 attachment_dir: Optional[str] = None):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.attachment_dir = attachment_dir or os.path.join(tempfile.gettempdir(), 'email_app_queue_attachments')
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _spool_upload(self, uploaded_file: Any) -> str:
+        """Copy an upload, chunk by chunk, to a new file in attachment_dir and return its name"""
+        os.makedirs(self.attachment_dir, exist_ok=True)
+        name = uuid.uuid4().hex
+        uploaded_file.seek(0)
+        with open(os.path.join(self.attachment_dir, name), 'xb') as spooled:
+            for chunk in uploaded_file.chunks(chunk_size=ATTACHMENT_READ_CHUNK_SIZE):
+                spooled.write(chunk)
+        return name
+
+    def _spooled_path(self, name: str) -> str:
+        # Only a bare file name is ever stored; anything else never leaves attachment_dir
+        return os.path.join(self.attachment_dir, os.path.basename(name))
+
+    def _storable_attachment(self, attachment: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON-safe copy of an attachment: decoded bytes are dropped, uploads are spooled to a file"""
+        stored = {key: value for key, value in attachment.items() if key not in ('decoded_content', 'file')}
+        if 'file' in attachment:
+            stored['spooled_file'] = self._spool_upload(attachment['file'])
+        return stored
+
+    def _storable(self, send_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The job outlives the request, so it keeps uploads as spooled files,
+        and the SMTP password only sealed
+        """
+        stored = dict(send_kwargs)
+        if stored.get('attachments'):
+            attachments = []
+            try:
+                for attachment in stored['attachments']:
+                    attachments.append(self._storable_attachment(attachment))
+            except Exception:
+                self._remove_spooled({'attachments': attachments})
+                raise
+            stored['attachments'] = attachments
+        email_settings = stored.get('email_settings')
+        if email_settings and email_settings.get('password'):
+            stored['email_settings'] = {key: value for key, value in email_settings.items() if key != 'password'}
+            stored['sealed_password'] = seal(email_settings['password'])
+        return stored
+
+    def _remove_spooled(self, payload: Optional[Dict[str, Any]]) -> None:
+        """Delete the spooled upload files of a payload"""
+        for attachment in (payload or {}).get('attachments') or []:
+            if attachment.get('spooled_file'):
+                try:
+                    os.remove(self._spooled_path(attachment['spooled_file']))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove spooled attachment {attachment['spooled_file']}: {str(e)}")
+
+    def _create(self, payload: Dict[str, Any], **fields) -> EmailJob:
+        """Insert a job row, removing the payload's spooled files if that fails"""
+        try:
+            return self._retry_locked(lambda: EmailJob.objects.create(payload=payload, **fields))
+        except Exception:
+            self._remove_spooled(payload)
+            raise
+
+    def _send_kwargs(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        send_email keyword arguments of a stored payload, with spooled uploads
+        opened as files. ValueError if its password cannot be unsealed,
+        OSError if a spooled file cannot be opened.
+        """
+        send_kwargs = dict(payload)
+        sealed_password = send_kwargs.pop('sealed_password', None)
+        if sealed_password is not None:
+            send_kwargs['email_settings'] = {**send_kwargs['email_settings'], 'password': unseal(sealed_password)}
+        if send_kwargs.get('attachments'):
+            attachments = []
+            try:
+                for attachment in send_kwargs['attachments']:
+                    attachment = dict(attachment)
+                    if 'spooled_file' in attachment:
+                        attachment['file'] = File(open(self._spooled_path(attachment.pop('spooled_file')), 'rb'))
+                    attachments.append(attachment)
+            except OSError:
+                self._close_files(attachments)
+                raise
+            send_kwargs['attachments'] = attachments
+        return send_kwargs
+
+    @staticmethod
+    def _close_files(attachments: List[Dict[str, Any]]) -> None:
+        for attachment in attachments:
+            if 'file' in attachment:
+                attachment['file'].close()
+
+    @staticmethod
+    def _retry_locked(operation: Callable[[], T]) -> T:
+        """Run a database write, trying again while SQLite reports a lock"""
+        for attempt in range(1, _LOCK_ATTEMPTS + 1):
+            try:
+                return operation()
+            except OperationalError as e:
+                if not _is_locked(e) or attempt == _LOCK_ATTEMPTS:
+                    raise
+                time.sleep(random.uniform(0, _LOCK_RETRY_DELAY * attempt))
+
+    def enqueue(self, send_kwargs: Dict[str, Any]) -> EmailJob:
+        """Store a validated send request and wake the workers"""
+        job = self._create(self._storable(send_kwargs))
+        self.start_workers()
+        self._wakeup.set()
+        return job
+
+    def retry_delay(self, attempts: int) -> float:
+        """Seconds to wait after the given number of failed attempts"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** min(attempts - 1, 32))
+        # Half of it at random, so messages that failed together do not all come back at once
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def enqueue_retry(self, send_kwargs: Dict[str, Any], result: Dict[str, Any]) -> Optional[EmailJob]:
+        """
+        Store a send that failed in the request with a transient error, as a
+        job that already used one attempt. Returns None if retries are off.
+        """
+        if self.max_attempts <= 1:
+            return None
+        next_attempt_at = timezone.now() + timedelta(seconds=max(self.retry_delay(1), result.get('retry_after') or 0))
+        job = self._create(
+            self._storable(send_kwargs),
+            result=result,
+            attempts=1,
+            status=EmailJob.STATUS_RETRYING,
+            next_attempt_at=next_attempt_at
+        )
+        self.start_workers()
+        return job
+
+    def claim_next(self) -> Optional[EmailJob]:
+        """Atomically move the oldest runnable job to ``sending`` and return it"""
+        now = timezone.now()
+        runnable = Q(status=EmailJob.STATUS_QUEUED) | Q(
+            status=EmailJob.STATUS_RETRYING,
+            next_attempt_at__lte=now
+        ) | Q(
+            status=EmailJob.STATUS_SENDING,
+            started_at__lt=now - timedelta(seconds=self.stale_after)
+        )
+        candidates = EmailJob.objects.filter(runnable).order_by('created_at').values_list('id', 'status')[:10]
+        for job_id, job_status in candidates:
+            claimed = self._retry_locked(
+                lambda: EmailJob.objects.filter(pk=job_id, status=job_status).filter(runnable).update(
+                    status=EmailJob.STATUS_SENDING,
+                    started_at=now
+                )
+            )
+            if claimed:
+                return EmailJob.objects.get(pk=job_id)
+        return None
+
+    def run_job(self, job: EmailJob) -> Dict[str, Any]:
+        """Send a claimed job and record its outcome"""
+        try:
+            send_kwargs = self._send_kwargs(job.payload or {})
+        except (ValueError, KeyError) as e:
+            logger.error(f"Queued email {job.id} has unreadable credentials: {str(e)}")
+            result = {
+                'success': False,
+                'error': 'CREDENTIALS_UNAVAILABLE',
+                'message': 'The stored SMTP password could not be decrypted; SECRET_KEY may have changed',
+                'retryable': False
+            }
+        except OSError as e:
+            logger.error(f"Queued email {job.id} has an unreadable attachment: {str(e)}")
+            result = {
+                'success': False,
+                'error': 'ATTACHMENT_UNAVAILABLE',
+                'message': 'A stored attachment of the queued email could not be read',
+                'retryable': False
+            }
+        else:
+            try:
+                result = EmailService.send_email(**send_kwargs)
+            finally:
+                self._close_files(send_kwargs.get('attachments') or [])
+        job.attempts += 1
+        job.result = result
+
+        if not result.get('success') and result.get('retryable') and job.attempts < self.max_attempts:
+            job.status = EmailJob.STATUS_RETRYING
+            # A rate-limited send says when the account has room again
+            delay = max(self.retry_delay(job.attempts), result.get('retry_after') or 0)
+            job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            self._retry_locked(lambda: job.save(update_fields=['attempts', 'result', 'status', 'next_attempt_at']))
+            logger.warning(f"Queued email {job.id} failed: {result.get('error')}, attempt {job.attempts} "
+                           f"of {self.max_attempts}, retrying at {job.next_attempt_at.isoformat()}")
+            return result
+
+        job.status = EmailJob.STATUS_SENT if result.get('success') else EmailJob.STATUS_FAILED
+        job.next_attempt_at = None
+        job.finished_at = timezone.now()
+        # Credentials and attachments are not kept once the job is done
+        payload, job.payload = job.payload, None
+        self._retry_locked(lambda: job.save(
+            update_fields=['attempts', 'result', 'status', 'next_attempt_at', 'finished_at', 'payload']
+        ))
+        self._remove_spooled(payload)
+
+        if result.get('success'):
+            logger.info(f"Queued email {job.id} sent successfully")
+        else:
+            logger.warning(f"Queued email {job.id} failed: {result.get('error', 'Unknown error')}")
+        return result
+
+    def run_once(self) -> bool:
+        """Process a single job if one is available. Returns whether one was processed."""
+        close_old_connections()
+        try:
+            try:
+                job = self.claim_next()
+            except OperationalError as e:
+                if not _is_locked(e):
+                    raise
+                # Other workers are writing; this one tries again on its next poll
+                logger.warning(f"Email queue could not claim a job, database busy: {str(e)}")
+                return False
+            if job is None:
+                return False
+            try:
+                self.run_job(job)
+            except Exception:
+                # The job stays in 'sending' and is handed out again after stale_after
+                logger.exception(f"Email queue worker failed to record job {job.id}")
+            return True
+        except Exception:
+            logger.exception("Email queue worker error")
+            return False
+        finally:
+            close_old_connections()
+
+    def run_forever(self, stop_event: Optional[threading.Event] = None) -> None:
+        """Drain the queue until stop_event is set, waiting between empty polls"""
+        while stop_event is None or not stop_event.is_set():
+            if not self.run_once():
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start_workers(self) -> None:
+        """Start the in-process worker threads on first use in this process"""
+        if self.workers <= 0:
+            return
+        if len(self._threads) == self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for index in range(len(self._threads), self.workers):
+                thread = threading.Thread(
+                    target=self.run_forever,
+                    name=f'email-queue-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def job_status(self, job: EmailJob) -> Dict[str, Any]:
+        """Public representation of a job for the status endpoint"""
+        return {
+            'job_id': str(job.id),
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': self.max_attempts,
+            'next_attempt_at': job.next_attempt_at,
+            'created_at': job.created_at,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'result': job.result
+        }
+
+
+email_queue = EmailQueue(
+    workers=getattr(settings, 'EMAIL_QUEUE_WORKERS', 2),
+    poll_interval=getattr(settings, 'EMAIL_QUEUE_POLL_INTERVAL', 1.0),
+    stale_after=getattr(settings, 'EMAIL_QUEUE_STALE_AFTER', 900),
+    max_attempts=getattr(settings, 'EMAIL_RETRY_MAX_ATTEMPTS', 5),
+    retry_base_delay=getattr(settings, 'EMAIL_RETRY_BASE_DELAY', 30),
+    retry_max_delay=getattr(settings, 'EMAIL_RETRY_MAX_DELAY', 3600),
+    attachment_dir=getattr(settings, 'EMAIL_QUEUE_ATTACHMENT_DIR', None),
+)
@@ -0,0 +1,52 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from email_app.jobs import EmailQueue, email_queue
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails (run as a separate worker process)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=1,
+            help="Number of worker threads in this process"
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the queue and exit instead of polling forever"
+        )
+
+    def handle(self, *args, **options):
+        queue = EmailQueue(
+            workers=0,
+            poll_interval=email_queue.poll_interval,
+            stale_after=email_queue.stale_after,
+            max_attempts=email_queue.max_attempts,
+            retry_base_delay=email_queue.retry_base_delay,
+            retry_max_delay=email_queue.retry_max_delay
+        )
+
+        if options['once']:
+            processed = 0
+            while queue.run_once():
+                processed += 1
+            self.stdout.write(f"Processed {processed} queued emails")
+            return
+
+        self.stdout.write(f"Processing email queue with {options['threads']} threads")
+        threads = [
+            threading.Thread(target=queue.run_forever, daemon=True)
+            for _ in range(max(1, options['threads']))
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping email queue worker")
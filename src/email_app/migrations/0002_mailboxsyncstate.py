@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailboxSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255)),
+                ('username', models.CharField(max_length=255)),
+                ('folder', models.CharField(max_length=255)),
+                ('uidvalidity', models.BigIntegerField()),
+                ('last_uid', models.BigIntegerField(default=0)),
+                ('highest_modseq', models.BigIntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('host', 'username', 'folder')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-17 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_app', '0002_mailboxsyncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopSeenMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host', models.CharField(max_length=255)),
+                ('username', models.CharField(max_length=255)),
+                ('uid', models.CharField(max_length=70)),
+                ('seen_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('host', 'username', 'uid')},
+            },
+        ),
+    ]
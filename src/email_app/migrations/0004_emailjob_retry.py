@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('email_app', '0003_popseenmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='emailjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('sending', 'Sending'), ('retrying', 'Waiting to retry'), ('sent', 'Sent'), ('failed', 'Failed')], db_index=True, default='queued', max_length=16),
+        ),
+    ]
@@ -1,3 +1,74 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class EmailJob(models.Model):
+    """A send request queued for background delivery"""
+
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_RETRYING = 'retrying'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_RETRYING, 'Waiting to retry'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    # EmailService.send_email keyword arguments; cleared once the job is finished
+    payload = models.JSONField(null=True)
+    # The result dict returned by EmailService.send_email
+    result = models.JSONField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # When a job that failed with a transient error is tried again
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"EmailJob {self.id} ({self.status})"
+
+
+class MailboxSyncState(models.Model):
+    """High-water mark of an incrementally received IMAP folder"""
+
+    host = models.CharField(max_length=255)
+    username = models.CharField(max_length=255)
+    folder = models.CharField(max_length=255)
+    uidvalidity = models.BigIntegerField()
+    last_uid = models.BigIntegerField(default=0)
+    # Only known when the server supports CONDSTORE
+    highest_modseq = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('host', 'username', 'folder')]
+
+    def __str__(self):
+        return f"{self.username}@{self.host}/{self.folder} (UID {self.last_uid})"
+
+
+class PopSeenMessage(models.Model):
+    """A POP message (by UIDL id) already returned by an incremental receive"""
+
+    host = models.CharField(max_length=255)
+    username = models.CharField(max_length=255)
+    # UIDL ids are up to 70 characters (RFC 1939)
+    uid = models.CharField(max_length=70)
+    seen_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('host', 'username', 'uid')]
+
+    def __str__(self):
+        return f"{self.username}@{self.host} {self.uid}"
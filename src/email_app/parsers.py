@@ -0,0 +1,27 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from . import fastjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+
+    Bodies orjson rejects, and other charsets, go through DRF's parser, so
+    NaN/Infinity are refused and error messages are unchanged.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if fastjson.orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return fastjson.orjson.loads(body)
+        except fastjson.orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,798 @@
+import hashlib
+import imaplib
+import logging
+import poplib
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+from .ratelimit import SLOT_POLL_INTERVAL, RateLimited, SMTPAccountLimiter, smtp_limiter
+
+logger = logging.getLogger(__name__)
+
+# smtplib resets the transaction after these, so the session stays usable
+_RECOVERABLE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+# How often idle connections are checked for a capped account that needs its slot back
+_SLOT_RECLAIM_INTERVAL = 0.1
+
+
+class _TransactionTracking:
+    """
+    Records whether the server accepted MAIL FROM in the current sendmail.
+
+    Until it has, nothing of the message can have been delivered, so a
+    connection found dropped may be reopened and the message sent again.
+    """
+
+    mail_accepted = False
+
+    def sendmail(self, *args, **kwargs):
+        self.mail_accepted = False
+        return super().sendmail(*args, **kwargs)
+
+    def mail(self, *args, **kwargs):
+        reply = super().mail(*args, **kwargs)
+        self.mail_accepted = reply[0] == 250
+        return reply
+
+
+class _TrackedSMTP(_TransactionTracking, smtplib.SMTP):
+    pass
+
+
+class _TrackedSMTP_SSL(_TransactionTracking, smtplib.SMTP_SSL):
+    pass
+
+
+class _PooledEmailBackend(EmailBackend):
+    """EmailBackend whose connection records how far a send got (see _TransactionTracking)"""
+
+    @property
+    def connection_class(self):
+        return _TrackedSMTP_SSL if self.use_ssl else _TrackedSMTP
+
+
+class _PooledBackend:
+    """An open EmailBackend together with its bookkeeping timestamps"""
+
+    __slots__ = ('backend', 'last_used', 'last_checked')
+
+    def __init__(self, backend: EmailBackend):
+        now = time.monotonic()
+        self.backend = backend
+        self.last_used = now
+        self.last_checked = now
+
+
+class SMTPConnectionPool:
+    """
+    Process-wide pool of authenticated SMTP connections.
+
+    Connections are keyed by (host, port, username, password digest, tls, ssl)
+    so a session opened for one account is never handed to another. Idle
+    connections are health-checked with NOOP before reuse, evicted after
+    ``idle_ttl`` seconds and trimmed (least recently used first) when more
+    than ``max_size`` are idle at once.
+
+    With a ``limiter``, send_each takes one token of the account's rate
+    limit per message, and when it caps connections every open connection,
+    idle or borrowed, holds one of the account's slots. A connection that
+    sits idle while another process waits for a slot of its account is
+    closed to hand the slot over.
+    """
+
+    def __init__(self, max_size: int = 10, idle_ttl: float = 60, noop_interval: float = 15,
+                 limiter: Optional[SMTPAccountLimiter] = None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.noop_interval = noop_interval
+        self.limiter = limiter
+        self._idle: 'OrderedDict[int, Tuple[Tuple, _PooledBackend]]' = OrderedDict()
+        # id(backend) -> (slot descriptor, account key) of connections holding a connection slot
+        self._slots: Dict[int, Tuple[int, str]] = {}
+        self._lock = threading.Lock()
+        self._keepalive_thread: Optional[threading.Thread] = None
+
+    @property
+    def capped(self) -> bool:
+        return self.limiter is not None and self.limiter.max_connections > 0
+
+    @staticmethod
+    def make_key(backend_kwargs: Dict[str, Any]) -> Tuple:
+        """Build the pool key for a set of EmailBackend arguments"""
+        password = backend_kwargs.get('password') or ''
+        password_digest = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return (
+            backend_kwargs.get('host'),
+            int(backend_kwargs.get('port') or 0),
+            backend_kwargs.get('username') or '',
+            password_digest,
+            bool(backend_kwargs.get('use_tls')),
+            bool(backend_kwargs.get('use_ssl')),
+        )
+
+    @staticmethod
+    def _is_alive(backend: EmailBackend) -> bool:
+        """Check an idle connection with NOOP"""
+        if backend.connection is None:
+            return False
+        try:
+            code, _ = backend.connection.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self, backend: EmailBackend) -> None:
+        try:
+            backend.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled SMTP connection: {str(e)}")
+        slot = self._slots.pop(id(backend), None)
+        if slot is not None:
+            self.limiter.release_slot(slot[0])
+
+    def _evict_expired(self, now: float) -> List[EmailBackend]:
+        """Remove idle entries older than the TTL or over the size cap. Caller holds the lock."""
+        evicted = []
+        for entry_id in list(self._idle.keys()):
+            _, entry = self._idle[entry_id]
+            if now - entry.last_used > self.idle_ttl:
+                del self._idle[entry_id]
+                evicted.append(entry.backend)
+        while len(self._idle) > self.max_size:
+            _, (_, entry) = self._idle.popitem(last=False)
+            evicted.append(entry.backend)
+        return evicted
+
+    def _take_idle(self, key: Tuple) -> Optional[EmailBackend]:
+        """Take a live idle connection for the key out of the pool"""
+        now = time.monotonic()
+        candidate = None
+
+        with self._lock:
+            stale = self._evict_expired(now)
+            # Most recently used connection first: it is the most likely to be alive
+            for entry_id in reversed(list(self._idle.keys())):
+                entry_key, entry = self._idle[entry_id]
+                if entry_key == key:
+                    del self._idle[entry_id]
+                    candidate = entry
+                    break
+
+        for backend in stale:
+            self._close(backend)
+
+        if candidate is not None:
+            if now - candidate.last_checked < self.noop_interval or self._is_alive(candidate.backend):
+                return candidate.backend
+            self._close(candidate.backend)
+        return None
+
+    def _wait_for_slot(self, backend_kwargs: Dict[str, Any],
+                       key: Optional[Tuple] = None) -> Tuple[Optional[int], Optional[EmailBackend]]:
+        """
+        Lock a connection slot of a capped account, waiting up to the limiter's max_wait.
+
+        With a ``key``, a connection released to the pool for it in the
+        meantime is returned instead of a slot. Raises RateLimited when
+        neither turns up in time.
+        """
+        account = self.limiter.account_key(backend_kwargs)
+        deadline = time.monotonic() + self.limiter.max_wait
+        while True:
+            slot = self.limiter.try_slot(account)
+            if slot is not None:
+                return slot, None
+            if time.monotonic() >= deadline:
+                raise self.limiter.slot_limited()
+            self.limiter.want_slot(account)
+            time.sleep(SLOT_POLL_INTERVAL)
+            if key is not None:
+                backend = self._take_idle(key)
+                if backend is not None:
+                    return None, backend
+
+    def acquire(self, backend_kwargs: Dict[str, Any]) -> Tuple[EmailBackend, bool]:
+        """
+        Borrow an open backend for the given settings.
+
+        Returns the backend and whether it was reused from the idle pool.
+        """
+        key = self.make_key(backend_kwargs)
+        backend = self._take_idle(key)
+        if backend is not None:
+            return backend, True
+        if not self.capped:
+            return self._open(backend_kwargs), False
+        slot, backend = self._wait_for_slot(backend_kwargs, key)
+        if backend is not None:
+            return backend, True
+        return self._open(backend_kwargs, slot), False
+
+    @staticmethod
+    def _dropped_before_mail(backend: EmailBackend) -> bool:
+        """Whether a send that found the connection dropped failed before the server accepted MAIL FROM"""
+        return not getattr(backend.connection, 'mail_accepted', True)
+
+    def _reopen(self, backend_kwargs: Dict[str, Any]) -> EmailBackend:
+        """Open a replacement for a connection the server dropped"""
+        slot = self._wait_for_slot(backend_kwargs)[0] if self.capped else None
+        return self._open(backend_kwargs, slot)
+
+    def _open(self, backend_kwargs: Dict[str, Any], slot: Optional[int] = None) -> EmailBackend:
+        """Open and authenticate a new backend, which keeps ``slot`` until it is closed"""
+        backend = _PooledEmailBackend(**backend_kwargs)
+        if slot is not None:
+            self._slots[id(backend)] = (slot, self.limiter.account_key(backend_kwargs))
+        try:
+            backend.open()
+        except Exception:
+            self._close(backend)
+            raise
+        return backend
+
+    def release(self, backend_kwargs: Dict[str, Any], backend: EmailBackend) -> None:
+        """Return a healthy backend to the idle pool"""
+        if backend.connection is None or self.max_size <= 0:
+            self._close(backend)
+            return
+
+        entry = _PooledBackend(backend)
+        with self._lock:
+            self._idle[id(backend)] = (self.make_key(backend_kwargs), entry)
+            evicted = self._evict_expired(entry.last_used)
+        for stale in evicted:
+            self._close(stale)
+        self._ensure_keepalive()
+
+    def discard(self, backend: EmailBackend) -> None:
+        """Close a backend that must not be reused"""
+        self._close(backend)
+
+    @contextmanager
+    def connection(self, backend_kwargs: Dict[str, Any]):
+        """Context manager that borrows a backend and returns or discards it on exit"""
+        backend, _ = self.acquire(backend_kwargs)
+        try:
+            yield backend
+        except Exception:
+            self.discard(backend)
+            raise
+        else:
+            self.release(backend_kwargs, backend)
+
+    def send_each(self, backend_kwargs: Dict[str, Any], messages: List[Any]) -> List[Optional[Exception]]:
+        """
+        Send messages one at a time over a single pooled session.
+
+        Returns one entry per message: None when it was sent, otherwise the
+        exception it failed with. A refused recipient or sender leaves the
+        session usable for the next message; any other failure replaces the
+        connection. If a reused connection turns out to have been dropped by
+        the server before it accepted MAIL FROM, it is reopened and the
+        message retried. A disconnect later in the transaction fails the
+        message instead, as the server may already have taken it. When the
+        account's rate limit runs out, the messages left fail with
+        RateLimited.
+        """
+        outcomes: List[Optional[Exception]] = []
+        backend = None
+        reused = False
+        throttled = self.limiter is not None and self.limiter.rate > 0
+        for index, message in enumerate(messages):
+            if throttled:
+                try:
+                    self.limiter.wait_for_tokens(backend_kwargs)
+                except RateLimited as e:
+                    outcomes.extend([e] * (len(messages) - index))
+                    break
+            try:
+                if backend is None:
+                    backend, reused = self.acquire(backend_kwargs)
+                try:
+                    backend.send_messages([message])
+                except smtplib.SMTPServerDisconnected:
+                    if not reused or not self._dropped_before_mail(backend):
+                        raise
+                    logger.info("Pooled SMTP connection was dropped by the server, reconnecting")
+                    self.discard(backend)
+                    backend = None
+                    backend = self._reopen(backend_kwargs)
+                    backend.send_messages([message])
+                reused = False
+                outcomes.append(None)
+            except _RECOVERABLE_ERRORS as e:
+                reused = False
+                outcomes.append(e)
+            except Exception as e:
+                outcomes.append(e)
+                if backend is None:
+                    # Could not connect or authenticate; the rest would fail the same way
+                    outcomes.extend([e] * (len(messages) - len(outcomes)))
+                    break
+                self.discard(backend)
+                backend = None
+
+        if backend is not None:
+            self.release(backend_kwargs, backend)
+        return outcomes
+
+    def send_messages(self, backend_kwargs: Dict[str, Any], messages: List[Any]) -> int:
+        """Send messages over a pooled session, raising the first failure"""
+        outcomes = self.send_each(backend_kwargs, messages)
+        for error in outcomes:
+            if error is not None:
+                raise error
+        return len(outcomes)
+
+    def sendmail(self, backend_kwargs: Dict[str, Any], from_addr: str, recipients: List[str],
+                 message: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send one envelope over a pooled session.
+
+        Returns the refused recipients like smtplib.SMTP.sendmail, which
+        EmailBackend drops, and raises SMTPRecipientsRefused only when all of
+        them were refused. The session is handled as in send_each, but no
+        rate limit token is taken: the caller takes one for the message.
+        """
+        backend, reused = self.acquire(backend_kwargs)
+        try:
+            try:
+                refused = backend.connection.sendmail(from_addr, recipients, message)
+            except smtplib.SMTPServerDisconnected:
+                if not reused or not self._dropped_before_mail(backend):
+                    raise
+                logger.info("Pooled SMTP connection was dropped by the server, reconnecting")
+                self.discard(backend)
+                backend = None
+                backend = self._reopen(backend_kwargs)
+                refused = backend.connection.sendmail(from_addr, recipients, message)
+        except _RECOVERABLE_ERRORS:
+            self.release(backend_kwargs, backend)
+            raise
+        except Exception:
+            if backend is not None:
+                self.discard(backend)
+            raise
+        self.release(backend_kwargs, backend)
+        return refused
+
+    def reclaim_slots(self) -> None:
+        """Close the idle connections of capped accounts that a caller has waited for a slot of since they went idle"""
+        with self._lock:
+            entries = list(self._idle.items())
+
+        for entry_id, (_, entry) in entries:
+            slot = self._slots.get(id(entry.backend))
+            if slot is None or not self.limiter.slot_wanted(slot[1], entry.last_used):
+                continue
+            with self._lock:
+                if self._idle.pop(entry_id, None) is None:
+                    continue
+            self._close(entry.backend)
+
+    def keepalive(self) -> None:
+        """NOOP every idle connection, dropping the dead and the expired ones"""
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_expired(now)
+            entries = list(self._idle.items())
+
+        for entry_id, (key, entry) in entries:
+            if self.noop_interval <= 0 or now - entry.last_checked < self.noop_interval:
+                continue
+            with self._lock:
+                # Skip entries that were borrowed in the meantime
+                if self._idle.pop(entry_id, None) is None:
+                    continue
+            if self._is_alive(entry.backend):
+                entry.last_checked = time.monotonic()
+                with self._lock:
+                    self._idle[entry_id] = (key, entry)
+            else:
+                evicted.append(entry.backend)
+
+        for backend in evicted:
+            self._close(backend)
+
+    def _ensure_keepalive(self) -> None:
+        """Start the keepalive thread on first use in this process"""
+        if self.noop_interval <= 0 and not self.capped:
+            return
+        if self._keepalive_thread is not None and self._keepalive_thread.is_alive():
+            return
+        with self._lock:
+            if self._keepalive_thread is not None and self._keepalive_thread.is_alive():
+                return
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive_loop,
+                name='smtp-pool-keepalive',
+                daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def _keepalive_loop(self) -> None:
+        interval = min(self.noop_interval, _SLOT_RECLAIM_INTERVAL) if self.capped else self.noop_interval
+        if interval <= 0:
+            interval = _SLOT_RECLAIM_INTERVAL
+        while True:
+            time.sleep(interval)
+            try:
+                if self.capped:
+                    self.reclaim_slots()
+                self.keepalive()
+            except Exception as e:
+                logger.error(f"SMTP pool keepalive error: {str(e)}")
+
+    def close_all(self) -> None:
+        """Close every idle connection"""
+        with self._lock:
+            entries = list(self._idle.values())
+            self._idle.clear()
+        for _, entry in entries:
+            self._close(entry.backend)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current number of idle connections"""
+        with self._lock:
+            return {'idle': len(self._idle), 'max_size': self.max_size}
+
+
+class _PooledSession:
+    """A logged-in IMAP or POP session with its bookkeeping timestamps"""
+
+    __slots__ = ('mail', 'opened_at', 'last_used', 'last_checked')
+
+    def __init__(self, mail: Any, opened_at: float):
+        now = time.monotonic()
+        self.mail = mail
+        self.opened_at = opened_at
+        self.last_used = now
+        self.last_checked = now
+
+
+class SessionLimitReached(Exception):
+    """Every session a mailbox may have open stayed in use for longer than the caller may wait"""
+
+
+class MailSessionPool:
+    """
+    Process-wide pool of logged-in IMAP or POP sessions for receiving.
+
+    Sessions are keyed by (host, port, username, password digest, ssl) and,
+    for IMAP, the folder, so a borrowed session never belongs to another
+    account. Like SMTPConnectionPool, idle sessions are NOOP-checked before
+    reuse, closed after ``idle_ttl`` seconds and trimmed least recently used
+    first above ``max_size``. ``max_age`` additionally limits how long after
+    login a session may be reused, which is what POP needs: a POP session
+    holds the maildrop lock and never sees messages that arrived after it
+    logged in.
+
+    With ``max_sessions``, at most that many sessions per key are open at
+    once, idle or borrowed. A caller that needs another waits up to
+    ``max_wait`` seconds for one to be released or closed, then gets
+    SessionLimitReached.
+    """
+
+    def __init__(self, protocol: str, max_size: int = 10, idle_ttl: float = 60,
+                 noop_interval: float = 15, max_age: Optional[float] = None,
+                 max_sessions: int = 0, max_wait: float = 10.0):
+        self.protocol = protocol
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.noop_interval = noop_interval
+        self.max_age = max_age
+        self.max_sessions = max_sessions
+        self.max_wait = max_wait
+        self._idle: 'OrderedDict[int, Tuple[Tuple, _PooledSession]]' = OrderedDict()
+        # id(session) -> (key, login time) of every open session, idle or borrowed
+        self._sessions: Dict[int, Tuple[Tuple, float]] = {}
+        self._open_per_key: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+        # Notified whenever a session is released or closed
+        self._changed = threading.Condition(self._lock)
+        self._reaper_thread: Optional[threading.Thread] = None
+
+    def make_key(self, config: Dict[str, Any]) -> Tuple:
+        """Build the pool key for a receive configuration"""
+        password_digest = hashlib.sha256((config.get('password') or '').encode('utf-8')).hexdigest()
+        key = (
+            config.get('host'),
+            int(config.get('port') or 0),
+            config.get('username') or '',
+            password_digest,
+            bool(config.get('use_ssl')),
+        )
+        if self.protocol == 'IMAP':
+            key += (config.get('folder') or 'INBOX',)
+        return key
+
+    def _has_room(self, key: Tuple) -> bool:
+        """Caller holds the lock"""
+        return self.max_sessions <= 0 or self._open_per_key.get(key, 0) < self.max_sessions
+
+    def _reserve(self, key: Tuple) -> bool:
+        """Count a session about to be opened for key if it is under the cap. Caller holds the lock."""
+        if not self._has_room(key):
+            return False
+        self._open_per_key[key] = self._open_per_key.get(key, 0) + 1
+        return True
+
+    def _unreserve(self, key: Tuple) -> None:
+        """Caller holds the lock"""
+        count = self._open_per_key.get(key, 0) - 1
+        if count > 0:
+            self._open_per_key[key] = count
+        else:
+            self._open_per_key.pop(key, None)
+        self._changed.notify_all()
+
+    def _forget(self, mail: Any) -> None:
+        """Stop counting a session that is being closed"""
+        with self._lock:
+            registered = self._sessions.pop(id(mail), None)
+            if registered is not None:
+                self._unreserve(registered[0])
+
+    def _wait(self, key: Tuple, deadline: float) -> None:
+        """Wait for a session of key to be released or closed; SessionLimitReached after the deadline"""
+        with self._changed:
+            if self._has_room(key) or any(entry_key == key for entry_key, _ in self._idle.values()):
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SessionLimitReached(
+                    f"All {self.max_sessions} {self.protocol} sessions allowed for this mailbox are in use"
+                )
+            self._changed.wait(remaining)
+
+    def open(self, config: Dict[str, Any]) -> Any:
+        """Connect and log in a new session that can later be released to the pool"""
+        return self._checkout(config, reuse=False)[0]
+
+    def _login(self, config: Dict[str, Any], key: Tuple) -> Any:
+        """Open a session for a place already reserved for key, giving the place back if that fails"""
+        try:
+            mail = self._connect(config)
+        except Exception:
+            with self._lock:
+                self._unreserve(key)
+            raise
+        with self._lock:
+            self._sessions[id(mail)] = (key, time.monotonic())
+        return mail
+
+    def _connect(self, config: Dict[str, Any]) -> Any:
+        # A timeout bounds every blocking socket operation of the session
+        connect_kwargs = {'timeout': config['timeout']} if config.get('timeout') else {}
+        if self.protocol == 'IMAP':
+            if config.get('use_ssl'):
+                mail = imaplib.IMAP4_SSL(config['host'], config['port'], **connect_kwargs)
+            else:
+                mail = imaplib.IMAP4(config['host'], config['port'], **connect_kwargs)
+            try:
+                mail.login(config['username'], config['password'])
+                # ENABLE is only allowed before SELECT, so turn CONDSTORE on while we can
+                if 'CONDSTORE' in mail.capabilities and 'ENABLE' in mail.capabilities:
+                    mail.enable('CONDSTORE')
+            except Exception:
+                self.discard(mail)
+                raise
+        else:
+            if config.get('use_ssl'):
+                mail = poplib.POP3_SSL(config['host'], config['port'], **connect_kwargs)
+            else:
+                mail = poplib.POP3(config['host'], config['port'], **connect_kwargs)
+            try:
+                mail.user(config['username'])
+                mail.pass_(config['password'])
+            except Exception:
+                self.discard(mail)
+                raise
+        return mail
+
+    @staticmethod
+    def _is_alive(mail: Any) -> bool:
+        try:
+            if isinstance(mail, imaplib.IMAP4):
+                return mail.noop()[0] == 'OK'
+            return mail.noop().startswith(b'+OK')
+        except (imaplib.IMAP4.error, poplib.error_proto, OSError, EOFError):
+            return False
+
+    def _close(self, mail: Any) -> None:
+        """Log out politely"""
+        self._forget(mail)
+        try:
+            if isinstance(mail, imaplib.IMAP4):
+                mail.logout()
+            else:
+                mail.quit()
+        except Exception as e:
+            logger.debug(f"Error closing pooled {self.protocol} session: {str(e)}")
+
+    def discard(self, mail: Any) -> None:
+        """Drop a session that must not be reused without another round trip"""
+        self._forget(mail)
+        try:
+            if isinstance(mail, imaplib.IMAP4):
+                mail.shutdown()
+            else:
+                mail.close()
+        except Exception as e:
+            logger.debug(f"Error dropping {self.protocol} session: {str(e)}")
+
+    def _expired(self, entry: _PooledSession, now: float) -> bool:
+        return now - entry.last_used > self.idle_ttl or (
+            self.max_age is not None and now - entry.opened_at > self.max_age
+        )
+
+    def _evict_expired(self, now: float) -> List[Any]:
+        """Remove idle sessions past their TTL or over the size cap. Caller holds the lock."""
+        evicted = []
+        for entry_id in list(self._idle.keys()):
+            _, entry = self._idle[entry_id]
+            if self._expired(entry, now):
+                del self._idle[entry_id]
+                evicted.append(entry.mail)
+        while len(self._idle) > self.max_size:
+            _, (_, entry) = self._idle.popitem(last=False)
+            evicted.append(entry.mail)
+        return evicted
+
+    @staticmethod
+    def _set_timeout(mail: Any, timeout: Optional[float]) -> bool:
+        """Apply the caller's timeout to a reused session; False if its socket is already closed"""
+        try:
+            mail.sock.settimeout(timeout)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, config: Dict[str, Any]) -> Tuple[Any, bool]:
+        """
+        Borrow a logged-in session for the given configuration.
+
+        Returns the session and whether it was reused from the idle pool.
+        Raises SessionLimitReached when the key stays at max_sessions for
+        max_wait seconds.
+        """
+        return self._checkout(config, reuse=True)
+
+    def _checkout(self, config: Dict[str, Any], reuse: bool) -> Tuple[Any, bool]:
+        """
+        Take an idle session of the config's key if ``reuse``, else log in a
+        new one once the key is under max_sessions. Without ``reuse``, an
+        idle session is closed to make room when the key is at the cap.
+        """
+        key = self.make_key(config)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            candidate = None
+            with self._lock:
+                stale = self._evict_expired(now)
+                reserved = not reuse and self._reserve(key)
+                if not reserved:
+                    for entry_id in reversed(list(self._idle.keys())):
+                        entry_key, entry = self._idle[entry_id]
+                        if entry_key == key:
+                            del self._idle[entry_id]
+                            candidate = entry
+                            break
+                    reserved = candidate is None and self._reserve(key)
+
+            for mail in stale:
+                self._close(mail)
+
+            if candidate is not None:
+                if reuse and self._set_timeout(candidate.mail, config.get('timeout')) and (
+                    now - candidate.last_checked < self.noop_interval or self._is_alive(candidate.mail)
+                ):
+                    return candidate.mail, True
+                # Its place is free for the next round
+                if reuse:
+                    self.discard(candidate.mail)
+                else:
+                    self._close(candidate.mail)
+            elif reserved:
+                return self._login(config, key), False
+            else:
+                self._wait(key, deadline)
+
+    def release(self, config: Dict[str, Any], mail: Any) -> None:
+        """Return a session in a clean state to the idle pool"""
+        with self._lock:
+            registered = self._sessions.get(id(mail))
+        entry = _PooledSession(mail, registered[1] if registered is not None else time.monotonic())
+        if self.max_size <= 0 or self._expired(entry, entry.last_used):
+            self._close(mail)
+            return
+
+        with self._lock:
+            self._idle[id(mail)] = (self.make_key(config), entry)
+            evicted = self._evict_expired(entry.last_used)
+            self._changed.notify_all()
+        for stale in evicted:
+            self._close(stale)
+        self._ensure_reaper()
+
+    def reap(self) -> None:
+        """Log out sessions that have been idle too long"""
+        with self._lock:
+            evicted = self._evict_expired(time.monotonic())
+        for mail in evicted:
+            self._close(mail)
+
+    def _ensure_reaper(self) -> None:
+        """Start the thread that closes expired idle sessions on first use in this process"""
+        if self._reaper_thread is not None and self._reaper_thread.is_alive():
+            return
+        with self._lock:
+            if self._reaper_thread is not None and self._reaper_thread.is_alive():
+                return
+            self._reaper_thread = threading.Thread(
+                target=self._reaper_loop,
+                name=f'{self.protocol.lower()}-pool-reaper',
+                daemon=True
+            )
+            self._reaper_thread.start()
+
+    def _reaper_loop(self) -> None:
+        interval = max(1.0, min(self.idle_ttl, self.max_age or self.idle_ttl))
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"{self.protocol} pool reaper error: {str(e)}")
+
+    def close_all(self) -> None:
+        """Log out every idle session"""
+        with self._lock:
+            entries = list(self._idle.values())
+            self._idle.clear()
+        for _, entry in entries:
+            self._close(entry.mail)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current number of idle and open sessions"""
+        with self._lock:
+            return {'idle': len(self._idle), 'open': len(self._sessions), 'max_size': self.max_size,
+                    'max_sessions': self.max_sessions}
+
+
+smtp_pool = SMTPConnectionPool(
+    max_size=getattr(settings, 'SMTP_POOL_MAX_SIZE', 10),
+    idle_ttl=getattr(settings, 'SMTP_POOL_IDLE_TTL', 60),
+    noop_interval=getattr(settings, 'SMTP_POOL_NOOP_INTERVAL', 15),
+    limiter=smtp_limiter,
+)
+
+imap_pool = MailSessionPool(
+    'IMAP',
+    max_size=getattr(settings, 'IMAP_POOL_MAX_SIZE', 10),
+    idle_ttl=getattr(settings, 'IMAP_POOL_IDLE_TTL', 60),
+    noop_interval=getattr(settings, 'IMAP_POOL_NOOP_INTERVAL', 15),
+    max_sessions=getattr(settings, 'IMAP_POOL_MAX_SESSIONS', 4),
+    max_wait=getattr(settings, 'RECEIVE_POOL_MAX_WAIT', 10),
+)
+
+pop_pool = MailSessionPool(
+    'POP',
+    max_size=getattr(settings, 'POP_POOL_MAX_SIZE', 5),
+    idle_ttl=getattr(settings, 'POP_SESSION_MAX_AGE', 5),
+    max_age=getattr(settings, 'POP_SESSION_MAX_AGE', 5),
+    max_sessions=getattr(settings, 'POP_POOL_MAX_SESSIONS', 1),
+    max_wait=getattr(settings, 'RECEIVE_POOL_MAX_WAIT', 10),
+)
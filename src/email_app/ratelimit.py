@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import struct
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; the limiter cannot be enabled there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_BUCKET = struct.Struct('dd')
+_WANTED = struct.Struct('d')
+# How often a request waiting for a connection slot checks again
+SLOT_POLL_INTERVAL = 0.05
+# Suggested wait after finding every slot taken: about one message's send time
+_SLOT_RETRY_AFTER = 1.0
+
+
+class RateLimited(Exception):
+    """The SMTP account is over its limit for longer than the caller may wait"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SMTPAccountLimiter:
+    """
+    Token bucket and concurrent connection cap per SMTP account (host, username).
+
+    The state lives in lock files under ``directory``, so every gunicorn
+    worker and queue process on the host shares the same limits. The bucket
+    holds up to ``burst`` messages and refills at ``rate`` messages per
+    second. A connection slot is an exclusive flock on one of
+    ``max_connections`` files, held for as long as the connection is open
+    (pooled idle connections included) and freed by the kernel if its
+    process dies. A caller waits up to ``max_wait`` seconds for a token or
+    a slot, then gets RateLimited with the time to wait before trying again.
+    A zero ``rate`` or ``max_connections`` turns that limit off.
+    """
+
+    def __init__(self, directory: str, rate: float = 0, burst: int = 10, max_connections: int = 0,
+                 max_wait: float = 2.0):
+        self.directory = directory
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_connections = max_connections
+        self.max_wait = max_wait
+        if self.enabled and fcntl is None:
+            raise ImproperlyConfigured("SMTP rate limiting needs fcntl file locks, which this platform lacks")
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or self.max_connections > 0
+
+    @staticmethod
+    def account_key(backend_kwargs: Dict[str, Any]) -> str:
+        account = f"{(backend_kwargs.get('host') or '').lower()}\0{backend_kwargs.get('username') or ''}"
+        return hashlib.sha256(account.encode('utf-8')).hexdigest()[:32]
+
+    def _open(self, name: str) -> int:
+        try:
+            return os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o600)
+        except FileNotFoundError:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            return os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT, 0o600)
+
+    def reserve(self, backend_kwargs: Dict[str, Any], messages: int = 1) -> float:
+        """
+        Take ``messages`` tokens and return how long to wait before sending
+
+        Tokens not yet refilled are reserved, so callers are served in
+        order. Raises RateLimited, without taking anything, if the wait
+        would exceed max_wait.
+        """
+        if self.rate <= 0:
+            return 0.0
+        fd = self._open(f'{self.account_key(backend_kwargs)}.bucket')
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.monotonic()
+            state = os.pread(fd, _BUCKET.size, 0)
+            tokens, updated = _BUCKET.unpack(state) if len(state) == _BUCKET.size else (self.burst, now)
+            # monotonic restarts with the machine; a bucket from before a reboot starts full
+            tokens = self.burst if updated > now else min(self.burst, tokens + (now - updated) * self.rate)
+            wait = max(0.0, (messages - tokens) / self.rate)
+            if wait > self.max_wait:
+                raise RateLimited(f"SMTP account is over {self.rate * 60:g} messages per minute", wait)
+            os.pwrite(fd, _BUCKET.pack(tokens - messages, now), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+    def try_slot(self, account: str) -> Optional[int]:
+        """Lock a free connection slot of the account and return its descriptor, or None if all are taken"""
+        start = random.randrange(self.max_connections)
+        for offset in range(self.max_connections):
+            fd = self._open(f'{account}.slot{(start + offset) % self.max_connections}')
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    def release_slot(fd: int) -> None:
+        os.close(fd)
+
+    def want_slot(self, account: str) -> None:
+        """Record that a caller is waiting for a slot, so idle pooled connections give theirs up"""
+        fd = self._open(f'{account}.wanted')
+        try:
+            os.pwrite(fd, _WANTED.pack(time.monotonic()), 0)
+        finally:
+            os.close(fd)
+
+    def slot_wanted(self, account: str, since: float) -> bool:
+        """Whether a caller has waited for a slot of the account after ``since`` (time.monotonic())"""
+        try:
+            fd = os.open(os.path.join(self.directory, f'{account}.wanted'), os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            state = os.pread(fd, _WANTED.size, 0)
+        finally:
+            os.close(fd)
+        return len(state) == _WANTED.size and _WANTED.unpack(state)[0] > since
+
+    def slot_limited(self) -> RateLimited:
+        return RateLimited(
+            f"SMTP account already has {self.max_connections} connections in use",
+            _SLOT_RETRY_AFTER
+        )
+
+    @asynccontextmanager
+    async def slot_async(self, backend_kwargs: Dict[str, Any]):
+        """Hold one of the account's connection slots, waiting up to max_wait for one without blocking the event loop"""
+        if self.max_connections <= 0:
+            yield
+            return
+        account = self.account_key(backend_kwargs)
+        deadline = time.monotonic() + self.max_wait
+        fd = self.try_slot(account)
+        while fd is None:
+            if time.monotonic() >= deadline:
+                raise self.slot_limited()
+            self.want_slot(account)
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+            fd = self.try_slot(account)
+        try:
+            yield
+        finally:
+            self.release_slot(fd)
+
+    def wait_for_tokens(self, backend_kwargs: Dict[str, Any], messages: int = 1) -> None:
+        wait = self.reserve(backend_kwargs, messages)
+        if wait:
+            time.sleep(wait)
+
+    async def wait_for_tokens_async(self, backend_kwargs: Dict[str, Any], messages: int = 1) -> None:
+        wait = self.reserve(backend_kwargs, messages)
+        if wait:
+            await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def limit_async(self, backend_kwargs: Dict[str, Any], messages: int = 1):
+        """A connection slot and ``messages`` tokens, for sending over one AsyncSMTP connection"""
+        async with self.slot_async(backend_kwargs):
+            await self.wait_for_tokens_async(backend_kwargs, messages)
+            yield
+
+
+smtp_limiter = SMTPAccountLimiter(
+    directory=getattr(settings, 'SMTP_RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'email_app_smtp_limits')),
+    rate=getattr(settings, 'SMTP_RATE_LIMIT_PER_MINUTE', 0) / 60,
+    burst=getattr(settings, 'SMTP_RATE_LIMIT_BURST', 10),
+    max_connections=getattr(settings, 'SMTP_MAX_CONNECTIONS_PER_ACCOUNT', 0),
+    max_wait=getattr(settings, 'SMTP_RATE_LIMIT_MAX_WAIT', 2.0)
+)
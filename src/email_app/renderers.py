@@ -0,0 +1,45 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from . import fastjson
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Produces what JSONRenderer does with the default UNICODE_JSON and
+    COMPACT_JSON settings; indented output (``; indent=`` in Accept) and
+    other settings are left to JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (fastjson.orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = fastjson.dumps(data)
+        # Same escaping as JSONRenderer: U+2028/U+2029 are not valid in JavaScript string literals
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON (one object per line).
+
+    Views that stream use ``line`` to encode each record themselves; a
+    regular Response (such as a validation error) renders as a single line.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    @staticmethod
+    def line(data) -> bytes:
+        return fastjson.dumps(data) + b'\n'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return self.line(data)
@@ -1,7 +1,65 @@
 from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail
 from typing import Dict, Union, List, Optional
 import base64
 
+from .addresses import address_validator, INVALID_ADDRESS
+
+MAX_ATTACHMENTS = 10
+MAX_ATTACHMENT_SIZE = 25 * 1024 * 1024  # 25MB per attachment
+MAX_TOTAL_ATTACHMENT_SIZE = 100 * 1024 * 1024  # 100MB total
+
+
+class EmailAddressField(serializers.CharField):
+    """EmailField checked through the shared address_validator (cached, with domain policies)"""
+    default_error_messages = {
+        'invalid': INVALID_ADDRESS
+    }
+
+    def to_internal_value(self, data):
+        address = super().to_internal_value(data)
+        verdict = address_validator.check(address)
+        if verdict:
+            raise serializers.ValidationError(verdict, code='invalid')
+        return address
+
+
+class EmailAddressListField(serializers.ListField):
+    """
+    List of email addresses validated in one pass.
+
+    Errors are reported per index like ListField(child=EmailField()), but
+    the whole list goes through address_validator at once instead of one
+    child field run per address.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('child', EmailAddressField())
+        super().__init__(**kwargs)
+
+    def run_child_validation(self, data):
+        addresses = []
+        errors = {}
+        for index, item in enumerate(data):
+            if item is None:
+                errors[index] = [ErrorDetail(self.child.error_messages['null'], code='null')]
+                item = ''
+            elif isinstance(item, bool) or not isinstance(item, (str, int, float)):
+                errors[index] = [ErrorDetail(self.child.error_messages['invalid'], code='invalid')]
+                item = ''
+            else:
+                item = str(item).strip()
+                if not item:
+                    errors[index] = [ErrorDetail(self.child.error_messages['blank'], code='blank')]
+            addresses.append(item)
+
+        for index, verdict in enumerate(address_validator.check_many(addresses)):
+            if verdict and index not in errors:
+                errors[index] = [ErrorDetail(verdict, code='invalid')]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return addresses
+
 class EmailSerializer(serializers.Serializer):
     """Enhanced email serializer with comprehensive validation"""
     
@@ -14,29 +72,26 @@ class EmailSerializer(serializers.Serializer):
     )
     
     # Sender configuration
-    sender = serializers.EmailField(
+    sender = EmailAddressField(
         required=True,
         help_text="Sender's email address"
     )
     
     # Recipients configuration
-    recipients = serializers.ListField(
-        child=serializers.EmailField(),
+    recipients = EmailAddressListField(
         required=True,
         min_length=1,
         help_text="List of recipient email addresses (at least one required)"
     )
     
     # Optional CC and BCC
-    cc = serializers.ListField(
-        child=serializers.EmailField(),
+    cc = EmailAddressListField(
         required=False,
         allow_empty=True,
         help_text="Optional list of CC recipients"
     )
     
-    bcc = serializers.ListField(
-        child=serializers.EmailField(),
+    bcc = EmailAddressListField(
         required=False,
         allow_empty=True,
         help_text="Optional list of BCC recipients"
@@ -67,16 +122,48 @@ class EmailSerializer(serializers.Serializer):
         child=serializers.DictField(),
         required=False,
         allow_empty=True,
-        max_length=10,  # Limit number of attachments
+        max_length=MAX_ATTACHMENTS,  # Limit number of attachments
         help_text="Optional list of file attachments (max 10)"
     )
     
+    # File parts of a multipart/form-data request
+    files = serializers.ListField(
+        child=serializers.FileField(allow_empty_file=True),
+        required=False,
+        allow_empty=True,
+        max_length=MAX_ATTACHMENTS,
+        help_text="Optional file uploads sent as multipart/form-data parts (max 10)"
+    )
+    
     # Default settings flag
     use_default_settings = serializers.BooleanField(
         default=False,
         help_text="Use Django's default email settings"
     )
     
+    delivery = serializers.ChoiceField(
+        choices=['single', 'per_domain'],
+        required=False,
+        default='single',
+        help_text="'per_domain' sends one envelope per recipient domain in parallel and reports "
+                  "the outcome per recipient in 'recipient_status'"
+    )
+    
+    retry = serializers.BooleanField(
+        default=False,
+        help_text="If sending fails with a transient error, queue the email for retries "
+                  "and return 202 with a job id instead of the error"
+    )
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # 'async' is a reserved word, so it cannot be declared as a class attribute
+        fields['async'] = serializers.BooleanField(
+            default=False,
+            help_text="Queue the email and return 202 with a job id instead of waiting for SMTP"
+        )
+        return fields
+    
     def validate_email_settings(self, value):
         """Validate email settings structure"""
         if not value:
@@ -109,8 +196,8 @@ class EmailSerializer(serializers.Serializer):
             return value
         
         total_size = 0
-        max_attachment_size = 25 * 1024 * 1024  # 25MB per attachment
-        max_total_size = 100 * 1024 * 1024  # 100MB total
+        max_attachment_size = MAX_ATTACHMENT_SIZE
+        max_total_size = MAX_TOTAL_ATTACHMENT_SIZE
         
         for i, attachment in enumerate(value):
             # Check required fields
@@ -130,6 +217,8 @@ class EmailSerializer(serializers.Serializer):
             try:
                 content = base64.b64decode(attachment['content'], validate=True)
                 content_size = len(content)
+                # Hand the decoded bytes to EmailService so it doesn't decode again
+                attachment['decoded_content'] = content
                 
                 if content_size > max_attachment_size:
                     raise serializers.ValidationError(
@@ -178,7 +267,42 @@ class EmailSerializer(serializers.Serializer):
                     "Cannot use both TLS and SSL simultaneously. Choose one."
                 )
         
+        # Limits shared by base64 attachments and uploaded files
+        attachments = data.get('attachments', [])
+        files = data.get('files', [])
+        if len(attachments) + len(files) > MAX_ATTACHMENTS:
+            raise serializers.ValidationError(
+                f"At most {MAX_ATTACHMENTS} attachments are allowed"
+            )
+        
+        for uploaded_file in files:
+            if uploaded_file.size > MAX_ATTACHMENT_SIZE:
+                raise serializers.ValidationError(
+                    f"Attachment {uploaded_file.name} exceeds maximum size of 25MB"
+                )
+        
+        total_size = sum(len(attachment.get('decoded_content', b'')) for attachment in attachments)
+        total_size += sum(uploaded_file.size for uploaded_file in files)
+        if total_size > MAX_TOTAL_ATTACHMENT_SIZE:
+            raise serializers.ValidationError(
+                f"Total attachments size exceeds maximum of 100MB"
+            )
+        
         return data
+
+
+class EmailBatchSerializer(serializers.Serializer):
+    """Bulk send envelope; each message is validated with EmailSerializer by the view"""
+    
+    MAX_MESSAGES = 500
+    
+    messages = serializers.ListField(
+        child=serializers.DictField(),
+        required=True,
+        min_length=1,
+        max_length=MAX_MESSAGES,
+        help_text="List of email payloads, each in the same format as the send endpoint"
+    )
     
 from rest_framework import serializers
 from typing import Dict, Union
@@ -186,6 +310,72 @@ from typing import Dict, Union
 from rest_framework import serializers
 from typing import Dict, Union
 
+class EmailSearchSerializer(serializers.Serializer):
+    """Receive filters, evaluated by the IMAP server with SEARCH"""
+    
+    to = serializers.CharField(
+        required=False,
+        max_length=200,
+        help_text="Substring of the To header"
+    )
+    
+    subject = serializers.CharField(
+        required=False,
+        max_length=200,
+        help_text="Substring of the subject"
+    )
+    
+    since = serializers.DateField(
+        required=False,
+        help_text="Received on or after this date"
+    )
+    
+    before = serializers.DateField(
+        required=False,
+        help_text="Received before this date"
+    )
+    
+    unseen = serializers.BooleanField(
+        required=False,
+        help_text="true: only unread messages, false: only read ones"
+    )
+    
+    flagged = serializers.BooleanField(
+        required=False,
+        help_text="true: only flagged messages, false: only unflagged ones"
+    )
+    
+    larger_than = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="Only messages larger than this many bytes"
+    )
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        # 'from' is a reserved word, so it cannot be declared as a class attribute
+        fields['from'] = serializers.CharField(
+            required=False,
+            max_length=200,
+            help_text="Substring of the From header"
+        )
+        return fields
+    
+    def validate(self, data):
+        if data.get('since') and data.get('before') and data['since'] >= data['before']:
+            raise serializers.ValidationError({"before": "Must be after 'since'"})
+        for key in ('from', 'to', 'subject'):
+            if key in data and ('\r' in data[key] or '\n' in data[key]):
+                raise serializers.ValidationError({key: "Must be a single line"})
+        # imaplib sends at most one literal per command, and only a literal can carry 8-bit text
+        non_ascii = [key for key in ('from', 'to', 'subject') if key in data and not data[key].isascii()]
+        if len(non_ascii) > 1:
+            raise serializers.ValidationError({
+                non_ascii[1]: "Only one of 'from', 'to' and 'subject' can contain non-ASCII characters"
+            })
+        return data
+
+
 class EmailReceiveSerializer(serializers.Serializer):
     # Email server configuration
     host = serializers.CharField(
@@ -222,11 +412,93 @@ class EmailReceiveSerializer(serializers.Serializer):
         help_text="Email folder to retrieve emails from"
     )
     
+    protocol = serializers.ChoiceField(
+        choices=['IMAP', 'POP'],
+        required=False,
+        default='IMAP',
+        help_text="Mail retrieval protocol"
+    )
+    
+    mode = serializers.ChoiceField(
+        choices=['full', 'headers'],
+        required=False,
+        default='full',
+        help_text="'headers' returns only message-id, subject, from, to, date and size per message"
+    )
+    
+    attachment_mode = serializers.ChoiceField(
+        choices=['content', 'metadata'],
+        required=False,
+        default='content',
+        help_text="'metadata' lists attachments (part, filename, mimetype, size) without their content; "
+                  "download them with /receive/attachment/"
+    )
+    
     max_emails = serializers.IntegerField(
         required=True,
         min_value=1,
         max_value=100,
-        help_text="Maximum number of most recent emails to retrieve"
+        help_text="Maximum number of emails to retrieve: the page size when walking a folder with cursor"
+    )
+    
+    fetch_chunk_size = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=500,
+        help_text="Number of messages requested per IMAP FETCH round trip"
+    )
+    
+    # Incremental (UID based) receive
+    incremental = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Only fetch messages not returned before: newer than the folder's stored high-water mark (IMAP) "
+                  "or with a UIDL id not seen yet (POP)"
+    )
+    
+    uids = serializers.ListField(
+        child=serializers.CharField(max_length=70),
+        required=False,
+        max_length=100,
+        help_text="POP: fetch only the messages with these UIDL ids, e.g. picked from a mode=headers listing"
+    )
+    
+    since_uid = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="Only fetch messages with a UID above this cursor (sync.last_uid of a previous response)"
+    )
+    
+    uidvalidity = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="UIDVALIDITY the since_uid cursor was issued with; a mismatch triggers a full resync"
+    )
+    
+    since_modseq = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="sync.highest_modseq of a previous response, to get flag changes on CONDSTORE servers"
+    )
+    
+    cursor = serializers.CharField(
+        required=False,
+        max_length=200,
+        help_text="next_cursor of a previous response: return the page of older messages that follows it"
+    )
+    
+    # Server-side search (IMAP)
+    filters = EmailSearchSerializer(
+        required=False,
+        help_text="IMAP: only return messages matching all of these filters; the server does the matching"
+    )
+    
+    sort = serializers.ChoiceField(
+        choices=['arrival', 'date'],
+        required=False,
+        default='arrival',
+        help_text="IMAP: which messages count as the most recent. 'date' orders by the Date header "
+                  "on servers with SORT; others fall back to arrival order"
     )
 
     def validate(self, data):
@@ -239,4 +511,76 @@ class EmailReceiveSerializer(serializers.Serializer):
                 "max_emails": "Must be a positive integer"
             })
         
-        return data
\ No newline at end of file
+        if data.get('cursor'):
+            # Pages walk backwards from the newest message in arrival order
+            conflicts = [key for key in ('incremental', 'since_uid', 'uids') if data.get(key) not in (None, False, [])]
+            if data.get('sort') == 'date':
+                conflicts.append('sort')
+            if conflicts:
+                raise serializers.ValidationError({"cursor": f"Cannot be combined with {', '.join(conflicts)}"})
+        
+        if data.get('filters') and data.get('protocol') == 'POP':
+            raise serializers.ValidationError({"filters": "Only supported over IMAP"})
+        # The stored high-water mark is shared by every request for the folder, so a
+        # filtered read must not advance it; a client-held since_uid cursor is fine
+        if data.get('filters') and data.get('incremental'):
+            raise serializers.ValidationError({
+                "filters": "Cannot be combined with incremental; pass since_uid to page through filtered results"
+            })
+        
+        return data
+
+
+
+class EmailReceiveMultiSerializer(serializers.Serializer):
+    """Multi-mailbox receive envelope; each mailbox is validated with EmailReceiveSerializer by the view"""
+    
+    MAX_MAILBOXES = 100
+    
+    mailboxes = serializers.ListField(
+        child=serializers.DictField(),
+        required=True,
+        min_length=1,
+        max_length=MAX_MAILBOXES,
+        help_text="List of receive configurations, each in the same format as the receive endpoint, "
+                  "optionally with an 'id' to key its result by"
+    )
+    
+    timeout = serializers.FloatField(
+        required=False,
+        min_value=1,
+        max_value=300,
+        help_text="Seconds allowed per mailbox before it is reported as TIMEOUT"
+    )
+
+class AttachmentFetchSerializer(serializers.Serializer):
+    host = serializers.CharField(required=True, help_text="IMAP or POP server hostname")
+    username = serializers.EmailField(required=True, help_text="Email account username")
+    password = serializers.CharField(
+        required=True,
+        help_text="Email account password",
+        style={'input_type': 'password'}
+    )
+    port = serializers.IntegerField(required=False, default=993, help_text="Server port (default: 993)")
+    use_ssl = serializers.BooleanField(required=False, default=True, help_text="Use SSL for connection")
+    folder = serializers.CharField(required=False, default='INBOX', help_text="IMAP folder holding the message")
+    protocol = serializers.ChoiceField(
+        choices=['IMAP', 'POP'],
+        required=False,
+        default='IMAP',
+        help_text="Mail retrieval protocol"
+    )
+    uid = serializers.IntegerField(required=False, min_value=1, help_text="IMAP UID of the message")
+    message_number = serializers.IntegerField(required=False, min_value=1, help_text="POP message number")
+    part = serializers.RegexField(
+        r'^\d+(\.\d+)*$',
+        required=True,
+        help_text="Section number of the part, as listed in the receive response (e.g. '2' or '1.2')"
+    )
+
+    def validate(self, data):
+        if data.get('protocol', 'IMAP') == 'IMAP' and 'uid' not in data:
+            raise serializers.ValidationError({"uid": "Required for IMAP"})
+        if data.get('protocol') == 'POP' and 'message_number' not in data:
+            raise serializers.ValidationError({"message_number": "Required for POP"})
+        return data
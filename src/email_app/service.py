@@ -1,28 +1,45 @@
 import os
+import re
 import base64
+import binascii
 import imaplib
 import poplib
 import email
 import quopri
+import json
+import bisect
 from django.core.mail import EmailMessage
 from django.conf import settings
 from typing import List, Optional, Dict, Union, Any
 from django.core.mail import EmailMessage, get_connection
 from email.header import decode_header
+from email.mime.base import MIMEBase
 
 # Enhanced service.py
 import mimetypes
 import logging
 from typing import Dict, List, Union, Any, Optional, Tuple
 from django.core.mail import EmailMultiAlternatives
+from django.core.mail.message import sanitize_address
 from django.core.mail.backends.smtp import EmailBackend
-from django.core.exceptions import ValidationError
-from django.core.validators import validate_email
 import smtplib
 import socket
+from datetime import date
+from asgiref.sync import sync_to_async
+from .aio import AsyncIMAP4, AsyncPOP3, AsyncSMTP
+from .pool import imap_pool, pop_pool, smtp_pool
+from .delivery import domain_delivery, group_by_domain
+from .ratelimit import RateLimited, smtp_limiter
+from .cache import message_cache
+from .addresses import address_validator
+from .models import MailboxSyncState, PopSeenMessage
+from .imap_utils import body_parts, mime_parts, parse_fetch_response, split_parts
 
 logger = logging.getLogger(__name__)
 
+# 57 input bytes make one 76-character base64 line, so chunks encode independently
+ATTACHMENT_READ_CHUNK_SIZE = 57 * 16 * 1024
+
 class EmailServiceError(Exception):
     """Custom exception for email service errors"""
     pass
@@ -39,34 +56,85 @@ class EmailService:
     
     @staticmethod
     def validate_email_addresses(emails: List[str]) -> Tuple[bool, List[str]]:
-        """Validate a list of email addresses"""
-        invalid_emails = []
-        for email in emails:
-            try:
-                validate_email(email)
-            except ValidationError:
-                invalid_emails.append(email)
+        """Validate a list of email addresses (verdicts cached, so addresses the serializer checked are free)"""
+        invalid_emails = address_validator.invalid_addresses(emails)
         return len(invalid_emails) == 0, invalid_emails
     
     @staticmethod
     def validate_attachment(attachment: Dict[str, Any]) -> Tuple[bool, str]:
-        """Validate attachment structure and content"""
-        required_fields = ['filename', 'content', 'content_type']
+        """Validate attachment structure"""
+        required_fields = ['filename', 'content_type']
         
         for field in required_fields:
             if field not in attachment:
                 return False, f"Missing required field: {field}"
         
-        # Validate base64 content
-        try:
-            base64.b64decode(attachment['content'], validate=True)
-        except Exception as e:
-            return False, f"Invalid base64 content: {str(e)}"
+        # Either base64 content or an uploaded file
+        if 'content' not in attachment and 'file' not in attachment:
+            return False, "Missing required field: content"
         
         return True, ""
     
+    @staticmethod
+    def attachment_content(attachment: Dict[str, Any]) -> bytes:
+        """
+        Return the raw bytes of an attachment
+        
+        EmailSerializer stores the bytes it decoded while validating under
+        'decoded_content', so the base64 payload is only decoded once per
+        request. Other callers get the content decoded (and validated) here.
+        """
+        decoded_content = attachment.get('decoded_content')
+        if decoded_content is not None:
+            return decoded_content
+        return base64.b64decode(attachment['content'], validate=True)
+    
+    @staticmethod
+    def file_attachment_part(uploaded_file: Any, filename: str, content_type: str) -> MIMEBase:
+        """
+        Build a MIME part from an uploaded file, reading it in chunks
+        
+        Uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE live in temp files
+        and are base64-encoded chunk by chunk, so the raw bytes are never
+        read whole. The encoded payload (about 4/3 of the file) is still
+        built in memory, and the message is flattened in full when it is
+        sent, since smtplib takes the whole message; the upload size limits
+        are what bound it.
+        """
+        maintype, _, subtype = (content_type or 'application/octet-stream').partition('/')
+        part = MIMEBase(maintype, subtype or 'octet-stream')
+        
+        uploaded_file.seek(0)
+        encoded_chunks = [
+            base64.encodebytes(chunk).decode('ascii')
+            for chunk in uploaded_file.chunks(chunk_size=ATTACHMENT_READ_CHUNK_SIZE)
+        ]
+        part.set_payload(''.join(encoded_chunks))
+        del encoded_chunks
+        part['Content-Transfer-Encoding'] = 'base64'
+        
+        try:
+            filename.encode('ascii')
+        except UnicodeEncodeError:
+            filename = ('utf-8', '', filename)
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        return part
+    
+    @staticmethod
+    def default_backend_kwargs() -> Dict[str, Any]:
+        """SMTP backend arguments taken from Django's email settings"""
+        return {
+            'host': settings.EMAIL_HOST,
+            'port': int(settings.EMAIL_PORT),
+            'username': settings.EMAIL_HOST_USER,
+            'password': settings.EMAIL_HOST_PASSWORD,
+            'use_tls': settings.EMAIL_USE_TLS,
+            'use_ssl': settings.EMAIL_USE_SSL,
+            'timeout': settings.EMAIL_TIMEOUT
+        }
+    
     @classmethod
-    def send_email(
+    def prepare_email(
         cls,
         email_settings: Dict[str, Any] = None,
         sender: str = "",
@@ -80,206 +148,350 @@ class EmailService:
         html_body: str = None
     ) -> Dict[str, Any]:
         """
-        Enhanced email sending service with comprehensive error handling
+        Validate the send parameters and build the message
         
         Returns:
-            Dict containing success status, message, and additional info
+            A failure result dict, or a dict with success=True holding the
+            built 'email_message', the 'backend_kwargs' to send it with and
+            the 'result' fields to report once it has been sent
         """
-        try:
-            # Initialize default values
-            recipients = recipients or []
-            cc = cc or []
-            bcc = bcc or []
-            attachments = attachments or []
-            email_settings = email_settings or {}
-            
-            # Validate email addresses
-            all_emails = recipients + cc + bcc + ([sender] if sender else [])
-            is_valid, invalid_emails = cls.validate_email_addresses(all_emails)
-            
-            if not is_valid:
-                return {
-                    'success': False,
-                    'error': 'INVALID_EMAIL_ADDRESSES',
-                    'message': f'Invalid email addresses: {", ".join(invalid_emails)}',
-                    'invalid_emails': invalid_emails
-                }
-            
-            # Validate recipients
-            if not recipients:
-                return {
-                    'success': False,
-                    'error': 'NO_RECIPIENTS',
-                    'message': 'At least one recipient is required'
-                }
-            
-            # Validate sender
-            if not sender:
-                return {
-                    'success': False,
-                    'error': 'NO_SENDER',
-                    'message': 'Sender email is required'
-                }
-            
-            # Validate subject and body
-            if not subject.strip():
+        # Initialize default values
+        recipients = recipients or []
+        cc = cc or []
+        bcc = bcc or []
+        attachments = attachments or []
+        email_settings = email_settings or {}
+        
+        # Validate email addresses
+        all_emails = recipients + cc + bcc + ([sender] if sender else [])
+        is_valid, invalid_emails = cls.validate_email_addresses(all_emails)
+        
+        if not is_valid:
+            return {
+                'success': False,
+                'error': 'INVALID_EMAIL_ADDRESSES',
+                'message': f'Invalid email addresses: {", ".join(invalid_emails)}',
+                'invalid_emails': invalid_emails
+            }
+        
+        # Validate recipients
+        if not recipients:
+            return {
+                'success': False,
+                'error': 'NO_RECIPIENTS',
+                'message': 'At least one recipient is required'
+            }
+        
+        # Validate sender
+        if not sender:
+            return {
+                'success': False,
+                'error': 'NO_SENDER',
+                'message': 'Sender email is required'
+            }
+        
+        # Validate subject and body
+        if not subject.strip():
+            return {
+                'success': False,
+                'error': 'NO_SUBJECT',
+                'message': 'Email subject is required'
+            }
+        
+        # Check if we have meaningful content (either body or html_body)
+        has_text_body = body and body.strip()
+        has_html_body = html_body and html_body.strip()
+        
+        if not has_text_body and not has_html_body:
+            return {
+                'success': False,
+                'error': 'NO_CONTENT',
+                'message': 'Either body or html_body content is required'
+            }
+        
+        # Resolve SMTP connection settings; the connection itself comes from the pool
+        if use_default_settings:
+            backend_kwargs = cls.default_backend_kwargs()
+        else:
+            if not email_settings:
                 return {
                     'success': False,
-                    'error': 'NO_SUBJECT',
-                    'message': 'Email subject is required'
+                    'error': 'NO_EMAIL_SETTINGS',
+                    'message': 'Email settings are required when not using default settings'
                 }
             
-            # Check if we have meaningful content (either body or html_body)
-            has_text_body = body and body.strip()
-            has_html_body = html_body and html_body.strip()
+            # Validate required email settings
+            required_settings = ['host', 'port', 'username', 'password']
+            missing_settings = [s for s in required_settings if not email_settings.get(s)]
             
-            if not has_text_body and not has_html_body:
+            if missing_settings:
                 return {
                     'success': False,
-                    'error': 'NO_CONTENT',
-                    'message': 'Either body or html_body content is required'
+                    'error': 'MISSING_EMAIL_SETTINGS',
+                    'message': f'Missing required email settings: {", ".join(missing_settings)}',
+                    'missing_settings': missing_settings
                 }
             
-            # Create email backend
-            if use_default_settings:
-                backend = EmailBackend()
-            else:
-                if not email_settings:
-                    return {
-                        'success': False,
-                        'error': 'NO_EMAIL_SETTINGS',
-                        'message': 'Email settings are required when not using default settings'
-                    }
-                
-                # Validate required email settings
-                required_settings = ['host', 'port', 'username', 'password']
-                missing_settings = [s for s in required_settings if not email_settings.get(s)]
-                
-                if missing_settings:
-                    return {
-                        'success': False,
-                        'error': 'MISSING_EMAIL_SETTINGS',
-                        'message': f'Missing required email settings: {", ".join(missing_settings)}',
-                        'missing_settings': missing_settings
-                    }
-                
-                # Create custom backend
-                backend = EmailBackend(
-                    host=email_settings['host'],
-                    port=int(email_settings['port']),
-                    username=email_settings['username'],
-                    password=email_settings['password'],
-                    use_tls=cls.to_bool(email_settings.get('use_tls', False)),
-                    use_ssl=cls.to_bool(email_settings.get('use_ssl', False)),
-                    timeout=int(email_settings.get('timeout', 300))
-                )
-            
-            # Create email message with proper body handling
-            # Use text body if available and not empty, otherwise use empty string
-            email_body = body.strip() if body and body.strip() else ""
-            
-            email_message = EmailMultiAlternatives(
-                subject=subject,
-                body=email_body,
-                from_email=sender,
-                to=recipients,
-                cc=cc,
-                bcc=bcc,
-                connection=backend
-            )
-            
-            # Add HTML alternative if provided and not empty
-            if html_body and html_body.strip():
-                email_message.attach_alternative(html_body.strip(), "text/html")
-            
-            # Process attachments
-            processed_attachments = 0
-            attachment_errors = []
+            # Custom backend settings
+            backend_kwargs = {
+                'host': email_settings['host'],
+                'port': int(email_settings['port']),
+                'username': email_settings['username'],
+                'password': email_settings['password'],
+                'use_tls': cls.to_bool(email_settings.get('use_tls', False)),
+                'use_ssl': cls.to_bool(email_settings.get('use_ssl', False)),
+                'timeout': int(email_settings.get('timeout', 300))
+            }
+        
+        # Create email message with proper body handling
+        # Use text body if available and not empty, otherwise use empty string
+        email_body = body.strip() if body and body.strip() else ""
+        
+        email_message = EmailMultiAlternatives(
+            subject=subject,
+            body=email_body,
+            from_email=sender,
+            to=recipients,
+            cc=cc,
+            bcc=bcc
+        )
+        
+        # Add HTML alternative if provided and not empty
+        if html_body and html_body.strip():
+            email_message.attach_alternative(html_body.strip(), "text/html")
+        
+        # Process attachments
+        processed_attachments = 0
+        attachment_errors = []
+        
+        for i, attachment in enumerate(attachments):
+            is_valid, error_msg = cls.validate_attachment(attachment)
+            if not is_valid:
+                attachment_errors.append(f"Attachment {i+1}: {error_msg}")
+                continue
             
-            for i, attachment in enumerate(attachments):
-                is_valid, error_msg = cls.validate_attachment(attachment)
-                if not is_valid:
-                    attachment_errors.append(f"Attachment {i+1}: {error_msg}")
-                    continue
-                
+            if 'file' in attachment:
                 try:
-                    # Decode base64 content
-                    file_content = base64.b64decode(attachment['content'])
-                    
-                    # Create attachment
-                    email_message.attach(
+                    email_message.attach(cls.file_attachment_part(
+                        attachment['file'],
                         attachment['filename'],
-                        file_content,
                         attachment.get('content_type', 'application/octet-stream')
-                    )
+                    ))
                     processed_attachments += 1
-                    
                 except Exception as e:
                     attachment_errors.append(f"Attachment {i+1} ({attachment.get('filename', 'unknown')}): {str(e)}")
+                continue
             
-            # Send email
             try:
-                sent_count = email_message.send()
-                
-                result = {
-                    'success': True,
-                    'message': 'Email sent successfully',
-                    'sent_count': sent_count,
-                    'recipients_count': len(recipients),
-                    'cc_count': len(cc),
-                    'bcc_count': len(bcc),
-                    'attachments_processed': processed_attachments,
-                    'total_attachments': len(attachments)
-                }
-                
-                if attachment_errors:
-                    result['attachment_warnings'] = attachment_errors
-                
-                return result
+                file_content = cls.attachment_content(attachment)
+            except (binascii.Error, ValueError, TypeError) as e:
+                attachment_errors.append(f"Attachment {i+1}: Invalid base64 content: {str(e)}")
+                continue
+            
+            try:
+                # Create attachment
+                email_message.attach(
+                    attachment['filename'],
+                    file_content,
+                    attachment.get('content_type', 'application/octet-stream')
+                )
+                processed_attachments += 1
                 
-            except smtplib.SMTPAuthenticationError:
-                return {
-                    'success': False,
-                    'error': 'SMTP_AUTH_ERROR',
-                    'message': 'SMTP authentication failed. Check username and password.'
-                }
+            except Exception as e:
+                attachment_errors.append(f"Attachment {i+1} ({attachment.get('filename', 'unknown')}): {str(e)}")
+        
+        result = {
+            'success': True,
+            'message': 'Email sent successfully',
+            'recipients_count': len(recipients),
+            'cc_count': len(cc),
+            'bcc_count': len(bcc),
+            'attachments_processed': processed_attachments,
+            'total_attachments': len(attachments)
+        }
+        
+        if attachment_errors:
+            result['attachment_warnings'] = attachment_errors
+        
+        return {
+            'success': True,
+            'email_message': email_message,
+            'backend_kwargs': backend_kwargs,
+            'result': result
+        }
+    
+    @staticmethod
+    def is_transient(error: Exception) -> bool:
+        """
+        Whether sending again later may succeed: a dropped or refused
+        connection, a timeout, or a 4xx (temporary) SMTP reply
+        """
+        if isinstance(error, RateLimited):
+            return True
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return bool(error.recipients) and all(400 <= code < 500 for code, _ in error.recipients.values())
+        if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+            return True
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 400 <= error.smtp_code < 500
+        if isinstance(error, smtplib.SMTPException):
+            return False
+        # Timeouts, refused and reset connections
+        return isinstance(error, OSError)
+    
+    @classmethod
+    def smtp_error_result(cls, error: Exception) -> Dict[str, Any]:
+        """
+        Map an exception raised while sending to a failure result dict
+        
+        'retryable' tells whether the error is transient (see is_transient).
+        """
+        if isinstance(error, RateLimited):
+            result = {
+                'success': False,
+                'error': 'RATE_LIMITED',
+                'message': str(error),
+                'retry_after': round(error.retry_after, 3)
+            }
+        elif isinstance(error, smtplib.SMTPAuthenticationError):
+            result = {
+                'success': False,
+                'error': 'SMTP_AUTH_ERROR',
+                'message': 'SMTP authentication failed. Check username and password.'
+            }
+        elif isinstance(error, smtplib.SMTPRecipientsRefused):
+            result = {
+                'success': False,
+                'error': 'SMTP_RECIPIENTS_REFUSED',
+                'message': 'SMTP server refused recipients',
+                'refused_recipients': list(error.recipients.keys())
+            }
+        elif isinstance(error, smtplib.SMTPServerDisconnected):
+            result = {
+                'success': False,
+                'error': 'SMTP_SERVER_DISCONNECTED',
+                'message': 'SMTP server disconnected unexpectedly'
+            }
+        elif isinstance(error, smtplib.SMTPConnectError):
+            result = {
+                'success': False,
+                'error': 'SMTP_CONNECT_ERROR',
+                'message': 'Could not connect to SMTP server'
+            }
+        elif isinstance(error, smtplib.SMTPResponseException) and 400 <= error.smtp_code < 500:
+            smtp_message = error.smtp_error
+            result = {
+                'success': False,
+                'error': 'SMTP_TEMPORARY_FAILURE',
+                'message': 'SMTP server is temporarily unable to accept the message',
+                'smtp_code': error.smtp_code,
+                'smtp_message': smtp_message.decode('utf-8', 'replace') if isinstance(smtp_message, bytes) else str(smtp_message)
+            }
+        elif isinstance(error, socket.timeout):
+            result = {
+                'success': False,
+                'error': 'SMTP_TIMEOUT',
+                'message': 'SMTP connection timed out'
+            }
+        else:
+            logger.error(f"Unexpected error sending email: {str(error)}")
+            result = {
+                'success': False,
+                'error': 'UNEXPECTED_ERROR',
+                'message': f'An unexpected error occurred: {str(error)}'
+            }
+        
+        result['retryable'] = cls.is_transient(error)
+        return result
+    
+    @classmethod
+    def send_email(
+        cls,
+        email_settings: Dict[str, Any] = None,
+        sender: str = "",
+        recipients: List[str] = None,
+        subject: str = "",
+        body: str = "",
+        cc: List[str] = None,
+        bcc: List[str] = None,
+        attachments: List[Dict[str, Any]] = None,
+        use_default_settings: bool = False,
+        html_body: str = None,
+        delivery: str = 'single'
+    ) -> Dict[str, Any]:
+        """
+        Enhanced email sending service with comprehensive error handling
+        
+        delivery='per_domain' sends one envelope per recipient domain in
+        parallel (see deliver_per_domain) instead of one for everyone.
+        
+        Returns:
+            Dict containing success status, message, and additional info
+        """
+        try:
+            prepared = cls.prepare_email(
+                email_settings=email_settings,
+                sender=sender,
+                recipients=recipients,
+                subject=subject,
+                body=body,
+                cc=cc,
+                bcc=bcc,
+                attachments=attachments,
+                use_default_settings=use_default_settings,
+                html_body=html_body
+            )
+            if not prepared['success']:
+                return prepared
             
-            except smtplib.SMTPRecipientsRefused as e:
-                return {
-                    'success': False,
-                    'error': 'SMTP_RECIPIENTS_REFUSED',
-                    'message': 'SMTP server refused recipients',
-                    'refused_recipients': list(e.recipients.keys())
-                }
+            if delivery == 'per_domain':
+                return cls.deliver_per_domain(prepared)
             
-            except smtplib.SMTPServerDisconnected:
-                return {
-                    'success': False,
-                    'error': 'SMTP_SERVER_DISCONNECTED',
-                    'message': 'SMTP server disconnected unexpectedly'
-                }
+            # Send email over a pooled connection, within the account's rate limits
+            try:
+                sent_count = smtp_pool.send_messages(prepared['backend_kwargs'], [prepared['email_message']])
+            except Exception as e:
+                return cls.smtp_error_result(e)
             
-            except smtplib.SMTPConnectError:
-                return {
-                    'success': False,
-                    'error': 'SMTP_CONNECT_ERROR',
-                    'message': 'Could not connect to SMTP server'
-                }
+            result = prepared['result']
+            result['sent_count'] = sent_count
+            return result
+        
+        except Exception as e:
+            logger.error(f"Email service error: {str(e)}")
+            return {
+                'success': False,
+                'error': 'SERVICE_ERROR',
+                'message': f'Email service error: {str(e)}'
+            }
+    
+    @classmethod
+    async def send_email_async(cls, **kwargs: Any) -> Dict[str, Any]:
+        """
+        Native asyncio counterpart of send_email, taking the same keyword arguments
+        
+        The message is prepared exactly as for send_email and delivered over
+        its own AsyncSMTP connection instead of the blocking connection pool,
+        so waiting on the server does not hold a thread.
+        """
+        try:
+            delivery = kwargs.pop('delivery', 'single')
+            prepared = cls.prepare_email(**kwargs)
+            if not prepared['success']:
+                return prepared
             
-            except socket.timeout:
-                return {
-                    'success': False,
-                    'error': 'SMTP_TIMEOUT',
-                    'message': 'SMTP connection timed out'
-                }
+            if delivery == 'per_domain':
+                return await cls.deliver_per_domain_async(prepared)
             
+            try:
+                async with smtp_limiter.limit_async(prepared['backend_kwargs']):
+                    sent_count = await AsyncSMTP.send_messages(prepared['backend_kwargs'], [prepared['email_message']])
             except Exception as e:
-                logger.error(f"Unexpected error sending email: {str(e)}")
-                return {
-                    'success': False,
-                    'error': 'UNEXPECTED_ERROR',
-                    'message': f'An unexpected error occurred: {str(e)}'
-                }
+                return cls.smtp_error_result(e)
+            
+            result = prepared['result']
+            result['sent_count'] = sent_count
+            return result
         
         except Exception as e:
             logger.error(f"Email service error: {str(e)}")
@@ -288,6 +500,171 @@ class EmailService:
                 'error': 'SERVICE_ERROR',
                 'message': f'Email service error: {str(e)}'
             }
+    
+    @classmethod
+    def send_batch(cls, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send many messages, reusing one SMTP session per server account
+        
+        Each item holds the keyword arguments of send_email. Messages are
+        grouped by SMTP settings and every group is delivered through
+        send_messages on a single open connection. A failing message does
+        not abort the rest of the batch.
+        
+        Returns:
+            One result dict per message, in input order
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        groups: Dict[Tuple, List[Tuple[int, Dict[str, Any]]]] = {}
+        
+        per_domain: List[Tuple[int, Dict[str, Any]]] = []
+        
+        for index, message_kwargs in enumerate(messages):
+            message_kwargs = dict(message_kwargs)
+            delivery = message_kwargs.pop('delivery', 'single')
+            try:
+                prepared = cls.prepare_email(**message_kwargs)
+            except Exception as e:
+                logger.error(f"Email service error: {str(e)}")
+                prepared = {
+                    'success': False,
+                    'error': 'SERVICE_ERROR',
+                    'message': f'Email service error: {str(e)}'
+                }
+            if not prepared['success']:
+                results[index] = prepared
+                continue
+            if delivery == 'per_domain':
+                per_domain.append((index, prepared))
+                continue
+            key = smtp_pool.make_key(prepared['backend_kwargs'])
+            groups.setdefault(key, []).append((index, prepared))
+        
+        for group in groups.values():
+            backend_kwargs = group[0][1]['backend_kwargs']
+            outcomes = smtp_pool.send_each(backend_kwargs, [prepared['email_message'] for _, prepared in group])
+            for (index, prepared), error in zip(group, outcomes):
+                if error is None:
+                    result = prepared['result']
+                    result['sent_count'] = 1
+                else:
+                    result = cls.smtp_error_result(error)
+                results[index] = result
+        
+        for index, prepared in per_domain:
+            results[index] = cls.deliver_per_domain(prepared)
+        
+        return results
+    
+    @staticmethod
+    def domain_envelopes(email_message: EmailMultiAlternatives) -> Tuple[str, Dict[str, List[str]], List[List[str]], bytes]:
+        """
+        Envelope sender, recipients grouped by domain, the envelope address
+        lists of those groups and the rendered message, as EmailBackend builds them
+        """
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        groups = group_by_domain(email_message.recipients())
+        envelopes = [[sanitize_address(address, encoding) for address in addresses] for addresses in groups.values()]
+        return (
+            sanitize_address(email_message.from_email, encoding),
+            groups,
+            envelopes,
+            email_message.message().as_bytes(linesep='\r\n')
+        )
+    
+    @classmethod
+    def recipient_result(cls, prepared: Dict[str, Any], groups: Dict[str, List[str]],
+                         envelopes: List[List[str]], outcomes: List[Any]) -> Dict[str, Any]:
+        """
+        Merge the outcome of every domain envelope into one result dict
+        
+        Every recipient gets an entry in 'recipient_status': 'sent',
+        'refused' (with the server's smtp_code and smtp_message) or 'failed'
+        (with the error code and message its envelope failed with). When
+        only some recipients were delivered to, the result is a
+        PARTIAL_DELIVERY failure listing the others in 'failed_recipients';
+        it is never retryable, as the delivered recipients would get the
+        message twice.
+        """
+        recipient_status = []
+        all_refused = {}
+        first_error = None
+        transient = True
+        for (domain, addresses), envelope, outcome in zip(groups.items(), envelopes, outcomes):
+            if isinstance(outcome, smtplib.SMTPRecipientsRefused):
+                refused, error = outcome.recipients, None
+            elif isinstance(outcome, Exception):
+                refused, error = {}, cls.smtp_error_result(outcome)
+                first_error = first_error or outcome
+                transient = transient and error['retryable']
+                logger.warning(f"Delivery to {domain} failed: {str(outcome)}")
+            else:
+                refused, error = outcome, None
+            for address, envelope_address in zip(addresses, envelope):
+                entry = {'recipient': address, 'domain': domain, 'status': 'sent'}
+                refusal = refused.get(envelope_address)
+                if error is not None:
+                    entry.update(status='failed', error=error['error'], message=error['message'])
+                elif refusal is not None:
+                    code, text = refusal
+                    all_refused[address] = refusal
+                    transient = transient and 400 <= code < 500
+                    entry.update(status='refused', smtp_code=code,
+                                 smtp_message=text.decode('utf-8', 'replace') if isinstance(text, bytes) else str(text))
+                recipient_status.append(entry)
+        
+        delivered = sum(1 for entry in recipient_status if entry['status'] == 'sent')
+        failed_recipients = [entry['recipient'] for entry in recipient_status if entry['status'] != 'sent']
+        if not delivered:
+            result = cls.smtp_error_result(first_error or smtplib.SMTPRecipientsRefused(all_refused))
+            # Nobody got the message, so sending it again cannot duplicate it
+            result['retryable'] = transient
+        elif failed_recipients:
+            result = {
+                **prepared['result'],
+                'success': False,
+                'error': 'PARTIAL_DELIVERY',
+                'message': f'Email delivered to {delivered} of {len(recipient_status)} recipients',
+                'sent_count': 1,
+                'failed_recipients': failed_recipients,
+                'retryable': False
+            }
+        else:
+            result = prepared['result']
+            result['sent_count'] = 1
+        result['domains'] = len(groups)
+        result['delivered_count'] = delivered
+        result['recipient_status'] = recipient_status
+        return result
+    
+    @classmethod
+    def deliver_per_domain(cls, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Deliver a prepared message with one envelope per recipient domain
+        
+        The envelopes run in parallel on domain_delivery's thread pool, each
+        over its own pooled connection, so a slow domain does not delay the
+        others and a refused recipient only fails itself. The message takes
+        one token of the account's rate limit.
+        """
+        try:
+            smtp_limiter.wait_for_tokens(prepared['backend_kwargs'])
+        except RateLimited as e:
+            return cls.smtp_error_result(e)
+        from_addr, groups, envelopes, message = cls.domain_envelopes(prepared['email_message'])
+        outcomes = domain_delivery.deliver(prepared['backend_kwargs'], from_addr, envelopes, message)
+        return cls.recipient_result(prepared, groups, envelopes, outcomes)
+    
+    @classmethod
+    async def deliver_per_domain_async(cls, prepared: Dict[str, Any]) -> Dict[str, Any]:
+        """deliver_per_domain over AsyncSMTP connections"""
+        try:
+            await smtp_limiter.wait_for_tokens_async(prepared['backend_kwargs'])
+        except RateLimited as e:
+            return cls.smtp_error_result(e)
+        from_addr, groups, envelopes, message = cls.domain_envelopes(prepared['email_message'])
+        outcomes = await domain_delivery.deliver_async(prepared['backend_kwargs'], from_addr, envelopes, message)
+        return cls.recipient_result(prepared, groups, envelopes, outcomes)
 
 
 
@@ -296,6 +673,14 @@ class EmailService:
 
 
 max_emails = int(os.getenv('MAX_EMAILS'))
+IMAP_FETCH_CHUNK_SIZE = getattr(settings, 'IMAP_FETCH_CHUNK_SIZE', 50)
+_UID_RE = re.compile(rb'\bUID (\d+)')
+_FLAGS_RE = re.compile(rb'FLAGS \(([^)]*)\)')
+_SIZE_RE = re.compile(rb'RFC822\.SIZE (\d+)')
+_ESEARCH_ALL_RE = re.compile(rb'\bALL ([\d:,]+)')
+IMAP_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+IMAP_HEADER_QUERY = '(UID RFC822.SIZE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID SUBJECT FROM TO DATE)])'
+IMAP_STRUCTURE_QUERY = '(UID BODYSTRUCTURE BODY.PEEK[HEADER])'
 class EmailReceiver:
     @staticmethod
     def _decode_subject(subject):
@@ -311,127 +696,1176 @@ class EmailReceiver:
         return ' '.join(decoded_parts)
 
     @staticmethod
-    def _decode_body(payload, content_type):
+    def _decode_text(data: bytes, charset: Optional[str]) -> str:
+        """Decode a text part's bytes with its declared charset, falling back to UTF-8"""
         try:
-            if content_type == 'base64':
-                return base64.b64decode(payload).decode('utf-8', errors='ignore')
-            elif content_type == 'quoted-printable':
-                return quopri.decodestring(payload).decode('utf-8', errors='ignore')
-            return payload.decode('utf-8', errors='ignore')
-        except Exception:
-            return payload
+            return data.decode(charset or 'utf-8')
+        except (LookupError, UnicodeDecodeError):
+            return data.decode('utf-8', errors='replace')
+
+    @staticmethod
+    def _sequence_set(ids: List[bytes]) -> bytes:
+        """Compact IMAP sequence set for a list of message numbers, e.g. b'1:5,9'"""
+        numbers = sorted(int(i) for i in ids)
+        ranges = []
+        start = prev = numbers[0]
+        for number in numbers[1:]:
+            if number != prev + 1:
+                ranges.append((start, prev))
+                start = number
+            prev = number
+        ranges.append((start, prev))
+        return b','.join(
+            str(a).encode() if a == b else f'{a}:{b}'.encode()
+            for a, b in ranges
+        )
+
+    @staticmethod
+    def _sequence_ranges(sequence_set: bytes) -> List[Tuple[int, int]]:
+        """Inverse of _sequence_set as (low, high) ranges: b'1:3,9' -> [(1, 3), (9, 9)]"""
+        ranges = []
+        for item in sequence_set.split(b','):
+            start, _, end = item.partition(b':')
+            low, high = sorted((int(start), int(end or start)))
+            ranges.append((low, high))
+        return ranges
+
+    @staticmethod
+    def _fetch_messages(mail, email_ids: List[bytes], chunk_size: int, message_parts: str = '(UID RFC822)'):
+        """
+        UID FETCH messages in batches of chunk_size, one round trip per batch
+        
+        Yields (UID, literal bytes, response text) in the order of email_ids.
+        The response text holds the non-literal items such as RFC822.SIZE.
+        """
+        for offset in range(0, len(email_ids), chunk_size):
+            chunk = email_ids[offset:offset + chunk_size]
+            _, data = mail.uid('FETCH', EmailReceiver._sequence_set(chunk), message_parts)
+            yield from EmailReceiver._fetched_in_order(chunk, data)
+
+    @staticmethod
+    def _fetched_in_order(chunk: List[bytes], data: List[Any]):
+        """Yield (UID, literal bytes, response text) from a UID FETCH response, in the order of chunk"""
+        # The response interleaves (b'<num> (UID <uid> RFC822 {size}', raw) tuples with
+        # b')' closers; servers may also put items such as UID after the literal
+        fetched = {}
+        for index, item in enumerate(data):
+            if isinstance(item, tuple):
+                meta = item[0]
+                if index + 1 < len(data) and isinstance(data[index + 1], bytes):
+                    meta += data[index + 1]
+                match = _UID_RE.search(meta)
+                if match:
+                    fetched[match.group(1)] = (item[1], meta)
+        
+        for uid in chunk:
+            if uid in fetched:
+                yield (uid,) + fetched[uid]
+
+    @staticmethod
+    def _header_record(header_bytes: bytes, **extra: Any) -> Dict[str, Any]:
+        """Lightweight listing record built from a message's headers only"""
+        headers = email.message_from_bytes(header_bytes)
+        return {
+            **extra,
+            'message_id': headers.get('Message-ID', ''),
+            'subject': EmailReceiver._decode_subject(headers.get('Subject', '')),
+            'from': headers.get('From', ''),
+            'to': headers.get('To', ''),
+            'date': headers.get('Date', '')
+        }
+
+    @staticmethod
+    def _imap_header_record(uid: bytes, header_bytes: bytes, meta: bytes) -> Dict[str, Any]:
+        """Listing record from an IMAP_HEADER_QUERY response item"""
+        size = _SIZE_RE.search(meta)
+        return EmailReceiver._header_record(header_bytes, uid=int(uid), size=int(size.group(1)) if size else None)
+
+    @staticmethod
+    def _decode_transfer(data: bytes, encoding: str) -> bytes:
+        """Undo a part's Content-Transfer-Encoding"""
+        if encoding == 'base64':
+            try:
+                return binascii.a2b_base64(data)
+            except binascii.Error:
+                # Tolerate missing padding the way the email package does
+                return binascii.a2b_base64(data + b'==')
+        if encoding == 'quoted-printable':
+            return quopri.decodestring(data)
+        return data
+
+    @staticmethod
+    def _attachment_metadata(part: Dict[str, Any]) -> Dict[str, Any]:
+        """Attachment entry without content, for retrieval through /receive/attachment/"""
+        return {
+            'part': part['part'],
+            'filename': EmailReceiver._decode_subject(part['filename'] or ''),
+            'mimetype': part['mimetype'],
+            'size': part['size']
+        }
+
+    @staticmethod
+    def _structure_records(mail, email_ids: List[bytes], chunk_size: int):
+        """
+        Build message records from BODYSTRUCTURE, listing attachments instead of downloading them
+
+        Per chunk, one FETCH gets the structure and headers, and a second one
+        fetches only the text/plain and text/html sections. Yields records in
+        the order of email_ids.
+        """
+        for offset in range(0, len(email_ids), chunk_size):
+            chunk = email_ids[offset:offset + chunk_size]
+            sequence_set = EmailReceiver._sequence_set(chunk)
+            _, data = mail.uid('FETCH', sequence_set, IMAP_STRUCTURE_QUERY)
+            structures = EmailReceiver._parse_structures(data)
+
+            query = EmailReceiver._text_sections_query(structures)
+            bodies = {}
+            if query:
+                _, data = mail.uid('FETCH', sequence_set, query)
+                bodies = EmailReceiver._fetched_by_uid(data)
+
+            yield from EmailReceiver._structure_chunk_records(chunk, structures, bodies)
+
+    @staticmethod
+    def _parse_structures(data: List[Any]) -> Dict[bytes, Tuple[bytes, List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """UID to (header bytes, text parts, attachment parts) from an IMAP_STRUCTURE_QUERY response"""
+        structures = {}
+        for message in parse_fetch_response(data):
+            if 'UID' in message and isinstance(message.get('BODYSTRUCTURE'), list):
+                texts, attachments = split_parts(body_parts(message['BODYSTRUCTURE']))
+                structures[message['UID'].encode()] = (message.get('BODY[HEADER]') or b'', texts, attachments)
+        return structures
+
+    @staticmethod
+    def _text_sections_query(structures: Dict[bytes, Tuple]) -> Optional[str]:
+        """FETCH items for the text sections of a chunk, or None if it has none"""
+        # Sections missing from a message come back empty, so one FETCH covers the chunk
+        sections = sorted({part['part'] for _, texts, _ in structures.values() for part in texts})
+        if not sections:
+            return None
+        return '(UID ' + ' '.join(f'BODY.PEEK[{section}]' for section in sections) + ')'
+
+    @staticmethod
+    def _fetched_by_uid(data: List[Any]) -> Dict[bytes, Dict[str, Any]]:
+        return {message['UID'].encode(): message for message in parse_fetch_response(data) if 'UID' in message}
+
+    @staticmethod
+    def _structure_chunk_records(chunk: List[bytes], structures: Dict[bytes, Tuple], bodies: Dict[bytes, Dict[str, Any]]):
+        """Yield the records of a chunk from its parsed structures and fetched text sections"""
+        for uid in chunk:
+            if uid not in structures:
+                continue
+            header_bytes, texts, attachments = structures[uid]
+            record = EmailReceiver._header_record(header_bytes, uid=int(uid))
+            record['body'] = ''
+            record['html_body'] = ''
+            for part in texts:
+                content = bodies.get(uid, {}).get(f'BODY[{part["part"]}]')
+                if content:
+                    key = 'html_body' if part['mimetype'] == 'text/html' else 'body'
+                    content = EmailReceiver._decode_transfer(content, part['encoding'])
+                    record[key] = EmailReceiver._decode_text(content, part['params'].get('charset'))
+            record['attachments'] = [EmailReceiver._attachment_metadata(part) for part in attachments]
+            yield record
+
+    @staticmethod
+    def _response_int(mail, code: str) -> Optional[int]:
+        """Integer value of a response code such as UIDVALIDITY from the last SELECT"""
+        _, data = mail.response(code)
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _sync_cursor(email_config: Dict[str, Any], uidvalidity: Optional[int]) -> Dict[str, Any]:
+        """
+        Resolve where an incremental receive starts
+        
+        The cursor comes from the request (since_uid, with the uidvalidity and
+        since_modseq it was issued with) or, for incremental=True, from the
+        high-water mark stored for (host, username, folder). A cursor from
+        another UIDVALIDITY is discarded, which means a full resync.
+        """
+        cursor = {'since_uid': None, 'since_modseq': None, 'uidvalidity_changed': False}
+        
+        if email_config.get('since_uid') is not None:
+            cursor_uidvalidity = email_config.get('uidvalidity')
+            since_uid = email_config['since_uid']
+            since_modseq = email_config.get('since_modseq')
+        elif email_config.get('incremental'):
+            state = MailboxSyncState.objects.filter(
+                host=email_config['host'],
+                username=email_config['username'],
+                folder=email_config['folder']
+            ).first()
+            if state is None:
+                return cursor
+            cursor_uidvalidity = state.uidvalidity
+            since_uid = state.last_uid
+            since_modseq = state.highest_modseq
+        else:
+            return cursor
+        
+        if cursor_uidvalidity is not None and uidvalidity is not None and int(cursor_uidvalidity) != uidvalidity:
+            cursor['uidvalidity_changed'] = True
+            return cursor
+        
+        cursor['since_uid'] = int(since_uid)
+        cursor['since_modseq'] = since_modseq
+        return cursor
+
+    @staticmethod
+    def _pages(email_config: Dict[str, Any]) -> bool:
+        """Whether a receive walks backwards page by page, i.e. returns next_cursor"""
+        return not (
+            email_config.get('incremental') or email_config.get('since_uid') is not None
+            or email_config.get('uids') or email_config.get('sort') == 'date'
+        )
+
+    @staticmethod
+    def _encode_cursor(position: Dict[str, Any]) -> str:
+        """Opaque next_cursor for a page position"""
+        return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _page_cursor(email_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The decoded 'cursor' of a request, or None for the first page"""
+        if not email_config.get('cursor'):
+            return None
+        token = email_config['cursor']
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (ValueError, binascii.Error):
+            position = None
+        if not isinstance(position, dict) or position.get('protocol') != email_config['protocol'].upper():
+            raise EmailServiceError("Invalid cursor, pass next_cursor of a previous response as is")
+        return position
+
+    @staticmethod
+    def _imap_page_start(position: Optional[Dict[str, Any]], uidvalidity: Optional[int]) -> Optional[int]:
+        """UID the requested page ends below"""
+        if position is None:
+            return None
+        if position.get('uidvalidity') is not None and uidvalidity is not None and position['uidvalidity'] != uidvalidity:
+            raise EmailServiceError("Cursor expired: the folder's UIDVALIDITY changed, start again without a cursor")
+        return int(position['before'])
+
+    @staticmethod
+    def _pop_page_start(position: Optional[Dict[str, Any]], uid_map: Optional[Dict[int, str]]) -> Optional[int]:
+        """
+        Message number the requested page ends below
+
+        Message numbers shift when earlier messages are deleted, so the
+        cursor's UIDL id locates the page when the server has UIDL.
+        """
+        if position is None:
+            return None
+        if position.get('uid') and uid_map is not None:
+            for number, uid in uid_map.items():
+                if uid == position['uid']:
+                    return number
+            raise EmailServiceError("Cursor expired: its message was deleted from the server, start again without a cursor")
+        return int(position['before'])
+
+    @staticmethod
+    def _imap_date(value: date) -> str:
+        """IMAP date-text, e.g. 1-Feb-2024; month names must not follow the locale"""
+        return f'{value.day}-{IMAP_MONTHS[value.month - 1]}-{value.year}'
+
+    @staticmethod
+    def _search_criteria(cursor: Dict[str, Any], filters: Optional[Dict[str, Any]] = None,
+                         before: Optional[int] = None) -> Tuple[List[str], Optional[bytes]]:
+        """
+        SEARCH keys for the sync cursor, the page cursor's UID and the request's filters
+
+        A text filter that is not ASCII goes last with its value returned as a
+        UTF-8 literal (EmailSearchSerializer allows only one). Returns the keys
+        and that literal, or None.
+        """
+        criteria = []
+        if cursor['since_uid'] is not None:
+            criteria.append(f'UID {cursor["since_uid"] + 1}:*')
+        if before is not None:
+            criteria.append(f'UID 1:{max(before - 1, 1)}')
+        filters = filters or {}
+        if filters.get('since'):
+            criteria.append(f'SINCE {EmailReceiver._imap_date(filters["since"])}')
+        if filters.get('before'):
+            criteria.append(f'BEFORE {EmailReceiver._imap_date(filters["before"])}')
+        if filters.get('unseen') is not None:
+            criteria.append('UNSEEN' if filters['unseen'] else 'SEEN')
+        if filters.get('flagged') is not None:
+            criteria.append('FLAGGED' if filters['flagged'] else 'UNFLAGGED')
+        if filters.get('larger_than') is not None:
+            criteria.append(f'LARGER {filters["larger_than"]}')
+
+        literal = None
+        for key in ('from', 'to', 'subject'):
+            value = filters.get(key)
+            if not value:
+                continue
+            if value.isascii():
+                criteria.append(f'{key.upper()} "' + value.replace('\\', '\\\\').replace('"', '\\"') + '"')
+            else:
+                literal_key, literal = key.upper(), value.encode('utf-8')
+        if literal is not None:
+            criteria.append(literal_key)
+        return criteria or ['ALL'], literal
+
+    @staticmethod
+    def _search_command(email_config: Dict[str, Any], cursor: Dict[str, Any], capabilities,
+                        before: Optional[int] = None) -> Tuple[str, List[str], Optional[bytes]]:
+        """
+        (command, arguments, literal) of the UID SEARCH or UID SORT that selects the messages
+
+        SORT (RFC 5256) is used for sort='date' without a cursor, since a
+        cursor pages in UID order. Otherwise ESEARCH (RFC 4731) makes the
+        server answer with a compact sequence set instead of every UID.
+        """
+        criteria, literal = EmailReceiver._search_criteria(cursor, email_config.get('filters'), before)
+        if email_config.get('sort') == 'date' and cursor['since_uid'] is None and 'SORT' in capabilities:
+            return 'SORT', ['(REVERSE DATE)', 'UTF-8', *criteria], literal
+        args = ['RETURN', '(ALL)'] if 'ESEARCH' in capabilities else []
+        if literal is not None:
+            args += ['CHARSET', 'UTF-8']
+        return 'SEARCH', args + criteria, literal
+
+    @staticmethod
+    def _searched_ranges(data: List[Any], esearch: List[Any]) -> List[Tuple[int, int]]:
+        """
+        Matching UIDs of a UID SEARCH as ascending (low, high) ranges
+
+        esearch is response('ESEARCH') data. Its compact sequence set is kept
+        as ranges, so a folder of contiguous UIDs costs one range however
+        large it is.
+        """
+        for line in esearch:
+            if isinstance(line, bytes):
+                match = _ESEARCH_ALL_RE.search(line)
+                # An ESEARCH result without ALL means nothing matched
+                return sorted(EmailReceiver._sequence_ranges(match.group(1))) if match else []
+        uids = sorted(int(uid) for uid in b' '.join(item for item in data if isinstance(item, bytes)).split())
+        return EmailReceiver._sequence_ranges(EmailReceiver._sequence_set(uids)) if uids else []
+
+    @staticmethod
+    def _newest_uids(ranges: List[Tuple[int, int]], limit: int) -> List[bytes]:
+        uids = []
+        for low, high in reversed(ranges):
+            for uid in range(high, max(low - 1, high - (limit - len(uids))), -1):
+                uids.append(str(uid).encode())
+            if len(uids) == limit:
+                break
+        return uids
+
+    @staticmethod
+    def _select_uids(ranges: List[Tuple[int, int]], cursor: Dict[str, Any], max_emails: int) -> Tuple[List[bytes], int, bool]:
+        """
+        Pick the UIDs to fetch from the searched UID ranges
+
+        Without a cursor these are the newest max_emails, otherwise the oldest
+        max_emails above the cursor. Returns the UIDs newest first, the new
+        high-water mark and whether more messages are waiting.
+        """
+        if cursor['since_uid'] is None:
+            return EmailReceiver._newest_uids(ranges, max_emails), ranges[-1][1] if ranges else 0, False
+        since_uid = cursor['since_uid']
+        batch = []
+        has_more = False
+        # "n:*" always matches the highest UID, even when it is below n
+        for low, high in ranges:
+            for uid in range(max(low, since_uid + 1), high + 1):
+                if len(batch) == max_emails:
+                    has_more = True
+                    break
+                batch.append(str(uid).encode())
+            if has_more:
+                break
+        return batch[::-1], int(batch[-1]) if batch else since_uid, has_more
+
+    @staticmethod
+    def _imap_select(email_config: Dict[str, Any], command: str, data: List[Any], esearch: List[Any],
+                     cursor: Dict[str, Any], uidvalidity: Optional[int], before: Optional[int]):
+        """
+        UIDs to fetch from a UID SEARCH/SORT answer, newest first
+
+        Returns them with the sync high-water mark, whether more new messages
+        are waiting, and the next_cursor of the page below them (None on the
+        last page or when the receive does not page).
+        """
+        if command == 'SORT':
+            # Already newest first by Date; only the first page is sorted, so there is no next page
+            uids = b' '.join(item for item in data if isinstance(item, bytes)).split()
+            return uids[:email_config['max_emails']], max((int(uid) for uid in uids), default=0), False, None
+        ranges = EmailReceiver._searched_ranges(data, esearch)
+        if before is not None:
+            # 1:n with n below every UID still matches UID 1
+            ranges = [(low, min(high, before - 1)) for low, high in ranges if low < before]
+        email_ids, last_uid, has_more = EmailReceiver._select_uids(ranges, cursor, email_config['max_emails'])
+        next_cursor = None
+        if EmailReceiver._pages(email_config) and email_ids and ranges[0][0] < int(email_ids[-1]):
+            next_cursor = EmailReceiver._encode_cursor({'protocol': 'IMAP', 'uidvalidity': uidvalidity, 'before': int(email_ids[-1])})
+        return email_ids, last_uid, has_more, next_cursor
+
+    @staticmethod
+    def _imap_cached(email_config: Dict[str, Any], uidvalidity: Optional[int], email_ids: List[bytes]):
+        """Cache keys of the selected UIDs and the records already cached"""
+        # A UID names the same message for as long as UIDVALIDITY holds, so parsed records can be reused
+        kind = EmailReceiver._record_kind(email_config)
+        keys = {}
+        if uidvalidity is not None:
+            keys = {uid: message_cache.make_key(email_config, uidvalidity, int(uid), kind) for uid in email_ids}
+        found = message_cache.get_many(keys.values())
+        # Copies, so a caller changing a record does not change the cached one
+        return keys, {uid: dict(found[key]) for uid, key in keys.items() if key in found}
+
+    @staticmethod
+    def _cached_seen_set(email_config: Dict[str, Any], cached: Dict[bytes, Dict[str, Any]]) -> Optional[bytes]:
+        """
+        UIDs of the cache hits to flag \\Seen, or None
+
+        Fetching RFC822 sets \\Seen, so messages served from the cache are
+        flagged the same way; headers and metadata receives only PEEK.
+        """
+        if not cached or EmailReceiver._record_kind(email_config) != 'content':
+            return None
+        return EmailReceiver._sequence_set(list(cached))
+
+    @staticmethod
+    def _imap_summary(cursor: Dict[str, Any], uidvalidity: Optional[int], last_uid: int, highest_modseq: Optional[int],
+                      has_more: bool, flag_changes: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+        summary = {
+            'sync': {
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'highest_modseq': highest_modseq,
+                'has_more': has_more,
+                'uidvalidity_changed': cursor['uidvalidity_changed']
+            }
+        }
+        if flag_changes is not None:
+            summary['flag_changes'] = flag_changes
+        return summary
+
+    @staticmethod
+    def _page_summary(summary: Dict[str, Any], email_config: Dict[str, Any], next_cursor: Optional[str]) -> None:
+        """Add next_cursor to the summary of a receive that pages"""
+        if EmailReceiver._pages(email_config):
+            summary['next_cursor'] = next_cursor
+
+    @staticmethod
+    def _store_sync_state(email_config: Dict[str, Any], sync: Dict[str, Any]) -> None:
+        """Save the high-water mark that the next incremental receive starts from"""
+        MailboxSyncState.objects.update_or_create(
+            host=email_config['host'],
+            username=email_config['username'],
+            folder=email_config['folder'],
+            defaults={
+                'uidvalidity': sync['uidvalidity'],
+                'last_uid': sync['last_uid'],
+                'highest_modseq': sync['highest_modseq']
+            }
+        )
+
+    @staticmethod
+    def _flag_changes(mail, since_uid: int, since_modseq: int) -> List[Dict[str, Any]]:
+        """Flags of already-seen messages changed since since_modseq (CONDSTORE)"""
+        if since_uid < 1:
+            return []
+        _, data = mail.uid('FETCH', f'1:{since_uid}', f'(UID FLAGS) (CHANGEDSINCE {since_modseq})')
+        return EmailReceiver._parse_flag_changes(data)
+
+    @staticmethod
+    def _parse_flag_changes(data: List[Any]) -> List[Dict[str, Any]]:
+        changes = []
+        for item in data:
+            if isinstance(item, tuple):
+                item = item[0]
+            if not item:
+                continue
+            uid_match = _UID_RE.search(item)
+            flags_match = _FLAGS_RE.search(item)
+            if uid_match and flags_match:
+                changes.append({
+                    'uid': int(uid_match.group(1)),
+                    'flags': flags_match.group(1).decode('utf-8', errors='ignore').split()
+                })
+        return changes
+
+    @staticmethod
+    def default_config() -> Dict[str, Any]:
+        """Receive configuration taken from the environment"""
+        return {
+            'host': os.getenv('EMAIL_HOST', 'imap.gmail.com'),
+            'port': int(os.getenv('EMAIL_PORT', 993)),
+            'username': os.getenv('EMAIL_HOST_USER', 'your_username'),
+            'password': os.getenv('EMAIL_HOST_PASSWORD', 'your_password'),
+            'use_ssl': os.getenv('EMAIL_USE_SSL', 'True') == 'True',
+            'use_tls': os.getenv('EMAIL_USE_TLS', 'True') == 'True',
+            'max_emails': max_emails,
+            'folder' : 'INBOX',
+            'protocol': 'IMAP' 
+        }
+
+    @staticmethod
+    def _has_required_keys(email_config: Dict[str, Any]) -> bool:
+        required_keys = ['host', 'port', 'username', 'password', 'use_ssl','use_tls', 'max_emails', 'protocol', 'folder']
+        return all(key in email_config for key in required_keys)
 
     @staticmethod
     def receive_emails(email_config: Dict[str, Union[str, int, bool]], use_default_settings: bool = False) -> Dict[str, Any]:
         try:
             if use_default_settings:
-                email_config = {
-                    'host': os.getenv('EMAIL_HOST', 'imap.gmail.com'),
-                    'port': int(os.getenv('EMAIL_PORT', 993)),
-                    'username': os.getenv('EMAIL_HOST_USER', 'your_username'),
-                    'password': os.getenv('EMAIL_HOST_PASSWORD', 'your_password'),
-                    'use_ssl': os.getenv('EMAIL_USE_SSL', 'True') == 'True',
-                    'use_tls': os.getenv('EMAIL_USE_TLS', 'True') == 'True',
-                    'max_emails': max_emails,
-                    'folder' : 'INBOX',
-                    'protocol': 'IMAP' 
-                }
+                email_config = EmailReceiver.default_config()
                 
-            required_keys = ['host', 'port', 'username', 'password', 'use_ssl','use_tls', 'max_emails', 'protocol', 'folder']
-            if not all(key in email_config for key in required_keys):
+            if not EmailReceiver._has_required_keys(email_config):
                 return {"success": False, "message": "Missing required email configuration t"}
-            use_ssl = email_config['use_ssl']
-            use_tls = email_config['use_tls']
-            if email_config['protocol'].upper() == 'IMAP':
-                if use_ssl:
-                    mail = imaplib.IMAP4_SSL(email_config['host'], email_config['port'])
+            summary: Dict[str, Any] = {}
+            parsed_emails = list(EmailReceiver.iter_emails(email_config, summary))
+            return {"success": True, "emails": parsed_emails, **summary}
+
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    @staticmethod
+    async def receive_emails_async(email_config: Dict[str, Any], use_default_settings: bool = False) -> Dict[str, Any]:
+        """Native asyncio counterpart of receive_emails"""
+        try:
+            if use_default_settings:
+                email_config = EmailReceiver.default_config()
+
+            if not EmailReceiver._has_required_keys(email_config):
+                return {"success": False, "message": "Missing required email configuration t"}
+            summary: Dict[str, Any] = {}
+            parsed_emails = [record async for record in EmailReceiver.iter_emails_async(email_config, summary)]
+            return {"success": True, "emails": parsed_emails, **summary}
+
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+    @staticmethod
+    def _pop_uids(mail) -> Optional[Dict[int, str]]:
+        """Message number to UIDL id, or None if the server has no UIDL"""
+        try:
+            _, lines, _ = mail.uidl()
+        except poplib.error_proto as e:
+            if not EmailReceiver._pop_err(e):
+                raise
+            return None
+        return EmailReceiver._parse_pop_uids(lines)
+
+    @staticmethod
+    def _pop_err(error: poplib.error_proto) -> bool:
+        """
+        True for a -ERR reply from the server. poplib raises error_proto for a
+        dropped connection too, but with a str argument ('-ERR EOF') where
+        server replies carry the bytes of the line.
+        """
+        return bool(error.args) and isinstance(error.args[0], bytes)
+
+    @staticmethod
+    def _parse_pop_uids(lines: List[bytes]) -> Dict[int, str]:
+        uids = {}
+        for line in lines:
+            number, _, uid = line.partition(b' ')
+            uids[int(number)] = uid.strip().decode('utf-8', errors='replace')
+        return uids
+
+    @staticmethod
+    def _pop_sizes(lines: List[bytes]) -> Dict[int, Optional[int]]:
+        """Message number to size in octets from a LIST response"""
+        sizes = {}
+        for line in lines:
+            number, _, size = line.partition(b' ')
+            sizes[int(number)] = int(size) if size.strip().isdigit() else None
+        return sizes
+
+    @staticmethod
+    def _pop_tracks_seen(email_config: Dict[str, Any], uid_map: Optional[Dict[int, str]]) -> bool:
+        """Whether this receive selects and records unseen messages by UIDL id"""
+        if not email_config.get('incremental') or email_config.get('uids'):
+            return False
+        if uid_map is None:
+            raise EmailServiceError("POP server does not support UIDL, incremental receive is unavailable")
+        return True
+
+    @staticmethod
+    def _pop_seen_uids(email_config: Dict[str, Any]) -> set:
+        return set(PopSeenMessage.objects.filter(
+            host=email_config['host'],
+            username=email_config['username']
+        ).values_list('uid', flat=True))
+
+    @staticmethod
+    def _select_pop_numbers(email_config: Dict[str, Any], numbers: List[int], uid_map: Optional[Dict[int, str]], seen: Optional[set],
+                            before: Optional[int] = None):
+        """
+        Pick the message numbers to return, newest first
+
+        Returns (selected, batch, unseen); batch and unseen are only
+        meaningful for an incremental receive, where seen holds the UIDL ids
+        already returned. A page cursor's message number limits the selection
+        to the messages below it.
+        """
+        batch, unseen = [], []
+        # Message numbers grow with arrival, so the newest messages have the highest numbers
+        if email_config.get('uids'):
+            wanted = set(email_config['uids'])
+            selected = [number for number in numbers[::-1] if (uid_map or {}).get(number) in wanted]
+        elif seen is not None:
+            unseen = [number for number in numbers if uid_map.get(number) not in seen]
+            batch = unseen[:email_config['max_emails']]
+            selected = batch[::-1]
+        else:
+            if before is not None:
+                numbers = numbers[:bisect.bisect_left(numbers, before)]
+            selected = numbers[::-1][:email_config['max_emails']]
+        return selected, batch, unseen
+
+    @staticmethod
+    def _pop_next_cursor(email_config: Dict[str, Any], numbers: List[int], selected: List[int],
+                         uid_map: Optional[Dict[int, str]]) -> Optional[str]:
+        """next_cursor of the page below the selected messages, or None on the last page"""
+        if not selected or numbers[0] >= selected[-1]:
+            return None
+        return EmailReceiver._encode_cursor({
+            'protocol': 'POP',
+            'before': selected[-1],
+            'uid': (uid_map or {}).get(selected[-1])
+        })
+
+    @staticmethod
+    def _pop_cached(email_config: Dict[str, Any], selected: List[int], uid_map: Optional[Dict[int, str]]):
+        """Cache keys of the selected messages and the records already cached"""
+        # UIDL ids are unique and stable per maildrop, so they key the cache like IMAP UIDs
+        kind = EmailReceiver._record_kind(email_config)
+        keys = {
+            number: message_cache.make_key(email_config, 'POP', uid_map[number], kind)
+            for number in selected if uid_map and uid_map.get(number)
+        }
+        found = message_cache.get_many(keys.values())
+        # Message numbers are per session, so cached records get the current one
+        cached = {
+            number: {**found[key], 'message_number': number}
+            for number, key in keys.items() if key in found
+        }
+        return keys, cached
+
+    @staticmethod
+    def _mark_pop_seen(email_config: Dict[str, Any], uids: List[str], current_uids: set) -> None:
+        """Remember returned UIDL ids and forget those no longer on the server"""
+        account = {'host': email_config['host'], 'username': email_config['username']}
+        PopSeenMessage.objects.bulk_create(
+            [PopSeenMessage(uid=uid, **account) for uid in uids],
+            ignore_conflicts=True
+        )
+        seen = PopSeenMessage.objects.filter(**account)
+        gone = [uid for uid in seen.values_list('uid', flat=True) if uid not in current_uids]
+        for offset in range(0, len(gone), 500):
+            seen.filter(uid__in=gone[offset:offset + 500]).delete()
+
+    @staticmethod
+    def _abort_session(mail) -> None:
+        """Drop a session that failed or that a consumer stopped reading from"""
+        (imap_pool if isinstance(mail, imaplib.IMAP4) else pop_pool).discard(mail)
+
+    @staticmethod
+    def _imap_session(email_config: Dict[str, Any], readonly: bool = False):
+        """
+        Borrow a logged-in IMAP session and SELECT the folder
+
+        SELECT is sent on reused sessions too, which refreshes the message
+        count, UIDVALIDITY and HIGHESTMODSEQ. A reused session the server
+        has dropped in the meantime is replaced once.
+        """
+        mail, reused = imap_pool.acquire(email_config)
+        try:
+            mail.select(f'{email_config["folder"]}', readonly=readonly)
+        except (imaplib.IMAP4.abort, OSError):
+            imap_pool.discard(mail)
+            if not reused:
+                raise
+            logger.info("Pooled IMAP session was dropped by the server, reconnecting")
+            mail = imap_pool.open(email_config)
+            mail.select(f'{email_config["folder"]}', readonly=readonly)
+        except Exception:
+            imap_pool.discard(mail)
+            raise
+        return mail
+
+    @staticmethod
+    def _record_kind(email_config: Dict[str, Any]) -> str:
+        """Which kind of record a receive produces, part of the message cache key"""
+        if email_config.get('mode') == 'headers':
+            return 'headers'
+        return email_config.get('attachment_mode') or 'content'
+
+    @staticmethod
+    def _merge_cached(ids: List[Any], cache_keys: Dict[Any, Tuple], cached: Dict[Any, Dict[str, Any]], fetched, record_id):
+        """
+        Yield the records for ids in order, taking cached ones from the cache
+
+        fetched yields records for the other ids, in the same order, and skips
+        messages that are no longer on the server. Fetched records are added
+        to the cache under their cache_keys entry.
+        """
+        pending = None
+        for message_id in ids:
+            if message_id in cached:
+                yield cached[message_id]
+                continue
+            if pending is None:
+                pending = next(fetched, None)
+            if pending is not None and record_id(pending) == message_id:
+                if message_id in cache_keys:
+                    message_cache.set(cache_keys[message_id], pending)
+                yield pending
+                pending = None
+
+    @staticmethod
+    def _part_content(headers, body: bytes) -> bytes:
+        """Decoded bytes of a leaf from mime_parts"""
+        return EmailReceiver._decode_transfer(body, headers.get('Content-Transfer-Encoding', '').strip().lower())
+
+    @staticmethod
+    def _message_record(raw_email: bytes, attachment_metadata: bool, **extra: Any) -> Dict[str, Any]:
+        """Parse a whole downloaded message into a receive record"""
+        headers, parts = mime_parts(raw_email)
+        email_details = {
+            **extra,
+            'message_id': headers.get('Message-ID', ''),
+            'subject': EmailReceiver._decode_subject(headers.get('Subject', '')),
+            'from': headers.get('From', ''),
+            'to': headers.get('To', ''),
+            'date': headers.get('Date', ''),
+            'body': '',
+            'html_body': '',
+            'attachments': []
+        }
+
+        # Parts are classified like split_parts classifies BODYSTRUCTURE, so both
+        # receive paths agree on what is a body and what is an attachment
+        for number, part, body in parts:
+            content_type = part.get_content_type()
+            disposition = part.get_content_disposition()
+            filename = part.get_filename()
+            if content_type in ('text/plain', 'text/html') and disposition != 'attachment':
+                key = 'html_body' if content_type == 'text/html' else 'body'
+                email_details[key] = EmailReceiver._decode_text(EmailReceiver._part_content(part, body), part.get_content_charset())
+            elif filename or disposition == 'attachment':
+                attachment = {
+                    'part': number,
+                    'filename': EmailReceiver._decode_subject(filename or ''),
+                    'mimetype': content_type
+                }
+                if attachment_metadata:
+                    # Encoded size, as BODYSTRUCTURE reports it; nothing is decoded
+                    attachment['size'] = len(body)
                 else:
-                    mail = imaplib.IMAP4(email_config['host'], email_config['port'])
-                mail.login(email_config['username'], email_config['password'])
-                mail.select(f'{email_config["folder"]}')
-
-                # Fetch emails
-                _, search_data = mail.search(None, 'ALL')
-                email_ids = search_data[0].split()[::-1][:email_config['max_emails']] 
-                parsed_emails = []
-
-                for num in email_ids:
-                    _, data = mail.fetch(num, '(RFC822)')
-                    raw_email = data[0][1]
-                    email_message = email.message_from_bytes(raw_email)
-                    email_details = {
-                        'message_id': email_message.get('Message-ID', ''),
-                        'subject': EmailReceiver._decode_subject(email_message.get('Subject', '')),
-                        'from': email_message.get('From', ''),
-                        'to': email_message.get('To', ''),
-                        'date': email_message.get('Date', ''),
-                        'body': '',
-                        'html_body': '',
-                        'attachments': []
-                    }
+                    attachment['content'] = base64.b64encode(EmailReceiver._part_content(part, body)).decode('ascii')
+                email_details['attachments'].append(attachment)
 
-                    for part in email_message.walk():
-                        content_type = part.get_content_type()
-                        if content_type == 'text/plain':
-                            email_details['body'] = EmailReceiver._decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
-                        elif content_type == 'text/html':
-                            email_details['html_body'] = EmailReceiver._decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
-                        elif part.get_filename():
-                            filename = EmailReceiver._decode_subject(part.get_filename())
-                            email_details['attachments'].append({
-                                'filename': filename,
-                                'content': base64.b64encode(part.get_payload(decode=True)).decode('utf-8'),
-                                'mimetype': part.get_content_type()
-                            })
-
-                    parsed_emails.append(email_details)
+        return email_details
 
-                mail.close()
-                mail.logout()
+    @staticmethod
+    def _imap_records(mail, email_ids: List[bytes], chunk_size: int, email_config: Dict[str, Any]):
+        """Fetch and parse the given UIDs in chunks, in order"""
+        headers_only = email_config.get('mode') == 'headers'
+        attachment_metadata = email_config.get('attachment_mode') == 'metadata'
+
+        if headers_only:
+            for uid, header_bytes, meta in EmailReceiver._fetch_messages(mail, email_ids, chunk_size, IMAP_HEADER_QUERY):
+                yield EmailReceiver._imap_header_record(uid, header_bytes, meta)
+        elif attachment_metadata:
+            yield from EmailReceiver._structure_records(mail, email_ids, chunk_size)
+        else:
+            for uid, raw_email, _ in EmailReceiver._fetch_messages(mail, email_ids, chunk_size):
+                yield EmailReceiver._message_record(raw_email, attachment_metadata, uid=int(uid))
+
+    @staticmethod
+    def _pop_records(mail, numbers: List[int], uid_map: Optional[Dict[int, str]], sizes: Dict[int, Optional[int]], email_config: Dict[str, Any]):
+        """Retrieve and parse the given POP message numbers, in order"""
+        # POP has no BODYSTRUCTURE: messages are downloaded whole, only the response skips the content
+        attachment_metadata = email_config.get('attachment_mode') == 'metadata'
+
+        if email_config.get('mode') == 'headers':
+            # TOP n 0 returns the headers without the body
+            for number in numbers:
+                _, header_lines, _ = mail.top(number, 0)
+                yield EmailReceiver._header_record(
+                    b'\r\n'.join(header_lines),
+                    message_number=number,
+                    uid=(uid_map or {}).get(number),
+                    size=sizes[number]
+                )
+        else:
+            for number in numbers:
+                _, lines, _ = mail.retr(number)
+                yield EmailReceiver._message_record(
+                    b'\n'.join(lines),
+                    attachment_metadata,
+                    message_number=number,
+                    uid=(uid_map or {}).get(number)
+                )
+
+    @staticmethod
+    def iter_emails(email_config: Dict[str, Any], summary: Dict[str, Any]):
+        """
+        Fetch and parse messages, yielding each one as soon as it is parsed
+
+        Only one FETCH chunk is held at a time, so a streaming caller's memory
+        does not grow with max_emails. Once the generator is exhausted,
+        summary holds the IMAP 'sync' block and any 'flag_changes'. If the
+        caller stops early the connection is dropped and no sync state is
+        stored.
+        """
+        mail = None
+        try:
+            if email_config['protocol'].upper() == 'IMAP':
+                mail = EmailReceiver._imap_session(email_config)
+                
+                # CONDSTORE (enabled by the pool at login) lets an incremental receive report flag changes cheaply
+                wants_sync = email_config.get('incremental') or email_config.get('since_uid') is not None
+                condstore = wants_sync and 'CONDSTORE' in mail.capabilities and 'ENABLE' in mail.capabilities
+                uidvalidity = EmailReceiver._response_int(mail, 'UIDVALIDITY')
+                highest_modseq = EmailReceiver._response_int(mail, 'HIGHESTMODSEQ') if condstore else None
+                cursor = EmailReceiver._sync_cursor(email_config, uidvalidity)
+                before = EmailReceiver._imap_page_start(EmailReceiver._page_cursor(email_config), uidvalidity)
+
+                command, args, mail.literal = EmailReceiver._search_command(email_config, cursor, mail.capabilities, before)
+                _, search_data = mail.uid(command, *args)
+                email_ids, last_uid, has_more, next_cursor = EmailReceiver._imap_select(
+                    email_config, command, search_data, mail.response('ESEARCH')[1], cursor, uidvalidity, before
+                )
+
+                flag_changes = None
+                if condstore and cursor['since_uid'] is not None and cursor['since_modseq']:
+                    flag_changes = EmailReceiver._flag_changes(mail, cursor['since_uid'], int(cursor['since_modseq']))
+
+                chunk_size = int(email_config.get('fetch_chunk_size') or IMAP_FETCH_CHUNK_SIZE)
+
+                keys, cached = EmailReceiver._imap_cached(email_config, uidvalidity, email_ids)
+                seen_set = EmailReceiver._cached_seen_set(email_config, cached)
+                if seen_set:
+                    mail.uid('STORE', seen_set, '+FLAGS.SILENT', '(\\Seen)')
+                fetched = EmailReceiver._imap_records(
+                    mail, [uid for uid in email_ids if uid not in cached], chunk_size, email_config
+                )
+                yield from EmailReceiver._merge_cached(
+                    email_ids, keys, cached, fetched,
+                    record_id=lambda record: str(record['uid']).encode()
+                )
+
+                imap_pool.release(email_config, mail)
+                mail = None
+
+                EmailReceiver._page_summary(summary, email_config, next_cursor)
+                # A page of older messages reports no sync block and must not move the high-water mark
+                if before is None:
+                    summary.update(EmailReceiver._imap_summary(cursor, uidvalidity, last_uid, highest_modseq, has_more, flag_changes))
+                    if email_config.get('incremental') and uidvalidity is not None:
+                        EmailReceiver._store_sync_state(email_config, summary['sync'])
 
             elif email_config['protocol'].upper() == 'POP':
-                if use_ssl:
-                    mail = poplib.POP3_SSL(email_config['host'], email_config['port'])
+                mail, _ = pop_pool.acquire(email_config)
+                sizes = EmailReceiver._pop_sizes(mail.list()[1])
+                uid_map = EmailReceiver._pop_uids(mail)
+                seen = None
+                if EmailReceiver._pop_tracks_seen(email_config, uid_map):
+                    seen = EmailReceiver._pop_seen_uids(email_config)
+                numbers = sorted(sizes)
+                before = EmailReceiver._pop_page_start(EmailReceiver._page_cursor(email_config), uid_map)
+                selected, batch, unseen = EmailReceiver._select_pop_numbers(email_config, numbers, uid_map, seen, before)
+
+                keys, cached = EmailReceiver._pop_cached(email_config, selected, uid_map)
+                fetched = EmailReceiver._pop_records(
+                    mail, [number for number in selected if number not in cached], uid_map, sizes, email_config
+                )
+                yield from EmailReceiver._merge_cached(
+                    selected, keys, cached, fetched,
+                    record_id=lambda record: record['message_number']
+                )
+
+                pop_pool.release(email_config, mail)
+                mail = None
+
+                EmailReceiver._page_summary(summary, email_config,
+                                            EmailReceiver._pop_next_cursor(email_config, numbers, selected, uid_map))
+                if seen is not None:
+                    EmailReceiver._mark_pop_seen(email_config, [uid_map[number] for number in batch], set(uid_map.values()))
+                    summary['sync'] = {
+                        'unseen': len(unseen) - len(batch),
+                        'has_more': len(unseen) > len(batch)
+                    }
+
+        finally:
+            if mail is not None:
+                EmailReceiver._abort_session(mail)
+
+    @staticmethod
+    async def _merge_cached_async(ids: List[Any], cache_keys: Dict[Any, Tuple], cached: Dict[Any, Dict[str, Any]], fetched, record_id):
+        """_merge_cached for an async generator of fetched records"""
+        pending = None
+        for message_id in ids:
+            if message_id in cached:
+                yield cached[message_id]
+                continue
+            if pending is None:
+                pending = await anext(fetched, None)
+            if pending is not None and record_id(pending) == message_id:
+                if message_id in cache_keys:
+                    message_cache.set(cache_keys[message_id], pending)
+                yield pending
+                pending = None
+
+    @staticmethod
+    async def _imap_records_async(mail: AsyncIMAP4, email_ids: List[bytes], chunk_size: int, email_config: Dict[str, Any]):
+        """_imap_records over an AsyncIMAP4 session"""
+        headers_only = email_config.get('mode') == 'headers'
+        attachment_metadata = email_config.get('attachment_mode') == 'metadata'
+
+        for offset in range(0, len(email_ids), chunk_size):
+            chunk = email_ids[offset:offset + chunk_size]
+            sequence_set = EmailReceiver._sequence_set(chunk)
+            if headers_only:
+                _, data = await mail.uid('FETCH', sequence_set, IMAP_HEADER_QUERY)
+                for uid, header_bytes, meta in EmailReceiver._fetched_in_order(chunk, data):
+                    yield EmailReceiver._imap_header_record(uid, header_bytes, meta)
+            elif attachment_metadata:
+                _, data = await mail.uid('FETCH', sequence_set, IMAP_STRUCTURE_QUERY)
+                structures = EmailReceiver._parse_structures(data)
+                query = EmailReceiver._text_sections_query(structures)
+                bodies = {}
+                if query:
+                    _, data = await mail.uid('FETCH', sequence_set, query)
+                    bodies = EmailReceiver._fetched_by_uid(data)
+                for record in EmailReceiver._structure_chunk_records(chunk, structures, bodies):
+                    yield record
+            else:
+                _, data = await mail.uid('FETCH', sequence_set, '(UID RFC822)')
+                for uid, raw_email, _ in EmailReceiver._fetched_in_order(chunk, data):
+                    yield EmailReceiver._message_record(raw_email, False, uid=int(uid))
+
+    @staticmethod
+    async def _pop_records_async(mail: AsyncPOP3, numbers: List[int], uid_map: Optional[Dict[int, str]], sizes: Dict[int, Optional[int]], email_config: Dict[str, Any]):
+        """_pop_records over an AsyncPOP3 session"""
+        attachment_metadata = email_config.get('attachment_mode') == 'metadata'
+
+        for number in numbers:
+            if email_config.get('mode') == 'headers':
+                _, header_lines, _ = await mail.top(number, 0)
+                yield EmailReceiver._header_record(
+                    b'\r\n'.join(header_lines),
+                    message_number=number,
+                    uid=(uid_map or {}).get(number),
+                    size=sizes[number]
+                )
+            else:
+                _, lines, _ = await mail.retr(number)
+                yield EmailReceiver._message_record(
+                    b'\n'.join(lines),
+                    attachment_metadata,
+                    message_number=number,
+                    uid=(uid_map or {}).get(number)
+                )
+
+    @staticmethod
+    async def iter_emails_async(email_config: Dict[str, Any], summary: Dict[str, Any]):
+        """
+        Native asyncio counterpart of iter_emails
+
+        Message selection, the parsed-message cache and the sync state work
+        exactly as in iter_emails, over the asyncio clients of aio.py. Each
+        call opens and logs out its own session rather than borrowing one
+        from the blocking session pools; database reads and writes for
+        incremental receives run in a thread.
+        """
+        mail = None
+        try:
+            if email_config['protocol'].upper() == 'IMAP':
+                mail = await AsyncIMAP4.open(email_config)
+                await mail.select(email_config['folder'])
+
+                wants_sync = email_config.get('incremental') or email_config.get('since_uid') is not None
+                condstore = wants_sync and 'CONDSTORE' in mail.capabilities and 'ENABLE' in mail.capabilities
+                uidvalidity = EmailReceiver._response_int(mail, 'UIDVALIDITY')
+                highest_modseq = EmailReceiver._response_int(mail, 'HIGHESTMODSEQ') if condstore else None
+                if email_config.get('incremental'):
+                    cursor = await sync_to_async(EmailReceiver._sync_cursor)(email_config, uidvalidity)
                 else:
-                    mail = poplib.POP3(email_config['host'], email_config['port'])
-                mail.user(email_config['username'])
-                mail.pass_(email_config['password'])
-                num_messages = len(mail.list()[1])
-                parsed_emails = []
-                for i in range(min(num_messages, email_config['max_emails'])):
-                    response, raw_email, size = mail.retr(i + 1)
-                    raw_email = b'\n'.join(raw_email)
-                    email_message = email.message_from_bytes(raw_email)
-                    email_details = {
-                        'message_id': email_message.get('Message-ID', ''),
-                        'subject': EmailReceiver._decode_subject(email_message.get('Subject', '')),
-                        'from': email_message.get('From', ''),
-                        'to': email_message.get('To', ''),
-                        'date': email_message.get('Date', ''),
-                        'body': '',
-                        'html_body': '',
-                        'attachments': []
+                    cursor = EmailReceiver._sync_cursor(email_config, uidvalidity)
+                before = EmailReceiver._imap_page_start(EmailReceiver._page_cursor(email_config), uidvalidity)
+
+                command, args, mail.literal = EmailReceiver._search_command(email_config, cursor, mail.capabilities, before)
+                _, search_data = await mail.uid(command, *args)
+                email_ids, last_uid, has_more, next_cursor = EmailReceiver._imap_select(
+                    email_config, command, search_data, mail.response('ESEARCH')[1], cursor, uidvalidity, before
+                )
+
+                flag_changes = None
+                if condstore and cursor['since_uid'] is not None and cursor['since_modseq']:
+                    flag_changes = []
+                    if cursor['since_uid'] >= 1:
+                        _, data = await mail.uid(
+                            'FETCH', f'1:{cursor["since_uid"]}', f'(UID FLAGS) (CHANGEDSINCE {int(cursor["since_modseq"])})'
+                        )
+                        flag_changes = EmailReceiver._parse_flag_changes(data)
+
+                chunk_size = int(email_config.get('fetch_chunk_size') or IMAP_FETCH_CHUNK_SIZE)
+
+                keys, cached = EmailReceiver._imap_cached(email_config, uidvalidity, email_ids)
+                seen_set = EmailReceiver._cached_seen_set(email_config, cached)
+                if seen_set:
+                    await mail.uid('STORE', seen_set, '+FLAGS.SILENT', '(\\Seen)')
+                fetched = EmailReceiver._imap_records_async(
+                    mail, [uid for uid in email_ids if uid not in cached], chunk_size, email_config
+                )
+                async for record in EmailReceiver._merge_cached_async(
+                    email_ids, keys, cached, fetched,
+                    record_id=lambda record: str(record['uid']).encode()
+                ):
+                    yield record
+
+                await mail.logout()
+                mail = None
+
+                EmailReceiver._page_summary(summary, email_config, next_cursor)
+                if before is None:
+                    summary.update(EmailReceiver._imap_summary(cursor, uidvalidity, last_uid, highest_modseq, has_more, flag_changes))
+                    if email_config.get('incremental') and uidvalidity is not None:
+                        await sync_to_async(EmailReceiver._store_sync_state)(email_config, summary['sync'])
+
+            elif email_config['protocol'].upper() == 'POP':
+                mail = await AsyncPOP3.open(email_config)
+                sizes = EmailReceiver._pop_sizes((await mail.list())[1])
+                try:
+                    uid_map = EmailReceiver._parse_pop_uids((await mail.uidl())[1])
+                except poplib.error_proto:
+                    uid_map = None
+                seen = None
+                if EmailReceiver._pop_tracks_seen(email_config, uid_map):
+                    seen = await sync_to_async(EmailReceiver._pop_seen_uids)(email_config)
+                numbers = sorted(sizes)
+                before = EmailReceiver._pop_page_start(EmailReceiver._page_cursor(email_config), uid_map)
+                selected, batch, unseen = EmailReceiver._select_pop_numbers(email_config, numbers, uid_map, seen, before)
+
+                keys, cached = EmailReceiver._pop_cached(email_config, selected, uid_map)
+                fetched = EmailReceiver._pop_records_async(
+                    mail, [number for number in selected if number not in cached], uid_map, sizes, email_config
+                )
+                async for record in EmailReceiver._merge_cached_async(
+                    selected, keys, cached, fetched,
+                    record_id=lambda record: record['message_number']
+                ):
+                    yield record
+
+                await mail.quit()
+                mail = None
+
+                EmailReceiver._page_summary(summary, email_config,
+                                            EmailReceiver._pop_next_cursor(email_config, numbers, selected, uid_map))
+                if seen is not None:
+                    await sync_to_async(EmailReceiver._mark_pop_seen)(
+                        email_config, [uid_map[number] for number in batch], set(uid_map.values())
+                    )
+                    summary['sync'] = {
+                        'unseen': len(unseen) - len(batch),
+                        'has_more': len(unseen) > len(batch)
                     }
 
-                    for part in email_message.walk():
-                        content_type = part.get_content_type()
-                        if content_type == 'text/plain':
-                            email_details['body'] = EmailReceiver._decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
-                        elif content_type == 'text/html':
-                            email_details['html_body'] = EmailReceiver._decode_body(part.get_payload(decode=True), part.get('Content-Transfer-Encoding', '').lower())
-                        elif part.get_filename():
-                            filename = EmailReceiver._decode_subject(part.get_filename())
-                            email_details['attachments'].append({
-                                'filename': filename,
-                                'content': base64.b64encode(part.get_payload(decode=True)).decode('utf-8'),
-                                'mimetype': part.get_content_type()
-                            })
+        finally:
+            if mail is not None:
+                mail.close()
 
-                    parsed_emails.append(email_details)
+    @staticmethod
+    def fetch_attachment(email_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Download a single message part, addressed by its section number
 
-                mail.quit()
+        IMAP fetches only that section (BINARY.PEEK when the server offers
+        RFC 3516, so it arrives already decoded) together with the message's
+        BODYSTRUCTURE in one round trip. POP has no partial retrieval, so the
+        message is downloaded and the part picked out by the same numbering.
 
-            return {"success": True, "emails": parsed_emails}
+        Returns:
+            On success a dict with the decoded 'content' bytes, 'filename' and
+            'mimetype'; otherwise a failure dict with an error code
+        """
+        part_number = email_config['part']
+        try:
+            if email_config['protocol'].upper() == 'IMAP':
+                mail = EmailReceiver._imap_session(email_config, readonly=True)
+                binary = 'BINARY' in mail.capabilities
+                section = f'BINARY.PEEK[{part_number}]' if binary else f'BODY.PEEK[{part_number}]'
+                try:
+                    _, data = mail.uid('FETCH', str(email_config['uid']), f'(UID BODYSTRUCTURE {section})')
+                except Exception:
+                    imap_pool.discard(mail)
+                    raise
+                imap_pool.release(email_config, mail)
+
+                fetched = [m for m in parse_fetch_response(data) if m.get('UID') == str(email_config['uid'])]
+                if not fetched or not isinstance(fetched[0].get('BODYSTRUCTURE'), list):
+                    return {
+                        'success': False,
+                        'error': 'MESSAGE_NOT_FOUND',
+                        'message': f"No message with UID {email_config['uid']}"
+                    }
+                parts = {part['part']: part for part in body_parts(fetched[0]['BODYSTRUCTURE'])}
+                part = parts.get(part_number)
+                if part is None:
+                    return {
+                        'success': False,
+                        'error': 'PART_NOT_FOUND',
+                        'message': f'Message has no part {part_number}'
+                    }
+                content = fetched[0].get(f'BINARY[{part_number}]' if binary else f'BODY[{part_number}]') or b''
+                if not binary:
+                    content = EmailReceiver._decode_transfer(content, part['encoding'])
+                filename = EmailReceiver._decode_subject(part['filename'] or '')
+                mimetype = part['mimetype']
+
+            else:
+                mail, _ = pop_pool.acquire(email_config)
+                try:
+                    _, lines, _ = mail.retr(email_config['message_number'])
+                except poplib.error_proto as e:
+                    if not EmailReceiver._pop_err(e):
+                        pop_pool.discard(mail)
+                        raise
+                    # -ERR leaves the session usable
+                    pop_pool.release(email_config, mail)
+                    return {
+                        'success': False,
+                        'error': 'MESSAGE_NOT_FOUND',
+                        'message': f"No message number {email_config['message_number']}"
+                    }
+                except Exception:
+                    pop_pool.discard(mail)
+                    raise
+                pop_pool.release(email_config, mail)
+
+                _, parts = mime_parts(b'\n'.join(lines))
+                found = [(part, body) for number, part, body in parts if number == part_number]
+                if not found:
+                    return {
+                        'success': False,
+                        'error': 'PART_NOT_FOUND',
+                        'message': f'Message has no part {part_number}'
+                    }
+                part, body = found[0]
+                content = EmailReceiver._part_content(part, body)
+                filename = EmailReceiver._decode_subject(part.get_filename() or '')
+                mimetype = part.get_content_type()
+
+            return {
+                'success': True,
+                'content': content,
+                'filename': filename,
+                'mimetype': mimetype
+            }
 
         except Exception as e:
-            return {"success": False, "message": str(e)}
+            logger.error(f"Error fetching attachment: {str(e)}")
+            return {'success': False, 'error': 'RECEIVE_ERROR', 'message': str(e)}
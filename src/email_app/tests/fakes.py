@@ -0,0 +1,179 @@
+"""Small in-process mail servers for the tests"""
+import socket
+import socketserver
+import threading
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    SMTP server that accepts everything except RCPT TO for a domain in
+    ``refuse`` (550) or ``defer`` (451). ``deliveries`` records (sender,
+    recipients, message bytes) of every accepted message and
+    ``connections`` the connections opened. hang_up() drops the open
+    connections, as a server timing out idle clients does. With
+    ``drop_after_data`` set, a message is accepted and the connection
+    closed before the reply to its DATA.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, refuse=(), defer=()):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.refuse = set(refuse)
+        self.defer = set(defer)
+        self.deliveries = []
+        self.connections = 0
+        self.open_connections = set()
+        self.drop_after_data = False
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def hang_up(self):
+        with self.lock:
+            for connection in self.open_connections:
+                connection.shutdown(socket.SHUT_RDWR)
+
+    def settings(self, username='user'):
+        """email_settings for send_email pointing at this server"""
+        return {'host': '127.0.0.1', 'port': str(self.port), 'username': username, 'password': 'secret',
+                'use_tls': 'False', 'use_ssl': 'False'}
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, text):
+        self.wfile.write(f"{text}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+            server.open_connections.add(self.connection)
+        try:
+            self.converse(server)
+        except ConnectionError:
+            pass  # the client or hang_up() dropped the connection
+        finally:
+            with server.lock:
+                server.open_connections.discard(self.connection)
+
+    def converse(self, server):
+        self.reply("220 fake SMTP ready")
+        sender, recipients = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply("250-fake\r\n250 AUTH PLAIN LOGIN")
+            elif verb in ('HELO', 'NOOP', 'RSET'):
+                self.reply("250 OK")
+            elif verb == 'AUTH':
+                self.reply("235 Authentication successful")
+            elif verb == 'MAIL':
+                sender, recipients = command.partition(':')[2].strip(), []
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                address = command.partition(':')[2].strip().strip('<>')
+                domain = address.rpartition('@')[2].lower()
+                if domain in server.refuse:
+                    self.reply(f"550 5.1.1 <{address}>: Recipient address rejected")
+                elif domain in server.defer:
+                    self.reply(f"451 4.7.1 <{address}>: Try again later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                    chunks.append(data)
+                with server.lock:
+                    server.deliveries.append((sender, list(recipients), b''.join(chunks)))
+                if server.drop_after_data:
+                    return
+                self.reply("250 OK queued")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("500 Command not recognized")
+
+
+class ScriptedServer(socketserver.ThreadingTCPServer):
+    """
+    Server that plays ``script(conversation)`` on every connection, for
+    testing protocol edge cases line by line. Returning from the script
+    closes the connection.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, script):
+        super().__init__(('127.0.0.1', 0), _ScriptedHandler)
+        self.script = script
+        self.received = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _ScriptedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.script(self)
+
+    def send(self, *lines):
+        """Write each line (str or bytes) followed by CRLF"""
+        for line in lines:
+            self.send_raw((line.encode() if isinstance(line, str) else line) + b'\r\n')
+
+    def send_raw(self, data):
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def receive(self):
+        """The next line from the client without its line ending ('' once it has closed)"""
+        line = self.rfile.readline().decode().rstrip('\r\n')
+        self.server.received.append(line)
+        return line
+
+
+def pop_login(conn, password_reply='+OK Logged in'):
+    """Greet a POP3 client on a ScriptedServer and answer USER and PASS"""
+    conn.send('+OK POP3 ready')
+    conn.receive()
+    conn.send('+OK')
+    conn.receive()
+    conn.send(password_reply)
+
+
+def answer_until_quit(conn, replies):
+    """Answer each command line with its lines in replies, -ERR for others, until QUIT or hang-up"""
+    while True:
+        command = conn.receive()
+        if not command or command == 'QUIT':
+            conn.send('+OK Bye')
+            return
+        conn.send(*replies.get(command, ('-ERR unknown command',)))
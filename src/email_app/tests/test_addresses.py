@@ -0,0 +1,195 @@
+import importlib.util
+import time
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+from rest_framework import serializers
+
+from email_app import serializers as email_serializers
+from email_app.addresses import INVALID_ADDRESS, AddressValidator, MXPolicy, _load_policies
+from email_app.serializers import EmailAddressField, EmailAddressListField
+
+
+def refuse_all(address, domain):
+    return f"{domain} is blocked"
+
+
+class RecordingPolicy:
+    def __init__(self, verdict=None):
+        self.verdict = verdict
+        self.calls = []
+
+    def __call__(self, address, domain):
+        self.calls.append(address)
+        return self.verdict
+
+
+class AddressValidatorTests(SimpleTestCase):
+    def test_syntax(self):
+        validator = AddressValidator()
+        self.assertEqual(validator.check_many(['a@example.com', 'not-an-address', 'b@', '']),
+                         [None, INVALID_ADDRESS, INVALID_ADDRESS, INVALID_ADDRESS])
+
+    def test_domain_is_normalised(self):
+        policy = RecordingPolicy()
+        validator = AddressValidator(policies={'*': policy})
+        self.assertEqual(validator.normalize('Alice@Example.COM'), 'Alice@example.com')
+        validator.check_many(['Alice@Example.COM', 'Alice@example.com', 'alice@example.com'])
+        # The local part may be case sensitive, so it is kept as it is
+        self.assertEqual(policy.calls, ['Alice@example.com', 'alice@example.com'])
+
+    def test_cache_hits(self):
+        policy = RecordingPolicy()
+        validator = AddressValidator(policies={'*': policy})
+        validator.check_many(['a@example.com', 'b@example.com', 'a@example.com'])
+        validator.check('b@EXAMPLE.com')
+        self.assertEqual(len(policy.calls), 2)
+        self.assertEqual(validator.stats(), {'entries': 2, 'max_size': 10000, 'hits': 2, 'misses': 2})
+
+    def test_least_recently_used_address_goes_first(self):
+        policy = RecordingPolicy()
+        validator = AddressValidator(policies={'*': policy}, max_size=2)
+        for address in ('a@example.com', 'b@example.com', 'a@example.com', 'c@example.com'):
+            validator.check(address)
+        self.assertEqual(validator.stats()['entries'], 2)
+        del policy.calls[:]
+        validator.check_many(['a@example.com', 'c@example.com', 'b@example.com'])
+        self.assertEqual(policy.calls, ['b@example.com'])
+
+    def test_expired_verdict_is_checked_again(self):
+        policy = RecordingPolicy()
+        validator = AddressValidator(policies={'*': policy}, ttl=0.05)
+        validator.check('a@example.com')
+        time.sleep(0.1)
+        validator.check('a@example.com')
+        self.assertEqual(len(policy.calls), 2)
+
+    def test_zero_size_keeps_nothing(self):
+        validator = AddressValidator(max_size=0)
+        self.assertEqual(validator.check_many(['a@example.com', 'bad']), [None, INVALID_ADDRESS])
+        self.assertEqual(validator.stats()['entries'], 0)
+
+    def test_policy_of_the_domain_before_the_catch_all(self):
+        catch_all = RecordingPolicy("Catch-all refusal")
+        validator = AddressValidator(policies={'Blocked.Example': refuse_all, '*': catch_all})
+        self.assertEqual(validator.invalid_addresses(['a@blocked.example', 'b@other.example', 'bad']),
+                         ['a@blocked.example', 'b@other.example', 'bad'])
+        self.assertEqual(validator.check('a@BLOCKED.example'), 'blocked.example is blocked')
+        # Addresses that fail the syntax check never reach a policy
+        self.assertEqual(catch_all.calls, ['b@other.example'])
+        self.assertIsNone(AddressValidator(policies={'blocked.example': refuse_all}).check('a@other.example'))
+
+    def test_load_policies(self):
+        policies = _load_policies(' blocked.example = email_app.tests.test_addresses.refuse_all ,'
+                                  '*=email_app.tests.test_addresses.RecordingPolicy,ignored')
+        self.assertIs(policies['blocked.example'], refuse_all)
+        # Classes are instantiated
+        self.assertIsInstance(policies['*'], RecordingPolicy)
+        self.assertEqual(len(policies), 2)
+
+
+class FakeResolver:
+    """Stands in for dns.resolver with answers per (domain, record type)"""
+
+    class NXDOMAIN(Exception):
+        pass
+
+    class NoAnswer(Exception):
+        pass
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queries = []
+
+    def resolve(self, domain, record_type, lifetime=None):
+        self.queries.append((domain, record_type))
+        answer = self.answers.get((domain, record_type), self.NoAnswer)
+        if isinstance(answer, type) and issubclass(answer, Exception) or isinstance(answer, Exception):
+            raise answer
+        return [SimpleNamespace(exchange=SimpleNamespace(to_text=lambda host=host: host)) for host in answer]
+
+
+@skipUnless(importlib.util.find_spec('dns'), "MXPolicy needs dnspython")
+class MXPolicyTests(SimpleTestCase):
+    def policy(self, answers, **kwargs):
+        policy = MXPolicy(**kwargs)
+        policy.resolver = FakeResolver(answers)
+        return policy
+
+    def test_verdicts(self):
+        policy = self.policy({
+            ('mail.example', 'MX'): ['mx1.mail.example.'],
+            ('gone.example', 'MX'): FakeResolver.NXDOMAIN,
+            ('null.example', 'MX'): ['.'],
+            ('host.example', 'AAAA'): ['2001:db8::1'],
+        })
+        self.assertIsNone(policy('a@mail.example', 'mail.example'))
+        self.assertEqual(policy('a@gone.example', 'gone.example'), "Domain gone.example does not exist")
+        self.assertEqual(policy('a@null.example', 'null.example'), "Domain null.example does not accept email")
+        # No MX, but an address record to deliver to
+        self.assertIsNone(policy('a@host.example', 'host.example'))
+        self.assertEqual(policy('a@empty.example', 'empty.example'), "Domain empty.example does not accept email")
+
+    def test_failed_lookup_accepts_and_is_not_kept(self):
+        policy = self.policy({('slow.example', 'MX'): TimeoutError('timed out')})
+        self.assertIsNone(policy('a@slow.example', 'slow.example'))
+        self.assertIsNone(policy('a@slow.example', 'slow.example'))
+        self.assertEqual(len(policy.resolver.queries), 2)
+
+    def test_domains_are_bounded(self):
+        policy = self.policy({(f'{name}.example', 'MX'): ['mx.example.'] for name in 'abc'}, max_size=2)
+        for name in 'abac':
+            policy(f'x@{name}.example', f'{name}.example')
+        self.assertEqual(list(policy._domains), ['a.example', 'c.example'])
+        del policy.resolver.queries[:]
+        policy('x@a.example', 'a.example')
+        policy('x@b.example', 'b.example')
+        self.assertEqual(policy.resolver.queries, [('b.example', 'MX')])
+        self.assertEqual(len(policy._domains), 2)
+
+    def test_answers_expire(self):
+        policy = self.policy({('a.example', 'MX'): ['mx.example.']}, ttl=0.05)
+        policy('x@a.example', 'a.example')
+        time.sleep(0.1)
+        policy('x@a.example', 'a.example')
+        self.assertEqual(len(policy.resolver.queries), 2)
+
+
+class AddressFieldTests(SimpleTestCase):
+    def setUp(self):
+        self.policy = RecordingPolicy()
+        validator = AddressValidator(policies={'*': self.policy, 'blocked.example': refuse_all})
+        patcher = mock.patch.object(email_serializers, 'address_validator', validator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_address_field(self):
+        field = EmailAddressField()
+        self.assertEqual(field.run_validation(' a@example.com '), 'a@example.com')
+        for value, message in (('bad', INVALID_ADDRESS), ('a@blocked.example', 'blocked.example is blocked')):
+            with self.subTest(value), self.assertRaises(serializers.ValidationError) as raised:
+                field.run_validation(value)
+            self.assertEqual(raised.exception.detail, [message])
+
+    def test_list_errors_are_per_index(self):
+        field = EmailAddressListField()
+        with self.assertRaises(serializers.ValidationError) as raised:
+            field.run_validation(['a@example.com', None, ' ', 'bad', 'b@blocked.example', ['x'], True])
+        self.assertEqual(raised.exception.detail, {
+            1: ['This field may not be null.'],
+            2: ['This field may not be blank.'],
+            3: [INVALID_ADDRESS],
+            4: ['blocked.example is blocked'],
+            5: [INVALID_ADDRESS],
+            6: [INVALID_ADDRESS],
+        })
+
+    def test_list_is_checked_in_one_pass(self):
+        field = EmailAddressListField()
+        with mock.patch.object(email_serializers.address_validator, 'check_many',
+                               wraps=email_serializers.address_validator.check_many) as check_many:
+            self.assertEqual(field.run_validation([' a@example.com', 'b@example.com', 'a@example.com']),
+                             ['a@example.com', 'b@example.com', 'a@example.com'])
+        check_many.assert_called_once()
+        self.assertEqual(self.policy.calls, ['a@example.com', 'b@example.com'])
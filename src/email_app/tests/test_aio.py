@@ -0,0 +1,235 @@
+import imaplib
+import poplib
+import smtplib
+
+from django.test import SimpleTestCase
+
+from email_app.aio import AsyncIMAP4, AsyncPOP3, AsyncSMTP, POP3Disconnected
+from email_app.service import EmailReceiver
+
+from .fakes import ScriptedServer, pop_login
+
+
+class ScriptedTestCase(SimpleTestCase):
+    def serve(self, script):
+        server = ScriptedServer(script).start()
+        self.addCleanup(server.stop)
+        return server
+
+
+def smtp_greeting(conn, auth_reply='235 2.7.0 Authentication successful'):
+    conn.send('220 fake ESMTP')
+    conn.receive()  # EHLO
+    conn.send('250-fake', '250-AUTH PLAIN LOGIN', '250 SIZE 1000')
+    conn.receive()  # AUTH PLAIN ...
+    conn.send(auth_reply)
+
+
+class AsyncSMTPTests(ScriptedTestCase):
+    def backend_kwargs(self, server):
+        return {'host': '127.0.0.1', 'port': server.port, 'username': 'user', 'password': 'secret', 'timeout': 5}
+
+    async def test_multiline_ehlo_reply(self):
+        def script(conn):
+            smtp_greeting(conn)
+            conn.receive()
+            conn.send('221 Bye')
+
+        client = await AsyncSMTP.connect_with(self.backend_kwargs(self.serve(script)))
+        self.assertEqual(client.features['auth'], 'PLAIN LOGIN')
+        self.assertEqual(client.features['size'], '1000')
+        await client.quit()
+
+    async def test_login_failure(self):
+        server = self.serve(lambda conn: smtp_greeting(conn, '535 5.7.8 Authentication credentials invalid'))
+        with self.assertRaises(smtplib.SMTPAuthenticationError) as raised:
+            await AsyncSMTP.connect_with(self.backend_kwargs(server))
+        self.assertEqual(raised.exception.smtp_code, 535)
+
+    async def test_data_is_dot_stuffed(self):
+        data = []
+
+        def script(conn):
+            smtp_greeting(conn)
+            for reply in ('250 OK', '250 OK', '354 Go ahead'):
+                conn.receive()
+                conn.send(reply)
+            line = conn.receive()
+            while line != '.':
+                data.append(line)
+                line = conn.receive()
+            conn.send('250 OK queued')
+            conn.receive()
+            conn.send('221 Bye')
+
+        server = self.serve(script)
+        refused = await AsyncSMTP.send_envelope(self.backend_kwargs(server), 'shop@example.com', ['a@example.com'],
+                                                b'Subject: x\r\n\r\n.hidden\r\n..two\r\nlast')
+        self.assertEqual(refused, {})
+        self.assertEqual(data, ['Subject: x', '', '..hidden', '...two', 'last'])
+
+    async def test_some_recipients_refused(self):
+        def script(conn):
+            smtp_greeting(conn)
+            for reply in ('250 OK', '550 5.1.1 No such user', '250 OK', '354 Go ahead'):
+                conn.receive()
+                conn.send(reply)
+            while conn.receive() != '.':
+                pass
+            conn.send('250 OK queued')
+            conn.receive()
+            conn.send('221 Bye')
+
+        refused = await AsyncSMTP.send_envelope(self.backend_kwargs(self.serve(script)), 'shop@example.com',
+                                                ['gone@example.com', 'a@example.com'], b'Subject: x\r\n\r\nbody')
+        self.assertEqual(refused, {'gone@example.com': (550, b'5.1.1 No such user')})
+
+    async def test_connection_dropped_mid_command(self):
+        def script(conn):
+            smtp_greeting(conn)
+            conn.receive()  # MAIL FROM, then hang up
+
+        client = await AsyncSMTP.connect_with(self.backend_kwargs(self.serve(script)))
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            await client.sendmail('shop@example.com', ['a@example.com'], b'Subject: x\r\n\r\nbody')
+        client.close()
+
+
+def imap_login(conn, reply='OK LOGIN completed'):
+    conn.send('* OK [CAPABILITY IMAP4rev1 LITERAL+] ready')
+    tag = conn.receive().split()[0]
+    conn.send(f'{tag} {reply}')
+
+
+class AsyncIMAP4Tests(ScriptedTestCase):
+    def config(self, server):
+        return {'host': '127.0.0.1', 'port': server.port, 'username': 'user', 'password': 'sec"ret', 'timeout': 5}
+
+    async def test_login_failure(self):
+        server = self.serve(lambda conn: imap_login(conn, 'NO [AUTHENTICATIONFAILED] Invalid credentials'))
+        with self.assertRaises(imaplib.IMAP4.error):
+            await AsyncIMAP4.open(self.config(server))
+        self.assertEqual(server.received[0].split()[1:], ['LOGIN', 'user', '"sec\\"ret"'])
+
+    async def test_fetch_literals(self):
+        # Shaped like imaplib's FETCH data: (header with the literal size, literal), then the rest of the line
+        def script(conn):
+            imap_login(conn)
+            tag = conn.receive().split()[0]
+            conn.send('* 1 FETCH (UID 7 BODY[] {12}')
+            conn.send_raw(b'hello\r\nworld')
+            conn.send(' FLAGS (\\Seen))', '* 2 FETCH (UID 8 BODY[] {0}', ')', f'{tag} OK FETCH completed')
+
+        mail = await AsyncIMAP4.open(self.config(self.serve(script)))
+        typ, data = await mail.uid('FETCH', '7:8', '(BODY.PEEK[])')
+        self.assertEqual(typ, 'OK')
+        self.assertEqual(data, [
+            (b'1 (UID 7 BODY[] {12}', b'hello\r\nworld'),
+            b' FLAGS (\\Seen))',
+            (b'2 (UID 8 BODY[] {0}', b''),
+            b')',
+        ])
+        mail.close()
+
+    async def test_command_literal_waits_for_continuation(self):
+        literals = []
+
+        def script(conn):
+            imap_login(conn)
+            command = conn.receive()
+            conn.send('+ Ready for literal data')
+            literals.append(conn.rfile.read(len('Grüße'.encode()) + 2))
+            conn.send('* SEARCH 3 5', f'{command.split()[0]} OK SEARCH completed')
+
+        server = self.serve(script)
+        mail = await AsyncIMAP4.open(self.config(server))
+        mail.literal = 'Grüße'.encode()
+        typ, data = await mail.uid('SEARCH', 'CHARSET', 'UTF-8', 'SUBJECT')
+        self.assertEqual((typ, data), ('OK', [b'3 5']))
+        self.assertTrue(server.received[-1].endswith('SUBJECT {%d}' % len('Grüße'.encode())))
+        self.assertEqual(literals, ['Grüße'.encode() + b'\r\n'])
+        mail.close()
+
+    async def test_connection_dropped_mid_command(self):
+        def script(conn):
+            imap_login(conn)
+            conn.receive()
+            conn.send('* 3 EXISTS')
+
+        mail = await AsyncIMAP4.open(self.config(self.serve(script)))
+        with self.assertRaises(imaplib.IMAP4.abort):
+            await mail.select('INBOX')
+        mail.close()
+
+    async def test_bye_aborts(self):
+        def script(conn):
+            imap_login(conn)
+            conn.receive()
+            conn.send('* BYE Server shutting down')
+
+        mail = await AsyncIMAP4.open(self.config(self.serve(script)))
+        with self.assertRaises(imaplib.IMAP4.abort):
+            await mail.select('INBOX')
+        mail.close()
+
+
+class AsyncPOP3Tests(ScriptedTestCase):
+    def config(self, server):
+        return {'host': '127.0.0.1', 'port': server.port, 'username': 'user', 'password': 'secret', 'timeout': 5}
+
+    async def test_login_failure(self):
+        server = self.serve(lambda conn: pop_login(conn, '-ERR [AUTH] Invalid login'))
+        with self.assertRaises(poplib.error_proto) as raised:
+            await AsyncPOP3.open(self.config(server))
+        self.assertEqual(raised.exception.args[0], b'-ERR [AUTH] Invalid login')
+
+    async def test_multiline_response_is_dot_unstuffed(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('+OK 41 octets', 'Subject: x', '', '..leading dot', '...', 'body', '.')
+
+        mail = await AsyncPOP3.open(self.config(self.serve(script)))
+        response, lines, octets = await mail.retr(1)
+        self.assertEqual(response, b'+OK 41 octets')
+        self.assertEqual(lines, [b'Subject: x', b'', b'.leading dot', b'..', b'body'])
+        # Like poplib: line lengths with CRLF, without the stuffed dots
+        self.assertEqual(octets, sum(len(line) + 2 for line in lines))
+        mail.close()
+
+    async def test_err_reply_is_error_proto(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('-ERR UIDL not supported')
+
+        mail = await AsyncPOP3.open(self.config(self.serve(script)))
+        with self.assertRaises(poplib.error_proto):
+            await mail.uidl()
+        mail.close()
+
+    async def test_connection_dropped_mid_command(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('+OK unique-id listing follows', '1 abc')
+
+        mail = await AsyncPOP3.open(self.config(self.serve(script)))
+        with self.assertRaises(POP3Disconnected) as raised:
+            await mail.uidl()
+        self.assertNotIsInstance(raised.exception, poplib.error_proto)
+        mail.close()
+
+    async def test_receive_reports_a_drop_during_uidl(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('+OK 1 messages', '1 120', '.')
+            conn.receive()  # UIDL, then hang up
+
+        server = self.serve(script)
+        config = {**self.config(server), 'use_ssl': False, 'use_tls': False, 'max_emails': 10,
+                  'protocol': 'POP', 'folder': 'INBOX'}
+        result = await EmailReceiver.receive_emails_async(config)
+        self.assertFalse(result['success'])
+        self.assertNotIn('RETR 1', server.received)
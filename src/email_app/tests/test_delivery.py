@@ -0,0 +1,123 @@
+import smtplib
+
+from django.test import SimpleTestCase, TestCase
+
+from email_app.delivery import DomainDelivery, group_by_domain
+from email_app.pool import smtp_pool
+from email_app.service import EmailService
+
+from .fakes import FakeSMTPServer
+from .utils import api_client
+
+
+class GroupByDomainTests(SimpleTestCase):
+    def test_groups_in_first_seen_order(self):
+        groups = group_by_domain(['a@one.example', 'b@two.example', 'c@One.Example', 'd@three.example'])
+        self.assertEqual(list(groups.items()), [
+            ('one.example', ['a@one.example', 'c@One.Example']),
+            ('two.example', ['b@two.example']),
+            ('three.example', ['d@three.example']),
+        ])
+
+    def test_address_listed_twice_is_delivered_once(self):
+        groups = group_by_domain(['a@one.example', 'A@one.example', 'a@ONE.example'])
+        # The local part is case sensitive, the domain is not
+        self.assertEqual(groups, {'one.example': ['a@one.example', 'A@one.example']})
+
+
+class SMTPServerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer(refuse=['bad.example'], defer=['later.example']).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(smtp_pool.close_all)
+
+    def delivered_to(self):
+        return sorted(address for _, recipients, _ in self.server.deliveries for address in recipients)
+
+
+class DomainDeliveryTests(SMTPServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.delivery = DomainDelivery(workers=4, per_message=2)
+        self.addCleanup(self.delivery.shutdown)
+        self.backend_kwargs = {'host': '127.0.0.1', 'port': self.server.port, 'username': 'shop',
+                               'password': 'secret', 'use_tls': False, 'use_ssl': False, 'timeout': 5}
+
+    def test_one_envelope_per_domain(self):
+        envelopes = [['a@one.example', 'c@one.example'], ['b@two.example'], ['d@three.example']]
+        outcomes = self.delivery.deliver(self.backend_kwargs, 'shop@example.com', envelopes, b'Subject: Hi\r\n\r\nHi\r\n')
+        self.assertEqual(outcomes, [{}, {}, {}])
+        self.assertCountEqual([recipients for _, recipients, _ in self.server.deliveries], envelopes)
+
+    def test_refused_domain_does_not_fail_the_others(self):
+        envelopes = [['a@one.example'], ['x@bad.example'], ['b@two.example']]
+        outcomes = self.delivery.deliver(self.backend_kwargs, 'shop@example.com', envelopes, b'Subject: Hi\r\n\r\nHi\r\n')
+        self.assertEqual(outcomes[0], {})
+        self.assertIsInstance(outcomes[1], smtplib.SMTPRecipientsRefused)
+        self.assertEqual(list(outcomes[1].recipients), ['x@bad.example'])
+        self.assertEqual(outcomes[2], {})
+        self.assertEqual(self.delivered_to(), ['a@one.example', 'b@two.example'])
+
+
+class PerDomainSendTests(SMTPServerTestCase):
+    def send(self, recipients):
+        return EmailService.send_email(email_settings=self.server.settings(), sender='shop@example.com',
+                                       recipients=recipients, subject='Receipt', body='Thank you',
+                                       delivery='per_domain')
+
+    def test_all_delivered(self):
+        result = self.send(['a@one.example', 'b@two.example'])
+        self.assertTrue(result['success'])
+        self.assertEqual((result['domains'], result['delivered_count']), (2, 2))
+        self.assertEqual([entry['status'] for entry in result['recipient_status']], ['sent', 'sent'])
+
+    def test_partial_delivery(self):
+        result = self.send(['a@one.example', 'x@bad.example', 'c@one.example', 'y@later.example'])
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], 'PARTIAL_DELIVERY')
+        self.assertFalse(result['retryable'])
+        self.assertEqual(result['delivered_count'], 2)
+        self.assertEqual(result['failed_recipients'], ['x@bad.example', 'y@later.example'])
+        self.assertEqual(
+            [(entry['recipient'], entry['domain'], entry['status'], entry.get('smtp_code'))
+             for entry in result['recipient_status']],
+            [('a@one.example', 'one.example', 'sent', None), ('c@one.example', 'one.example', 'sent', None),
+             ('x@bad.example', 'bad.example', 'refused', 550), ('y@later.example', 'later.example', 'refused', 451)]
+        )
+        self.assertIn('Recipient address rejected', result['recipient_status'][2]['smtp_message'])
+        self.assertEqual(self.delivered_to(), ['a@one.example', 'c@one.example'])
+
+    def test_nobody_delivered(self):
+        for recipients, retryable in ((['x@bad.example', 'y@later.example'], False), (['y@later.example'], True)):
+            with self.subTest(recipients):
+                result = self.send(recipients)
+                self.assertEqual(result['error'], 'SMTP_RECIPIENTS_REFUSED')
+                # Sending again cannot duplicate the message, so only the permanent refusal is final
+                self.assertEqual(result['retryable'], retryable)
+                self.assertEqual(result['delivered_count'], 0)
+        self.assertEqual(self.server.deliveries, [])
+
+
+class PerDomainViewTests(TestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer(refuse=['bad.example']).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(smtp_pool.close_all)
+        self.client = api_client(self)
+
+    def post(self, recipients):
+        return self.client.post('/api/send/', {
+            'email_settings': self.server.settings(), 'sender': 'shop@example.com', 'recipients': recipients,
+            'subject': 'Receipt', 'body': 'Thank you', 'delivery': 'per_domain'
+        }, format='json')
+
+    def test_partial_delivery_is_multi_status(self):
+        response = self.post(['a@one.example', 'x@bad.example'])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual(body['error'], 'PARTIAL_DELIVERY')
+        self.assertEqual([entry['status'] for entry in body['recipient_status']], ['sent', 'refused'])
+
+    def test_all_refused_and_all_delivered(self):
+        self.assertEqual(self.post(['x@bad.example']).status_code, 422)
+        self.assertEqual(self.post(['a@one.example', 'b@two.example']).status_code, 200)
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import Counter
+
+from django.test import SimpleTestCase
+
+from email_app.fanout import MailboxFanout
+
+
+class ScriptedFanout(MailboxFanout):
+    """Fanout whose receive sleeps for the config's 'delay' and records how many ran per host at once"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.most = Counter()
+        self.started = []
+
+    def _receive(self, email_config):
+        host = email_config['host']
+        with self.lock:
+            self.running[host] += 1
+            self.most[host] = max(self.most[host], self.running[host])
+            self.started.append(email_config['name'])
+        try:
+            time.sleep(email_config['delay'])
+            return {'success': True, 'name': email_config['name']}
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+
+
+def mailbox(name, delay, host='imap.example.com'):
+    return {'host': host, 'name': name, 'delay': delay}
+
+
+class ReceiveManyTests(SimpleTestCase):
+    def fanout(self, **kwargs):
+        fanout = ScriptedFanout(**kwargs)
+        self.addCleanup(fanout.shutdown)
+        return fanout
+
+    def test_results_in_order(self):
+        fanout = self.fanout(workers=4, per_host=2, timeout=5)
+        configs = [mailbox('a', 0.05), mailbox('b', 0), mailbox('c', 0, host='pop.example.com')]
+        self.assertEqual([result['name'] for result in fanout.receive_many(configs)], ['a', 'b', 'c'])
+
+    def test_per_host_limit(self):
+        fanout = self.fanout(workers=8, per_host=2, timeout=5)
+        fanout.receive_many([mailbox(str(n), 0.05) for n in range(6)] + [mailbox('other', 0.05, host='b.example.com')])
+        self.assertEqual(fanout.most, Counter({'imap.example.com': 2, 'b.example.com': 1}))
+
+    def test_timed_out_receive_keeps_its_slot(self):
+        fanout = self.fanout(workers=4, per_host=1, timeout=0.3)
+        results = fanout.receive_many([mailbox('slow', 0.45), mailbox('next', 0)])
+        self.assertEqual(results[0]['error'], 'TIMEOUT')
+        # Started only once the slow receive had really finished
+        self.assertTrue(results[1]['success'])
+        self.assertEqual(fanout.most['imap.example.com'], 1)
+
+    def test_queue_behind_a_stuck_host_times_out(self):
+        fanout = self.fanout(workers=4, per_host=1, timeout=0.2)
+        start = time.monotonic()
+        results = fanout.receive_many([mailbox('stuck', 2), mailbox('queued', 0), mailbox('b', 0, host='b.example.com')])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual([result.get('error') for result in results], ['TIMEOUT', 'TIMEOUT', None])
+        self.assertNotIn('queued', fanout.started)
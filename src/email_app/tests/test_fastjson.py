@@ -0,0 +1,102 @@
+import io
+import json
+import uuid
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from email_app import fastjson
+from email_app.parsers import FastJSONParser
+from email_app.renderers import FastJSONRenderer
+
+SAMPLE = {
+    'text': 'Grüße, 日本',
+    'nested': [1, 2.5, None, True, {'deep': []}],
+    'decimal': Decimal('1.10'),
+    'aware': datetime(2024, 2, 1, 9, 30, 15, 123456, tzinfo=timezone.utc),
+    'naive': datetime(2024, 2, 1, 9, 30),
+    'date': date(2024, 2, 1),
+    'time': time(9, 30, 15, 500),
+    'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'lazy': gettext_lazy('This field is required.'),
+    1: 'integer key',
+}
+
+
+class DumpsLoadsTests(SimpleTestCase):
+    def test_same_as_the_stdlib_path(self):
+        fast = fastjson.dumps(SAMPLE)
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertEqual(fastjson.dumps(SAMPLE), fast)
+        # Types orjson leaves to ``default`` are formatted by DRF's encoder
+        self.assertEqual(json.loads(fast)['aware'], '2024-02-01T09:30:15.123456Z')
+        self.assertEqual(json.loads(fast)['decimal'], 1.1)
+        self.assertEqual(json.loads(fast)['lazy'], 'This field is required.')
+        self.assertEqual(json.loads(fast)['1'], 'integer key')
+
+    def test_integers_over_64_bits(self):
+        self.assertEqual(fastjson.dumps({'n': 2 ** 70}), b'{"n":1180591620717411303424}')
+        self.assertEqual(fastjson.loads(b'{"n":1180591620717411303424}'), {'n': 2 ** 70})
+
+    def test_loads(self):
+        for body in (b'{"a":[1,"\xc3\xbc"]}', '{"a":[1,"ü"]}'):
+            with self.subTest(body):
+                self.assertEqual(fastjson.loads(body), {'a': [1, 'ü']})
+        # Errors are those of stdlib json
+        with self.assertRaises(json.JSONDecodeError) as raised:
+            fastjson.loads(b'{"a": ')
+        self.assertEqual(raised.exception.msg, 'Expecting value')
+
+    def test_without_orjson(self):
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertEqual(fastjson.dumps({'a': 'ü', 'n': 2 ** 70}), '{"a":"ü","n":1180591620717411303424}'.encode())
+            self.assertEqual(fastjson.loads(b'{"a":"\\u00fc"}'), {'a': 'ü'})
+
+    def test_response(self):
+        response = fastjson.FastJsonResponse({'success': True}, status=201)
+        self.assertEqual((response.status_code, response['Content-Type'], response.content),
+                         (201, 'application/json', b'{"success":true}'))
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def assertRendersLikeJSONRenderer(self, data, accepted_media_type=None):
+        expected = JSONRenderer().render(data, accepted_media_type, {})
+        self.assertEqual(FastJSONRenderer().render(data, accepted_media_type, {}), expected)
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data, accepted_media_type, {}), expected)
+
+    def test_same_output_as_json_renderer(self):
+        for data in (SAMPLE, [SAMPLE, SAMPLE], {'n': 2 ** 70}, 'text', 12, [], None):
+            with self.subTest(data=data):
+                self.assertRendersLikeJSONRenderer(data)
+
+    def test_line_and_paragraph_separators_are_escaped(self):
+        data = {'text': 'one\u2028two\u2029three'}
+        self.assertRendersLikeJSONRenderer(data)
+        self.assertEqual(FastJSONRenderer().render(data), b'{"text":"one\\u2028two\\u2029three"}')
+
+    def test_indented_output(self):
+        self.assertRendersLikeJSONRenderer(SAMPLE, 'application/json; indent=2')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    def parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(io.BytesIO(body), 'application/json', {'encoding': encoding})
+
+    def test_same_as_json_parser(self):
+        body = '{"text":"Grüße","n":[1,2.5,null,true],"big":1180591620717411303424}'.encode()
+        self.assertEqual(self.parse(FastJSONParser(), body), self.parse(JSONParser(), body))
+        body = '{"text":"Grüße"}'.encode('latin-1')
+        self.assertEqual(self.parse(FastJSONParser(), body, 'latin-1'), {'text': 'Grüße'})
+
+    def test_invalid_bodies_are_refused(self):
+        for body in (b'{"a": ', b'{"a": NaN}', b'\xff'):
+            with self.subTest(body):
+                with self.assertRaises(ParseError):
+                    self.parse(FastJSONParser(), body)
@@ -0,0 +1,230 @@
+import email
+
+from django.test import SimpleTestCase
+
+from email_app.imap_utils import Atom, _tokens, body_parts, mime_parts, parse_fetch_response
+
+
+def crlf(text):
+    return text.replace(b'\n', b'\r\n')
+
+
+NESTED = crlf(b'''From: a@example.com
+Subject: nested
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="outer"
+
+This is the preamble.
+--outer
+Content-Type: multipart/alternative; boundary=inner
+
+--inner
+Content-Type: text/plain; charset=utf-8
+
+plain body
+--inner
+Content-Type: text/html
+
+<p>html</p>
+--inner--
+--outer
+Content-Type: application/pdf; name="a.pdf"
+Content-Disposition: attachment; filename="a.pdf"
+Content-Transfer-Encoding: base64
+
+JVBERi0xLjQK
+--outer--
+This is the epilogue.
+''')
+
+CORPUS = {
+    'single part': crlf(b'Subject: x\n\nhello\n\nworld\n'),
+    'nested with preamble and epilogue': NESTED,
+    'LF only': NESTED.replace(b'\r\n', b'\n'),
+    'unterminated close delimiter': crlf(b'''Content-Type: multipart/mixed; boundary=b1
+
+--b1
+Content-Type: text/plain
+
+first
+--b1
+Content-Type: text/plain
+
+second, no close delimiter
+
+'''),
+    'trailing delimiter': crlf(b'''Content-Type: multipart/mixed; boundary=b1
+
+--b1
+
+first
+--b1
+'''),
+    'boundary inside body lines': crlf(b'''Content-Type: multipart/mixed; boundary=b1
+
+--b1
+Content-Type: text/plain
+
+a line mentioning --b1 in the middle
+--b1x is not a delimiter
+--b1--not a close delimiter either
+--b1
+Content-Type: text/plain
+
+second
+--b1--
+'''),
+    'RFC 2231 filenames': crlf(b'''Content-Type: multipart/mixed; boundary=b1
+
+--b1
+Content-Type: text/plain
+
+body
+--b1
+Content-Type: application/octet-stream
+Content-Disposition: attachment; filename*=utf-8''na%C3%AFve%20r%C3%A9sum%C3%A9.txt
+
+data
+--b1
+Content-Type: application/octet-stream
+Content-Disposition: attachment; filename*0*=utf-8''long%20; filename*1="name.txt"
+
+data2
+--b1--
+'''),
+    'attached message': crlf(b'''Content-Type: multipart/mixed; boundary=b1
+
+--b1
+Content-Type: text/plain
+
+body
+--b1
+Content-Type: message/rfc822
+
+Subject: inner
+Content-Type: multipart/mixed; boundary=b2
+
+--b2
+Content-Type: text/plain
+
+inner body
+--b2--
+--b1--
+'''),
+    'digest': crlf(b'''Content-Type: multipart/digest; boundary=b1
+
+--b1
+
+Subject: one
+
+first
+--b1--
+'''),
+}
+
+
+def reference_parts(message, prefix=''):
+    """(number, type, filename, body or attached Subject) per leaf, as the email package parses it"""
+    if message.get_content_maintype() == 'multipart':
+        parts = []
+        for number, child in enumerate(message.get_payload(), 1):
+            parts.extend(reference_parts(child, f'{prefix}.{number}' if prefix else str(number)))
+        return parts
+    if message.get_content_type() == 'message/rfc822':
+        content = message.get_payload(0)['Subject']
+    else:
+        content = message.get_payload().encode('ascii', 'surrogateescape')
+    return [(prefix or '1', message.get_content_type(), message.get_filename(), content)]
+
+
+def sliced_parts(raw):
+    parts = []
+    for number, headers, body in mime_parts(raw)[1]:
+        if headers.get_content_type() == 'message/rfc822':
+            content = email.message_from_bytes(body)['Subject']
+        else:
+            content = body
+        parts.append((number, headers.get_content_type(), headers.get_filename(), content))
+    return parts
+
+
+class MimePartsTests(SimpleTestCase):
+    def test_matches_the_email_package(self):
+        for name, raw in CORPUS.items():
+            with self.subTest(name):
+                self.assertEqual(sliced_parts(raw), reference_parts(email.message_from_bytes(raw)))
+
+    def test_numbering_and_filenames(self):
+        self.assertEqual([(number, filename) for number, _, filename, _ in sliced_parts(CORPUS['RFC 2231 filenames'])],
+                         [('1', None), ('2', 'naïve résumé.txt'), ('3', 'long name.txt')])
+        self.assertEqual([number for number, *_ in sliced_parts(NESTED)], ['1.1', '1.2', '2'])
+
+    def test_top_level_headers(self):
+        headers, _ = mime_parts(NESTED)
+        self.assertEqual(headers['Subject'], 'nested')
+
+
+class TokensTests(SimpleTestCase):
+    def test_quoted_string_escapes(self):
+        self.assertEqual(list(_tokens(rb'"a \"quoted\" back\\slash" ""')), [b'a "quoted" back\\slash', b''])
+
+    def test_literals(self):
+        self.assertEqual(list(_tokens(b'{5}\r\nab)cd ~{3}\r\n\x00\r\n NIL')), [b'ab)cd', b'\x00\r\n', None])
+
+    def test_malformed_literal(self):
+        with self.assertRaises(ValueError):
+            list(_tokens(b'{5x}\r\nabcde'))
+
+    def test_section_atoms_keep_their_spaces_and_parentheses(self):
+        tokens = list(_tokens(b'(UID 4 BODY[HEADER.FIELDS (FROM SUBJECT)] {3}\r\nabc)'))
+        self.assertEqual(tokens, ['(', 'UID', '4', 'BODY[HEADER.FIELDS (FROM SUBJECT)]', b'abc', ')'])
+        self.assertIsInstance(tokens[3], Atom)
+        self.assertNotIsInstance(tokens[4], Atom)
+
+    def test_parenthesis_atoms_are_not_lists(self):
+        self.assertEqual(parse_fetch_response([b'1 (UID 4 FLAGS (\\Seen))']), [{'UID': '4', 'FLAGS': ['\\Seen']}])
+
+
+class FetchResponseTests(SimpleTestCase):
+    def test_literals_from_imaplib_data(self):
+        data = [
+            (b'1 (UID 7 BODY[HEADER.FIELDS (SUBJECT)] {14}', b'Subject: a\r\n\r\n'),
+            b' FLAGS (\\Seen))',
+            (b'2 (UID 8 BODY[HEADER.FIELDS (SUBJECT)] {0}', b''),
+            b')',
+        ]
+        self.assertEqual(parse_fetch_response(data), [
+            {'UID': '7', 'BODY[HEADER.FIELDS (SUBJECT)]': b'Subject: a\r\n\r\n', 'FLAGS': ['\\Seen']},
+            {'UID': '8', 'BODY[HEADER.FIELDS (SUBJECT)]': b''},
+        ])
+
+
+class BodyPartsTests(SimpleTestCase):
+    def structure(self, text):
+        return parse_fetch_response([b'1 (BODYSTRUCTURE ' + text + b')'])[0]['BODYSTRUCTURE']
+
+    def test_nested_multipart(self):
+        structure = self.structure(
+            b'((("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 10 1 NIL NIL NIL)'
+            b'("TEXT" "HTML" NIL NIL NIL "QUOTED-PRINTABLE" 20 1 NIL NIL NIL) "ALTERNATIVE")'
+            b'("APPLICATION" "PDF" ("NAME" "a.pdf") NIL NIL "BASE64" 300 NIL ("ATTACHMENT" ("FILENAME" "a.pdf")) NIL)'
+            b' "MIXED" ("BOUNDARY" "outer") NIL NIL)'
+        )
+        self.assertEqual([(part['part'], part['mimetype'], part['encoding'], part['size'], part['filename'])
+                          for part in body_parts(structure)], [
+            ('1.1', 'text/plain', '7bit', 10, None),
+            ('1.2', 'text/html', 'quoted-printable', 20, None),
+            ('2', 'application/pdf', 'base64', 300, 'a.pdf'),
+        ])
+
+    def test_rfc2231_filenames(self):
+        for params, filename in (
+            (b'("FILENAME*" "utf-8\'\'na%C3%AFve.txt")', 'naïve.txt'),
+            (b'("FILENAME*1" "name.txt" "FILENAME*0" "long ")', 'long name.txt'),
+            (b'("FILENAME*0*" "utf-8\'\'r%C3%A9" "FILENAME*1*" "sum%C3%A9.txt")', 'résumé.txt'),
+        ):
+            with self.subTest(params):
+                structure = self.structure(
+                    b'("APPLICATION" "OCTET-STREAM" NIL NIL NIL "BASE64" 4 NIL ("ATTACHMENT" ' + params + b') NIL)'
+                )
+                self.assertEqual(body_parts(structure)[0]['filename'], filename)
@@ -0,0 +1,259 @@
+import base64
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from email_app.jobs import EmailQueue, seal, unseal
+from email_app.models import EmailJob
+from email_app.pool import smtp_pool
+
+from .fakes import FakeSMTPServer
+
+
+class SealTests(TestCase):
+    def test_round_trip(self):
+        sealed = seal('pässword:1')
+        self.assertNotIn('pässword', sealed)
+        self.assertEqual(unseal(sealed), 'pässword:1')
+
+    def test_nonce_makes_every_seal_different(self):
+        self.assertNotEqual(seal('secret'), seal('secret'))
+
+    def test_tampering_is_detected(self):
+        sealed = bytearray(seal('secret').encode('ascii'))
+        sealed[30] = ord('A') if sealed[30] != ord('A') else ord('B')
+        with self.assertRaises(ValueError):
+            unseal(sealed.decode('ascii'))
+
+    def test_rotated_secret_key(self):
+        sealed = seal('secret')
+        with override_settings(SECRET_KEY='new-key', SECRET_KEY_FALLBACKS=[]):
+            with self.assertRaises(ValueError):
+                unseal(sealed)
+        with override_settings(SECRET_KEY='new-key', SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertEqual(unseal(sealed), 'secret')
+
+
+class QueueTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer(defer=['later.example']).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(smtp_pool.close_all)
+        self.attachment_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.attachment_dir)
+        self.queue = EmailQueue(workers=0, max_attempts=3, retry_base_delay=60, retry_max_delay=600,
+                                attachment_dir=self.attachment_dir)
+
+    def send_kwargs(self, recipient='customer@example.com'):
+        return {
+            'email_settings': self.server.settings(),
+            'sender': 'shop@example.com',
+            'recipients': [recipient],
+            'subject': 'Receipt',
+            'body': 'Thank you'
+        }
+
+
+class EnqueueTests(QueueTestCase):
+    def test_password_is_not_stored_in_the_clear(self):
+        job = self.queue.enqueue(self.send_kwargs())
+        job.refresh_from_db()
+        self.assertNotIn('password', job.payload['email_settings'])
+        self.assertNotIn('secret', str(job.payload))
+        self.assertEqual(unseal(job.payload['sealed_password']), 'secret')
+
+    def test_payload_is_cleared_when_done(self):
+        job = self.queue.enqueue(self.send_kwargs())
+        self.assertTrue(self.queue.run_once())
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_SENT)
+        self.assertIsNone(job.payload)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(len(self.server.deliveries), 1)
+
+    def test_unreadable_password_fails_the_job(self):
+        job = self.queue.enqueue(self.send_kwargs())
+        with override_settings(SECRET_KEY='new-key'):
+            self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_FAILED)
+        self.assertEqual(job.result['error'], 'CREDENTIALS_UNAVAILABLE')
+        self.assertIsNone(job.payload)
+        self.assertEqual(self.server.deliveries, [])
+
+    def test_plain_payload_of_an_older_job_still_sends(self):
+        job = EmailJob.objects.create(payload=self.send_kwargs())
+        self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_SENT)
+
+
+class SpooledUploadTests(QueueTestCase):
+    def upload_kwargs(self, content=b'a,b\n1,2\n', recipient='customer@example.com'):
+        upload = SimpleUploadedFile('report.csv', content, content_type='text/csv')
+        return {**self.send_kwargs(recipient),
+                'attachments': [{'filename': 'report.csv', 'content_type': 'text/csv', 'file': upload}]}
+
+    def test_upload_is_kept_as_a_file_not_in_the_row(self):
+        job = self.queue.enqueue(self.upload_kwargs(b'x' * 3000))
+        job.refresh_from_db()
+        attachment = job.payload['attachments'][0]
+        self.assertNotIn('content', attachment)
+        with open(os.path.join(self.attachment_dir, attachment['spooled_file']), 'rb') as spooled:
+            self.assertEqual(spooled.read(), b'x' * 3000)
+        self.assertLess(len(str(job.payload)), 1000)
+
+    def test_file_is_sent_and_removed_when_done(self):
+        job = self.queue.enqueue(self.upload_kwargs())
+        self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_SENT)
+        self.assertIn(base64.b64encode(b'a,b\n1,2\n'), self.server.deliveries[0][2])
+        self.assertEqual(os.listdir(self.attachment_dir), [])
+
+    def test_file_is_kept_while_the_job_is_retrying(self):
+        job = self.queue.enqueue(self.upload_kwargs(recipient='customer@later.example'))
+        self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_RETRYING)
+        self.assertEqual(len(os.listdir(self.attachment_dir)), 1)
+
+    def test_missing_file_fails_the_job(self):
+        job = self.queue.enqueue(self.upload_kwargs())
+        os.remove(os.path.join(self.attachment_dir, os.listdir(self.attachment_dir)[0]))
+        self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_FAILED)
+        self.assertEqual(job.result['error'], 'ATTACHMENT_UNAVAILABLE')
+        self.assertEqual(self.server.deliveries, [])
+
+    def test_file_is_removed_if_the_row_cannot_be_written(self):
+        with mock.patch.object(EmailJob.objects, 'create', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                self.queue.enqueue(self.upload_kwargs())
+        self.assertEqual(os.listdir(self.attachment_dir), [])
+
+
+class ClaimTests(QueueTestCase):
+    def test_job_is_claimed_once(self):
+        job = self.queue.enqueue(self.send_kwargs())
+        claimed = self.queue.claim_next()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, EmailJob.STATUS_SENDING)
+        self.assertIsNone(self.queue.claim_next())
+
+    def test_oldest_first(self):
+        first = self.queue.enqueue(self.send_kwargs())
+        self.queue.enqueue(self.send_kwargs())
+        self.assertEqual(self.queue.claim_next().pk, first.pk)
+
+    def test_stale_sending_job_is_handed_out_again(self):
+        job = self.queue.enqueue(self.send_kwargs())
+        self.queue.claim_next()
+        EmailJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=self.queue.stale_after + 1))
+        self.assertEqual(self.queue.claim_next().pk, job.pk)
+
+    def test_locked_write_is_retried(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database table is locked: email_app_emailjob')
+            return 'done'
+
+        self.assertEqual(EmailQueue._retry_locked(flaky), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_other_database_errors_are_not_retried(self):
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise OperationalError('no such table: email_app_emailjob')
+
+        with self.assertRaises(OperationalError):
+            EmailQueue._retry_locked(broken)
+        self.assertEqual(len(calls), 1)
+
+    def test_busy_database_is_not_a_worker_error(self):
+        locked = OperationalError('database is locked')
+        with mock.patch.object(self.queue, 'claim_next', side_effect=locked):
+            with self.assertLogs('email_app.jobs', 'WARNING') as logs:
+                self.assertFalse(self.queue.run_once())
+        self.assertIn('database busy', logs.output[0])
+        self.assertNotIn('worker error', logs.output[0])
+
+
+class RetryTests(QueueTestCase):
+    def make_due(self, job):
+        EmailJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+
+    def assertRetryIn(self, job, low, high):
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_RETRYING)
+        delay = (job.next_attempt_at - timezone.now()).total_seconds()
+        self.assertGreater(delay, low - 5)
+        self.assertLessEqual(delay, high)
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, full in ((1, 60), (2, 120), (3, 240), (4, 480), (5, 600), (100, 600)):
+            with self.subTest(attempts):
+                for _ in range(20):
+                    self.assertTrue(full / 2 <= self.queue.retry_delay(attempts) <= full)
+
+    def test_transient_failure_is_retried_later(self):
+        job = self.queue.enqueue(self.send_kwargs('customer@later.example'))
+        self.queue.run_once()
+        self.assertRetryIn(job, 30, 60)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.result['retryable'])
+        self.assertIsNotNone(job.payload)
+        # Not handed out before it is due
+        self.assertIsNone(self.queue.claim_next())
+        self.make_due(job)
+        self.assertEqual(self.queue.claim_next().pk, job.pk)
+
+    def test_gives_up_after_max_attempts(self):
+        job = self.queue.enqueue(self.send_kwargs('customer@later.example'))
+        for _ in range(self.queue.max_attempts):
+            self.make_due(job)
+            self.assertTrue(self.queue.run_once())
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIsNone(job.payload)
+        self.assertIsNone(job.next_attempt_at)
+        self.assertFalse(self.queue.run_once())
+
+    def test_retry_after_is_honoured(self):
+        limited = {'success': False, 'error': 'RATE_LIMITED', 'retryable': True, 'retry_after': 500}
+        job = self.queue.enqueue(self.send_kwargs())
+        with mock.patch('email_app.jobs.EmailService.send_email', return_value=limited):
+            self.queue.run_once()
+        self.assertRetryIn(job, 500, 501)
+
+    def test_permanent_failure_is_not_retried(self):
+        refused = {'success': False, 'error': 'SMTP_AUTH_ERROR', 'retryable': False}
+        job = self.queue.enqueue(self.send_kwargs())
+        with mock.patch('email_app.jobs.EmailService.send_email', return_value=refused):
+            self.queue.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, EmailJob.STATUS_FAILED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_failed_request_is_queued_as_first_attempt(self):
+        result = {'success': False, 'error': 'SMTP_TEMPORARY_FAILURE', 'retryable': True}
+        job = self.queue.enqueue_retry(self.send_kwargs(), result)
+        self.assertEqual(job.attempts, 1)
+        self.assertRetryIn(job, 30, 60)
+        self.assertRetryIn(self.queue.enqueue_retry(self.send_kwargs(), {**result, 'retry_after': 300}), 300, 301)
+        self.assertIsNone(EmailQueue(workers=0, max_attempts=1).enqueue_retry(self.send_kwargs(), result))
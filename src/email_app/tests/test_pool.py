@@ -0,0 +1,189 @@
+import poplib
+import smtplib
+import threading
+import time
+
+from django.core import mail
+from django.test import SimpleTestCase
+
+from email_app.pool import MailSessionPool, SMTPConnectionPool, SessionLimitReached
+
+from .fakes import FakeSMTPServer, ScriptedServer, answer_until_quit, pop_login
+
+
+def make_message():
+    return mail.EmailMessage('Receipt', 'Thank you', 'shop@example.com', ['customer@example.com'])
+
+
+class SMTPConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.backend_kwargs = {'host': '127.0.0.1', 'port': self.server.port, 'username': 'shop',
+                               'password': 'secret', 'use_tls': False, 'use_ssl': False, 'timeout': 5}
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('noop_interval', 0)
+        pool = SMTPConnectionPool(**kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_connection_is_reused(self):
+        pool = self.pool()
+        for _ in range(3):
+            self.assertEqual(pool.send_each(self.backend_kwargs, [make_message()]), [None])
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.deliveries), 3)
+
+    def test_disconnect_after_data_is_not_retried(self):
+        pool = self.pool(noop_interval=60)
+        pool.send_each(self.backend_kwargs, [make_message()])
+        self.server.drop_after_data = True
+        outcomes = pool.send_each(self.backend_kwargs, [make_message()])
+        self.assertIsInstance(outcomes[0], smtplib.SMTPServerDisconnected)
+        # The server took the message, so it was not sent again
+        self.assertEqual(len(self.server.deliveries), 2)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_accounts_get_their_own_connections(self):
+        pool = self.pool()
+        for kwargs in (self.backend_kwargs, {**self.backend_kwargs, 'username': 'other'},
+                       {**self.backend_kwargs, 'password': 'changed'}, self.backend_kwargs):
+            pool.send_each(kwargs, [make_message()])
+        self.assertEqual(self.server.connections, 3)
+        self.assertNotIn('secret', repr(pool.make_key(self.backend_kwargs)))
+
+    def test_expired_connection_is_not_reused(self):
+        pool = self.pool(idle_ttl=0.05)
+        pool.send_each(self.backend_kwargs, [make_message()])
+        time.sleep(0.1)
+        pool.send_each(self.backend_kwargs, [make_message()])
+        self.assertEqual(self.server.connections, 2)
+
+    def test_size_cap_closes_the_least_recently_used(self):
+        pool = self.pool(max_size=1)
+        first = pool.acquire(self.backend_kwargs)[0]
+        second = pool.acquire({**self.backend_kwargs, 'username': 'other'})[0]
+        pool.release(self.backend_kwargs, first)
+        pool.release({**self.backend_kwargs, 'username': 'other'}, second)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertIsNone(first.connection)
+
+    def test_noop_replaces_a_dead_connection(self):
+        pool = self.pool()
+        pool.send_each(self.backend_kwargs, [make_message()])
+        self.server.hang_up()
+        backend, reused = pool.acquire(self.backend_kwargs)
+        pool.release(self.backend_kwargs, backend)
+        self.assertFalse(reused)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_dropped_connection_is_reopened_without_sending_twice(self):
+        # No NOOP check before reuse, so the send finds out
+        pool = self.pool(noop_interval=60)
+        pool.send_each(self.backend_kwargs, [make_message()])
+        self.server.hang_up()
+        self.assertEqual(pool.send_each(self.backend_kwargs, [make_message(), make_message()]), [None, None])
+        self.assertEqual(self.server.connections, 2)
+        self.assertEqual(len(self.server.deliveries), 3)
+
+
+class POPSessionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.logins = 0
+        self.replies = {'NOOP': ('+OK',)}
+        self.password_reply = '+OK Logged in'
+
+        def script(conn):
+            self.logins += 1
+            pop_login(conn, self.password_reply)
+            answer_until_quit(conn, self.replies)
+
+        self.server = ScriptedServer(script).start()
+        self.addCleanup(self.server.stop)
+        self.config = {'host': '127.0.0.1', 'port': self.server.port, 'username': 'user', 'password': 'secret',
+                       'use_ssl': False, 'timeout': 5}
+
+    def pool(self, **kwargs):
+        kwargs.setdefault('noop_interval', 0)
+        pool = MailSessionPool('POP', **kwargs)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def borrow(self, pool, config=None):
+        session, reused = pool.acquire(config or self.config)
+        pool.release(config or self.config, session)
+        return reused
+
+    def test_session_is_reused(self):
+        pool = self.pool()
+        self.assertEqual([self.borrow(pool) for _ in range(3)], [False, True, True])
+        self.assertEqual(self.logins, 1)
+
+    def test_accounts_get_their_own_sessions(self):
+        pool = self.pool()
+        self.borrow(pool)
+        self.assertFalse(self.borrow(pool, {**self.config, 'password': 'changed'}))
+        self.assertFalse(self.borrow(pool, {**self.config, 'username': 'other'}))
+        self.assertTrue(self.borrow(pool))
+        self.assertEqual(self.logins, 3)
+
+    def test_session_older_than_max_age_is_logged_out(self):
+        pool = self.pool(max_age=0.05)
+        session, _ = pool.acquire(self.config)
+        time.sleep(0.1)
+        pool.release(self.config, session)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertFalse(self.borrow(pool))
+
+    def test_failed_noop_opens_a_new_session(self):
+        pool = self.pool()
+        self.borrow(pool)
+        self.replies['NOOP'] = ('-ERR session expired',)
+        self.assertFalse(self.borrow(pool))
+        self.assertEqual(self.logins, 2)
+
+    def test_open_sessions_are_capped(self):
+        pool = self.pool(max_sessions=1, max_wait=0.1)
+        session, _ = pool.acquire(self.config)
+        with self.assertRaises(SessionLimitReached):
+            pool.acquire(self.config)
+        # Other mailboxes are not held up
+        self.assertFalse(self.borrow(pool, {**self.config, 'username': 'other'}))
+        pool.release(self.config, session)
+        self.assertTrue(self.borrow(pool))
+        self.assertEqual(pool.stats()['open'], 2)
+
+    def test_waiting_caller_gets_the_released_session(self):
+        pool = self.pool(max_sessions=1, max_wait=5)
+        session, _ = pool.acquire(self.config)
+        threading.Timer(0.1, pool.release, (self.config, session)).start()
+        self.assertEqual(pool.acquire(self.config), (session, True))
+        self.assertEqual(self.logins, 1)
+
+    def test_closed_sessions_free_their_place(self):
+        pool = self.pool(max_sessions=1, max_wait=0)
+        self.password_reply = '-ERR [AUTH] invalid password'
+        with self.assertRaises(poplib.error_proto):
+            pool.acquire(self.config)
+        self.password_reply = '+OK Logged in'
+        session, _ = pool.acquire(self.config)
+        pool.discard(session)
+        self.assertFalse(self.borrow(pool))
+        self.assertEqual(pool.stats()['open'], 1)
+
+    def test_open_at_the_cap_closes_an_idle_session(self):
+        pool = self.pool(max_sessions=1, max_wait=0)
+        self.borrow(pool)
+        pool.release(self.config, pool.open(self.config))
+        self.assertEqual(self.logins, 2)
+        self.assertEqual(pool.stats()['open'], 1)
+
+
+class IMAPSessionKeyTests(SimpleTestCase):
+    def test_folder_is_part_of_the_key(self):
+        pool = MailSessionPool('IMAP')
+        config = {'host': 'imap.example.com', 'port': 993, 'username': 'user', 'password': 'secret', 'use_ssl': True}
+        self.assertEqual(pool.make_key(config), pool.make_key({**config, 'folder': 'INBOX'}))
+        self.assertNotEqual(pool.make_key(config), pool.make_key({**config, 'folder': 'Archive'}))
+        self.assertNotEqual(pool.make_key(config), pool.make_key({**config, 'password': 'other'}))
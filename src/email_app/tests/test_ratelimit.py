@@ -0,0 +1,195 @@
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.core import mail
+from django.test import SimpleTestCase
+
+from email_app.pool import SMTPConnectionPool, smtp_pool
+from email_app.ratelimit import RateLimited, SMTPAccountLimiter, smtp_limiter
+from email_app.service import EmailService
+
+from .fakes import FakeSMTPServer
+from .utils import api_client
+
+
+def make_message():
+    return mail.EmailMessage('Receipt', 'Thank you', 'shop@example.com', ['customer@example.com'])
+
+
+class LimiterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.account = {'host': 'smtp.example.com', 'username': 'shop'}
+
+    def limiter(self, **kwargs):
+        return SMTPAccountLimiter(self.directory, **kwargs)
+
+
+class TokenBucketTests(LimiterTestCase):
+    def test_burst_then_rate_limited(self):
+        limiter = self.limiter(rate=1, burst=3, max_wait=0)
+        for _ in range(3):
+            self.assertEqual(limiter.reserve(self.account), 0)
+        with self.assertRaises(RateLimited) as raised:
+            limiter.reserve(self.account)
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertLessEqual(raised.exception.retry_after, 1)
+
+    def test_short_wait_is_reserved(self):
+        limiter = self.limiter(rate=10, burst=1, max_wait=1)
+        self.assertEqual(limiter.reserve(self.account), 0)
+        self.assertAlmostEqual(limiter.reserve(self.account), 0.1, delta=0.02)
+        # The reservation counts: the next caller queues behind it
+        self.assertAlmostEqual(limiter.reserve(self.account), 0.2, delta=0.02)
+
+    def test_rejected_request_takes_nothing(self):
+        limiter = self.limiter(rate=20, burst=1, max_wait=0)
+        limiter.reserve(self.account)
+        for _ in range(3):
+            with self.assertRaises(RateLimited):
+                limiter.reserve(self.account)
+        time.sleep(0.06)
+        self.assertEqual(limiter.reserve(self.account), 0)
+
+    def test_accounts_are_independent(self):
+        limiter = self.limiter(rate=1, burst=1, max_wait=0)
+        limiter.reserve(self.account)
+        limiter.reserve({**self.account, 'username': 'other'})
+        limiter.reserve({**self.account, 'host': 'smtp2.example.com'})
+        with self.assertRaises(RateLimited):
+            limiter.reserve({**self.account, 'host': 'SMTP.example.com'})
+
+    def test_shared_through_the_directory(self):
+        self.limiter(rate=1, burst=1, max_wait=0).reserve(self.account)
+        with self.assertRaises(RateLimited):
+            self.limiter(rate=1, burst=1, max_wait=0).reserve(self.account)
+
+    def test_disabled(self):
+        limiter = self.limiter()
+        self.assertFalse(limiter.enabled)
+        for _ in range(100):
+            self.assertEqual(limiter.reserve(self.account), 0)
+
+
+class ConnectionSlotTests(LimiterTestCase):
+    def test_slots_are_capped_and_released(self):
+        limiter = self.limiter(max_connections=2)
+        account = limiter.account_key(self.account)
+        first, second = limiter.try_slot(account), limiter.try_slot(account)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(limiter.try_slot(account))
+        limiter.release_slot(first)
+        third = limiter.try_slot(account)
+        self.assertIsNotNone(third)
+        limiter.release_slot(second)
+        limiter.release_slot(third)
+
+    def test_wanted(self):
+        limiter = self.limiter(max_connections=1)
+        account = limiter.account_key(self.account)
+        self.assertFalse(limiter.slot_wanted(account, 0))
+        limiter.want_slot(account)
+        self.assertTrue(limiter.slot_wanted(account, 0))
+        self.assertFalse(limiter.slot_wanted(account, float('inf')))
+
+
+class PoolLimitTests(LimiterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeSMTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.backend_kwargs = {'host': '127.0.0.1', 'port': self.server.port, 'username': 'shop',
+                               'password': 'secret', 'use_tls': False, 'use_ssl': False, 'timeout': 5}
+
+    def pool(self, limiter):
+        pool = SMTPConnectionPool(max_size=5, idle_ttl=60, noop_interval=0, limiter=limiter)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def test_idle_connection_keeps_its_slot(self):
+        limiter = self.limiter(max_connections=1, max_wait=0.2)
+        pool = self.pool(limiter)
+        account = limiter.account_key(self.backend_kwargs)
+        self.assertEqual(pool.send_each(self.backend_kwargs, [make_message()]), [None])
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertIsNone(limiter.try_slot(account))
+
+        # Reused without a new slot
+        self.assertEqual(pool.send_each(self.backend_kwargs, [make_message()]), [None])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_busy_slot_rate_limits_after_max_wait(self):
+        limiter = self.limiter(max_connections=1, max_wait=0.2)
+        slot = limiter.try_slot(limiter.account_key(self.backend_kwargs))
+        self.addCleanup(limiter.release_slot, slot)
+        outcomes = self.pool(limiter).send_each(self.backend_kwargs, [make_message()])
+        self.assertIsInstance(outcomes[0], RateLimited)
+        self.assertEqual(self.server.connections, 0)
+
+    def test_other_pool_gets_the_slot_of_an_idle_connection(self):
+        limiter = self.limiter(max_connections=1, max_wait=2)
+        holder = self.pool(limiter)
+        holder.send_each(self.backend_kwargs, [make_message()])
+        # The holder's keepalive thread closes its idle connection for the waiting pool
+        self.assertEqual(self.pool(limiter).send_each(self.backend_kwargs, [make_message()]), [None])
+        self.assertEqual(holder.stats()['idle'], 0)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_idle_connection_is_reclaimed_when_wanted(self):
+        limiter = self.limiter(max_connections=1, max_wait=0.2)
+        holder = self.pool(limiter)
+        holder.send_each(self.backend_kwargs, [make_message()])
+        account = limiter.account_key(self.backend_kwargs)
+
+        holder.reclaim_slots()
+        self.assertEqual(holder.stats()['idle'], 1)
+        limiter.want_slot(account)
+        holder.reclaim_slots()
+        self.assertEqual(holder.stats()['idle'], 0)
+        slot = limiter.try_slot(account)
+        self.assertIsNotNone(slot)
+        limiter.release_slot(slot)
+
+    def test_batch_uses_one_connection_and_one_token_per_message(self):
+        limiter = self.limiter(rate=1, burst=2, max_wait=0)
+        outcomes = self.pool(limiter).send_each(self.backend_kwargs, [make_message() for _ in range(4)])
+        self.assertIsNone(outcomes[0])
+        self.assertIsNone(outcomes[1])
+        self.assertIsInstance(outcomes[2], RateLimited)
+        self.assertIsInstance(outcomes[3], RateLimited)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.deliveries), 2)
+
+
+class RateLimitedResponseTests(LimiterTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeSMTPServer().start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(smtp_pool.close_all)
+        for name, value in (('directory', self.directory), ('rate', 1), ('burst', 1), ('max_wait', 0)):
+            patcher = mock.patch.object(smtp_limiter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_send_returns_429_with_retry_after(self):
+        client = api_client(self)
+        payload = {'email_settings': self.server.settings(), 'sender': 'shop@example.com',
+                   'recipients': ['customer@example.com'], 'subject': 'Receipt', 'body': 'Thank you'}
+        self.assertEqual(client.post('/api/send/', payload, format='json').status_code, 200)
+        response = client.post('/api/send/', payload, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(response.json()['error'], 'RATE_LIMITED')
+        self.assertTrue(response.json()['retryable'])
+        self.assertEqual(len(self.server.deliveries), 1)
+
+    def test_batch_reports_the_messages_over_the_limit(self):
+        message = {'email_settings': self.server.settings(), 'sender': 'shop@example.com',
+                   'recipients': ['customer@example.com'], 'subject': 'Receipt', 'body': 'Thank you'}
+        results = EmailService.send_batch([message, message])
+        self.assertEqual([result.get('error') for result in results], [None, 'RATE_LIMITED'])
@@ -0,0 +1,461 @@
+from datetime import date
+from email import message_from_bytes
+from email.utils import parsedate_to_datetime
+
+from django.test import SimpleTestCase, TestCase
+
+from email_app.cache import message_cache
+from email_app.models import MailboxSyncState
+from email_app.pool import imap_pool, pop_pool
+from email_app.service import IMAP_HEADER_QUERY, EmailReceiver
+
+from .fakes import ScriptedServer, answer_until_quit, pop_login
+
+MESSAGE = ('From: a@example.com', 'Subject: Hello', '', 'Body')
+
+
+def raw_message(subject='Hello', date=None):
+    date_header = f'Date: {date}\r\n' if date else ''
+    return f'From: a@example.com\r\n{date_header}Subject: {subject}\r\n\r\nBody'.encode()
+
+
+def uid_set(text, highest):
+    """UIDs of a sequence set such as '3:5,9:*'"""
+    uids = []
+    for item in text.replace('*', str(highest)).split(','):
+        first, _, last = item.partition(':')
+        first, last = int(first), int(last or first)
+        uids.extend(range(min(first, last), max(first, last) + 1))
+    return uids
+
+
+class IMAPMailbox:
+    """
+    ScriptedServer script for an INBOX of messages, a dict of UID to raw
+    bytes. SEARCH matches UID keys only; the other keys are kept in
+    ``searches`` for the tests to check. With ESEARCH among the
+    ``capabilities``, a search with RETURN is answered with an ESEARCH
+    sequence set, and with SORT the server sorts by the Date header.
+    FETCH answers in ascending UID order, whatever order the UIDs were
+    asked in; with ``uid_last`` the UID item follows the literal.
+    """
+
+    def __init__(self, messages, uidvalidity=5, capabilities=(), uid_last=False):
+        self.messages = messages
+        self.uidvalidity = uidvalidity
+        self.capabilities = capabilities
+        self.uid_last = uid_last
+        self.searches = []
+        self.fetches = []
+
+    @staticmethod
+    def command(conn):
+        """The next command line, with a literal it carries put in its place"""
+        line = conn.receive()
+        while line.endswith('}'):
+            line, _, size = line[:-1].rpartition('{')
+            conn.send('+ Ready for literal data')
+            line += conn.rfile.read(int(size)).decode('utf-8') + conn.receive()
+        return line
+
+    def by_date(self, uids):
+        return sorted(uids, key=lambda uid: parsedate_to_datetime(message_from_bytes(self.messages[uid])['Date']),
+                      reverse=True)
+
+    def send_fetched(self, conn, number, uid, headers_only):
+        message = self.messages[uid]
+        if headers_only:
+            items = f'RFC822.SIZE {len(message)} BODY[HEADER]'
+            literal = message.partition(b'\r\n\r\n')[0] + b'\r\n\r\n'
+        else:
+            items, literal = 'RFC822', message
+        if self.uid_last:
+            conn.send(f'* {number} FETCH ({items} {{{len(literal)}}}')
+            conn.send_raw(literal)
+            conn.send(f' UID {uid})')
+        else:
+            conn.send(f'* {number} FETCH (UID {uid} {items} {{{len(literal)}}}')
+            conn.send_raw(literal)
+            conn.send(')')
+
+    def __call__(self, conn):
+        conn.send(f'* OK [CAPABILITY {" ".join(["IMAP4rev1", *self.capabilities])}] ready')
+        while True:
+            line = self.command(conn)
+            if not line:
+                return
+            tag, *words = line.split(' ')
+            verb = ' '.join(words[:2] if words[0].upper() == 'UID' else words[:1]).upper()
+            highest = max(self.messages, default=0)
+            if verb in ('SELECT', 'EXAMINE'):
+                conn.send(f'* {len(self.messages)} EXISTS', f'* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid')
+            elif verb in ('UID SEARCH', 'UID SORT'):
+                self.searches.append(' '.join(words[1:]))
+                found = sorted(self.messages)
+                if 'UID' in words[2:]:
+                    wanted = uid_set(words[words.index('UID', 2) + 1], highest)
+                    found = [uid for uid in found if uid in wanted]
+                if verb == 'UID SORT':
+                    conn.send(' '.join(['* SORT', *map(str, self.by_date(found))]))
+                elif words[2] == 'RETURN':
+                    sequence_set = EmailReceiver._sequence_set(found).decode() if found else ''
+                    conn.send(f'* ESEARCH (TAG "{tag}") UID' + (f' ALL {sequence_set}' if found else ''))
+                else:
+                    conn.send(' '.join(['* SEARCH', *map(str, found)]))
+            elif verb == 'UID FETCH':
+                self.fetches.append(' '.join(words[2:]))
+                numbers = {uid: number for number, uid in enumerate(sorted(self.messages), 1)}
+                for uid in uid_set(words[2], highest):
+                    if uid in self.messages:
+                        self.send_fetched(conn, numbers[uid], uid, 'HEADER.FIELDS' in line)
+            elif verb == 'LOGOUT':
+                conn.send('* BYE', f'{tag} OK LOGOUT completed')
+                return
+            conn.send(f'{tag} OK {verb} completed')
+
+
+def pop_config(server, **extra):
+    return {'host': '127.0.0.1', 'port': server.port, 'username': 'user', 'password': 'secret', 'use_ssl': False,
+            'use_tls': False, 'max_emails': 10, 'protocol': 'POP', 'folder': 'INBOX', 'timeout': 5, **extra}
+
+
+class POPReceiveTestCase(TestCase):
+    def serve(self, script):
+        server = ScriptedServer(script).start()
+        self.addCleanup(server.stop)
+        self.addCleanup(pop_pool.close_all)
+        return server
+
+
+class POPUidlTests(POPReceiveTestCase):
+    def test_server_without_uidl(self):
+        def script(conn):
+            pop_login(conn)
+            answer_until_quit(conn, {
+                'LIST': ('+OK', '1 40', '.'),
+                'UIDL': ('-ERR command not supported',),
+                'RETR 1': ('+OK', *MESSAGE, '.'),
+                'NOOP': ('+OK',),
+            })
+
+        result = EmailReceiver.receive_emails(pop_config(self.serve(script)))
+        self.assertTrue(result['success'], result)
+        self.assertEqual([(record['message_number'], record['uid'], record['subject']) for record in result['emails']],
+                         [(1, None, 'Hello')])
+
+    def test_connection_dropped_during_uidl(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('+OK', '1 40', '.')
+            conn.receive()  # UIDL, then hang up
+
+        result = EmailReceiver.receive_emails(pop_config(self.serve(script), incremental=True))
+        self.assertFalse(result['success'])
+        # A hang-up, not a server without UIDL
+        self.assertNotIn('UIDL', result['message'])
+        self.assertEqual(pop_pool.stats()['idle'], 0)
+
+
+class POPAttachmentTests(POPReceiveTestCase):
+    def config(self, server, message_number):
+        return pop_config(server, part='1', message_number=message_number)
+
+    def test_missing_message_keeps_the_session(self):
+        def script(conn):
+            pop_login(conn)
+            answer_until_quit(conn, {'RETR 9': ('-ERR no such message',), 'NOOP': ('+OK',)})
+
+        result = EmailReceiver.fetch_attachment(self.config(self.serve(script), 9))
+        self.assertEqual(result['error'], 'MESSAGE_NOT_FOUND')
+        self.assertEqual(pop_pool.stats()['idle'], 1)
+
+    def test_connection_dropped_during_retr(self):
+        def script(conn):
+            pop_login(conn)
+            conn.receive()
+            conn.send('+OK', MESSAGE[0])
+
+        result = EmailReceiver.fetch_attachment(self.config(self.serve(script), 1))
+        self.assertFalse(result['success'])
+        self.assertNotEqual(result.get('error'), 'MESSAGE_NOT_FOUND')
+        self.assertEqual(pop_pool.stats()['idle'], 0)
+
+
+class IMAPCacheTests(TestCase):
+    def setUp(self):
+        message_cache.clear()
+        self.addCleanup(message_cache.clear)
+        self.server = ScriptedServer(IMAPMailbox({7: raw_message(), 8: raw_message()})).start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(imap_pool.close_all)
+        self.config = {**pop_config(self.server), 'protocol': 'IMAP', 'port': self.server.port}
+
+    def commands(self):
+        return [line.split(' ', 1)[1] for line in self.server.received if ' ' in line]
+
+    def test_cache_hit_still_marks_the_message_seen(self):
+        EmailReceiver.receive_emails(self.config)
+        self.assertNotIn('UID STORE', ' '.join(self.commands()))
+        del self.server.received[:]
+
+        result = EmailReceiver.receive_emails(self.config)
+        self.assertEqual([record['uid'] for record in result['emails']], [8, 7])
+        self.assertIn('UID STORE 7:8 +FLAGS.SILENT (\\Seen)', self.commands())
+        self.assertFalse([command for command in self.commands() if command.startswith('UID FETCH')])
+
+    async def test_async_cache_hit_still_marks_the_message_seen(self):
+        await EmailReceiver.receive_emails_async(self.config)
+        del self.server.received[:]
+        result = await EmailReceiver.receive_emails_async(self.config)
+        self.assertEqual([record['uid'] for record in result['emails']], [8, 7])
+        self.assertIn('UID STORE 7:8 +FLAGS.SILENT (\\Seen)', self.commands())
+
+    def test_only_content_receives_flag_hits(self):
+        cached = {b'9': {}, b'7': {}, b'8': {}}
+        self.assertEqual(EmailReceiver._cached_seen_set(self.config, cached), b'7:9')
+        self.assertIsNone(EmailReceiver._cached_seen_set(self.config, {}))
+        # Headers and metadata receives fetch with BODY.PEEK, which leaves \\Seen alone
+        self.assertIsNone(EmailReceiver._cached_seen_set({**self.config, 'mode': 'headers'}, cached))
+        self.assertIsNone(EmailReceiver._cached_seen_set({**self.config, 'attachment_mode': 'metadata'}, cached))
+
+    def test_hits_are_copies(self):
+        EmailReceiver.receive_emails(self.config)
+        EmailReceiver.receive_emails(self.config)['emails'][0]['subject'] = 'changed'
+        self.assertEqual(EmailReceiver.receive_emails(self.config)['emails'][0]['subject'], 'Hello')
+
+
+class IMAPPagingTestCase(TestCase):
+    def setUp(self):
+        message_cache.clear()
+        self.addCleanup(message_cache.clear)
+        self.mailbox = IMAPMailbox({uid: raw_message(f'Message {uid}') for uid in range(1, 6)})
+        server = ScriptedServer(self.mailbox).start()
+        self.addCleanup(server.stop)
+        self.addCleanup(imap_pool.close_all)
+        self.config = {**pop_config(server, max_emails=2), 'protocol': 'IMAP'}
+
+    def receive(self, **extra):
+        result = EmailReceiver.receive_emails({**self.config, **extra})
+        self.assertTrue(result['success'], result)
+        return result
+
+
+class IMAPCursorTests(IMAPPagingTestCase):
+    def test_pages_walk_back_to_the_oldest_message(self):
+        pages, cursor = [], None
+        while True:
+            result = self.receive(cursor=cursor)
+            pages.append([record['uid'] for record in result['emails']])
+            cursor = result['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[5, 4], [3, 2], [1]])
+
+    def test_new_mail_does_not_shift_the_next_page(self):
+        cursor = self.receive()['next_cursor']
+        self.mailbox.messages[6] = raw_message('Message 6')
+        self.assertEqual([record['uid'] for record in self.receive(cursor=cursor)['emails']], [3, 2])
+
+    def test_cursor_from_another_uidvalidity(self):
+        cursor = self.receive()['next_cursor']
+        self.mailbox.uidvalidity = 6
+        result = EmailReceiver.receive_emails({**self.config, 'cursor': cursor})
+        self.assertFalse(result['success'])
+        self.assertIn('Cursor expired', result['message'])
+
+    def test_invalid_and_foreign_cursors(self):
+        pop_cursor = EmailReceiver._encode_cursor({'protocol': 'POP', 'before': 3})
+        for cursor in ('garbage!', pop_cursor):
+            with self.subTest(cursor):
+                result = EmailReceiver.receive_emails({**self.config, 'cursor': cursor})
+                self.assertIn('Invalid cursor', result['message'])
+
+
+class IMAPSyncStateTests(IMAPPagingTestCase):
+    def test_incremental_receive_resumes_where_it_stopped(self):
+        # The first sync returns the newest messages and starts from the top
+        first = self.receive(incremental=True)
+        self.assertEqual([record['uid'] for record in first['emails']], [5, 4])
+        self.assertEqual(first['sync']['last_uid'], 5)
+        self.assertEqual(self.receive(incremental=True)['emails'], [])
+
+        for uid in (6, 7, 8):
+            self.mailbox.messages[uid] = raw_message(f'Message {uid}')
+        second = self.receive(incremental=True)
+        # The oldest new messages first, so nothing is skipped
+        self.assertEqual([record['uid'] for record in second['emails']], [7, 6])
+        self.assertTrue(second['sync']['has_more'])
+        last = self.receive(incremental=True)
+        self.assertEqual([record['uid'] for record in last['emails']], [8])
+        self.assertFalse(last['sync']['has_more'])
+        self.assertEqual(MailboxSyncState.objects.get().last_uid, 8)
+
+    def test_uidvalidity_change_starts_over(self):
+        self.receive(incremental=True, max_emails=10)
+        self.mailbox.uidvalidity = 6
+        result = self.receive(incremental=True, max_emails=10)
+        self.assertTrue(result['sync']['uidvalidity_changed'])
+        self.assertEqual(len(result['emails']), 5)
+        self.assertEqual(MailboxSyncState.objects.get().uidvalidity, 6)
+
+    def test_since_uid_does_not_store_state(self):
+        result = self.receive(since_uid=3, uidvalidity=5)
+        self.assertEqual([record['uid'] for record in result['emails']], [5, 4])
+        self.assertFalse(MailboxSyncState.objects.exists())
+
+    def test_page_of_an_incremental_mailbox_keeps_the_stored_state(self):
+        self.receive(incremental=True, max_emails=10)
+        cursor = self.receive()['next_cursor']
+        # The API refuses cursor with incremental; a direct call must not fail or move the high-water mark
+        result = self.receive(incremental=True, cursor=cursor)
+        self.assertNotIn('sync', result)
+        self.assertEqual(MailboxSyncState.objects.get().last_uid, 5)
+
+    async def test_async_page_of_an_incremental_mailbox(self):
+        cursor = (await EmailReceiver.receive_emails_async(self.config))['next_cursor']
+        result = await EmailReceiver.receive_emails_async({**self.config, 'incremental': True, 'cursor': cursor})
+        self.assertTrue(result['success'], result)
+        self.assertNotIn('sync', result)
+
+
+class POPCursorTests(POPReceiveTestCase):
+    def test_pages_follow_the_uidl_id(self):
+        messages = {number: ('Subject: Message %d' % number, '', 'Body') for number in range(1, 6)}
+        listing = [f'{number} 30' for number in messages]
+
+        def script(conn):
+            pop_login(conn)
+            answer_until_quit(conn, {
+                'LIST': ('+OK', *listing, '.'),
+                'UIDL': ('+OK', *[f'{number} id-{number}' for number in messages], '.'),
+                'NOOP': ('+OK',),
+                **{f'RETR {number}': ('+OK', *lines, '.') for number, lines in messages.items()},
+            })
+
+        config = pop_config(self.serve(script), max_emails=2)
+        pages, cursor = [], None
+        while True:
+            result = EmailReceiver.receive_emails({**config, 'cursor': cursor})
+            self.assertTrue(result['success'], result)
+            pages.append([record['uid'] for record in result['emails']])
+            cursor = result['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(pages, [['id-5', 'id-4'], ['id-3', 'id-2'], ['id-1']])
+
+
+class IMAPSearchCommandTests(SimpleTestCase):
+    cursor = {'since_uid': None}
+
+    def test_each_filter_becomes_a_search_key(self):
+        filters = {'since': date(2024, 2, 1), 'before': date(2024, 3, 5), 'unseen': True, 'flagged': False,
+                   'larger_than': 1000, 'from': 'alice', 'to': 'bob@example.com', 'subject': 'Q1 "draft"'}
+        criteria, literal = EmailReceiver._search_criteria({'since_uid': 9}, filters, before=40)
+        self.assertEqual(criteria, ['UID 10:*', 'UID 1:39', 'SINCE 1-Feb-2024', 'BEFORE 5-Mar-2024', 'UNSEEN',
+                                    'UNFLAGGED', 'LARGER 1000', 'FROM "alice"', 'TO "bob@example.com"',
+                                    'SUBJECT "Q1 \\"draft\\""'])
+        self.assertIsNone(literal)
+        self.assertEqual(EmailReceiver._search_criteria(self.cursor, {'unseen': False, 'flagged': True})[0],
+                         ['SEEN', 'FLAGGED'])
+        self.assertEqual(EmailReceiver._search_criteria(self.cursor), (['ALL'], None))
+
+    def test_non_ascii_text_is_a_utf8_literal(self):
+        criteria, literal = EmailReceiver._search_criteria(self.cursor, {'from': 'alice', 'subject': 'Grüße'})
+        # The literal follows its key, so that key goes last
+        self.assertEqual(criteria, ['FROM "alice"', 'SUBJECT'])
+        self.assertEqual(literal, 'Grüße'.encode('utf-8'))
+        config = {'filters': {'subject': 'Grüße'}}
+        self.assertEqual(EmailReceiver._search_command(config, self.cursor, ('IMAP4REV1',)),
+                         ('SEARCH', ['CHARSET', 'UTF-8', 'SUBJECT'], literal))
+        self.assertEqual(EmailReceiver._search_command(config, self.cursor, ('ESEARCH',)),
+                         ('SEARCH', ['RETURN', '(ALL)', 'CHARSET', 'UTF-8', 'SUBJECT'], literal))
+
+    def test_sort_by_date(self):
+        config = {'sort': 'date', 'filters': {'unseen': True}}
+        self.assertEqual(EmailReceiver._search_command(config, self.cursor, ('SORT', 'ESEARCH')),
+                         ('SORT', ['(REVERSE DATE)', 'UTF-8', 'UNSEEN'], None))
+        # Without SORT, or when reading on from a cursor, arrival order is used
+        self.assertEqual(EmailReceiver._search_command(config, self.cursor, ('ESEARCH',))[0], 'SEARCH')
+        self.assertEqual(EmailReceiver._search_command(config, {'since_uid': 3}, ('SORT',))[0], 'SEARCH')
+
+    def test_esearch_all_ranges(self):
+        esearch = [b'(TAG "A4") UID ALL 9:10,1:3,7']
+        self.assertEqual(EmailReceiver._searched_ranges([None], esearch), [(1, 3), (7, 7), (9, 10)])
+        # Nothing matched
+        self.assertEqual(EmailReceiver._searched_ranges([None], [b'(TAG "A4") UID']), [])
+        # A plain SEARCH answer
+        self.assertEqual(EmailReceiver._searched_ranges([b'4 2 3 9'], [None]), [(2, 4), (9, 9)])
+
+
+class IMAPSearchTests(TestCase):
+    def setUp(self):
+        message_cache.clear()
+        self.addCleanup(message_cache.clear)
+        self.addCleanup(imap_pool.close_all)
+
+    def receive(self, capabilities, **extra):
+        dates = {1: 'Fri, 01 Mar 2024 10:00:00 +0000', 2: 'Mon, 01 Jan 2024 10:00:00 +0000',
+                 3: 'Thu, 01 Feb 2024 10:00:00 +0000'}
+        self.mailbox = IMAPMailbox({uid: raw_message(f'Message {uid}', day) for uid, day in dates.items()},
+                                   capabilities=capabilities)
+        server = ScriptedServer(self.mailbox).start()
+        self.addCleanup(server.stop)
+        result = EmailReceiver.receive_emails({**pop_config(server, max_emails=2), 'protocol': 'IMAP', **extra})
+        self.assertTrue(result['success'], result)
+        return [record['uid'] for record in result['emails']]
+
+    def test_esearch_answer(self):
+        self.assertEqual(self.receive(('ESEARCH',), filters={'unseen': True, 'subject': 'Message'}), [3, 2])
+        self.assertEqual(self.mailbox.searches, ['SEARCH RETURN (ALL) UNSEEN SUBJECT "Message"'])
+
+    def test_non_ascii_filter_is_sent_as_a_literal(self):
+        self.assertEqual(self.receive(('ESEARCH',), filters={'subject': 'Grüße'}), [3, 2])
+        self.assertEqual(self.mailbox.searches, ['SEARCH RETURN (ALL) CHARSET UTF-8 SUBJECT Grüße'])
+
+    def test_sort_by_date(self):
+        self.assertEqual(self.receive(('SORT', 'ESEARCH'), sort='date'), [1, 3])
+        self.assertEqual(self.mailbox.searches, ['SORT (REVERSE DATE) UTF-8 ALL'])
+
+    def test_sort_falls_back_to_arrival_order(self):
+        self.assertEqual(self.receive((), sort='date'), [3, 2])
+        self.assertEqual(self.mailbox.searches, ['SEARCH ALL'])
+
+
+class IMAPFetchTests(TestCase):
+    def setUp(self):
+        message_cache.clear()
+        self.addCleanup(message_cache.clear)
+        self.addCleanup(imap_pool.close_all)
+
+    def receive(self, mailbox, **extra):
+        server = ScriptedServer(mailbox).start()
+        self.addCleanup(server.stop)
+        result = EmailReceiver.receive_emails({**pop_config(server, max_emails=5), 'protocol': 'IMAP', **extra})
+        self.assertTrue(result['success'], result)
+        return result['emails']
+
+    def test_one_fetch_per_batch(self):
+        mailbox = IMAPMailbox({uid: raw_message(f'Message {uid}') for uid in range(1, 7)})
+        records = self.receive(mailbox, fetch_chunk_size=2)
+        self.assertEqual(mailbox.fetches, ['5:6 (UID RFC822)', '3:4 (UID RFC822)', '2 (UID RFC822)'])
+        # The server answers each batch oldest first; the records stay newest first
+        self.assertEqual([(record['uid'], record['subject']) for record in records],
+                         [(uid, f'Message {uid}') for uid in (6, 5, 4, 3, 2)])
+
+    def test_uid_after_the_literal(self):
+        mailbox = IMAPMailbox({uid: raw_message(f'Message {uid}') for uid in range(1, 4)}, uid_last=True)
+        self.assertEqual([record['subject'] for record in self.receive(mailbox, fetch_chunk_size=2)],
+                         ['Message 3', 'Message 2', 'Message 1'])
+
+    def test_headers_mode(self):
+        message = (b'Message-ID: <1@example.com>\r\nFrom: a@example.com\r\nTo: b@example.com\r\n'
+                   b'Date: Thu, 01 Feb 2024 10:00:00 +0000\r\nSubject: =?utf-8?q?Gr=C3=BC=C3=9Fe?=\r\n\r\nBody')
+        mailbox = IMAPMailbox({1: message, 2: raw_message('Second')})
+        records = self.receive(mailbox, mode='headers')
+        self.assertEqual(mailbox.fetches, [f'1:2 {IMAP_HEADER_QUERY}'])
+        self.assertEqual(records[1], {
+            'uid': 1, 'size': len(message), 'message_id': '<1@example.com>', 'subject': 'Grüße',
+            'from': 'a@example.com', 'to': 'b@example.com', 'date': 'Thu, 01 Feb 2024 10:00:00 +0000'
+        })
+        self.assertEqual(records[0]['subject'], 'Second')
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from django.test import SimpleTestCase
+from rest_framework.test import APIClient
+
+from email_app.tokens import TokenError, TokenVerifier, VerifiedTokenCache, _parse_keys
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def hs256_token(claims, secret, **header):
+    signing_input = f"{b64(json.dumps({'alg': 'HS256', 'typ': 'JWT', **header}).encode())}.{b64(json.dumps(claims).encode())}"
+    signature = hmac.digest(secret.encode(), signing_input.encode(), hashlib.sha256)
+    return f'{signing_input}.{b64(signature)}'
+
+
+class ParseKeysTests(SimpleTestCase):
+    def test_kid_and_plain_keys(self):
+        self.assertEqual(_parse_keys('2024-06=new-secret, old-secret,,'), [('2024-06', 'new-secret'), (None, 'old-secret')])
+
+    def test_secrets_are_kept_whole(self):
+        for value, keys in (
+            ('user:pa:ss', [(None, 'user:pa:ss')]),
+            ('c2VjcmV0IQ==', [(None, 'c2VjcmV0IQ==')]),
+            ('c2VjcmV0=', [(None, 'c2VjcmV0=')]),
+            ('k1=pa=ss:word==', [('k1', 'pa=ss:word==')]),
+            ('/etc/jwt/key.pem', [(None, '/etc/jwt/key.pem')]),
+            ('not a kid=secret', [(None, 'not a kid=secret')]),
+        ):
+            with self.subTest(value):
+                self.assertEqual(_parse_keys(value), keys)
+
+
+class TokenVerifierTests(SimpleTestCase):
+    def verifier(self, **kwargs):
+        kwargs.setdefault('hs256_keys', [('old', 'retired:secret'), ('current', 'current-secret')])
+        return TokenVerifier(static_tokens=['static-token'], **kwargs)
+
+    def test_static_token(self):
+        self.assertEqual(self.verifier().verify('static-token'), {})
+        with self.assertRaises(TokenError):
+            self.verifier().verify('static-tokex')
+
+    def test_hs256_with_and_without_kid(self):
+        verifier = self.verifier()
+        claims = {'sub': 'shop', 'exp': time.time() + 60}
+        self.assertEqual(verifier.verify(hs256_token(claims, 'current-secret', kid='current')), claims)
+        self.assertEqual(verifier.verify(hs256_token(claims, 'retired:secret')), claims)
+
+    def test_kid_restricts_the_key(self):
+        token = hs256_token({'sub': 'shop'}, 'retired:secret', kid='current')
+        with self.assertRaises(TokenError):
+            self.verifier().verify(token)
+
+    def test_bad_signature_and_algorithms(self):
+        verifier = self.verifier()
+        for token in (
+            hs256_token({'sub': 'shop'}, 'wrong-secret'),
+            hs256_token({'sub': 'shop'}, 'current-secret', alg='none'),
+            hs256_token({'sub': 'shop'}, 'current-secret', alg='RS256'),
+            'a.b.c',
+            'not-a-token',
+        ):
+            with self.subTest(token):
+                with self.assertRaises(TokenError):
+                    verifier.verify(token)
+
+    def test_time_claims_with_leeway(self):
+        verifier = self.verifier(leeway=30)
+        now = time.time()
+        verifier.verify(hs256_token({'exp': now - 10}, 'current-secret'))
+        verifier.verify(hs256_token({'nbf': now + 10}, 'current-secret'))
+        for claims, message in (({'exp': now - 60}, "Token expired"), ({'nbf': now + 60}, "Token not yet valid"),
+                                ({'exp': 'soon'}, "Invalid or unauthorized token")):
+            with self.subTest(claims):
+                with self.assertRaisesMessage(TokenError, message):
+                    verifier.verify(hs256_token(claims, 'current-secret'))
+
+    def test_audience_and_issuer(self):
+        verifier = self.verifier(audience='email-api', issuer='https://auth.example.com')
+        verifier.verify(hs256_token({'aud': ['other', 'email-api'], 'iss': 'https://auth.example.com'}, 'current-secret'))
+        for claims in ({'aud': 'other', 'iss': 'https://auth.example.com'}, {'aud': 'email-api'}):
+            with self.subTest(claims):
+                with self.assertRaises(TokenError):
+                    verifier.verify(hs256_token(claims, 'current-secret'))
+
+    def test_cached_token_expires_with_its_exp(self):
+        cache = VerifiedTokenCache(max_size=10, ttl=300)
+        verifier = self.verifier(leeway=0, cache=cache)
+        token = hs256_token({'exp': time.time() + 0.2}, 'current-secret')
+        verifier.verify(token)
+        self.assertEqual(len(cache), 1)
+        time.sleep(0.3)
+        with self.assertRaisesMessage(TokenError, "Token expired"):
+            verifier.verify(token)
+
+    def test_rejected_tokens_are_not_cached(self):
+        cache = VerifiedTokenCache(max_size=10)
+        with self.assertRaises(TokenError):
+            self.verifier(cache=cache).verify(hs256_token({}, 'wrong-secret'))
+        self.assertEqual(len(cache), 0)
+
+
+class MiddlewareTests(SimpleTestCase):
+    def test_missing_and_invalid_tokens(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/receive/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Token abc')
+        self.assertEqual(client.get('/api/receive/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        response = client.get('/api/receive/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {'success': False, 'message': 'Invalid or unauthorized token'})
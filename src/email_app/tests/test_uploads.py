@@ -0,0 +1,46 @@
+from django.core.files.uploadhandler import StopUpload
+from django.test import SimpleTestCase
+
+from email_app.uploads import AttachmentLimitUploadHandler
+
+MB = 1024 * 1024
+
+
+class AttachmentLimitUploadHandlerTests(SimpleTestCase):
+    def handler(self, **kwargs):
+        return AttachmentLimitUploadHandler(**kwargs)
+
+    def stream(self, handler, name, chunks):
+        handler.new_file('files', name, 'text/plain', sum(map(len, chunks)))
+        for chunk in chunks:
+            self.assertEqual(handler.receive_data_chunk(chunk, 0), chunk)
+        self.assertIsNone(handler.file_complete(sum(map(len, chunks))))
+
+    def test_files_within_the_limits_pass_through(self):
+        handler = self.handler(max_file_size=MB, max_total_size=2 * MB)
+        self.stream(handler, 'a.txt', [b'x' * MB])
+        self.stream(handler, 'b.txt', [b'x' * (MB // 2)] * 2)
+        self.assertIsNone(handler.error)
+
+    def test_file_over_the_limit_stops_the_upload(self):
+        handler = self.handler(max_file_size=MB, max_total_size=10 * MB)
+        handler.new_file('files', 'big.bin', 'application/octet-stream', None)
+        handler.receive_data_chunk(b'x' * MB, 0)
+        with self.assertRaises(StopUpload) as stopped:
+            handler.receive_data_chunk(b'x', MB)
+        # The rest of the body is read so the client gets a response
+        self.assertFalse(stopped.exception.connection_reset)
+        self.assertEqual(handler.error, 'Attachment big.bin exceeds maximum size of 1MB')
+
+    def test_total_over_the_limit_stops_the_upload(self):
+        handler = self.handler(max_file_size=MB, max_total_size=MB)
+        self.stream(handler, 'a.txt', [b'x' * (MB // 2)])
+        handler.new_file('files', 'b.txt', 'text/plain', None)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'x' * (MB // 2 + 1), 0)
+        self.assertEqual(handler.error, 'Total attachments size exceeds maximum of 1MB')
+
+    def test_zero_means_no_limit(self):
+        handler = self.handler()
+        self.stream(handler, 'a.txt', [b'x' * MB] * 3)
+        self.assertIsNone(handler.error)
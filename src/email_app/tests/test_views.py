@@ -0,0 +1,174 @@
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from email_app.cache import message_cache
+from email_app.jobs import email_queue
+from email_app.models import EmailJob
+from email_app.parsers import FastJSONParser
+from email_app.pool import pop_pool
+from email_app.service import EmailReceiver
+from email_app.fastjson import dumps, loads
+from email_app.views import ReceiveMultiEmailView, SendBatchEmailView
+
+from .fakes import FakeSMTPServer, ScriptedServer, answer_until_quit, pop_login
+from .utils import api_client
+
+ATTACHED = (
+    'Content-Type: multipart/mixed; boundary=b1', '', '--b1', 'Content-Type: text/plain', '', 'Body', '--b1',
+    'Content-Type: text/csv; name="report.csv"', 'Content-Disposition: attachment; filename="report.csv"',
+    'Content-Transfer-Encoding: base64', '', 'YSxiCjEsMgo=', '--b1--',
+)
+
+
+class ReceiveAttachmentViewTests(TestCase):
+    def setUp(self):
+        self.client = api_client(self)
+
+    def fields(self, port=110):
+        return {'host': '127.0.0.1', 'port': port, 'username': 'user@example.com', 'password': 'secret', 'use_ssl': False,
+                'protocol': 'POP', 'message_number': 1, 'part': '2'}
+
+    def test_get_is_refused(self):
+        with mock.patch.object(EmailReceiver, 'fetch_attachment') as fetch:
+            response = self.client.get('/api/receive/attachment/', self.fields())
+        self.assertEqual(response.status_code, 405)
+        fetch.assert_not_called()
+
+    def test_post_streams_the_part(self):
+        def script(conn):
+            pop_login(conn)
+            answer_until_quit(conn, {'RETR 1': ('+OK', *ATTACHED, '.'), 'NOOP': ('+OK',)})
+
+        server = ScriptedServer(script).start()
+        self.addCleanup(server.stop)
+        self.addCleanup(pop_pool.close_all)
+        response = self.client.post('/api/receive/attachment/', self.fields(server.port), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('report.csv', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b'a,b\n1,2\n')
+
+
+class NDJSONReceiveTests(TestCase):
+    def setUp(self):
+        self.client = api_client(self)
+        message_cache.clear()
+        self.addCleanup(message_cache.clear)
+        self.addCleanup(pop_pool.close_all)
+
+    def post(self, replies, password_reply='+OK Logged in'):
+        def script(conn):
+            pop_login(conn, password_reply)
+            answer_until_quit(conn, {'LIST': ('+OK', '1 40', '2 40', '.'), 'UIDL': ('+OK', '1 id-1', '2 id-2', '.'),
+                                     'NOOP': ('+OK',), **replies})
+
+        server = ScriptedServer(script).start()
+        self.addCleanup(server.stop)
+        data = {'host': '127.0.0.1', 'port': server.port, 'username': 'user@example.com', 'password': 'secret',
+                'use_ssl': False, 'protocol': 'POP', 'max_emails': 10}
+        return self.client.post('/api/receive/', data, format='json', HTTP_ACCEPT='application/x-ndjson')
+
+    def records(self, response):
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertTrue(body.endswith(b'\n'))
+        return [loads(line) for line in body.splitlines()]
+
+    def test_one_message_per_line_then_the_status(self):
+        response = self.post({'RETR 1': ('+OK', 'Subject: First', '', 'Body', '.'),
+                              'RETR 2': ('+OK', 'Subject: Second', '', 'Body', '.')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = self.records(response)
+        self.assertEqual([record['subject'] for record in records[:-1]], ['Second', 'First'])
+        self.assertEqual(records[-1], {'success': True, 'count': 2, 'next_cursor': None})
+
+    def test_error_mid_stream_ends_with_an_error_record(self):
+        # Newest first, so message 2 is sent before message 1 is refused
+        records = self.records(self.post({'RETR 2': ('+OK', 'Subject: Hello', '', 'Body', '.'),
+                                          'RETR 1': ('-ERR message gone',)}))
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['subject'], 'Hello')
+        self.assertEqual((records[1]['success'], records[1]['count']), (False, 1))
+        self.assertIn('message gone', records[1]['message'])
+
+    def test_errors_before_the_first_message_are_a_single_line(self):
+        response = self.post({}, password_reply='-ERR [AUTH] invalid password')
+        self.assertEqual(response.status_code, 400)
+        records = self.records(response)
+        self.assertEqual(len(records), 1)
+        self.assertFalse(records[0]['success'])
+
+    def test_validation_errors_are_a_single_line(self):
+        response = self.client.post('/api/receive/', {'protocol': 'SMTP'}, format='json',
+                                    HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        [errors] = self.records(response)
+        self.assertIn('protocol', errors)
+        self.assertIn('host', errors)
+
+
+class UnparseableBodyTests(TestCase):
+    def setUp(self):
+        self.client = api_client(self)
+
+    def test_form_body_without_a_form_parser(self):
+        # src.settings_api leaves the JSON parser only
+        for url, view in (('/api/send/batch/', SendBatchEmailView), ('/api/receive/multi/', ReceiveMultiEmailView)):
+            with self.subTest(url), mock.patch.object(view, 'parser_classes', [FastJSONParser]):
+                self.assertEqual(self.client.post(url, {'messages': 'x'}, format='multipart').status_code, 415)
+
+    def test_malformed_json(self):
+        for url in ('/api/send/', '/api/send/batch/', '/api/receive/multi/'):
+            with self.subTest(url):
+                response = self.client.post(url, '{"messages": [', content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+
+
+class MultipartSendTests(TestCase):
+    def setUp(self):
+        self.client = api_client(self)
+        self.server = FakeSMTPServer().start()
+        self.addCleanup(self.server.stop)
+
+    def post(self, payload=None, **files):
+        if payload is None:
+            payload = dumps({'email_settings': self.server.settings(), 'sender': 'shop@example.com',
+                             'recipients': ['customer@example.com'], 'subject': 'Receipt', 'body': 'Thank you'}).decode()
+        return self.client.post('/api/send/', {'payload': payload, **files}, format='multipart')
+
+    def test_payload_and_file_parts_are_sent(self):
+        response = self.post(report=SimpleUploadedFile('report.csv', b'a,b\n1,2\n', content_type='text/csv'),
+                             notes=SimpleUploadedFile('notes.txt', b'see report', content_type='text/plain'))
+        self.assertEqual(response.status_code, 200, response.content)
+        message = self.server.deliveries[0][2]
+        self.assertIn(b'filename="report.csv"', message)
+        self.assertIn(b'YSxiCjEsMgo=', message)
+        self.assertIn(b'filename="notes.txt"', message)
+
+    def test_file_over_the_limit(self):
+        with mock.patch('email_app.views.MAX_ATTACHMENT_SIZE', 1024 * 1024):
+            response = self.post(big=SimpleUploadedFile('big.bin', b'x' * (1024 * 1024 + 1)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['validation_errors'],
+                         {'files': ['Attachment big.bin exceeds maximum size of 1MB']})
+        self.assertEqual(self.server.deliveries, [])
+
+    def test_invalid_payload(self):
+        for payload in ('{"sender": ', '["shop@example.com"]'):
+            with self.subTest(payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('payload', response.json()['validation_errors'])
+
+
+class SendEmailStatusViewTests(TestCase):
+    def test_status_poll_has_no_side_effects(self):
+        job = EmailJob.objects.create(payload={})
+        with mock.patch.object(email_queue, 'start_workers') as start_workers:
+            response = api_client(self).get(f'/api/send/status/{job.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], EmailJob.STATUS_QUEUED)
+        start_workers.assert_not_called()
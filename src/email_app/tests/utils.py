@@ -0,0 +1,18 @@
+"""Helpers shared by the test modules"""
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from email_app.tokens import token_verifier
+
+TOKEN = 'test-token'
+
+
+def api_client(test_case) -> APIClient:
+    """An APIClient whose bearer token the middleware accepts for the rest of the test"""
+    patcher = mock.patch.object(token_verifier, 'static_tokens', [TOKEN.encode('utf-8')])
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {TOKEN}')
+    return client
@@ -0,0 +1,242 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+_KID_RE = re.compile(r'[A-Za-z0-9._-]+')
+
+
+class TokenError(Exception):
+    """Bearer token that must be rejected"""
+    pass
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def _parse_keys(value: str) -> List[Tuple[Optional[str], str]]:
+    """
+    Split 'kid=key,other-key' into [(kid, key), (None, key)]
+
+    Only a leading name of letters, digits, '.', '_' and '-' followed by '='
+    is a kid, so secrets with ':' or with base64 '=' padding stay whole. A
+    secret that itself starts with such a name and '=' needs a kid of its own.
+    """
+    keys = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kid, separator, key = entry.partition('=')
+        if separator and key and not key.startswith('=') and _KID_RE.fullmatch(kid):
+            keys.append((kid, key))
+        else:
+            keys.append((None, entry))
+    return keys
+
+
+def _load_rsa_key(path: str) -> Any:
+    try:
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    except ImportError:
+        raise ImproperlyConfigured("JWT_RS256_PUBLIC_KEYS requires the 'cryptography' package")
+    with open(path, 'rb') as key_file:
+        return load_pem_public_key(key_file.read())
+
+
+def _verify_rsa(public_key: Any, signature: bytes, signing_input: bytes) -> bool:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    try:
+        public_key.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+    except InvalidSignature:
+        return False
+    return True
+
+
+class VerifiedTokenCache:
+    """
+    LRU of tokens whose signature and claims were already checked.
+
+    Entries expire at the token's ``exp`` (or after ``ttl`` seconds, whichever
+    comes first), so a cached token is never accepted past its lifetime.
+    Only accepted tokens are stored: garbage tokens cannot evict good ones.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        # The dict lookup compares the token only after its randomised hash
+        # matched, so its timing reveals nothing usable about stored tokens
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def set(self, token: str, claims: Dict[str, Any], expires_at: float) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (min(expires_at, time.time() + self.ttl), claims)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TokenVerifier:
+    """
+    Checks bearer tokens: signed JWTs (HS256, and RS256 when the
+    'cryptography' package is installed) or static shared tokens.
+
+    Several keys may be configured at once for rotation. A token whose header
+    names a known ``kid`` is only checked against that key; otherwise every
+    key of its algorithm is tried. Signatures and static tokens are compared
+    in constant time.
+    """
+
+    def __init__(self, static_tokens: List[str] = (), hs256_keys: List[Tuple[Optional[str], str]] = (),
+                 rs256_keys: List[Tuple[Optional[str], Any]] = (), audience: Optional[str] = None,
+                 issuer: Optional[str] = None, leeway: int = 30, cache: Optional[VerifiedTokenCache] = None):
+        self.static_tokens = [token.encode('utf-8') for token in static_tokens]
+        self.keys = {
+            'HS256': [(kid, key.encode('utf-8')) for kid, key in hs256_keys],
+            'RS256': list(rs256_keys),
+        }
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.cache = cache if cache is not None else VerifiedTokenCache()
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the token's claims ({} for a static token), or raise TokenError"""
+        claims = self.cache.get(token)
+        if claims is not None:
+            return claims
+        if self._matches_static(token):
+            claims, expires_at = {}, float('inf')
+        elif token.count('.') == 2:
+            claims, expires_at = self._verify_jwt(token)
+        else:
+            raise TokenError("Invalid or unauthorized token")
+        self.cache.set(token, claims, expires_at)
+        return claims
+
+    def _matches_static(self, token: str) -> bool:
+        candidate = token.encode('utf-8')
+        matched = False
+        # Compare against every token so the time taken does not depend on which one matched
+        for static_token in self.static_tokens:
+            matched |= hmac.compare_digest(candidate, static_token)
+        return matched
+
+    def _verify_jwt(self, token: str) -> Tuple[Dict[str, Any], float]:
+        header_segment, payload_segment, signature_segment = token.split('.')
+        try:
+            header = json.loads(_b64decode(header_segment))
+            signature = _b64decode(signature_segment)
+        except ValueError:
+            raise TokenError("Invalid or unauthorized token")
+        if not isinstance(header, dict):
+            raise TokenError("Invalid or unauthorized token")
+
+        algorithm = header.get('alg')
+        keys = self.keys.get(algorithm) if isinstance(algorithm, str) else None
+        if not keys:
+            raise TokenError("Invalid or unauthorized token")
+        kid = header.get('kid')
+        if kid is not None and any(key_id == kid for key_id, _ in keys):
+            keys = [(key_id, key) for key_id, key in keys if key_id == kid]
+
+        signing_input = f'{header_segment}.{payload_segment}'.encode('ascii', errors='replace')
+        if algorithm == 'HS256':
+            # Which key matched is no secret, only the signature bytes are
+            valid = any(hmac.compare_digest(hmac.digest(key, signing_input, hashlib.sha256), signature)
+                        for _, key in keys)
+        else:
+            valid = any(_verify_rsa(key, signature, signing_input) for _, key in keys)
+        if not valid:
+            raise TokenError("Invalid or unauthorized token")
+
+        try:
+            claims = json.loads(_b64decode(payload_segment))
+        except ValueError:
+            raise TokenError("Invalid or unauthorized token")
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid or unauthorized token")
+        return claims, self._check_claims(claims)
+
+    def _check_claims(self, claims: Dict[str, Any]) -> float:
+        """Validate exp/nbf/aud/iss and return the time until which the token is valid"""
+        now = time.time()
+        expires_at = float('inf')
+        try:
+            if 'exp' in claims:
+                expires_at = float(claims['exp']) + self.leeway
+                if not math.isfinite(expires_at):
+                    raise ValueError(claims['exp'])
+                if expires_at <= now:
+                    raise TokenError("Token expired")
+            if 'nbf' in claims and float(claims['nbf']) - self.leeway > now:
+                raise TokenError("Token not yet valid")
+        except (TypeError, ValueError):
+            raise TokenError("Invalid or unauthorized token")
+
+        if self.audience is not None:
+            audience = claims.get('aud')
+            audiences = audience if isinstance(audience, list) else [audience]
+            if self.audience not in audiences:
+                raise TokenError("Invalid or unauthorized token")
+        if self.issuer is not None and claims.get('iss') != self.issuer:
+            raise TokenError("Invalid or unauthorized token")
+        return expires_at
+
+
+def _build_verifier() -> TokenVerifier:
+    static_tokens = [token for token in getattr(settings, 'JWT_ACCESS_TOKEN', '').split(',') if token]
+    hs256_keys = _parse_keys(getattr(settings, 'JWT_HS256_KEYS', ''))
+    rs256_keys = [(kid, _load_rsa_key(path)) for kid, path in _parse_keys(getattr(settings, 'JWT_RS256_PUBLIC_KEYS', ''))]
+    if not (static_tokens or hs256_keys or rs256_keys):
+        logger.warning("No JWT_ACCESS_TOKEN, JWT_HS256_KEYS or JWT_RS256_PUBLIC_KEYS configured: every request will be rejected")
+    return TokenVerifier(
+        static_tokens=static_tokens,
+        hs256_keys=hs256_keys,
+        rs256_keys=rs256_keys,
+        audience=getattr(settings, 'JWT_AUDIENCE', None) or None,
+        issuer=getattr(settings, 'JWT_ISSUER', None) or None,
+        leeway=getattr(settings, 'JWT_LEEWAY', 30),
+        cache=VerifiedTokenCache(max_size=getattr(settings, 'JWT_CACHE_SIZE', 1024),
+                                 ttl=getattr(settings, 'JWT_CACHE_TTL', 300))
+    )
+
+
+token_verifier = _build_verifier()
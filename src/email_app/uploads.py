@@ -0,0 +1,51 @@
+from typing import Optional
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+
+class AttachmentLimitUploadHandler(FileUploadHandler):
+    """
+    Enforce attachment size limits while a multipart body is streamed in.
+
+    Placed in front of Django's memory/temporary-file handlers, it counts
+    the bytes of every file part as they arrive and stops the upload as soon
+    as a file or the request total goes over the limit, so an oversized
+    attachment is never fully written to memory or disk. The reason is kept
+    in ``error`` for the view to report.
+    """
+
+    def __init__(self, request=None, max_file_size: int = 0, max_total_size: int = 0):
+        super().__init__(request)
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.file_size = 0
+        self.total_size = 0
+        self.error: Optional[str] = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size += len(raw_data)
+        self.total_size += len(raw_data)
+
+        if self.max_file_size and self.file_size > self.max_file_size:
+            self.error = (
+                f"Attachment {self.file_name} exceeds maximum size of "
+                f"{self.max_file_size // (1024 * 1024)}MB"
+            )
+        elif self.max_total_size and self.total_size > self.max_total_size:
+            self.error = (
+                f"Total attachments size exceeds maximum of "
+                f"{self.max_total_size // (1024 * 1024)}MB"
+            )
+
+        if self.error:
+            # Read and discard the rest of the body so the client still gets a response
+            raise StopUpload(connection_reset=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        # The next handlers build the actual file
+        return None
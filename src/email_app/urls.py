@@ -1,7 +1,17 @@
 from django.urls import path
-from .views import SendEmailView, ReceiveEmailView
+from .views import (
+    SendEmailView, SendBatchEmailView, SendEmailStatusView, ReceiveEmailView, ReceiveMultiEmailView,
+    ReceiveAttachmentView, AsyncSendEmailView, AsyncReceiveEmailView
+)
 
 urlpatterns = [
     path('send/', SendEmailView.as_view(), name='send_email'),
+    path('send/batch/', SendBatchEmailView.as_view(), name='send_email_batch'),
+    path('send/status/<uuid:job_id>/', SendEmailStatusView.as_view(), name='send_email_status'),
     path('receive/', ReceiveEmailView.as_view(), name='receive_email'),
+    path('receive/multi/', ReceiveMultiEmailView.as_view(), name='receive_email_multi'),
+    path('receive/attachment/', ReceiveAttachmentView.as_view(), name='receive_attachment'),
+    # Native asyncio engines; serve with an ASGI server (src.asgi:application) to benefit
+    path('aio/send/', AsyncSendEmailView.as_view(), name='send_email_aio'),
+    path('aio/receive/', AsyncReceiveEmailView.as_view(), name='receive_email_aio'),
 ]
\ No newline at end of file
@@ -3,25 +3,223 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import EmailSerializer, EmailReceiveSerializer
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.settings import api_settings
+from .serializers import (
+    EmailSerializer, EmailBatchSerializer, EmailReceiveSerializer, EmailReceiveMultiSerializer,
+    AttachmentFetchSerializer,
+    MAX_ATTACHMENT_SIZE, MAX_TOTAL_ATTACHMENT_SIZE
+)
+from .uploads import AttachmentLimitUploadHandler
+from .renderers import NDJSONRenderer
+from .parsers import FastJSONParser
+from .fastjson import FastJsonResponse, loads as json_loads
 from .service import EmailReceiver ,EmailService, max_emails
+from .jobs import email_queue
+from .fanout import mailbox_fanout
+from .cache import message_cache
+from .pool import imap_pool, pop_pool
+from .models import EmailJob
 
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import content_disposition_header
 from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
+# Map error types to appropriate HTTP status codes
+ERROR_STATUS_MAP = {
+    'VALIDATION_ERROR': status.HTTP_400_BAD_REQUEST,
+    'INVALID_EMAIL_ADDRESSES': status.HTTP_400_BAD_REQUEST,
+    'NO_RECIPIENTS': status.HTTP_400_BAD_REQUEST,
+    'NO_SENDER': status.HTTP_400_BAD_REQUEST,
+    'NO_SUBJECT': status.HTTP_400_BAD_REQUEST,
+    'NO_CONTENT': status.HTTP_400_BAD_REQUEST,
+    'NO_EMAIL_SETTINGS': status.HTTP_400_BAD_REQUEST,
+    'MISSING_EMAIL_SETTINGS': status.HTTP_400_BAD_REQUEST,
+    'SMTP_AUTH_ERROR': status.HTTP_401_UNAUTHORIZED,
+    'RATE_LIMITED': status.HTTP_429_TOO_MANY_REQUESTS,
+    'SMTP_RECIPIENTS_REFUSED': status.HTTP_422_UNPROCESSABLE_ENTITY,
+    'PARTIAL_DELIVERY': status.HTTP_207_MULTI_STATUS,
+    'SMTP_SERVER_DISCONNECTED': status.HTTP_503_SERVICE_UNAVAILABLE,
+    'SMTP_CONNECT_ERROR': status.HTTP_503_SERVICE_UNAVAILABLE,
+    'SMTP_TEMPORARY_FAILURE': status.HTTP_503_SERVICE_UNAVAILABLE,
+    'SMTP_TIMEOUT': status.HTTP_504_GATEWAY_TIMEOUT,
+    'UNEXPECTED_ERROR': status.HTTP_500_INTERNAL_SERVER_ERROR,
+    'SERVICE_ERROR': status.HTTP_500_INTERNAL_SERVER_ERROR,
+    'MESSAGE_NOT_FOUND': status.HTTP_404_NOT_FOUND,
+    'PART_NOT_FOUND': status.HTTP_404_NOT_FOUND,
+    'RECEIVE_ERROR': status.HTTP_400_BAD_REQUEST,
+}
+
+# Size of the pieces an attachment download is written out in
+ATTACHMENT_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def email_request_data(request):
+    """
+    EmailSerializer input for a send request
+    
+    JSON bodies are used as they are. A multipart/form-data request carries
+    the JSON message in a 'payload' field and its attachments as file parts.
+    """
+    if request.content_type.startswith('multipart/form-data'):
+        try:
+            data = json_loads(request.data.get('payload') or '{}')
+        except ValueError as e:
+            raise ValidationError({'payload': [f'Invalid JSON: {str(e)}']})
+        if not isinstance(data, dict):
+            raise ValidationError({'payload': ['Expected a JSON object']})
+        data['files'] = [
+            uploaded_file
+            for field_name in request.FILES
+            for uploaded_file in request.FILES.getlist(field_name)
+        ]
+        return data
+    return request.data
+
+
+def send_kwargs(email_data):
+    """Build EmailService.send_email keyword arguments from validated EmailSerializer data"""
+    attachments = list(email_data.get('attachments', []))
+    attachments.extend(
+        {
+            'filename': uploaded_file.name,
+            'content_type': uploaded_file.content_type or 'application/octet-stream',
+            'file': uploaded_file
+        }
+        for uploaded_file in email_data.get('files', [])
+    )
+    return {
+        'email_settings': email_data.get('email_settings', {}),
+        'sender': email_data['sender'],
+        'recipients': email_data['recipients'],
+        'subject': email_data['subject'],
+        'body': email_data.get('body', ''),
+        'html_body': email_data.get('html_body'),
+        'cc': email_data.get('cc', []),
+        'bcc': email_data.get('bcc', []),
+        'attachments': attachments,
+        'use_default_settings': email_data.get('use_default_settings', False),
+        'delivery': email_data.get('delivery', 'single')
+    }
+
+
+def with_retry_after(response, result):
+    """Add Retry-After, in whole seconds, to a failure response that says when to try again"""
+    if result.get('retry_after') is not None:
+        response['Retry-After'] = str(math.ceil(result['retry_after']))
+    return response
+
+
+def retry_later(email_data, kwargs, result):
+    """
+    Hand a send that failed with a transient error to the retry queue when
+    the request asked for it. Returns the response body, or None to report
+    the error.
+    """
+    if not (email_data.get('retry') and result.get('retryable')):
+        return None
+    job = email_queue.enqueue_retry(kwargs, result)
+    if job is None:
+        return None
+    logger.info(f"Email send failed with {result.get('error')}, queued for retry as job {job.id}")
+    return {
+        'success': True,
+        'message': 'Email could not be sent yet and is queued for retry',
+        'job_id': str(job.id),
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': email_queue.max_attempts,
+        'next_attempt_at': job.next_attempt_at,
+        'last_error': result.get('error'),
+        'status_url': reverse('send_email_status', args=[job.id])
+    }
+
+
+def receive_config(email_config):
+    """Build the EmailReceiver configuration from validated EmailReceiveSerializer data"""
+    return {
+        'host': email_config['host'],
+        'username': email_config['username'],
+        'password': email_config['password'],
+        'port': email_config.get('port', 993),
+        'use_ssl': email_config.get('use_ssl', True),
+        'use_tls': email_config.get('use_tls', False),
+        'protocol' : email_config.get('protocol', "IMAP"),
+        'max_emails' : email_config.get('max_emails', max_emails),
+        'folder' : email_config.get('folder', 'INBOX'),
+        'fetch_chunk_size': email_config.get('fetch_chunk_size'),
+        'mode': email_config.get('mode', 'full'),
+        'incremental': email_config.get('incremental', False),
+        'since_uid': email_config.get('since_uid'),
+        'uidvalidity': email_config.get('uidvalidity'),
+        'since_modseq': email_config.get('since_modseq'),
+        'uids': email_config.get('uids'),
+        'attachment_mode': email_config.get('attachment_mode', 'content'),
+        'filters': email_config.get('filters'),
+        'sort': email_config.get('sort', 'arrival'),
+        'cursor': email_config.get('cursor')
+    }
+
+
 class SendEmailView(APIView):
     """Enhanced email sending API view with comprehensive error handling"""
     
+    parser_classes = [FastJSONParser, FormParser, MultiPartParser]
+    
+    def initialize_request(self, request, *args, **kwargs):
+        # Check attachment sizes while multipart uploads stream in; Django's
+        # handlers after it keep small files in memory and spill the rest to disk
+        request.upload_handlers.insert(0, AttachmentLimitUploadHandler(
+            request,
+            max_file_size=MAX_ATTACHMENT_SIZE,
+            max_total_size=MAX_TOTAL_ATTACHMENT_SIZE
+        ))
+        return super().initialize_request(request, *args, **kwargs)
+    
+    @staticmethod
+    def upload_error(request):
+        """Size limit error raised while streaming a multipart upload, if any"""
+        for handler in request.upload_handlers:
+            if isinstance(handler, AttachmentLimitUploadHandler):
+                return handler.error
+        return None
+    
     @method_decorator(never_cache)
     def post(self, request):
         """
         Send email with enhanced error handling and validation
         """
         try:
-            serializer = EmailSerializer(data=request.data)
+            try:
+                data = email_request_data(request)
+            except ValidationError as e:
+                return Response({
+                    'success': False,
+                    'error': 'VALIDATION_ERROR',
+                    'message': 'Request validation failed',
+                    'validation_errors': e.detail
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            upload_error = self.upload_error(request)
+            if upload_error:
+                return Response({
+                    'success': False,
+                    'error': 'VALIDATION_ERROR',
+                    'message': 'Request validation failed',
+                    'validation_errors': {'files': [upload_error]}
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            serializer = EmailSerializer(data=data)
             
             if not serializer.is_valid():
                 return Response({
@@ -38,19 +236,21 @@ class SendEmailView(APIView):
                        f"Subject: {email_data['subject'][:50]}..."
                        f"User Default Settings: {email_data['use_default_settings']}")
             
+            # Queue the email and return immediately when asked to
+            if email_data.get('async'):
+                job = email_queue.enqueue(send_kwargs(email_data))
+                logger.info(f"Email queued as job {job.id}")
+                return Response({
+                    'success': True,
+                    'message': 'Email queued for delivery',
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'status_url': reverse('send_email_status', args=[job.id])
+                }, status=status.HTTP_202_ACCEPTED)
+            
             # Send email using service
-            result = EmailService.send_email(
-                email_settings=email_data.get('email_settings', {}),
-                sender=email_data['sender'],
-                recipients=email_data['recipients'],
-                subject=email_data['subject'],
-                body=email_data.get('body', ''),
-                html_body=email_data.get('html_body'),
-                cc=email_data.get('cc', []),
-                bcc=email_data.get('bcc', []),
-                attachments=email_data.get('attachments', []),
-                use_default_settings=email_data.get('use_default_settings', False)
-            )
+            kwargs = send_kwargs(email_data)
+            result = EmailService.send_email(**kwargs)
             
             # Log result
             if result['success']:
@@ -59,28 +259,17 @@ class SendEmailView(APIView):
             else:
                 logger.warning(f"Email send failed: {result.get('error', 'Unknown error')}")
                 
-                # Map error types to appropriate HTTP status codes
-                error_status_map = {
-                    'VALIDATION_ERROR': status.HTTP_400_BAD_REQUEST,
-                    'INVALID_EMAIL_ADDRESSES': status.HTTP_400_BAD_REQUEST,
-                    'NO_RECIPIENTS': status.HTTP_400_BAD_REQUEST,
-                    'NO_SENDER': status.HTTP_400_BAD_REQUEST,
-                    'NO_SUBJECT': status.HTTP_400_BAD_REQUEST,
-                    'NO_CONTENT': status.HTTP_400_BAD_REQUEST,
-                    'NO_EMAIL_SETTINGS': status.HTTP_400_BAD_REQUEST,
-                    'MISSING_EMAIL_SETTINGS': status.HTTP_400_BAD_REQUEST,
-                    'SMTP_AUTH_ERROR': status.HTTP_401_UNAUTHORIZED,
-                    'SMTP_RECIPIENTS_REFUSED': status.HTTP_422_UNPROCESSABLE_ENTITY,
-                    'SMTP_SERVER_DISCONNECTED': status.HTTP_503_SERVICE_UNAVAILABLE,
-                    'SMTP_CONNECT_ERROR': status.HTTP_503_SERVICE_UNAVAILABLE,
-                    'SMTP_TIMEOUT': status.HTTP_504_GATEWAY_TIMEOUT,
-                    'UNEXPECTED_ERROR': status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    'SERVICE_ERROR': status.HTTP_500_INTERNAL_SERVER_ERROR,
-                }
+                queued = retry_later(email_data, kwargs, result)
+                if queued is not None:
+                    return Response(queued, status=status.HTTP_202_ACCEPTED)
                 
-                http_status = error_status_map.get(result.get('error'), status.HTTP_400_BAD_REQUEST)
-                return Response(result, status=http_status)
+                http_status = ERROR_STATUS_MAP.get(result.get('error'), status.HTTP_400_BAD_REQUEST)
+                return with_retry_after(Response(result, status=http_status), result)
         
+        except APIException:
+            # A body the parsers reject (malformed JSON, an unsupported content
+            # type) is the client's error: DRF answers it with 400 or 415
+            raise
         except Exception as e:
             logger.error(f"Unexpected error in SendEmailView: {str(e)}")
             return Response({
@@ -99,40 +288,465 @@ class SendEmailView(APIView):
                 'send_email': {
                     'method': 'POST',
                     'description': 'Send email with attachments support',
+                    'content_types': ['application/json', 'multipart/form-data'],
                     'max_recipients': 100,
                     'max_attachments': 10,
                     'max_attachment_size': '25MB',
                     'max_total_attachment_size': '100MB'
+                },
+                'send_status': {
+                    'method': 'GET',
+                    'description': 'Status and result of an email sent with "async": true'
+                },
+                'send_batch': {
+                    'method': 'POST',
+                    'description': 'Send many emails, one SMTP session per server account',
+                    'max_messages': EmailBatchSerializer.MAX_MESSAGES
                 }
             }
         })
 
 
+class SendEmailStatusView(APIView):
+    """Status of an email queued with "async": true"""
+    
+    @method_decorator(never_cache)
+    def get(self, request, job_id):
+        """
+        Report the job state and, once finished, the send_email result
+        """
+        try:
+            job = EmailJob.objects.get(pk=job_id)
+        except EmailJob.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'JOB_NOT_FOUND',
+                'message': f'No queued email with id {job_id}'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({'success': True, **email_queue.job_status(job)}, status=status.HTTP_200_OK)
+
+
+class SendBatchEmailView(APIView):
+    """Bulk email sending API view returning per-message results"""
+    
+    @method_decorator(never_cache)
+    def post(self, request):
+        """
+        Send a list of emails; one bad message does not abort the rest
+        """
+        try:
+            serializer = EmailBatchSerializer(data=request.data)
+            
+            if not serializer.is_valid():
+                return Response({
+                    'success': False,
+                    'error': 'VALIDATION_ERROR',
+                    'message': 'Request validation failed',
+                    'validation_errors': serializer.errors
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            messages = serializer.validated_data['messages']
+            results = [None] * len(messages)
+            pending_indexes = []
+            pending_data = []
+            pending_kwargs = []
+            
+            # Validate each message on its own so one bad item only fails itself
+            for index, message_data in enumerate(messages):
+                message_serializer = EmailSerializer(data=message_data)
+                if message_serializer.is_valid():
+                    pending_indexes.append(index)
+                    pending_data.append(message_serializer.validated_data)
+                    pending_kwargs.append(send_kwargs(message_serializer.validated_data))
+                else:
+                    results[index] = {
+                        'success': False,
+                        'error': 'VALIDATION_ERROR',
+                        'message': 'Request validation failed',
+                        'validation_errors': message_serializer.errors
+                    }
+            
+            logger.info(f"Batch send attempt: {len(messages)} messages, {len(pending_kwargs)} valid")
+            
+            batch_results = EmailService.send_batch(pending_kwargs)
+            for index, email_data, kwargs, result in zip(pending_indexes, pending_data, pending_kwargs, batch_results):
+                if not result['success']:
+                    result = retry_later(email_data, kwargs, result) or result
+                results[index] = result
+            
+            for index, result in enumerate(results):
+                result['index'] = index
+            
+            queued = sum(1 for result in results if result['success'] and 'job_id' in result)
+            sent = sum(1 for result in results if result['success']) - queued
+            failed = len(results) - sent - queued
+            
+            if failed:
+                logger.warning(f"Batch send finished with {failed} of {len(results)} messages failed")
+            else:
+                logger.info(f"Batch sent successfully: {sent} messages, {queued} queued for retry")
+            
+            return Response({
+                'success': failed == 0,
+                'total': len(results),
+                'sent': sent,
+                'queued': queued,
+                'failed': failed,
+                'results': results
+            }, status=status.HTTP_200_OK if failed == 0 else status.HTTP_207_MULTI_STATUS)
+        
+        except APIException:
+            # A body the parsers reject (malformed JSON, an unsupported content
+            # type) is the client's error: DRF answers it with 400 or 415
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in SendBatchEmailView: {str(e)}")
+            return Response({
+                'success': False,
+                'error': 'INTERNAL_ERROR',
+                'message': 'An internal server error occurred'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 
 
 
 
 class ReceiveEmailView(APIView):
+    # Accept: application/x-ndjson streams one message per line
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
     def post(self, request):
         serializer = EmailReceiveSerializer(data=request.data)
         
         if serializer.is_valid():
-            email_config = serializer.validated_data
-            imap_config = {
-                'host': email_config['host'],
-                'username': email_config['username'],
-                'password': email_config['password'],
-                'port': email_config.get('port', 993),
-                'use_ssl': email_config.get('use_ssl', True),
-                'use_tls': email_config.get('use_tls', False),
-                'protocol' : email_config.get('protocol', "IMAP"),
-                'max_emails' : email_config.get('max_emails', max_emails),
-                'folder' : email_config.get('folder', 'INBOX')
-            }
+            imap_config = receive_config(serializer.validated_data)
+            if request.accepted_renderer.format == NDJSONRenderer.format:
+                return self.stream(imap_config)
+            
             result = EmailReceiver.receive_emails(imap_config)
             if result['success']:
                 return Response(result, status=status.HTTP_200_OK)
             else:
                 return Response(result, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def get(self, request):
+        """Parsed-message cache counters and pooled session counts of this process"""
+        return Response({
+            'message_cache': message_cache.stats(),
+            'sessions': {
+                'imap': imap_pool.stats(),
+                'pop': pop_pool.stats()
+            }
+        })
+
+    @staticmethod
+    def stream(imap_config):
+        """
+        Stream messages as NDJSON while they are fetched
+        
+        Each message is written as soon as it is parsed. The last line holds
+        'success', the message 'count' and, for IMAP, the 'sync' block. The
+        first message is read before the response starts, so connection and
+        login errors still get a 400.
+        """
+        summary = {}
+        records = EmailReceiver.iter_emails(imap_config, summary)
+        try:
+            first = next(records, None)
+        except Exception as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def lines():
+            count = 0
+            try:
+                if first is not None:
+                    count += 1
+                    yield NDJSONRenderer.line(first)
+                for record in records:
+                    count += 1
+                    yield NDJSONRenderer.line(record)
+            except Exception as e:
+                logger.error(f"Error while streaming emails: {str(e)}")
+                yield NDJSONRenderer.line({"success": False, "message": str(e), "count": count})
+                return
+            finally:
+                # Drops the server connection if the client went away mid-stream
+                records.close()
+            yield NDJSONRenderer.line({"success": True, "count": count, **summary})
+        
+        return StreamingHttpResponse(lines(), content_type=NDJSONRenderer.media_type)
+
+
+class ReceiveMultiEmailView(APIView):
+    """Receive from several mailboxes concurrently, returning results keyed by mailbox"""
+
+    @staticmethod
+    def mailbox_key(index, mailbox_data, taken):
+        """The caller's 'id', else username@host/folder; repeated keys get '#<index>' appended"""
+        key = mailbox_data.get('id')
+        if not key:
+            if mailbox_data.get('username') and mailbox_data.get('host'):
+                key = f"{mailbox_data['username']}@{mailbox_data['host']}/{mailbox_data.get('folder', 'INBOX')}"
+            else:
+                key = f"mailbox-{index}"
+        key = str(key)
+        return f"{key}#{index}" if key in taken else key
+
+    def post(self, request):
+        """
+        Fetch every mailbox at the same time; a slow or failing server only affects its own entry
+        """
+        try:
+            serializer = EmailReceiveMultiSerializer(data=request.data)
+            
+            if not serializer.is_valid():
+                return Response({
+                    'success': False,
+                    'error': 'VALIDATION_ERROR',
+                    'message': 'Request validation failed',
+                    'validation_errors': serializer.errors
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            mailboxes = serializer.validated_data['mailboxes']
+            keys = []
+            results = [None] * len(mailboxes)
+            pending_indexes = []
+            pending_configs = []
+            
+            # Validate each mailbox on its own so one bad item only fails itself
+            for index, mailbox_data in enumerate(mailboxes):
+                keys.append(self.mailbox_key(index, mailbox_data, keys))
+                mailbox_serializer = EmailReceiveSerializer(data=mailbox_data)
+                if mailbox_serializer.is_valid():
+                    pending_indexes.append(index)
+                    pending_configs.append(receive_config(mailbox_serializer.validated_data))
+                else:
+                    results[index] = {
+                        'success': False,
+                        'error': 'VALIDATION_ERROR',
+                        'message': 'Request validation failed',
+                        'validation_errors': mailbox_serializer.errors
+                    }
+            
+            logger.info(f"Multi-mailbox receive attempt: {len(mailboxes)} mailboxes, {len(pending_configs)} valid")
+            
+            received = mailbox_fanout.receive_many(pending_configs, serializer.validated_data.get('timeout'))
+            for index, result in zip(pending_indexes, received):
+                results[index] = result
+            
+            succeeded = sum(1 for result in results if result['success'])
+            failed = len(results) - succeeded
+            
+            if failed:
+                logger.warning(f"Multi-mailbox receive finished with {failed} of {len(results)} mailboxes failed")
+            
+            return Response({
+                'success': failed == 0,
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': failed,
+                'results': {key: {**result, 'index': index} for index, (key, result) in enumerate(zip(keys, results))}
+            }, status=status.HTTP_200_OK if failed == 0 else status.HTTP_207_MULTI_STATUS)
+        
+        except APIException:
+            # A body the parsers reject (malformed JSON, an unsupported content
+            # type) is the client's error: DRF answers it with 400 or 415
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in ReceiveMultiEmailView: {str(e)}")
+            return Response({
+                'success': False,
+                'error': 'INTERNAL_ERROR',
+                'message': 'An internal server error occurred'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReceiveAttachmentView(APIView):
+    """
+    Download one attachment listed by a receive with attachment_mode=metadata.
+
+    The part is sent back as raw bytes with its content type instead of as
+    base64 inside JSON. The fields come as a JSON body; there is no GET,
+    which would put the mailbox password in URLs and access logs.
+    """
+
+    def post(self, request):
+        serializer = AttachmentFetchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        config = serializer.validated_data
+        result = EmailReceiver.fetch_attachment({
+            'host': config['host'],
+            'username': config['username'],
+            'password': config['password'],
+            'port': config.get('port', 993),
+            'use_ssl': config.get('use_ssl', True),
+            'protocol': config.get('protocol', 'IMAP'),
+            'folder': config.get('folder', 'INBOX'),
+            'uid': config.get('uid'),
+            'message_number': config.get('message_number'),
+            'part': config['part']
+        })
+        if not result['success']:
+            return Response(
+                result,
+                status=ERROR_STATUS_MAP.get(result.get('error'), status.HTTP_400_BAD_REQUEST)
+            )
+
+        content = memoryview(result['content'])
+        response = StreamingHttpResponse(
+            (content[offset:offset + ATTACHMENT_STREAM_CHUNK_SIZE]
+             for offset in range(0, len(content), ATTACHMENT_STREAM_CHUNK_SIZE)),
+            content_type=result['mimetype'] or 'application/octet-stream'
+        )
+        response['Content-Length'] = str(len(content))
+        response['Content-Disposition'] = content_disposition_header(
+            True, result['filename'] or f"part-{config['part']}"
+        )
+        return response
+
+
+class AsyncJSONView(View):
+    """
+    Base for the native asyncio endpoints
+
+    DRF's APIView runs its handlers synchronously, so these are plain Django
+    async views. They take JSON bodies only, validate with the same
+    serializers, return the same result dicts and are CSRF-exempt like
+    APIView. Under ASGI a request waiting on a mail server holds no thread.
+    """
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    @staticmethod
+    def json_body(request):
+        """Parsed JSON object body, or raise ValueError"""
+        data = json_loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        return data
+
+    @staticmethod
+    def validation_error(errors):
+        return FastJsonResponse({
+            'success': False,
+            'error': 'VALIDATION_ERROR',
+            'message': 'Request validation failed',
+            'validation_errors': errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncSendEmailView(AsyncJSONView):
+    """Send one email over a native asyncio SMTP connection"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # method_decorator would hide that post is a coroutine function
+        return never_cache(super().as_view(**initkwargs))
+
+    async def post(self, request):
+        try:
+            try:
+                data = self.json_body(request)
+            except ValueError as e:
+                return self.validation_error({'non_field_errors': [f'Invalid JSON: {str(e)}']})
+
+            serializer = EmailSerializer(data=data)
+            if not serializer.is_valid():
+                return self.validation_error(serializer.errors)
+
+            email_data = serializer.validated_data
+            logger.info(f"Async email send attempt: {len(email_data['recipients'])} recipients, "
+                        f"Subject: {email_data['subject'][:50]}...")
+
+            if email_data.get('async'):
+                job = await sync_to_async(email_queue.enqueue)(send_kwargs(email_data))
+                logger.info(f"Email queued as job {job.id}")
+                return FastJsonResponse({
+                    'success': True,
+                    'message': 'Email queued for delivery',
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'status_url': reverse('send_email_status', args=[job.id])
+                }, status=status.HTTP_202_ACCEPTED)
+
+            kwargs = send_kwargs(email_data)
+            result = await EmailService.send_email_async(**kwargs)
+            if result['success']:
+                logger.info(f"Email sent successfully to {result.get('recipients_count', 0)} recipients")
+                return FastJsonResponse(result, status=status.HTTP_200_OK)
+
+            logger.warning(f"Email send failed: {result.get('error', 'Unknown error')}")
+            queued = await sync_to_async(retry_later)(email_data, kwargs, result)
+            if queued is not None:
+                return FastJsonResponse(queued, status=status.HTTP_202_ACCEPTED)
+            return with_retry_after(
+                FastJsonResponse(result, status=ERROR_STATUS_MAP.get(result.get('error'), status.HTTP_400_BAD_REQUEST)),
+                result
+            )
+
+        except Exception as e:
+            logger.error(f"Unexpected error in AsyncSendEmailView: {str(e)}")
+            return FastJsonResponse({
+                'success': False,
+                'error': 'INTERNAL_ERROR',
+                'message': 'An internal server error occurred'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncReceiveEmailView(AsyncJSONView):
+    """Receive over native asyncio IMAP/POP connections; Accept: application/x-ndjson streams"""
+
+    async def post(self, request):
+        try:
+            data = self.json_body(request)
+        except ValueError as e:
+            return self.validation_error({'non_field_errors': [f'Invalid JSON: {str(e)}']})
+
+        serializer = EmailReceiveSerializer(data=data)
+        if not serializer.is_valid():
+            return FastJsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        imap_config = receive_config(serializer.validated_data)
+        if NDJSONRenderer.media_type in request.headers.get('Accept', ''):
+            return await self.stream(imap_config)
+
+        result = await EmailReceiver.receive_emails_async(imap_config)
+        return FastJsonResponse(result, status=status.HTTP_200_OK if result['success'] else status.HTTP_400_BAD_REQUEST)
+
+    @staticmethod
+    async def stream(imap_config):
+        """Same line format as ReceiveEmailView.stream, from the async engine"""
+        summary = {}
+        records = EmailReceiver.iter_emails_async(imap_config, summary)
+        try:
+            first = await anext(records, None)
+        except Exception as e:
+            return FastJsonResponse({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        async def lines():
+            count = 0
+            try:
+                if first is not None:
+                    count += 1
+                    yield NDJSONRenderer.line(first)
+                async for record in records:
+                    count += 1
+                    yield NDJSONRenderer.line(record)
+            except Exception as e:
+                logger.error(f"Error while streaming emails: {str(e)}")
+                yield NDJSONRenderer.line({"success": False, "message": str(e), "count": count})
+                return
+            finally:
+                await records.aclose()
+            yield NDJSONRenderer.line({"success": True, "count": count, **summary})
+
+        return StreamingHttpResponse(lines(), content_type=NDJSONRenderer.media_type)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'src.settings')
 
 application = get_asgi_application()
+
+# Serving processes drain the jobs still queued or retrying from before a restart
+from email_app.jobs import email_queue  # noqa: E402
+
+email_queue.start_workers()
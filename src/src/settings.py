@@ -21,6 +21,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 ALLOWED_HOSTS = []
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
@@ -47,17 +48,18 @@ INSTALLED_APPS = [
     'email_app',
 ]
 
+# CORS answers preflight requests itself; the token check comes next so
+# rejected requests never reach the session, CSRF and auth middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'email_app.middleware.JWTVerificationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'corsheaders.middleware.CorsMiddleware',
-    
-    'email_app.middleware.JWTVerificationMiddleware',
 ]
 
 ROOT_URLCONF = 'src.urls'
@@ -88,6 +90,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Several workers and queue processes write the same file: wait for
+        # locks instead of failing, take the write lock when a transaction
+        # starts, let readers run alongside the writer, and overwrite deleted
+        # data (cleared job payloads) on disk
+        'OPTIONS': {
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA secure_delete=ON',
+        },
     }
 }
 
@@ -151,6 +162,109 @@ EMAIL_USE_SSL = email_use_ssl_env
 
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+
+# SMTP connection pool (shared by default and per-request SMTP settings)
+SMTP_POOL_MAX_SIZE = int(os.getenv('SMTP_POOL_MAX_SIZE', 10))
+SMTP_POOL_IDLE_TTL = int(os.getenv('SMTP_POOL_IDLE_TTL', 60))
+SMTP_POOL_NOOP_INTERVAL = int(os.getenv('SMTP_POOL_NOOP_INTERVAL', 15))
+# "delivery": "per_domain": worker threads shared by all requests, and
+# envelopes of one message sent at the same time
+SMTP_DELIVERY_WORKERS = int(os.getenv('SMTP_DELIVERY_WORKERS', 16))
+SMTP_DELIVERY_PER_MESSAGE = int(os.getenv('SMTP_DELIVERY_PER_MESSAGE', 4))
+# Per SMTP account (host, username), shared by all workers on this host
+# through lock files in SMTP_RATE_LIMIT_DIR: messages per minute with bursts
+# of up to SMTP_RATE_LIMIT_BURST, and connections in use at once. 0 turns a
+# limit off. A send waits up to SMTP_RATE_LIMIT_MAX_WAIT seconds, then fails
+# with RATE_LIMITED (429 with Retry-After). Idle pooled SMTP connections
+# count against the connection cap.
+SMTP_RATE_LIMIT_PER_MINUTE = float(os.getenv('SMTP_RATE_LIMIT_PER_MINUTE', 0))
+SMTP_RATE_LIMIT_BURST = int(os.getenv('SMTP_RATE_LIMIT_BURST', 10))
+SMTP_MAX_CONNECTIONS_PER_ACCOUNT = int(os.getenv('SMTP_MAX_CONNECTIONS_PER_ACCOUNT', 0))
+SMTP_RATE_LIMIT_MAX_WAIT = float(os.getenv('SMTP_RATE_LIMIT_MAX_WAIT', 2.0))
+SMTP_RATE_LIMIT_DIR = os.getenv('SMTP_RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'email_app_smtp_limits'))
+
+# Background send queue ("async": true). Workers start with the WSGI/ASGI
+# application and on the first enqueue. Set EMAIL_QUEUE_WORKERS=0 when
+# running `python manage.py process_email_queue` as separate worker processes.
+EMAIL_QUEUE_WORKERS = int(os.getenv('EMAIL_QUEUE_WORKERS', 2))
+EMAIL_QUEUE_POLL_INTERVAL = float(os.getenv('EMAIL_QUEUE_POLL_INTERVAL', 1.0))
+EMAIL_QUEUE_STALE_AFTER = int(os.getenv('EMAIL_QUEUE_STALE_AFTER', 900))
+# Uploaded attachments of queued sends are kept here, next to the database,
+# until the job is done
+EMAIL_QUEUE_ATTACHMENT_DIR = os.getenv('EMAIL_QUEUE_ATTACHMENT_DIR', str(BASE_DIR / 'email_queue_attachments'))
+# Queued sends failing with a transient error (connection lost or refused,
+# timeout, 4xx reply) are retried up to EMAIL_RETRY_MAX_ATTEMPTS attempts in
+# all, waiting about EMAIL_RETRY_BASE_DELAY seconds doubled per failure and
+# at most EMAIL_RETRY_MAX_DELAY. Set EMAIL_RETRY_MAX_ATTEMPTS=1 to disable.
+EMAIL_RETRY_MAX_ATTEMPTS = int(os.getenv('EMAIL_RETRY_MAX_ATTEMPTS', 5))
+EMAIL_RETRY_BASE_DELAY = int(os.getenv('EMAIL_RETRY_BASE_DELAY', 30))
+EMAIL_RETRY_MAX_DELAY = int(os.getenv('EMAIL_RETRY_MAX_DELAY', 3600))
+
+# Messages requested per IMAP FETCH round trip when receiving
+IMAP_FETCH_CHUNK_SIZE = int(os.getenv('IMAP_FETCH_CHUNK_SIZE', 50))
+
+# Logged-in IMAP sessions reused across receive calls, per (host, port, user, folder)
+IMAP_POOL_MAX_SIZE = int(os.getenv('IMAP_POOL_MAX_SIZE', 10))
+IMAP_POOL_IDLE_TTL = int(os.getenv('IMAP_POOL_IDLE_TTL', 60))
+IMAP_POOL_NOOP_INTERVAL = int(os.getenv('IMAP_POOL_NOOP_INTERVAL', 15))
+# POP sessions lock the maildrop and only see messages present at login,
+# so one is reused only for a few seconds after it was opened
+POP_POOL_MAX_SIZE = int(os.getenv('POP_POOL_MAX_SIZE', 5))
+POP_SESSION_MAX_AGE = int(os.getenv('POP_SESSION_MAX_AGE', 5))
+# Sessions open at once per mailbox, idle or in use; a receive that needs
+# another waits up to RECEIVE_POOL_MAX_WAIT seconds. A POP maildrop takes
+# one session at a time.
+IMAP_POOL_MAX_SESSIONS = int(os.getenv('IMAP_POOL_MAX_SESSIONS', 4))
+POP_POOL_MAX_SESSIONS = int(os.getenv('POP_POOL_MAX_SESSIONS', 1))
+RECEIVE_POOL_MAX_WAIT = float(os.getenv('RECEIVE_POOL_MAX_WAIT', 10))
+
+# Cache of parsed received messages: 'local' (per-process LRU bounded by
+# MESSAGE_CACHE_MAX_BYTES), 'django' (the MESSAGE_CACHE_ALIAS cache) or 'none'
+MESSAGE_CACHE_BACKEND = os.getenv('MESSAGE_CACHE_BACKEND', 'local')
+MESSAGE_CACHE_MAX_BYTES = int(os.getenv('MESSAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+MESSAGE_CACHE_TTL = int(os.getenv('MESSAGE_CACHE_TTL', 3600))
+MESSAGE_CACHE_ALIAS = os.getenv('MESSAGE_CACHE_ALIAS', 'default')
+
+# POST /api/receive/multi/: worker threads shared by all requests, mailboxes
+# fetched at once from the same server, and default seconds per mailbox
+RECEIVE_MULTI_WORKERS = int(os.getenv('RECEIVE_MULTI_WORKERS', 16))
+RECEIVE_MULTI_PER_HOST = int(os.getenv('RECEIVE_MULTI_PER_HOST', 4))
+RECEIVE_MULTI_TIMEOUT = int(os.getenv('RECEIVE_MULTI_TIMEOUT', 30))
+# Sender and recipient addresses: verdicts kept per normalised address.
+# RECIPIENT_DOMAIN_POLICIES adds per-domain hooks, 'domain=dotted.path' pairs
+# separated by commas ('*' for every other domain), e.g.
+# '*=email_app.addresses.MXPolicy' to refuse domains that cannot receive mail
+RECIPIENT_VALIDATION_CACHE_SIZE = int(os.getenv('RECIPIENT_VALIDATION_CACHE_SIZE', 10000))
+RECIPIENT_VALIDATION_CACHE_TTL = int(os.getenv('RECIPIENT_VALIDATION_CACHE_TTL', 3600))
+RECIPIENT_DOMAIN_POLICIES = os.getenv('RECIPIENT_DOMAIN_POLICIES', '')
+
+# JSON is encoded and decoded with orjson when it is installed, stdlib json otherwise
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'email_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'email_app.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Bearer token check (email_app.middleware). JWT_ACCESS_TOKEN: static shared
+# tokens. JWT_HS256_KEYS: secrets, JWT_RS256_PUBLIC_KEYS: PEM file paths (needs
+# the 'cryptography' package). All three take a comma-separated list so old and
+# new keys can be live at once; key entries may be prefixed with 'kid='.
+JWT_ACCESS_TOKEN = os.getenv('JWT_ACCESS_TOKEN', '')
+JWT_HS256_KEYS = os.getenv('JWT_HS256_KEYS', '')
+JWT_RS256_PUBLIC_KEYS = os.getenv('JWT_RS256_PUBLIC_KEYS', '')
+JWT_AUDIENCE = os.getenv('JWT_AUDIENCE', '')
+JWT_ISSUER = os.getenv('JWT_ISSUER', '')
+JWT_LEEWAY = int(os.getenv('JWT_LEEWAY', 30))
+# Verified tokens remembered per process, each until its exp or for JWT_CACHE_TTL seconds
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 1024))
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', 300))
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True  # For development. Restrict in production
 
@@ -0,0 +1,37 @@
+"""
+API-only settings profile.
+
+Drops the admin, sessions, auth, messages and static files apps and their
+middleware, which the bearer-token protected API does not use, and limits
+DRF to JSON. Select it with DJANGO_SETTINGS_MODULE=src.settings_api
+(e.g. gunicorn --env DJANGO_SETTINGS_MODULE=src.settings_api src.wsgi:application).
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'rest_framework',
+    'corsheaders',
+    'email_app',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'email_app.middleware.JWTVerificationMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'src.urls_api'
+
+# No HTML is rendered: error pages fall back to Django's built-in templates
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['email_app.renderers.FastJSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['email_app.parsers.FastJSONParser'],
+    # Requests are authenticated by JWTVerificationMiddleware; without
+    # django.contrib.auth there is no user model to build request.user from
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+}
@@ -0,0 +1,8 @@
+"""
+URL configuration of the API-only settings profile (src.settings_api): no admin.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('email_app.urls'))
+]